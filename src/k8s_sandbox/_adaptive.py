@@ -0,0 +1,213 @@
+"""An adaptive (AIMD) concurrency limit for Helm install and uninstall operations.
+
+A fixed limit is either too low for a large, healthy cluster or too high for a stressed
+API server. The limiter in this module adjusts its limit at runtime in the manner of
+TCP congestion control: additive increase whilst operations succeed promptly, and
+multiplicative decrease when the cluster shows signs of overload. The signals of
+overload are:
+
+- an operation taking much longer than the median recent operation,
+- a resourcequota conflict (reported explicitly via `record_overload()`),
+- an API server throttling (429) or server (5xx) error, or a timeout.
+
+The limit always stays within a configured floor and ceiling.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import re
+import statistics
+import time
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from inspect_ai.util import concurrency
+from kubernetes.client.exceptions import ApiException  # type: ignore
+
+from k8s_sandbox._logger import log_debug
+
+# The fraction of the limit retained after an overload signal.
+DECREASE_FACTOR = 0.7
+# An operation is considered slow (an overload signal) if it takes longer than this
+# multiple of the median recent operation. Unlike the fastest, the median is not set by
+# a single outlier (e.g. an operation against an idle API server or a cached image).
+LATENCY_FACTOR = 3.0
+# The minimum number of seconds between decreases, so that a burst of failures from
+# operations which were all admitted at the old limit only counts once.
+DECREASE_COOLDOWN_SECONDS = 10.0
+# The number of recent successful operations whose latency defines the baseline.
+_LATENCY_WINDOW = 50
+# The number of latency samples needed before latency is used as a signal.
+_MIN_LATENCY_SAMPLES = 5
+_OVERLOAD_PATTERN = re.compile(
+    r"Too Many Requests|"
+    r"the server is currently unable to handle the request|"
+    r"an error on the server .* has prevented the request from succeeding|"
+    r"the server has received too many requests|"
+    r"etcdserver: (request timed out|leader changed)|"
+    r"context deadline exceeded|TLS handshake timeout"
+)
+
+_limiters: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, dict[str, AdaptiveLimiter]
+] = weakref.WeakKeyDictionary()
+
+
+class AdaptiveLimiter:
+    """A concurrency limiter whose limit adapts using AIMD.
+
+    Unlike a semaphore, the limit may be lowered below the number of permits in use;
+    new acquirers then wait until enough holders have released.
+    """
+
+    def __init__(self, name: str, initial: int, minimum: int, maximum: int) -> None:
+        if minimum < 1 or maximum < minimum:
+            raise ValueError(
+                f"Invalid adaptive concurrency bounds for '{name}': "
+                f"min={minimum}, max={maximum}."
+            )
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        self._limit = float(min(max(initial, minimum), maximum))
+        self._in_use = 0
+        self._condition = asyncio.Condition()
+        self._latencies: deque[float] = deque(maxlen=_LATENCY_WINDOW)
+        self._last_decrease = float("-inf")
+        # Inspect's concurrency semaphore, used to display the current limit.
+        self._display: object | None = None
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_use(self) -> int:
+        return self._in_use
+
+    @asynccontextmanager
+    async def permit(self) -> AsyncIterator[None]:
+        """Hold a permit for the duration of an operation and learn from its outcome.
+
+        Successful operations feed the latency baseline. Exceptions which indicate
+        overload decrease the limit.
+        """
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_use < self.limit)
+            self._in_use += 1
+        try:
+            # Registering with Inspect's concurrency() shows the operations in
+            # progress, and the current limit, in Inspect's display. The entry has
+            # its own key so that nothing but our permit holders enter it.
+            async with concurrency(
+                self.name, self.maximum, key=f"{self.name}-adaptive"
+            ) as display:
+                if self._display is None:
+                    self._display = display
+                    self._update_display()
+                start = time.monotonic()
+                try:
+                    yield
+                except Exception as e:
+                    if is_overload_error(e):
+                        self.record_overload(f"{type(e).__name__}: {e}")
+                    raise
+                self.record_success(time.monotonic() - start)
+        finally:
+            async with self._condition:
+                self._in_use -= 1
+                self._update_display()
+                self._condition.notify_all()
+
+    def record_success(self, latency: float) -> None:
+        """Record a successful operation which took `latency` seconds."""
+        if len(self._latencies) >= _MIN_LATENCY_SAMPLES:
+            baseline = statistics.median(self._latencies)
+            if latency > LATENCY_FACTOR * baseline:
+                self._latencies.append(latency)
+                self.record_overload(
+                    f"latency {latency:.1f}s exceeds {LATENCY_FACTOR}x the baseline "
+                    f"of {baseline:.1f}s"
+                )
+                return
+        self._latencies.append(latency)
+        # Additive increase: roughly +1 per `limit` successful operations.
+        self._set_limit(self._limit + 1 / self._limit, "success")
+
+    def record_overload(self, reason: str) -> None:
+        """Decrease the limit, unless it was decreased very recently."""
+        now = time.monotonic()
+        if now - self._last_decrease < DECREASE_COOLDOWN_SECONDS:
+            return
+        self._last_decrease = now
+        self._set_limit(self._limit * DECREASE_FACTOR, reason)
+
+    def _set_limit(self, limit: float, reason: str) -> None:
+        previous = self.limit
+        self._limit = min(max(limit, self.minimum), self.maximum)
+        if self.limit != previous:
+            log_debug(
+                f"Adjusted {self.name} concurrency limit.",
+                previous=previous,
+                limit=self.limit,
+                reason=reason,
+            )
+            # Increases only happen as a permit is released, which wakes waiters.
+            self._update_display()
+
+    def _update_display(self) -> None:
+        """Show the current limit on Inspect's display of the permits in use.
+
+        The display's semaphore is only entered by the holders of our permits, once
+        admitted, so it holds at most `in_use`. Its limit is never set below that
+        (after a decrease, it drains down to the new limit with our permits), so it
+        never constrains them.
+        """
+        # Recent versions of Inspect back concurrency() with a resizable semaphore
+        # whose limit is settable and displayed. Older versions use a plain attribute
+        # alongside a fixed semaphore (of our maximum), which must not be modified.
+        if self._display is None:
+            return
+        concurrency_attr = getattr(type(self._display), "concurrency", None)
+        if isinstance(concurrency_attr, property) and concurrency_attr.fset:
+            try:
+                setattr(self._display, "concurrency", max(self.limit, self._in_use))
+            except Exception as e:
+                log_debug("Failed to update the concurrency display.", error=e)
+
+
+def adaptive_concurrency(
+    name: str, initial: int, minimum: int, maximum: int
+) -> AdaptiveLimiter:
+    """Get the adaptive limiter for `name` in the running event loop.
+
+    Limiters are created on first use with the given bounds and are unique per event
+    loop (as asyncio primitives are bound to a loop).
+    """
+    limiters = _limiters.setdefault(asyncio.get_running_loop(), {})
+    if name not in limiters:
+        limiters[name] = AdaptiveLimiter(name, initial, minimum, maximum)
+    return limiters[name]
+
+
+def record_overload(name: str, reason: str) -> None:
+    """Report an overload signal to the adaptive limiter `name`, if it exists."""
+    limiter = _limiters.get(asyncio.get_running_loop(), {}).get(name)
+    if limiter is not None:
+        limiter.record_overload(reason)
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """Whether an error indicates that the API server or cluster is overloaded."""
+    cause: BaseException | None = error
+    while cause is not None:
+        if isinstance(cause, ApiException) and isinstance(cause.status, int):
+            if cause.status == 429 or cause.status >= 500:
+                return True
+        if isinstance(cause, TimeoutError):
+            return True
+        cause = cause.__cause__
+    return bool(_OVERLOAD_PATTERN.search(str(error)))
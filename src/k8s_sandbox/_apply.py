@@ -0,0 +1,292 @@
+"""Install a rendered Helm chart by applying its objects via the Kubernetes API.
+
+The "apply" install engine renders a chart once per task with ``helm template`` and
+then creates each sample's objects using server-side apply. This avoids forking a
+``helm`` process, re-reading and re-validating the chart and writing a release record
+Secret for every sample. The objects are tracked by the
+``app.kubernetes.io/instance`` label (as Helm-installed objects are), so an "uninstall"
+is a label-selector delete of each kind which was applied.
+
+An apply-engine release has no Helm release record, so ``helm list`` does not find it.
+Its objects are also labelled ``inspectSandbox=true`` and ``inspectRelease=<name>``,
+by which `inspect sandbox cleanup` finds and deletes them (see
+`find_applied_releases`).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Iterable
+
+import yaml
+from kubernetes.dynamic import DynamicClient  # type: ignore
+from kubernetes.dynamic.exceptions import ResourceNotFoundError  # type: ignore
+
+from k8s_sandbox._cleanup import RELEASE_LABEL
+from k8s_sandbox._kubernetes_api import k8s_dynamic_client
+from k8s_sandbox._logger import log_trace
+
+INSTANCE_LABEL = "app.kubernetes.io/instance"
+FIELD_MANAGER = "inspect-k8s-sandbox"
+# A stand-in release name passed to `helm template`. It is replaced with each sample's
+# real release name before the manifest is parsed. It is 8 characters long (like a
+# real release name) so that any length-dependent templating (e.g. `trunc 63`) renders
+# identically.
+RELEASE_NAME_PLACEHOLDER = "zzrlsezz"
+_POLL_INTERVAL_SECONDS = 2
+# The order in which Helm installs kinds, so that e.g. a ServiceAccount or ConfigMap
+# exists before the Pods which reference it. Unlisted kinds (e.g. custom resources)
+# are applied last.
+_INSTALL_ORDER = [
+    "Namespace",
+    "NetworkPolicy",
+    "ResourceQuota",
+    "LimitRange",
+    "PodSecurityPolicy",
+    "PodDisruptionBudget",
+    "ServiceAccount",
+    "Secret",
+    "SecretList",
+    "ConfigMap",
+    "StorageClass",
+    "PersistentVolume",
+    "PersistentVolumeClaim",
+    "CustomResourceDefinition",
+    "ClusterRole",
+    "ClusterRoleList",
+    "ClusterRoleBinding",
+    "ClusterRoleBindingList",
+    "Role",
+    "RoleList",
+    "RoleBinding",
+    "RoleBindingList",
+    "Service",
+    "DaemonSet",
+    "Pod",
+    "ReplicationController",
+    "ReplicaSet",
+    "Deployment",
+    "HorizontalPodAutoscaler",
+    "StatefulSet",
+    "Job",
+    "CronJob",
+    "IngressClass",
+    "Ingress",
+    "APIService",
+]
+
+# The kinds deleted when those which were applied are not known: when an install was
+# cancelled (or crashed) before its manifest was parsed, or when cleaning up a release
+# left behind by another process. They cover the built-in chart and the kinds most
+# commonly found in custom charts, in install order.
+FALLBACK_KINDS = [
+    ("networking.k8s.io/v1", "NetworkPolicy"),
+    ("v1", "ServiceAccount"),
+    ("v1", "Secret"),
+    ("v1", "ConfigMap"),
+    ("v1", "PersistentVolumeClaim"),
+    ("v1", "Service"),
+    ("v1", "Pod"),
+    ("apps/v1", "Deployment"),
+    ("apps/v1", "StatefulSet"),
+    ("batch/v1", "Job"),
+    ("cilium.io/v2", "CiliumNetworkPolicy"),
+]
+_SANDBOX_SELECTOR = "inspectSandbox=true"
+
+# Prefer the (much faster) libyaml-based loader when PyYAML was built with it.
+_YamlLoader: Any = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def parse_manifest(
+    manifest: str, release_name: str, labels: dict[str, str]
+) -> list[dict[str, Any]]:
+    """Parse a manifest rendered by `helm template` into one release's objects.
+
+    Args:
+        manifest: The multi-document YAML output of `helm template`, rendered with
+          RELEASE_NAME_PLACEHOLDER as the release name.
+        release_name: The release name to substitute for the placeholder.
+        labels: Labels to add to every object and to every Pod template, in addition
+          to the instance label.
+
+    Returns:
+        The objects, sorted into the order in which Helm would install them.
+    """
+    text = manifest.replace(RELEASE_NAME_PLACEHOLDER, release_name)
+    all_labels = {**labels, INSTANCE_LABEL: release_name}
+    objects = []
+    for document in yaml.load_all(text, Loader=_YamlLoader):
+        # Empty documents are common (e.g. templates whose content is conditional).
+        if not isinstance(document, dict) or not document.get("kind"):
+            continue
+        _add_labels(document, all_labels)
+        objects.append(document)
+    return sorted(objects, key=_install_order)
+
+
+def applied_kinds(objects: Iterable[dict[str, Any]]) -> list[tuple[str, str]]:
+    """The distinct (apiVersion, kind) pairs of objects, in install order."""
+    kinds: dict[tuple[str, str], None] = {}
+    for obj in objects:
+        kinds[(obj["apiVersion"], obj["kind"])] = None
+    return list(kinds)
+
+
+async def apply_objects(
+    context_name: str | None, namespace: str, objects: list[dict[str, Any]]
+) -> None:
+    """Create or update objects using server-side apply, in the order given.
+
+    Raises:
+        ApiException: If the API server rejects an object.
+    """
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(
+        None,
+        lambda: _apply_objects(k8s_dynamic_client(context_name), namespace, objects),
+    )
+
+
+async def delete_objects(
+    context_name: str | None,
+    namespace: str,
+    release_name: str,
+    kinds: list[tuple[str, str]] | None,
+    timeout: int,
+) -> None:
+    """Delete a release's objects and wait for its Pods to terminate.
+
+    Each kind is deleted with a single label-selector (deletecollection) request.
+    Kinds which the cluster does not serve (e.g. an uninstalled CRD) are skipped.
+    Waiting for Pods to terminate mirrors `helm uninstall --wait`, so that cluster
+    capacity and quota are released before this returns.
+
+    If `kinds` is empty or None (i.e. not known), the FALLBACK_KINDS are deleted by
+    the `inspectRelease` label instead.
+
+    Raises:
+        ApiException: If the API server rejects a delete request.
+        TimeoutError: If the Pods have not terminated within the timeout.
+    """
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(
+        None,
+        lambda: _delete_objects(
+            k8s_dynamic_client(context_name), namespace, release_name, kinds
+        ),
+    )
+    selector = _release_selector(release_name, kinds)
+    deadline = time.monotonic() + timeout
+    while await loop.run_in_executor(
+        None,
+        lambda: _count_pods(k8s_dynamic_client(context_name), namespace, selector),
+    ):
+        if time.monotonic() >= deadline:
+            raise TimeoutError(
+                f"Pods of release '{release_name}' did not terminate within {timeout}s."
+            )
+        await asyncio.sleep(_POLL_INTERVAL_SECONDS)
+
+
+async def find_applied_releases(context_name: str | None, namespace: str) -> list[str]:
+    """The names of the releases with sandbox objects in a namespace.
+
+    Objects are found by their `inspectSandbox=true` label, so this includes releases
+    installed by Helm as well as those installed by the apply engine (which `helm list`
+    cannot find). Only the FALLBACK_KINDS are searched.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None,
+        lambda: _find_applied_releases(k8s_dynamic_client(context_name), namespace),
+    )
+
+
+def _add_labels(obj: dict[str, Any], labels: dict[str, str]) -> None:
+    metadata = obj.get("metadata") or {}
+    obj["metadata"] = metadata
+    metadata["labels"] = {**(metadata.get("labels") or {}), **labels}
+    # Label the Pods created by workloads too, so that they can be found and cleaned
+    # up by the same selectors. Selectors themselves are left alone.
+    template = (obj.get("spec") or {}).get("template")
+    if isinstance(template, dict):
+        template_metadata = template.get("metadata") or {}
+        template["metadata"] = template_metadata
+        template_metadata["labels"] = {
+            **(template_metadata.get("labels") or {}),
+            **labels,
+        }
+
+
+def _install_order(obj: dict[str, Any]) -> int:
+    try:
+        return _INSTALL_ORDER.index(obj["kind"])
+    except ValueError:
+        return len(_INSTALL_ORDER)
+
+
+def _apply_objects(
+    client: DynamicClient, namespace: str, objects: list[dict[str, Any]]
+) -> None:
+    for obj in objects:
+        resource = client.resources.get(api_version=obj["apiVersion"], kind=obj["kind"])
+        client.server_side_apply(
+            resource,
+            body=obj,
+            namespace=namespace if resource.namespaced else None,
+            field_manager=FIELD_MANAGER,
+            force_conflicts=True,
+        )
+
+
+def _delete_objects(
+    client: DynamicClient,
+    namespace: str,
+    release_name: str,
+    kinds: list[tuple[str, str]] | None,
+) -> None:
+    selector = _release_selector(release_name, kinds)
+    # Delete in reverse install order, as Helm does.
+    for api_version, kind in reversed(kinds or FALLBACK_KINDS):
+        try:
+            resource = client.resources.get(api_version=api_version, kind=kind)
+        except ResourceNotFoundError:
+            log_trace("Skipping kind which the cluster does not serve.", kind=kind)
+            continue
+        client.delete(
+            resource,
+            namespace=namespace if resource.namespaced else None,
+            label_selector=selector,
+        )
+
+
+def _release_selector(release_name: str, kinds: list[tuple[str, str]] | None) -> str:
+    # The fallback is used for releases which may not have been installed by this
+    # process, so select by the label which every sandbox object has.
+    label = INSTANCE_LABEL if kinds else RELEASE_LABEL
+    return f"{label}={release_name}"
+
+
+def _count_pods(client: DynamicClient, namespace: str, selector: str) -> int:
+    pods = client.resources.get(api_version="v1", kind="Pod")
+    result = client.get(pods, namespace=namespace, label_selector=selector).to_dict()
+    return len(result["items"])
+
+
+def _find_applied_releases(client: DynamicClient, namespace: str) -> list[str]:
+    names: dict[str, None] = {}
+    for api_version, kind in FALLBACK_KINDS:
+        try:
+            resource = client.resources.get(api_version=api_version, kind=kind)
+        except ResourceNotFoundError:
+            continue
+        result = client.get(
+            resource, namespace=namespace, label_selector=_SANDBOX_SELECTOR
+        ).to_dict()
+        for item in result["items"]:
+            labels = (item.get("metadata") or {}).get("labels") or {}
+            if labels.get(RELEASE_LABEL):
+                names[labels[RELEASE_LABEL]] = None
+    return list(names)
@@ -0,0 +1,304 @@
+"""Uninstall many Helm releases at once by deleting their objects by label.
+
+Running one ``helm uninstall`` subprocess per release makes cleaning up after a large
+(e.g. interrupted) eval slow, and each one makes many requests of the API server. The
+built-in chart labels every object it creates with ``inspectRelease=<release name>``,
+so instead the objects of many releases can be deleted with a single
+``deletecollection`` request per kind, followed by a single request to delete the
+releases' Helm release record Secrets.
+
+Only releases whose every object carries the label (per the manifest in their release
+record) and which have no Helm hooks are uninstalled this way. Others, such as those
+installed from a custom chart which does not apply `.Values.labels`, are left for the
+caller to uninstall with ``helm uninstall``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import gzip
+import json
+import os
+import time
+from typing import Any, cast
+
+import yaml
+from kubernetes.client.exceptions import ApiException  # type: ignore
+from kubernetes.dynamic import DynamicClient  # type: ignore
+from kubernetes.dynamic.exceptions import ResourceNotFoundError  # type: ignore
+from rich import print
+from urllib3 import HTTPResponse
+
+from k8s_sandbox._kubernetes_api import k8s_client, k8s_dynamic_client
+from k8s_sandbox._logger import log_trace, log_warn
+
+INSPECT_K8S_BULK_CLEANUP = "INSPECT_K8S_BULK_CLEANUP"
+RELEASE_LABEL = "inspectRelease"
+# The number of release names in each set-based label selector, which keeps request
+# URLs to a reasonable length.
+_SELECTOR_BATCH_SIZE = 100
+_POLL_INTERVAL_SECONDS = 2
+_GZIP_MAGIC = b"\x1f\x8b"
+_YamlLoader: Any = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def bulk_cleanup_enabled() -> bool:
+    """Whether releases should be uninstalled in bulk where possible."""
+    return os.getenv(INSPECT_K8S_BULK_CLEANUP, "false").lower() in {
+        "1",
+        "true",
+        "yes",
+        "y",
+    }
+
+
+async def bulk_uninstall(
+    release_names: list[str],
+    namespace: str,
+    context_name: str | None,
+    timeout: int,
+    quiet: bool,
+) -> list[str]:
+    """Uninstall releases by deleting their objects and release records by label.
+
+    Like `helm uninstall --wait`, this waits (up to `timeout` seconds) for the releases'
+    Pods to terminate. Any objects which still exist afterwards are reported.
+
+    Args:
+        release_names: The names of the Helm releases to uninstall.
+        namespace: The Kubernetes namespace in which the releases are installed.
+        context_name: The kubeconfig context to use. If None, the current context.
+        timeout: The number of seconds to wait for the releases' Pods to terminate.
+        quiet: If False, print progress to the console.
+
+    Returns:
+        The names of the releases which could not be uninstalled in bulk and should be
+        uninstalled individually.
+    """
+    if not release_names:
+        return []
+    loop = asyncio.get_running_loop()
+    try:
+        covered, kinds, remaining = await loop.run_in_executor(
+            None,
+            lambda: _plan(context_name, namespace, release_names),
+        )
+    except ApiException as e:
+        log_warn(
+            "Failed to read Helm release records; uninstalling individually.", error=e
+        )
+        return list(release_names)
+    _progress(
+        quiet,
+        f"Uninstalling {len(covered)} release(s) in bulk; {len(remaining)} release(s) "
+        "must be uninstalled individually.",
+    )
+    if not covered:
+        return remaining
+    selectors = _selectors(covered)
+    failed = await loop.run_in_executor(
+        None,
+        lambda: _delete_collections(context_name, namespace, kinds, selectors, quiet),
+    )
+    if failed:
+        # The release records are kept so that `helm uninstall` can finish the job.
+        log_warn(
+            "Failed to delete some kinds in bulk; uninstalling individually.",
+            kinds=failed,
+        )
+        return remaining + covered
+    await loop.run_in_executor(
+        None, lambda: _delete_release_records(context_name, namespace, covered)
+    )
+    _progress(quiet, f"Deleted the Helm release records of {len(covered)} release(s).")
+    await _wait_for_pods(context_name, namespace, selectors, timeout, quiet)
+    leftovers = await loop.run_in_executor(
+        None, lambda: _count_objects(context_name, namespace, kinds, selectors)
+    )
+    if leftovers:
+        log_warn(
+            "Some objects of bulk uninstalled releases still exist.",
+            leftovers=leftovers,
+        )
+        _progress(
+            quiet,
+            "Objects which still exist: "
+            + ", ".join(f"{count} {kind}" for kind, count in leftovers.items()),
+        )
+    return remaining
+
+
+def decode_release_record(data: str) -> dict[str, Any]:
+    """Decode the `release` field of a Helm release record Secret.
+
+    The Secret's data is base64 encoded by Kubernetes; Helm itself stores the release
+    as (usually gzipped) JSON, base64 encoded.
+    """
+    encoded = base64.b64decode(base64.b64decode(data))
+    if encoded[:2] == _GZIP_MAGIC:
+        encoded = gzip.decompress(encoded)
+    return json.loads(encoded)
+
+
+def covered_kinds(release: dict[str, Any]) -> list[tuple[str, str]] | None:
+    """The (apiVersion, kind) pairs of a release's objects, if it can be bulk deleted.
+
+    Returns:
+        None if the release has hooks, or any object is in another namespace or lacks
+        the `inspectRelease` label.
+    """
+    if release.get("hooks"):
+        return None
+    name = release["name"]
+    kinds: dict[tuple[str, str], None] = {}
+    for obj in yaml.load_all(release.get("manifest", ""), Loader=_YamlLoader):
+        if not isinstance(obj, dict) or not obj.get("kind"):
+            continue
+        metadata = obj.get("metadata") or {}
+        if (metadata.get("labels") or {}).get(RELEASE_LABEL) != name:
+            return None
+        if metadata.get("namespace") not in (None, release.get("namespace")):
+            return None
+        kinds[(obj["apiVersion"], obj["kind"])] = None
+    return list(kinds)
+
+
+def _plan(
+    context_name: str | None, namespace: str, release_names: list[str]
+) -> tuple[list[str], list[tuple[str, str]], list[str]]:
+    """Determine which releases can be deleted in bulk, and the kinds to delete."""
+    client = k8s_dynamic_client(context_name)
+    latest: dict[str, dict[str, Any]] = {}
+    for selector in _selectors(release_names, "owner=helm,name"):
+        # See snapshot.read_pod for why _preload_content needs a call-arg ignore.
+        response = k8s_client(context_name).list_namespaced_secret(  # type: ignore[call-arg]
+            namespace, label_selector=selector, _preload_content=False
+        )
+        for secret in json.loads(cast(HTTPResponse, response).data)["items"]:
+            release = decode_release_record(secret["data"]["release"])
+            previous = latest.get(release["name"])
+            if previous is None or release["version"] > previous["version"]:
+                latest[release["name"]] = release
+    covered: list[str] = []
+    remaining: list[str] = []
+    kinds: dict[tuple[str, str], None] = {}
+    for name in release_names:
+        record = latest.get(name)
+        release_kinds = covered_kinds(record) if record else None
+        if release_kinds is None or not _all_namespaced(client, release_kinds):
+            remaining.append(name)
+            continue
+        covered.append(name)
+        kinds.update(dict.fromkeys(release_kinds))
+    return covered, list(kinds), remaining
+
+
+def _all_namespaced(client: DynamicClient, kinds: list[tuple[str, str]]) -> bool:
+    for api_version, kind in kinds:
+        try:
+            resource = client.resources.get(api_version=api_version, kind=kind)
+        except ResourceNotFoundError:
+            # Not served (e.g. its CRD was uninstalled), so there's nothing to delete.
+            continue
+        if not resource.namespaced:
+            return False
+    return True
+
+
+def _selectors(release_names: list[str], key: str = RELEASE_LABEL) -> list[str]:
+    return [
+        f"{key} in ({','.join(release_names[i : i + _SELECTOR_BATCH_SIZE])})"
+        for i in range(0, len(release_names), _SELECTOR_BATCH_SIZE)
+    ]
+
+
+def _delete_collections(
+    context_name: str | None,
+    namespace: str,
+    kinds: list[tuple[str, str]],
+    selectors: list[str],
+    quiet: bool,
+) -> list[str]:
+    """Delete each kind by label, returning the kinds which failed."""
+    client = k8s_dynamic_client(context_name)
+    failed: list[str] = []
+    # Delete workloads before the objects they reference, as Helm does.
+    for api_version, kind in reversed(kinds):
+        try:
+            resource = client.resources.get(api_version=api_version, kind=kind)
+        except ResourceNotFoundError:
+            log_trace("Skipping kind which the cluster does not serve.", kind=kind)
+            continue
+        try:
+            for selector in selectors:
+                client.delete(resource, namespace=namespace, label_selector=selector)
+        except ApiException as e:
+            log_warn("Failed to delete objects by label.", kind=kind, error=e)
+            failed.append(kind)
+            continue
+        _progress(quiet, f"Deleted {kind} objects.")
+    return failed
+
+
+def _delete_release_records(
+    context_name: str | None, namespace: str, release_names: list[str]
+) -> None:
+    for selector in _selectors(release_names, "owner=helm,name"):
+        k8s_client(context_name).delete_collection_namespaced_secret(
+            namespace, label_selector=selector
+        )
+
+
+async def _wait_for_pods(
+    context_name: str | None,
+    namespace: str,
+    selectors: list[str],
+    timeout: int,
+    quiet: bool,
+) -> None:
+    loop = asyncio.get_running_loop()
+    deadline = time.monotonic() + timeout
+    while True:
+        counts = await loop.run_in_executor(
+            None,
+            lambda: _count_objects(context_name, namespace, [("v1", "Pod")], selectors),
+        )
+        pods = counts.get("Pod", 0)
+        if pods == 0 or time.monotonic() >= deadline:
+            return
+        _progress(quiet, f"Waiting for {pods} Pod(s) to terminate.")
+        await asyncio.sleep(_POLL_INTERVAL_SECONDS)
+
+
+def _count_objects(
+    context_name: str | None,
+    namespace: str,
+    kinds: list[tuple[str, str]],
+    selectors: list[str],
+) -> dict[str, int]:
+    client = k8s_dynamic_client(context_name)
+    counts: dict[str, int] = {}
+    for api_version, kind in kinds:
+        try:
+            resource = client.resources.get(api_version=api_version, kind=kind)
+        except ResourceNotFoundError:
+            continue
+        count = sum(
+            len(
+                client.get(resource, namespace=namespace, label_selector=selector)
+                .to_dict()
+                .get("items", [])
+            )
+            for selector in selectors
+        )
+        if count:
+            counts[kind] = count
+    return counts
+
+
+def _progress(quiet: bool, message: str) -> None:
+    if quiet:
+        log_trace(message)
+    else:
+        print(message)
@@ -0,0 +1,145 @@
+"""Deadlines which bound the total time taken by a sandbox operation.
+
+Otherwise, the time taken by an operation is only bounded (if at all) step by step: an
+exec with a 30s timeout may also spend up to `API_TIMEOUT` connecting, wait on the Pod
+restart check, and be retried 5 times with up to 10s of backoff between attempts. When
+the cluster is under stress, such an exec can take minutes.
+
+A deadline is an absolute time on the monotonic clock, set for the duration of a
+sandbox call with `deadline()`. It is held in a context variable, so everything the
+call does sees it, including the pod operations run in `PodOpExecutor` threads (which
+run in a copy of the caller's context). Request timeouts are capped to the time
+remaining, operations still running at the deadline are abandoned (and aborted, see
+`_pod.cancellation`) and retries stop, with their backoff shortened to fit.
+
+The deadline is extended by any time spent waiting for a pod operation slot (see
+`paused()`), so that a command which was queued behind others, but never started, does
+not appear to have timed out.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+_current: ContextVar[_Deadline | None] = ContextVar(
+    "k8s_sandbox_deadline", default=None
+)
+
+
+class DeadlineExceededError(TimeoutError):
+    """A sandbox operation did not complete before its deadline."""
+
+    def __init__(self) -> None:
+        super().__init__("The sandbox operation did not complete before its deadline.")
+
+
+class _Deadline:
+    """A deadline, shared by the contexts copied from the one in which it was set.
+
+    It is mutable so that time spent paused (in any of those contexts) extends it.
+    """
+
+    def __init__(self, at: float, parent: _Deadline | None) -> None:
+        self._at = at
+        self._parent = parent
+
+    @property
+    def at(self) -> float:
+        if self._parent is None:
+            return self._at
+        return min(self._at, self._parent.at)
+
+    def extend(self, seconds: float) -> None:
+        self._at += seconds
+        if self._parent is not None:
+            self._parent.extend(seconds)
+
+
+@contextmanager
+def deadline(seconds: float | None) -> Iterator[None]:
+    """Bound everything run in this context to `seconds` from now.
+
+    An enclosing deadline which is sooner still applies. If `seconds` is None, only
+    the enclosing deadline (if any) applies.
+    """
+    if seconds is None:
+        yield
+        return
+    token = _current.set(_Deadline(time.monotonic() + seconds, _current.get()))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def paused() -> Iterator[None]:
+    """Extend the current deadline (if any) by the time spent in this context."""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        current = _current.get()
+        if current is not None:
+            current.extend(time.monotonic() - start)
+
+
+@contextmanager
+def unbounded() -> Iterator[None]:
+    """Lift the deadline, e.g. to clean up after an operation which exceeded it."""
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def remaining() -> float | None:
+    """The seconds until the current deadline (at least 0), or None if there is none."""
+    current = _current.get()
+    if current is None:
+        return None
+    return max(0.0, current.at - time.monotonic())
+
+
+def exceeded() -> bool:
+    """Whether the current deadline has passed."""
+    return remaining() == 0.0
+
+
+def bounded(seconds: float) -> float:
+    """`seconds`, or the time remaining until the current deadline if that's sooner.
+
+    Raises:
+      DeadlineExceededError: The deadline has passed.
+    """
+    left = remaining()
+    if left is None:
+        return seconds
+    if left == 0.0:
+        raise DeadlineExceededError()
+    return min(seconds, left)
+
+
+async def within_deadline(awaitable: Awaitable[T]) -> T:
+    """Await `awaitable`, cancelling it if the current deadline passes first.
+
+    Raises:
+      DeadlineExceededError: The deadline passed first.
+    """
+    left = remaining()
+    if left is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, left)
+    except asyncio.TimeoutError as e:
+        # The operation may have raised its own TimeoutError.
+        if exceeded():
+            raise DeadlineExceededError() from e
+        raise
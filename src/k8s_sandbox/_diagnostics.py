@@ -1,10 +1,14 @@
 from __future__ import annotations
 
+import json
 import logging
+from typing import Any, cast
 
-from kubernetes.client import CoreV1Api, V1ContainerStatus  # type: ignore
+from kubernetes.client import CoreV1Api  # type: ignore
+from urllib3 import HTTPResponse
 
 from k8s_sandbox._kubernetes_api import k8s_client
+from k8s_sandbox._pod.cache import pod_cache
 
 logger = logging.getLogger(__name__)
 
@@ -43,25 +47,22 @@ def _collect_diagnostics(
     context_name: str | None, namespace: str, release_name: str
 ) -> str | None:
     client = k8s_client(context_name)
-    pods = client.list_namespaced_pod(
-        namespace, label_selector=f"app.kubernetes.io/instance={release_name}"
-    )
     lines: list[str] = []
     pod_names: set[str] = set()
-    for pod in pods.items:
-        if pod.metadata is None or pod.metadata.name is None:
-            continue
-        pod_names.add(pod.metadata.name)
-        if pod.status is None:
+    for pod in _release_pods(client, context_name, namespace, release_name):
+        name = (pod.get("metadata") or {}).get("name")
+        if name is None:
             continue
+        pod_names.add(name)
+        status = pod.get("status") or {}
         # Init containers run to completion before the app containers start, so a
         # failing init container leaves the app container merely "waiting
         # (PodInitializing)"; the actionable cause is in the init container's status.
-        for container in pod.status.init_container_statuses or []:
+        for container in status.get("initContainerStatuses") or []:
             line = _describe_container(container, is_init=True)
             if line is not None:
                 lines.append(line)
-        for container in pod.status.container_statuses or []:
+        for container in status.get("containerStatuses") or []:
             line = _describe_container(container)
             if line is not None:
                 lines.append(line)
@@ -73,6 +74,24 @@ def _collect_diagnostics(
     return "\n".join(lines)
 
 
+def _release_pods(
+    client: CoreV1Api, context_name: str | None, namespace: str, release_name: str
+) -> list[dict[str, Any]]:
+    """The release's pods as raw JSON, from the pod cache if possible."""
+    cache = pod_cache(context_name, namespace)
+    pods = cache.raw_release_pods(release_name) if cache is not None else None
+    if pods is not None:
+        return pods
+    # See snapshot.read_pod for why raw responses are used and why _preload_content
+    # needs a call-arg ignore.
+    response = client.list_namespaced_pod(  # type: ignore[call-arg]
+        namespace,
+        label_selector=f"app.kubernetes.io/instance={release_name}",
+        _preload_content=False,
+    )
+    return json.loads(cast(HTTPResponse, response).data).get("items", [])
+
+
 def _describe_warning_events(
     client: CoreV1Api, namespace: str, pod_names: set[str]
 ) -> list[str]:
@@ -87,41 +106,38 @@ def _describe_warning_events(
     return lines
 
 
-def _describe_container(
-    container: V1ContainerStatus, is_init: bool = False
-) -> str | None:
+def _describe_container(container: dict[str, Any], is_init: bool = False) -> str | None:
     """Describe a single container's problematic state, or None if it looks healthy."""
-    state = container.state
-    last_state = container.last_state
-    waiting = state.waiting if state else None
-    terminated = state.terminated if state else None
-    last_terminated = last_state.terminated if last_state else None
+    state = container.get("state") or {}
+    waiting = state.get("waiting")
+    terminated = state.get("terminated")
+    last_terminated = (container.get("lastState") or {}).get("terminated")
 
     parts: list[str] = []
     if waiting is not None:
-        detail = waiting.reason or "Waiting"
-        if waiting.message:
-            detail += f": {waiting.message}"
+        detail = waiting.get("reason") or "Waiting"
+        if waiting.get("message"):
+            detail += f": {waiting['message']}"
         parts.append(f"waiting ({detail})")
     if terminated is not None:
         parts.append(
-            f"terminated {terminated.reason} (exit code {terminated.exit_code})"
+            f"terminated {terminated.get('reason')} "
+            f"(exit code {terminated.get('exitCode')})"
         )
     if terminated is None and last_terminated is not None:
         # A crash-looping container is currently "waiting"; the reason it keeps dying
         # (e.g. OOMKilled, exit 137) lives in its previous termination.
         parts.append(
-            f"last terminated {last_terminated.reason} "
-            f"(exit code {last_terminated.exit_code})"
+            f"last terminated {last_terminated.get('reason')} "
+            f"(exit code {last_terminated.get('exitCode')})"
         )
 
     if not parts:
         return None
-
     kind = "init container" if is_init else "container"
-    line = f"{kind} '{container.name}': " + "; ".join(parts)
-    if container.restart_count:
-        line += f", restarted {container.restart_count} time(s)"
-    if container.image:
-        line += f" [image: {container.image}]"
+    line = f"{kind} '{container.get('name')}': " + "; ".join(parts)
+    if container.get("restartCount"):
+        line += f", restarted {container['restartCount']} time(s)"
+    if container.get("image"):
+        line += f" [image: {container['image']}]"
     return line
@@ -0,0 +1,211 @@
+"""A shared watch of a namespace's FailedScheduling events.
+
+Every in-flight install wants to know about FailedScheduling events for its release's
+Pods (e.g. to warn that a GPU node is being provisioned). Rather than each install
+polling the namespace's events, a single watch per (context, namespace) is shared by
+all installs in that namespace and each event is dispatched to the subscribers for
+the release it concerns. The API cost is therefore independent of the number of
+installs in flight.
+
+The watch runs in a dedicated daemon thread (the Kubernetes client is synchronous)
+which is started by the first subscriber and stopped once the last unsubscribes.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+from contextlib import contextmanager, suppress
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator, cast
+
+from kubernetes import client  # type: ignore
+from kubernetes.client.exceptions import ApiException  # type: ignore
+from kubernetes.watch.watch import iter_resp_lines  # type: ignore
+from urllib3 import HTTPResponse
+
+from k8s_sandbox._kubernetes_api import k8s_client
+from k8s_sandbox._logger import log_debug, log_trace
+
+EventCallback = Callable[[dict[str, Any]], None]
+
+# The maximum duration of a single watch request.
+_MAX_WATCH_SECONDS = 300
+# How long to wait before re-establishing a watch which failed.
+_RETRY_INTERVAL_SECONDS = 10
+_HTTP_GONE = 410
+
+_informers: dict[tuple[str | None, str], _SchedulingEventInformer] = {}
+_informers_lock = threading.Lock()
+
+
+@contextmanager
+def subscribe_to_scheduling_events(
+    context_name: str | None,
+    namespace: str,
+    release_name: str,
+    callback: EventCallback,
+) -> Iterator[None]:
+    """Receive the FailedScheduling events of a release's objects whilst in scope.
+
+    An event concerns a release if the name of the object it involves contains the
+    release name as one of its dash-separated parts (e.g. the Pod
+    `agent-env-abcdefgh-default-0` of release `abcdefgh`).
+
+    Args:
+        context_name: The kubeconfig context. If None, the current context is used.
+        namespace: The namespace in which the release is installed.
+        release_name: The name of the release.
+        callback: Called on the running event loop with each event (as returned by
+          the Kubernetes API). Events may be repeated if the watch is re-established.
+    """
+    subscriber = _Subscriber(asyncio.get_running_loop(), callback)
+    key = (context_name, namespace)
+    with _informers_lock:
+        informer = _informers.get(key)
+        if informer is None:
+            informer = _SchedulingEventInformer(context_name, namespace)
+            _informers[key] = informer
+            informer.start()
+        informer.add(release_name, subscriber)
+    try:
+        yield
+    finally:
+        with _informers_lock:
+            if informer.remove(release_name, subscriber) == 0:
+                if _informers.get(key) is informer:
+                    del _informers[key]
+                informer.stop()
+
+
+@dataclass(frozen=True, eq=False)
+class _Subscriber:
+    loop: asyncio.AbstractEventLoop
+    callback: EventCallback
+
+
+class _SchedulingEventInformer:
+    """Lists then watches a namespace's FailedScheduling events in its own thread."""
+
+    def __init__(self, context_name: str | None, namespace: str) -> None:
+        self._context_name = context_name
+        self._namespace = namespace
+        self._subscribers: dict[str, list[_Subscriber]] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._response: HTTPResponse | None = None
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f"inspect-k8s-events-{namespace}",
+            daemon=True,
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        # Closing the response unblocks the thread if it's waiting for an event.
+        response = self._response
+        if response is not None:
+            response.close()
+
+    def add(self, release_name: str, subscriber: _Subscriber) -> None:
+        with self._lock:
+            self._subscribers.setdefault(release_name, []).append(subscriber)
+
+    def remove(self, release_name: str, subscriber: _Subscriber) -> int:
+        """Remove a subscriber, returning the number of subscribers remaining."""
+        with self._lock:
+            subscribers = self._subscribers.get(release_name, [])
+            if subscriber in subscribers:
+                subscribers.remove(subscriber)
+            if not subscribers:
+                self._subscribers.pop(release_name, None)
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def dispatch(self, event: dict[str, Any]) -> None:
+        name = (event.get("involvedObject") or {}).get("name") or ""
+        with self._lock:
+            subscribers = [
+                subscriber
+                for part in set(name.split("-"))
+                for subscriber in self._subscribers.get(part, ())
+            ]
+        for subscriber in subscribers:
+            # The subscriber's loop may have been closed.
+            with suppress(RuntimeError):
+                subscriber.loop.call_soon_threadsafe(subscriber.callback, event)
+
+    def _run(self) -> None:
+        resource_version: str | None = None
+        while not self._stopped.is_set():
+            try:
+                api = k8s_client(self._context_name)
+                if resource_version is None:
+                    resource_version = self._list(api)
+                resource_version = self._watch(api, resource_version)
+            except Exception as e:
+                if self._stopped.is_set():
+                    return
+                # Scheduling events are informational: never give up on them.
+                log_debug("Failed to watch scheduling events.", error=e)
+                resource_version = None
+                self._stopped.wait(_RETRY_INTERVAL_SECONDS)
+
+    def _list(self, api: client.CoreV1Api) -> str:
+        # See snapshot.read_pod for why _preload_content needs a call-arg ignore.
+        response = api.list_namespaced_event(  # type: ignore[call-arg]
+            self._namespace,
+            field_selector="reason=FailedScheduling",
+            _preload_content=False,
+        )
+        body = json.loads(cast(HTTPResponse, response).data)
+        for event in body.get("items", []):
+            self.dispatch(event)
+        return body["metadata"]["resourceVersion"]
+
+    def _watch(self, api: client.CoreV1Api, resource_version: str) -> str | None:
+        """Dispatch watch events until the watch ends or its history expires.
+
+        Returns:
+            The last resourceVersion seen, or None if the events must be re-listed.
+        """
+        # Consume the raw event stream for the reasons given in _readiness._watch.
+        response = cast(
+            HTTPResponse,
+            api.list_namespaced_event(  # type: ignore[call-arg]
+                self._namespace,
+                field_selector="reason=FailedScheduling",
+                watch=True,
+                allow_watch_bookmarks=True,
+                resource_version=resource_version,
+                timeout_seconds=_MAX_WATCH_SECONDS,
+                _preload_content=False,
+            ),
+        )
+        self._response = response
+        try:
+            if self._stopped.is_set():
+                return resource_version
+            for line in iter_resp_lines(response):
+                if not line:
+                    continue
+                event = json.loads(line)
+                obj = event["object"]
+                if event["type"] == "ERROR":
+                    if obj.get("code") == _HTTP_GONE:
+                        log_trace("Scheduling event watch expired; re-listing.")
+                        return None
+                    raise ApiException(
+                        status=obj.get("code"), reason=obj.get("message")
+                    )
+                resource_version = obj["metadata"]["resourceVersion"]
+                if event["type"] in ("ADDED", "MODIFIED"):
+                    self.dispatch(obj)
+        finally:
+            self._response = None
+            response.close()
+            response.release_conn()
+        return resource_version
@@ -2,10 +2,13 @@ from __future__ import annotations
 
 import asyncio
 import functools
+import hashlib
+import json
 import logging
 import os
 import re
 import sys
+from collections import OrderedDict
 from contextlib import contextmanager, suppress
 from pathlib import Path
 from typing import Any, AsyncContextManager, Generator, Literal, NoReturn, Protocol
@@ -14,7 +17,17 @@ from inspect_ai.util import ExecResult, concurrency
 from kubernetes.client.exceptions import ApiException  # type: ignore
 from shortuuid import uuid
 
+from k8s_sandbox._adaptive import adaptive_concurrency, record_overload
+from k8s_sandbox._apply import (
+    RELEASE_NAME_PLACEHOLDER,
+    applied_kinds,
+    apply_objects,
+    delete_objects,
+    parse_manifest,
+)
+from k8s_sandbox._cleanup import RELEASE_LABEL
 from k8s_sandbox._diagnostics import describe_release_pods
+from k8s_sandbox._events import subscribe_to_scheduling_events
 from k8s_sandbox._kubernetes_api import get_default_namespace, k8s_client
 from k8s_sandbox._logger import (
     format_log_message,
@@ -23,16 +36,32 @@ from k8s_sandbox._logger import (
     log_trace,
 )
 from k8s_sandbox._pod import Pod
-from k8s_sandbox._pod.snapshot import list_pods
+from k8s_sandbox._pod.cache import pod_cache
+from k8s_sandbox._pod.snapshot import PodSnapshot, list_pods
+from k8s_sandbox._readiness import (
+    PodFailedError,
+    readiness_watch_enabled,
+    wait_for_release_ready,
+)
 
 DEFAULT_CHART = Path(__file__).parent / "resources" / "helm" / "agent-env"
 DEFAULT_TIMEOUT = 600  # 10 minutes
 MAX_INSTALL_ATTEMPTS = 3
-_SCHEDULING_POLL_INTERVAL = 10  # seconds between k8s event polls during helm install
 INSTALL_RETRY_DELAY_SECONDS = 5
 INSPECT_HELM_TIMEOUT = "INSPECT_HELM_TIMEOUT"
 INSPECT_HELM_LABELS = "INSPECT_HELM_LABELS"
 INSPECT_SANDBOX_COREDNS_IMAGE = "INSPECT_SANDBOX_COREDNS_IMAGE"
+INSPECT_HELM_ADAPTIVE_CONCURRENCY = "INSPECT_HELM_ADAPTIVE_CONCURRENCY"
+INSPECT_HELM_ADAPTIVE_MIN = "INSPECT_HELM_ADAPTIVE_MIN"
+INSPECT_HELM_ADAPTIVE_MAX = "INSPECT_HELM_ADAPTIVE_MAX"
+# The number of rendered manifests kept for the "apply" install engine. Releases with
+# distinct configs (e.g. per-sample metadata values) each need their own render.
+_MAX_RENDERED_MANIFESTS = 128
+_RESOURCE_QUOTA_MODIFIED_PATTERN = (
+    r"Operation cannot be fulfilled on resourcequotas \".*\": the object has "
+    r"been modified; please apply your changes to the latest version and try "
+    r"again"
+)
 HELM_CONTEXT_DEADLINE_EXCEEDED_URL = (
     "https://k8s-sandbox.aisi.org.uk/tips/troubleshooting/"
     "#helm-context-deadline-exceeded"
@@ -40,6 +69,10 @@ HELM_CONTEXT_DEADLINE_EXCEEDED_URL = (
 
 logger = logging.getLogger(__name__)
 
+# Keyed by Release.config_digest(). Tasks rather than strings so that concurrent
+# samples share a single in-flight `helm template` call.
+_rendered_manifests: OrderedDict[str, asyncio.Task[str]] = OrderedDict()
+
 
 def _get_helm_major_version() -> int | None:
     """Return the major version of the installed Helm CLI, or None on failure."""
@@ -181,6 +214,7 @@ class Release:
         restarted_container_behavior: Literal["warn", "raise"] = "warn",
         sample_uuid: str | None = None,
         extra_values: dict[str, str] | None = None,
+        install_engine: Literal["helm", "apply"] = "helm",
     ) -> None:
         self.task_name = task_name
         self._chart_path = chart_path or DEFAULT_CHART
@@ -192,6 +226,10 @@ class Release:
         self.restarted_container_behavior = restarted_container_behavior
         self.sample_uuid = sample_uuid
         self._extra_values = dict(extra_values) if extra_values else {}
+        self.install_engine = install_engine
+        self._config_digest: str | None = None
+        # The kinds of object created by the "apply" install engine, for uninstall.
+        self._applied_kinds: list[tuple[str, str]] = []
 
     @property
     def namespace(self) -> str:
@@ -204,6 +242,46 @@ class Release:
     def _generate_release_name(self) -> str:
         return uuid().lower()[:8]
 
+    def config_digest(self) -> str:
+        """A digest of everything which determines what this release installs.
+
+        Two releases with the same digest install identical resources (other than their
+        release name and sample UUID label), so one can stand in for the other. The
+        values file is resolved and hashed by content rather than by path.
+        """
+        if self._config_digest is None:
+            with self._values_source.values_file() as values:
+                values_bytes = values.read_bytes() if values else b""
+            identity = json.dumps(
+                [
+                    self.task_name,
+                    str(self._chart_path),
+                    self._context_name,
+                    self._namespace,
+                    sorted(self._extra_values.items()),
+                    self.install_engine,
+                ]
+            )
+            digest = hashlib.sha256(identity.encode())
+            digest.update(values_bytes)
+            self._config_digest = digest.hexdigest()
+        return self._config_digest
+
+    def clone(self) -> Release:
+        """Create an uninstalled copy of this release with a new release name.
+
+        The sample UUID is not copied as the clone is not yet associated with a sample.
+        """
+        return Release(
+            self.task_name,
+            self._chart_path,
+            self._values_source,
+            self._context_name,
+            self.restarted_container_behavior,
+            extra_values=self._extra_values,
+            install_engine=self.install_engine,
+        )
+
     async def install(self) -> None:
         try:
             async with _install_semaphore():
@@ -222,6 +300,9 @@ class Release:
                                 await self._install(values, upgrade=attempt > 1)
                                 break
                             except _ResourceQuotaModifiedError:
+                                record_overload(
+                                    "helm-install", "resourcequota conflict"
+                                )
                                 if attempt >= MAX_INSTALL_ATTEMPTS:
                                     raise
                                 attempt += 1
@@ -238,24 +319,16 @@ class Release:
             raise
 
     async def uninstall(self, quiet: bool) -> None:
+        if self.install_engine == "apply":
+            await self._uninstall_applied(quiet)
+            return
         await uninstall(self.release_name, self._namespace, self._context_name, quiet)
 
     async def get_sandbox_pods(self) -> dict[str, Pod]:
-        client = k8s_client(self._context_name)
-        loop = asyncio.get_running_loop()
-        try:
-            pods = await loop.run_in_executor(
-                None,
-                lambda: list_pods(
-                    client,
-                    self._namespace,
-                    label_selector=f"app.kubernetes.io/instance={self.release_name}",
-                ),
-            )
-        except ApiException as e:
-            _raise_runtime_error(
-                "Failed to list pods.", release=self.release_name, from_exception=e
-            )
+        cache = pod_cache(self._context_name, self._namespace)
+        pods = cache.release_pods(self.release_name) if cache is not None else None
+        if pods is None:
+            pods = await self._list_pods()
         if not pods:
             _raise_runtime_error("No pods found.", release=self.release_name)
         sandboxes = dict()
@@ -277,10 +350,15 @@ class Release:
         return sandboxes
 
     async def _install(self, values: Path | None, upgrade: bool) -> None:
+        if self.install_engine == "apply":
+            await self._install_applied(values)
+            return
         # Whilst `upgrade --install` could always be used, prefer explicitly using
         # `install` for the first attempt.
         subcommand = ["upgrade", "--install"] if upgrade else ["install"]
         values_args = ["--values", str(values)] if values else []
+        # When watching for readiness, Helm only needs to create the resources.
+        watch_readiness = readiness_watch_enabled()
         watcher = asyncio.create_task(self._watch_for_scheduling_events())
         try:
             result = await _run_subprocess(
@@ -290,34 +368,27 @@ class Release:
                     self.release_name,
                     str(self._chart_path),
                     f"--namespace={self._namespace}",
-                    *(
-                        ["--create-namespace"]
-                        if os.getenv("INSPECT_HELM_CREATE_NAMESPACE", "false").lower()
-                        in {"1", "true", "yes", "y"}
-                        else []
-                    ),
-                    _get_wait_flag(),
+                    *(["--create-namespace"] if _create_namespace() else []),
+                    *([] if watch_readiness else [_get_wait_flag()]),
                     f"--timeout={_get_timeout()}s",
-                    # Annotation do not have strict length reqs. Quoting/escaping
-                    # handled by asyncio.create_subprocess_exec.
-                    f"--set=annotations.inspectTaskName={self.task_name}",
                     # Include a label to identify releases created by Inspect.
                     _labels_arg(),
+                    # Label the release's objects so that they can be deleted in bulk.
+                    "--set-string=labels.inspectSandbox=true",
+                    f"--set-string=labels.{RELEASE_LABEL}={self.release_name}",
                 ]
                 + (
                     [f"--set=labels.inspectSampleUUID={self.sample_uuid}"]
                     if self.sample_uuid
                     else []
                 )
-                + _coredns_image_args()
-                + [
-                    f"--set-string={_helm_escape(k)}={_helm_escape(v)}"
-                    for k, v in self._extra_values.items()
-                ]
+                + self._set_args()
                 + _kubeconfig_context_args(self._context_name)
                 + values_args,
                 capture_output=True,
             )
+            if result.success and watch_readiness:
+                await self._wait_until_ready()
         finally:
             watcher.cancel()
             # Watcher is best-effort; never let its exceptions mask Helm output.
@@ -328,69 +399,176 @@ class Release:
         if not result.success:
             await self._raise_install_error(result)
 
-    async def _watch_for_scheduling_events(self) -> None:
-        """Poll for FailedScheduling events and log once if GPU provisioning is needed.
+    def _set_args(self) -> list[str]:
+        """The --set arguments which are common to every sample's release."""
+        return (
+            [
+                # Annotation do not have strict length reqs. Quoting/escaping
+                # handled by asyncio.create_subprocess_exec.
+                f"--set=annotations.inspectTaskName={self.task_name}",
+            ]
+            + _coredns_image_args()
+            + [
+                f"--set-string={_helm_escape(k)}={_helm_escape(v)}"
+                for k, v in self._extra_values.items()
+            ]
+        )
 
-        Runs concurrently with the helm install subprocess. Degrades silently if the
-        k8s API is unavailable — it must never cause an install to fail.
-        """
+    async def _install_applied(self, values: Path | None) -> None:
+        manifest = await self._rendered_manifest(values)
+        labels = {"inspectSandbox": "true", RELEASE_LABEL: self.release_name}
+        if self.sample_uuid:
+            labels["inspectSampleUUID"] = self.sample_uuid
+        objects = parse_manifest(manifest, self.release_name, labels)
+        self._applied_kinds = applied_kinds(objects)
+        if _create_namespace():
+            namespace = {
+                "apiVersion": "v1",
+                "kind": "Namespace",
+                "metadata": {"name": self._namespace},
+            }
+            objects = [namespace, *objects]
+        watcher = asyncio.create_task(self._watch_for_scheduling_events())
+        try:
+            try:
+                await apply_objects(self._context_name, self._namespace, objects)
+            except ApiException as e:
+                if re.search(_RESOURCE_QUOTA_MODIFIED_PATTERN, str(e.body)):
+                    log_trace(
+                        "resourcequota modified error whilst applying manifest.",
+                        release=self.release_name,
+                        error=e.body,
+                    )
+                    raise _ResourceQuotaModifiedError(e.body) from e
+                _raise_runtime_error(
+                    "Failed to apply manifest.",
+                    release=self.release_name,
+                    from_exception=e,
+                    **await self._pod_diagnostics(),
+                )
+            await self._wait_until_ready()
+        finally:
+            watcher.cancel()
+            with suppress(Exception, asyncio.CancelledError):
+                await watcher
+
+    async def _list_pods(self) -> list[PodSnapshot]:
+        client = k8s_client(self._context_name)
         loop = asyncio.get_running_loop()
         try:
-            k8s = k8s_client(self._context_name)
-        except Exception as e:
-            log_debug(
-                "Could not initialise k8s client for scheduling watcher.", error=e
+            return await loop.run_in_executor(
+                None,
+                lambda: list_pods(
+                    client,
+                    self._namespace,
+                    label_selector=f"app.kubernetes.io/instance={self.release_name}",
+                ),
             )
-            return
-        logged = False
+        except ApiException as e:
+            _raise_runtime_error(
+                "Failed to list pods.", release=self.release_name, from_exception=e
+            )
+
+    async def _wait_until_ready(self) -> None:
+        """Watch the release's pods until they're ready, in place of Helm's --wait."""
         try:
-            while not logged:
-                await asyncio.sleep(_SCHEDULING_POLL_INTERVAL)
-                try:
-                    events = await loop.run_in_executor(
-                        None,
-                        lambda: k8s.list_namespaced_event(
-                            self._namespace,
-                            field_selector="reason=FailedScheduling",
-                        ),
-                    )
-                except Exception as e:
-                    log_debug("Failed to poll scheduling events.", error=e)
-                    return
-                for event in events.items:
-                    obj = event.involved_object
-                    if obj.name and self.release_name in obj.name:
-                        msg = event.message or ""
-                        if "nvidia.com/gpu" in msg:
-                            logger.warning(
-                                f"K8s: No GPU node is currently available for Helm "
-                                f"release '{self.release_name}'. A new GPU node may be "
-                                f"provisioning — this can take several minutes."
-                            )
-                            logged = True
-                            break
-        except asyncio.CancelledError:
-            pass
+            await wait_for_release_ready(
+                self._context_name, self._namespace, self.release_name, _get_timeout()
+            )
+        except PodFailedError as e:
+            _raise_runtime_error(
+                "A sandbox pod failed to start.",
+                release=self.release_name,
+                reason=str(e),
+                **await self._pod_diagnostics(),
+            )
+        except TimeoutError as e:
+            _raise_runtime_error(
+                f"Release did not become ready within the configured timeout of "
+                f"{_get_timeout()}s. Please see the docs for why this might occur: "
+                f"{HELM_CONTEXT_DEADLINE_EXCEEDED_URL}. Also consider increasing the "
+                f"timeout by setting the {INSPECT_HELM_TIMEOUT} environment variable.",
+                release=self.release_name,
+                reason=str(e),
+                **await self._pod_diagnostics(),
+            )
+        except ApiException as e:
+            _raise_runtime_error(
+                "Failed to watch the release's pods.",
+                release=self.release_name,
+                from_exception=e,
+            )
 
-    async def _raise_install_error(self, result: ExecResult[str]) -> NoReturn:
-        # When concurrent helm operations are modifying the same resource quota, the
-        # following error occasionally occurs. Retry.
-        if re.search(
-            r"Operation cannot be fulfilled on resourcequotas \".*\": the object has "
-            r"been modified; please apply your changes to the latest version and try "
-            r"again",
-            result.stderr,
+    async def _rendered_manifest(self, values: Path | None) -> str:
+        """Render the chart for this release's config, once per distinct config.
+
+        The chart is rendered with a placeholder release name and without a sample
+        UUID, so that the render can be shared by every release with the same config.
+        """
+        key = self.config_digest()
+        render = _rendered_manifests.get(key)
+        if render is None or render.get_loop() is not asyncio.get_running_loop():
+            render = asyncio.create_task(self._render(values))
+            _rendered_manifests[key] = render
+            while len(_rendered_manifests) > _MAX_RENDERED_MANIFESTS:
+                _rendered_manifests.popitem(last=False)
+        else:
+            _rendered_manifests.move_to_end(key)
+        try:
+            # Shield the shared render from the cancellation of any one sample.
+            return await asyncio.shield(render)
+        except Exception:
+            # Don't cache failures; let a later release try again.
+            if _rendered_manifests.get(key) is render:
+                del _rendered_manifests[key]
+            raise
+
+    async def _render(self, values: Path | None) -> str:
+        values_args = ["--values", str(values)] if values else []
+        with inspect_trace_action(
+            "K8s render Helm chart",
+            chart=self._chart_path,
+            values=values,
+            namespace=self._namespace,
+            task=self.task_name,
         ):
-            log_trace(
-                "resourcequota modified error whilst installing helm chart.",
-                release=self.release_name,
-                error=result.stderr,
+            result = await _run_subprocess(
+                "helm",
+                [
+                    "template",
+                    RELEASE_NAME_PLACEHOLDER,
+                    str(self._chart_path),
+                    f"--namespace={self._namespace}",
+                    # Hooks and tests rely on Helm managing the release lifecycle.
+                    "--no-hooks",
+                    "--skip-tests",
+                ]
+                + self._set_args()
+                + _kubeconfig_context_args(self._context_name)
+                + values_args,
+                capture_output=True,
             )
-            raise _ResourceQuotaModifiedError(result.stderr)
+        if not result.success:
+            _raise_runtime_error("Helm template failed.", result=result)
+        return result.stdout
+
+    async def _uninstall_applied(self, quiet: bool) -> None:
+        # If the install was cancelled before its manifest was parsed, no kinds are
+        # recorded and a fixed set of kinds is deleted instead.
+        await uninstall_applied(
+            self.release_name,
+            self._namespace,
+            self._context_name,
+            quiet,
+            kinds=self._applied_kinds,
+        )
+
+    async def _pod_diagnostics(self) -> dict[str, Any]:
+        """Describe the release's pods, for inclusion in an install error."""
         # Helm only reports the generic symptom (e.g. a pod not becoming ready). Read
-        # the pods' container states so the concrete cause (ImagePullBackOff, OOMKilled,
-        # FailedScheduling, ...) is surfaced. Best-effort: None if it can't be gathered.
-        # The Kubernetes client is synchronous, so run it in a thread (as
+        # the pods' container states so the concrete cause (ImagePullBackOff,
+        # OOMKilled, FailedScheduling, ...) is surfaced. Best-effort: empty if it can't
+        # be gathered. The Kubernetes client is synchronous, so run it in a thread (as
         # get_sandbox_pods and the scheduling watcher do) to avoid blocking the loop.
         loop = asyncio.get_running_loop()
         diagnostics = await loop.run_in_executor(
@@ -399,7 +577,48 @@ class Release:
                 self._context_name, self._namespace, self.release_name
             ),
         )
-        extra: dict[str, Any] = {"pod_diagnostics": diagnostics} if diagnostics else {}
+        return {"pod_diagnostics": diagnostics} if diagnostics else {}
+
+    async def _watch_for_scheduling_events(self) -> None:
+        """Log once if FailedScheduling events show that GPU provisioning is needed.
+
+        Runs concurrently with the install. Events come from a watch which is shared
+        by every install in the namespace. Degrades silently if the k8s API is
+        unavailable — it must never cause an install to fail.
+        """
+        gpu_unavailable = asyncio.Event()
+
+        def on_event(event: dict[str, Any]) -> None:
+            if "nvidia.com/gpu" in (event.get("message") or ""):
+                gpu_unavailable.set()
+
+        try:
+            with subscribe_to_scheduling_events(
+                self._context_name, self._namespace, self.release_name, on_event
+            ):
+                await gpu_unavailable.wait()
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            log_debug("Failed to watch scheduling events.", error=e)
+            return
+        logger.warning(
+            f"K8s: No GPU node is currently available for Helm "
+            f"release '{self.release_name}'. A new GPU node may be "
+            f"provisioning — this can take several minutes."
+        )
+
+    async def _raise_install_error(self, result: ExecResult[str]) -> NoReturn:
+        # When concurrent helm operations are modifying the same resource quota, the
+        # following error occasionally occurs. Retry.
+        if re.search(_RESOURCE_QUOTA_MODIFIED_PATTERN, result.stderr):
+            log_trace(
+                "resourcequota modified error whilst installing helm chart.",
+                release=self.release_name,
+                error=result.stderr,
+            )
+            raise _ResourceQuotaModifiedError(result.stderr)
+        extra = await self._pod_diagnostics()
         if re.search(r"context deadline exceeded", result.stderr):
             _raise_runtime_error(
                 f"Helm install timed out (context deadline exceeded). The configured "
@@ -475,6 +694,46 @@ async def uninstall(
                 )
 
 
+async def uninstall_applied(
+    release_name: str,
+    namespace: str,
+    context_name: str | None,
+    quiet: bool,
+    kinds: list[tuple[str, str]] | None = None,
+) -> None:
+    """
+    Uninstall a release which was installed by the "apply" install engine.
+
+    The number of concurrent uninstall operations is limited by a semaphore.
+
+    Args:
+        release_name: The name of the release to uninstall (e.g. abcdefgh).
+        namespace: The Kubernetes namespace in which the release is installed.
+        context_name: The kubeconfig context in which the release is installed. If
+          None, the current context is used.
+        quiet: If False, write a line to stdout once the release is uninstalled.
+        kinds: The (apiVersion, kind) pairs which were applied. If None or empty, a
+          fixed set of common kinds is deleted by the `inspectRelease` label.
+    """
+    async with _uninstall_semaphore():
+        with inspect_trace_action(
+            "K8s delete applied release", release=release_name, namespace=namespace
+        ):
+            try:
+                await delete_objects(
+                    context_name, namespace, release_name, kinds, _get_timeout()
+                )
+            except (ApiException, TimeoutError) as e:
+                _raise_runtime_error(
+                    "Failed to delete release objects.",
+                    release=release_name,
+                    namespace=namespace,
+                    from_exception=e,
+                )
+    if not quiet:
+        sys.stdout.write(f'release "{release_name}" uninstalled\n')
+
+
 async def get_all_release_names(namespace: str, context_name: str | None) -> list[str]:
     result = await _run_subprocess(
         "helm",
@@ -566,15 +825,36 @@ def _install_semaphore() -> AsyncContextManager[object]:
     # to be released by the "uninstall" operations.
     # Use Inspect's concurrency function as this ensures each asyncio.Semaphore is
     # unique per event loop.
-    return concurrency("helm-install", _get_environ_int("INSPECT_MAX_HELM_INSTALL", 8))
+    return _semaphore("helm-install", _get_environ_int("INSPECT_MAX_HELM_INSTALL", 8))
 
 
 def _uninstall_semaphore() -> AsyncContextManager[object]:
-    return concurrency(
+    return _semaphore(
         "helm-uninstall", _get_environ_int("INSPECT_MAX_HELM_UNINSTALL", 8)
     )
 
 
+def _semaphore(name: str, limit: int) -> AsyncContextManager[object]:
+    if not _adaptive_concurrency_enabled():
+        return concurrency(name, limit)
+    # The configured limit is the starting point from which the limit adapts.
+    return adaptive_concurrency(
+        name,
+        initial=limit,
+        minimum=_get_environ_int(INSPECT_HELM_ADAPTIVE_MIN, 1),
+        maximum=_get_environ_int(INSPECT_HELM_ADAPTIVE_MAX, 64),
+    ).permit()
+
+
+def _adaptive_concurrency_enabled() -> bool:
+    return os.getenv(INSPECT_HELM_ADAPTIVE_CONCURRENCY, "false").lower() in {
+        "1",
+        "true",
+        "yes",
+        "y",
+    }
+
+
 def _get_environ_int(name: str, default: int) -> int:
     try:
         return int(os.environ[name])
@@ -608,6 +888,15 @@ def _labels_arg() -> str:
     return f"--labels={labels}"
 
 
+def _create_namespace() -> bool:
+    return os.getenv("INSPECT_HELM_CREATE_NAMESPACE", "false").lower() in {
+        "1",
+        "true",
+        "yes",
+        "y",
+    }
+
+
 def _coredns_image_args() -> list[str]:
     """Formats --set argument for coredns image override if configured via env var."""
     image = os.getenv(INSPECT_SANDBOX_COREDNS_IMAGE)
@@ -11,6 +11,7 @@ from kubernetes import client, config  # type: ignore
 from kubernetes.config import (  # type: ignore
     ConfigException,
 )
+from kubernetes.dynamic import DynamicClient  # type: ignore
 
 logger = logging.getLogger(__name__)
 
@@ -58,6 +59,25 @@ def k8s_client(context_name: str | None) -> client.CoreV1Api:
     return _thread_local.client_factory.get_client(context_name)
 
 
+def k8s_dynamic_client(context_name: str | None) -> DynamicClient:
+    """
+    Get a thread-local dynamic Kubernetes client for the specified context.
+
+    The dynamic client wraps the same ApiClient as k8s_client(), so it shares its
+    connection pool and is recreated whenever that client is refreshed. Like
+    k8s_client(), it must not be used simultaneously from multiple threads.
+    """
+    api_client = k8s_client(context_name).api_client  # type: ignore[attr-defined]
+    if not hasattr(_thread_local, "dynamic_clients"):
+        _thread_local.dynamic_clients = {}
+    dynamic_clients: dict[str | None, DynamicClient] = _thread_local.dynamic_clients
+    dynamic_client = dynamic_clients.get(context_name)
+    if dynamic_client is None or dynamic_client.client is not api_client:
+        dynamic_client = DynamicClient(api_client)
+        dynamic_clients[context_name] = dynamic_client
+    return dynamic_client
+
+
 def get_default_namespace(context_name: str | None) -> str:
     """
     Get the default namespace for the specified kubeconfig context name.
@@ -1,7 +1,10 @@
 from __future__ import annotations
 
 import asyncio
+import contextvars
+import itertools
 import logging
+import os
 from contextvars import ContextVar
 
 from rich import box, print
@@ -9,9 +12,21 @@ from rich.panel import Panel
 from rich.prompt import Confirm
 from rich.table import Table
 
-from k8s_sandbox._helm import Release, get_all_release_names
+from k8s_sandbox._apply import find_applied_releases
+from k8s_sandbox._cleanup import bulk_cleanup_enabled, bulk_uninstall
+from k8s_sandbox._helm import (
+    Release,
+    _get_environ_int,
+    _get_timeout,
+    get_all_release_names,
+    uninstall_applied,
+)
 from k8s_sandbox._helm import uninstall as helm_uninstall
 from k8s_sandbox._kubernetes_api import get_current_context_name, get_default_namespace
+from k8s_sandbox._logger import log_trace
+
+INSPECT_HELM_WARM_POOL_SIZE = "INSPECT_HELM_WARM_POOL_SIZE"
+INSPECT_HELM_BACKGROUND_UNINSTALL = "INSPECT_HELM_BACKGROUND_UNINSTALL"
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +42,18 @@ class HelmReleaseManager:
 
     def __init__(self) -> None:
         self._installed_releases: list[Release] = []
+        pool_size = _get_environ_int(INSPECT_HELM_WARM_POOL_SIZE, 0)
+        if pool_size < 0:
+            raise ValueError(
+                f"{INSPECT_HELM_WARM_POOL_SIZE} must be a non-negative int: "
+                f"'{pool_size}'."
+            )
+        self._pool = WarmReleasePool(pool_size) if pool_size > 0 else None
+        self._reaper = (
+            ReleaseReaper(_get_environ_int("INSPECT_MAX_HELM_UNINSTALL", 8))
+            if _background_uninstall_enabled()
+            else None
+        )
 
     @classmethod
     def get_instance(cls) -> HelmReleaseManager:
@@ -38,25 +65,50 @@ class HelmReleaseManager:
             cls._context_var.set(manager)
             return manager
 
-    async def install(self, release: Release) -> None:
+    async def install(self, release: Release) -> Release:
         """
         Installs a release and tracks it for eventual cleanup.
 
+        If the warm pool is enabled and holds a ready release with the same
+        configuration, that release is handed out instead and `release` is not
+        installed.
+
         Args:
           release (Release): The release to install and track.
+
+        Returns:
+          Release: The release which is now installed on behalf of the caller.
         """
+        if self._pool is not None:
+            warm = self._pool.acquire(release)
+            if warm is not None:
+                self._installed_releases.append(warm)
+                return warm
         # Track the release regardless of the install result.
         self._installed_releases.append(release)
         await release.install()
+        return release
 
-    async def uninstall(self, release: Release, quiet: bool) -> None:
+    async def uninstall(
+        self, release: Release, quiet: bool, pod_count: int = 1
+    ) -> None:
         """
         Uninstalls a release managed by this instance.
 
+        If background uninstalls are enabled, the release is queued for uninstallation
+        and this method returns immediately. Failures are reported by
+        `uninstall_all()`.
+
         Args:
           release (Release): The release to uninstall.
           quiet (bool): If True, suppress output to the console.
+          pod_count (int): The number of Pods in the release. Larger releases are
+            uninstalled first when uninstalling in the background.
         """
+        if self._reaper is not None:
+            self._installed_releases.remove(release)
+            self._reaper.enqueue(release, pod_count)
+            return
         await release.uninstall(quiet)
         self._installed_releases.remove(release)
 
@@ -67,8 +119,16 @@ class HelmReleaseManager:
 
         Args:
           print_only (bool): If True, print cleanup instructions without actually
-            uninstalling anything.
+            uninstalling anything. Idle releases in the warm pool are uninstalled
+            regardless as no sample ever used them.
         """
+        if self._pool is not None:
+            await self._pool.drain()
+        if self._reaper is not None:
+            # Samples asked for these releases to be uninstalled, so do so regardless
+            # of print_only.
+            for release, error in await self._reaper.drain():
+                _log_uninstall_failure(release, error)
         if len(self._installed_releases) == 0:
             return
         if print_only:
@@ -76,26 +136,19 @@ class HelmReleaseManager:
             return
         _print_do_not_interrupt()
         releases = list(self._installed_releases)
-        tasks = [release.uninstall(quiet=False) for release in releases]
         # Clear the list before awaiting the tasks to prevent other calls to this method
         # from interfering.
         self._installed_releases.clear()
+        if bulk_cleanup_enabled():
+            releases = await _uninstall_in_bulk(releases)
+        tasks = [release.uninstall(quiet=False) for release in releases]
         results = await asyncio.gather(*tasks, return_exceptions=True)
         # An uninstall which raises here is not retried and the release has already
         # been dropped from tracking, so it would otherwise be left installed with no
         # record of it anywhere. Name it and say how to remove it.
         for release, result in zip(releases, results):
             if isinstance(result, BaseException):
-                logger.error(
-                    "Failed to uninstall Helm release '%s' in namespace '%s'. It is "
-                    "still installed in the cluster and will not be retried. Remove it "
-                    "with: inspect sandbox cleanup k8s %s%s",
-                    release.release_name,
-                    release.namespace,
-                    release.release_name,
-                    _cleanup_context_hint(release.context_name),
-                    exc_info=result,
-                )
+                _log_uninstall_failure(release, result)
 
     def _print_cleanup_instructions(self) -> None:
         _print_release_cleanup_table(
@@ -108,19 +161,191 @@ class HelmReleaseManager:
         )
 
 
+class WarmReleasePool:
+    """
+    A pool of pre-installed Helm releases which are handed out to samples.
+
+    Releases are keyed by `Release.config_digest()` so that a sample only ever receives
+    a release identical to the one it would have installed itself (other than its name
+    and the sample UUID label, which pooled releases do not have). A sample which
+    misses the pool installs its own release as normal.
+
+    Each time a release is requested, the pool for that configuration is topped back
+    up to `size` ready releases in the background. Background installs go through
+    `Release.install()` so they share the `helm-install` concurrency limit with
+    samples.
+
+    Each instance of this class is owned by a HelmReleaseManager and is therefore
+    scoped to a single task.
+    """
+
+    def __init__(self, size: int) -> None:
+        self._size = size
+        self._ready: dict[str, list[Release]] = {}
+        self._filling: dict[str, set[asyncio.Task[None]]] = {}
+        # Background installs are started from within samples; run them in the
+        # context which created the pool (the task's) so that they are not attributed
+        # to whichever sample happened to trigger the refill.
+        self._context = contextvars.copy_context()
+
+    def acquire(self, release: Release) -> Release | None:
+        """
+        Takes a ready release with the same configuration as `release`, if any.
+
+        Whether or not one is available, a background refill is started.
+
+        Args:
+          release (Release): The (uninstalled) release the caller would otherwise
+            install. It is used as the template for any background installs.
+
+        Returns:
+          Release | None: A ready release, or None if the pool had none.
+        """
+        key = release.config_digest()
+        ready = self._ready.setdefault(key, [])
+        warm = ready.pop(0) if ready else None
+        self._refill(key, release)
+        if warm is None:
+            log_trace("Warm pool miss.", key=key)
+            return None
+        log_trace("Warm pool hit.", key=key, release=warm.release_name)
+        warm.sample_uuid = release.sample_uuid
+        warm.restarted_container_behavior = release.restarted_container_behavior
+        return warm
+
+    async def drain(self) -> None:
+        """Cancels any background installs and uninstalls the idle releases."""
+        filling = [task for tasks in self._filling.values() for task in tasks]
+        for task in filling:
+            # Release.install() uninstalls the release when it is cancelled.
+            task.cancel()
+        await asyncio.gather(*filling, return_exceptions=True)
+        idle = [release for releases in self._ready.values() for release in releases]
+        self._ready.clear()
+        self._filling.clear()
+        results = await asyncio.gather(
+            *(release.uninstall(quiet=True) for release in idle),
+            return_exceptions=True,
+        )
+        for release, result in zip(idle, results):
+            if isinstance(result, BaseException):
+                _log_uninstall_failure(release, result)
+
+    def _refill(self, key: str, template: Release) -> None:
+        filling = self._filling.setdefault(key, set())
+        missing = self._size - len(self._ready[key]) - len(filling)
+        for _ in range(missing):
+            task = self._context.run(
+                asyncio.create_task, self._install(key, template.clone())
+            )
+            filling.add(task)
+            task.add_done_callback(filling.discard)
+
+    async def _install(self, key: str, release: Release) -> None:
+        try:
+            await release.install()
+        except Exception:
+            # Not refilled here: the next sample to request this configuration will
+            # trigger another attempt, so a broken configuration cannot spin.
+            logger.warning(
+                "Failed to install warm pool Helm release '%s'.",
+                release.release_name,
+                exc_info=True,
+            )
+            try:
+                await release.uninstall(quiet=True)
+            except Exception as e:
+                _log_uninstall_failure(release, e)
+            return
+        self._ready[key].append(release)
+
+
+class ReleaseReaper:
+    """
+    Uninstalls releases in the background so that samples needn't wait for them.
+
+    `helm uninstall --wait` only returns once Kubernetes has deleted every resource in
+    the release, which can take some time. Queuing the uninstall instead frees the
+    sample's slot immediately.
+
+    A fixed number of workers take releases from a priority queue, largest (by Pod
+    count) first, so that cluster capacity is returned as quickly as possible. The
+    uninstalls still go through `Release.uninstall()` so they share the
+    `helm-uninstall` concurrency limit with all other uninstalls.
+
+    Each instance of this class is owned by a HelmReleaseManager and is therefore
+    scoped to a single task.
+    """
+
+    def __init__(self, workers: int) -> None:
+        if workers < 1:
+            raise ValueError(f"The number of uninstall workers must be >= 1: {workers}")
+        self._worker_count = workers
+        self._workers: list[asyncio.Task[None]] = []
+        # Entries are (-pod_count, sequence, release); the sequence keeps equally sized
+        # releases in FIFO order and means Releases are never compared.
+        self._queue: asyncio.PriorityQueue[tuple[int, int, Release]] = (
+            asyncio.PriorityQueue()
+        )
+        self._sequence = itertools.count()
+        self._failures: list[tuple[Release, BaseException]] = []
+        # Workers are started from within samples; run them in the context which
+        # created the reaper (the task's) so that they outlive the sample.
+        self._context = contextvars.copy_context()
+
+    def enqueue(self, release: Release, pod_count: int) -> None:
+        """Queues a release for uninstallation, starting the workers if necessary."""
+        log_trace(
+            "Queued release for background uninstall.",
+            release=release.release_name,
+            pod_count=pod_count,
+        )
+        self._queue.put_nowait((-pod_count, next(self._sequence), release))
+        while len(self._workers) < self._worker_count:
+            self._workers.append(self._context.run(asyncio.create_task, self._work()))
+
+    async def drain(self) -> list[tuple[Release, BaseException]]:
+        """
+        Waits for every queued release to be uninstalled and stops the workers.
+
+        Returns:
+          list[tuple[Release, BaseException]]: The releases which failed to uninstall
+            (since the last drain) and their errors.
+        """
+        await self._queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        failures, self._failures = self._failures, []
+        return failures
+
+    async def _work(self) -> None:
+        while True:
+            _, _, release = await self._queue.get()
+            try:
+                await release.uninstall(quiet=True)
+            except Exception as e:
+                self._failures.append((release, e))
+            finally:
+                self._queue.task_done()
+
+
 async def uninstall_unmanaged_release(release_name: str) -> None:
     """
     Uninstall a Helm release which is not managed by a HelmReleaseManager.
 
     Only the current Kubernetes context (as defined by the kubeconfig file) is
-    considered.
+    considered. The release may have been installed by either install engine: any
+    objects left once the Helm release is uninstalled are deleted by label.
 
     Args:
       release_name (str): The name of the release to uninstall (e.g. "lsphdyup").
     """
     _print_do_not_interrupt()
     namespace = get_default_namespace(context_name=None)
-    await helm_uninstall(release_name, namespace, context_name=None, quiet=False)
+    await helm_uninstall(release_name, namespace, context_name=None, quiet=True)
+    await uninstall_applied(release_name, namespace, context_name=None, quiet=False)
 
 
 async def uninstall_all_unmanaged_releases() -> list[str]:
@@ -140,7 +365,14 @@ async def uninstall_all_unmanaged_releases() -> list[str]:
         print(table)
 
     namespace = get_default_namespace(context_name=None)
-    releases = await get_all_release_names(namespace, context_name=None)
+    helm_releases = await get_all_release_names(namespace, context_name=None)
+    # Releases installed by the "apply" engine have no Helm release record.
+    applied_releases = [
+        release
+        for release in await _find_applied_releases(namespace)
+        if release not in helm_releases
+    ]
+    releases = helm_releases + applied_releases
     if len(releases) == 0:
         print(
             f"No Inspect sandbox releases found in '{namespace}' namespace in your "
@@ -155,14 +387,21 @@ async def uninstall_all_unmanaged_releases() -> list[str]:
     ):
         print("Cancelled.")
         return []
+    if bulk_cleanup_enabled():
+        helm_releases = await _bulk_uninstall_or_all(
+            helm_releases, namespace, context_name=None
+        )
     tasks = [
         helm_uninstall(release, namespace, context_name=None, quiet=False)
-        for release in releases
+        for release in helm_releases
+    ] + [
+        uninstall_applied(release, namespace, context_name=None, quiet=False)
+        for release in applied_releases
     ]
     results = await asyncio.gather(*tasks, return_exceptions=True)
     failed = [
         release
-        for release, result in zip(releases, results)
+        for release, result in zip(helm_releases + applied_releases, results)
         if isinstance(result, BaseException)
     ]
     if failed:
@@ -177,6 +416,69 @@ async def uninstall_all_unmanaged_releases() -> list[str]:
     return []
 
 
+async def _find_applied_releases(namespace: str) -> list[str]:
+    try:
+        return await find_applied_releases(None, namespace)
+    except Exception as e:
+        # Still clean up the releases which Helm knows about.
+        logger.warning(
+            "Failed to find releases installed by the apply engine.", exc_info=e
+        )
+        return []
+
+
+async def _uninstall_in_bulk(releases: list[Release]) -> list[Release]:
+    """Uninstalls what it can in bulk, returning the releases left to uninstall."""
+    groups: dict[tuple[str | None, str], dict[str, Release]] = {}
+    for release in releases:
+        group = groups.setdefault((release.context_name, release.namespace), {})
+        group[release.release_name] = release
+    remaining: list[Release] = []
+    for (context_name, namespace), group in groups.items():
+        names = await _bulk_uninstall_or_all(list(group), namespace, context_name)
+        remaining.extend(group[name] for name in names)
+    return remaining
+
+
+async def _bulk_uninstall_or_all(
+    release_names: list[str], namespace: str, context_name: str | None
+) -> list[str]:
+    """Uninstalls releases in bulk, returning the names left to uninstall."""
+    try:
+        return await bulk_uninstall(
+            release_names, namespace, context_name, _get_timeout(), quiet=False
+        )
+    except Exception as e:
+        # Anything not yet deleted will be by `helm uninstall`, which tolerates
+        # objects (or a release record) which no longer exist.
+        logger.warning(
+            "Bulk uninstall failed; uninstalling releases individually.", exc_info=e
+        )
+        return release_names
+
+
+def _background_uninstall_enabled() -> bool:
+    return os.getenv(INSPECT_HELM_BACKGROUND_UNINSTALL, "false").lower() in {
+        "1",
+        "true",
+        "yes",
+        "y",
+    }
+
+
+def _log_uninstall_failure(release: Release, error: BaseException) -> None:
+    logger.error(
+        "Failed to uninstall Helm release '%s' in namespace '%s'. It is still "
+        "installed in the cluster and will not be retried. Remove it with: "
+        "inspect sandbox cleanup k8s %s%s",
+        release.release_name,
+        release.namespace,
+        release.release_name,
+        _cleanup_context_hint(release.context_name),
+        exc_info=error,
+    )
+
+
 def _cleanup_context_hint(context_name: str | None) -> str:
     """The cleanup command uses the current kubeconfig context, not the release's."""
     if context_name is None:
@@ -4,23 +4,33 @@ class LimitedBuffer:
 
     Once the buffer is full, `truncated` is set and further appends are ignored.
 
+    Appended data is not copied: views of it are kept until the buffer is converted to
+    a string, so it must not be modified afterwards.
+
     The buffer can be converted to a string (utf-8). Invalid utf-8 bytes — including an
     incomplete trailing character left by truncation — are replaced with the unicode
     replacement character.
     """
 
     def __init__(self, limit: int) -> None:
-        self._buffer = bytearray()
+        self._chunks: list[memoryview] = []
+        self._size = 0
         self._limit = limit
         self.truncated = False
 
-    def append(self, data: bytes) -> None:
-        if self.truncated:
+    def append(self, data: bytes | memoryview) -> None:
+        if self.truncated or not data:
             return
-        remaining_space = self._limit - len(self._buffer)
-        if len(data) > remaining_space:
+        view = memoryview(data)
+        remaining_space = self._limit - self._size
+        if len(view) > remaining_space:
             self.truncated = True
-        self._buffer.extend(data[:remaining_space])
+            view = view[:remaining_space]
+        self._chunks.append(view)
+        self._size += len(view)
+
+    def __len__(self) -> int:
+        return self._size
 
     def __str__(self) -> str:
-        return self._buffer.decode("utf-8", errors="replace")
+        return b"".join(self._chunks).decode("utf-8", errors="replace")
@@ -0,0 +1,222 @@
+"""A process-wide, watch-backed cache of sandbox Pods.
+
+Every exec, read and write checks whether its Pod has restarted, which would otherwise
+cost a ``read_namespaced_pod`` round trip (and a thread pool slot) per operation. When
+enabled, a single list-then-watch per (context, namespace) of the Pods labelled
+``inspectSandbox=true`` keeps a cache which serves those checks, as well as the
+listing of a release's Pods after install and the Pod state in install diagnostics.
+
+The cache is only used whilst it is fresh: once it has been listed and whilst its
+watch has seen an event or bookmark recently. Otherwise (and for Pods which it does
+not hold, e.g. from a custom chart which does not apply the label), callers fall back
+to reading from the API server.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from typing import Any, cast
+
+from kubernetes import client  # type: ignore
+from kubernetes.client.exceptions import ApiException  # type: ignore
+from kubernetes.watch.watch import iter_resp_lines  # type: ignore
+from urllib3 import HTTPResponse
+
+from k8s_sandbox._kubernetes_api import k8s_client
+from k8s_sandbox._logger import log_debug, log_trace
+from k8s_sandbox._pod.snapshot import PodSnapshot, parse_pod
+
+INSPECT_K8S_POD_CACHE = "INSPECT_K8S_POD_CACHE"
+SANDBOX_LABEL_SELECTOR = "inspectSandbox=true"
+_INSTANCE_LABEL = "app.kubernetes.io/instance"
+# The maximum duration of a single watch request.
+_MAX_WATCH_SECONDS = 300
+# The cache is considered stale if its watch has been silent for this long. The API
+# server sends bookmarks roughly every minute, so a healthy but idle watch stays fresh.
+# A watch which is silent for this long is also abandoned (via a read timeout) and
+# re-established.
+_STALE_SECONDS = 90
+_CONNECT_TIMEOUT_SECONDS = 10
+_RETRY_INTERVAL_SECONDS = 5
+_HTTP_GONE = 410
+
+_caches: dict[tuple[str | None, str], PodCache] = {}
+_caches_lock = threading.Lock()
+
+
+def pod_cache_enabled() -> bool:
+    """Whether Pod state should be served from a watch-backed cache."""
+    return os.getenv(INSPECT_K8S_POD_CACHE, "false").lower() in {
+        "1",
+        "true",
+        "yes",
+        "y",
+    }
+
+
+def pod_cache(context_name: str | None, namespace: str) -> PodCache | None:
+    """Get the Pod cache for a namespace, starting it on first use.
+
+    Returns:
+        The cache, or None if the cache is disabled.
+    """
+    if not pod_cache_enabled():
+        return None
+    key = (context_name, namespace)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = PodCache(context_name, namespace)
+            _caches[key] = cache
+            cache.start()
+        return cache
+
+
+class PodCache:
+    """Lists then watches a namespace's sandbox Pods in a dedicated daemon thread."""
+
+    def __init__(self, context_name: str | None, namespace: str) -> None:
+        self._context_name = context_name
+        self._namespace = namespace
+        self._pods: dict[str, tuple[PodSnapshot, dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._synced = False
+        self._last_seen = float("-inf")
+        self._thread = threading.Thread(
+            target=self._run, name=f"inspect-k8s-pod-cache-{namespace}", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    @property
+    def fresh(self) -> bool:
+        return self._synced and time.monotonic() - self._last_seen < _STALE_SECONDS
+
+    def get(self, name: str) -> PodSnapshot | None:
+        """A Pod's snapshot, or None if it's not cached or the cache is stale."""
+        with self._lock:
+            if not self.fresh:
+                return None
+            entry = self._pods.get(name)
+        return entry[0] if entry else None
+
+    def release_pods(self, release_name: str) -> list[PodSnapshot] | None:
+        """The Pods of a release which has finished installing.
+
+        Returns:
+            None if the cache is stale, holds no Pods for the release or any of them
+            are not Ready. Pods are only served once they're all Ready as a release's
+            Pods are all created (and so seen by the watch) well before the last of
+            them becomes Ready.
+        """
+        entries = self._release_entries(release_name)
+        if not entries or not all(
+            snapshot.ready and not snapshot.deleting for snapshot, _ in entries
+        ):
+            return None
+        return [snapshot for snapshot, _ in entries]
+
+    def raw_release_pods(self, release_name: str) -> list[dict[str, Any]] | None:
+        """The raw Pod objects of a release, or None if there are none cached."""
+        entries = self._release_entries(release_name)
+        return [raw for _, raw in entries] if entries else None
+
+    def _release_entries(
+        self, release_name: str
+    ) -> list[tuple[PodSnapshot, dict[str, Any]]] | None:
+        with self._lock:
+            if not self.fresh:
+                return None
+            return [
+                entry
+                for entry in self._pods.values()
+                if entry[0].labels.get(_INSTANCE_LABEL) == release_name
+            ]
+
+    def _update(self, event_type: str, pod: dict[str, Any]) -> None:
+        snapshot = parse_pod(pod)
+        with self._lock:
+            if event_type == "DELETED":
+                self._pods.pop(snapshot.name, None)
+            else:
+                self._pods[snapshot.name] = (snapshot, pod)
+
+    def _run(self) -> None:
+        resource_version: str | None = None
+        while True:
+            try:
+                api = k8s_client(self._context_name)
+                if resource_version is None:
+                    resource_version = self._list(api)
+                resource_version = self._watch(api, resource_version)
+            except Exception as e:
+                log_debug("Failed to watch sandbox pods.", error=e)
+                resource_version = None
+                self._synced = False
+                time.sleep(_RETRY_INTERVAL_SECONDS)
+            if resource_version is None:
+                self._synced = False
+
+    def _list(self, api: client.CoreV1Api) -> str:
+        # See snapshot.read_pod for why _preload_content needs a call-arg ignore.
+        response = api.list_namespaced_pod(  # type: ignore[call-arg]
+            self._namespace,
+            label_selector=SANDBOX_LABEL_SELECTOR,
+            _preload_content=False,
+        )
+        body = json.loads(cast(HTTPResponse, response).data)
+        pods = {}
+        for pod in body.get("items", []):
+            snapshot = parse_pod(pod)
+            pods[snapshot.name] = (snapshot, pod)
+        with self._lock:
+            self._pods = pods
+            self._synced = True
+            self._last_seen = time.monotonic()
+        log_trace("Listed sandbox pods.", namespace=self._namespace, count=len(pods))
+        return body["metadata"]["resourceVersion"]
+
+    def _watch(self, api: client.CoreV1Api, resource_version: str) -> str | None:
+        """Apply watch events until the watch ends or its history expires.
+
+        Returns:
+            The last resourceVersion seen, or None if the Pods must be re-listed.
+        """
+        # Consume the raw event stream for the reasons given in _readiness._watch.
+        response = cast(
+            HTTPResponse,
+            api.list_namespaced_pod(  # type: ignore[call-arg]
+                self._namespace,
+                label_selector=SANDBOX_LABEL_SELECTOR,
+                watch=True,
+                allow_watch_bookmarks=True,
+                resource_version=resource_version,
+                timeout_seconds=_MAX_WATCH_SECONDS,
+                _request_timeout=(_CONNECT_TIMEOUT_SECONDS, _STALE_SECONDS),
+                _preload_content=False,
+            ),
+        )
+        try:
+            for line in iter_resp_lines(response):
+                self._last_seen = time.monotonic()
+                if not line:
+                    continue
+                event = json.loads(line)
+                obj = event["object"]
+                if event["type"] == "ERROR":
+                    if obj.get("code") == _HTTP_GONE:
+                        return None
+                    raise ApiException(
+                        status=obj.get("code"), reason=obj.get("message")
+                    )
+                resource_version = obj["metadata"]["resourceVersion"]
+                if event["type"] != "BOOKMARK":
+                    self._update(event["type"], obj)
+        finally:
+            response.close()
+            response.release_conn()
+        return resource_version
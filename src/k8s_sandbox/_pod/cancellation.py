@@ -0,0 +1,150 @@
+"""Propagation of the cancellation of pod operations into the threads running them.
+
+When a sample is cancelled (e.g. by a time limit, an error or Ctrl-C), so is the task
+awaiting each of its pod operations. A synchronous operation runs on in its
+`PodOpExecutor` thread regardless: an exec blocks on its websocket until the remote
+command exits, occupying one of the `max_pod_ops` threads all the while.
+
+So each operation queued to the executor is given a `Cancellation`, which it finds in
+its context. Whilst an operation has a websocket open, it registers a callback which
+aborts it: shutting down its socket wakes the blocked thread, which then fails and is
+released. When enabled, a cancelled command's processes are then killed too, as
+closing an exec's websocket does not stop the command it started.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import threading
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator
+
+INSPECT_K8S_KILL_ON_CANCEL = "INSPECT_K8S_KILL_ON_CANCEL"
+# The environment variable which identifies the processes of an exec, so that they can
+# be killed if it is cancelled.
+EXEC_ID_VARIABLE = "INSPECT_K8S_EXEC_ID"
+# Kills the processes with `$1` in their environment. Every process started by the
+# command inherits it (unless the command clears its environment).
+_KILL_SCRIPT = f"""\
+for dir in /proc/[0-9]*; do
+  if tr '\\0' '\\n' < "$dir/environ" 2>/dev/null | grep -qx "{EXEC_ID_VARIABLE}=$1"
+  then
+    kill -KILL "${{dir#/proc/}}" 2>/dev/null
+  fi
+done
+true
+"""
+
+_current: ContextVar[Cancellation | None] = ContextVar(
+    "k8s_sandbox_pod_op_cancellation", default=None
+)
+
+logger = logging.getLogger(__name__)
+
+
+def kill_on_cancel_enabled() -> bool:
+    """Whether the processes of cancelled execs should be killed."""
+    return os.getenv(INSPECT_K8S_KILL_ON_CANCEL, "false").lower() in {
+        "1",
+        "true",
+        "yes",
+        "y",
+    }
+
+
+class Cancellation:
+    """Whether the task awaiting a pod operation has been cancelled.
+
+    This class is thread-safe.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._callbacks: list[Callable[[], Any]] = []
+        self.cancelled = False
+
+    def bind(self) -> None:
+        """Make this the cancellation of the operations run in the current context."""
+        _current.set(self)
+
+    def cancel(self) -> None:
+        """Run the callbacks of the operation, once."""
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            _run(callback)
+
+    @contextmanager
+    def on_cancel(self, callback: Callable[[], Any]) -> Iterator[None]:
+        """Run `callback` if the operation is cancelled whilst in this context.
+
+        It is run immediately if the operation has already been cancelled.
+        """
+        with self._lock:
+            cancelled = self.cancelled
+            if not cancelled:
+                self._callbacks.append(callback)
+        if cancelled:
+            _run(callback)
+        try:
+            yield
+        finally:
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+
+
+def current_cancellation() -> Cancellation:
+    """The cancellation of the operation running in this context.
+
+    Operations which were not queued to the executor (e.g. in tests) are never
+    cancelled.
+    """
+    return _current.get() or Cancellation()
+
+
+@contextmanager
+def uncancellable() -> Iterator[None]:
+    """Run operations which must not be aborted, e.g. those which clean up after one."""
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def new_exec_id() -> str | None:
+    """An ID with which to mark an exec's processes, if they are to be killed."""
+    return uuid.uuid4().hex if kill_on_cancel_enabled() else None
+
+
+def kill_command(exec_id: str) -> list[str]:
+    """The command which kills the processes of the exec with the ID `exec_id`."""
+    return ["/bin/sh", "-c", _KILL_SCRIPT, "sh", exec_id]
+
+
+def abort_websocket(ws_client: Any) -> None:
+    """Wake a thread blocked on a `WSClient`'s socket, which then fails."""
+    sock = getattr(getattr(ws_client, "sock", None), "sock", None)
+    if sock is None:
+        return
+    try:
+        # Not `SSLSocket.shutdown`, which would unwrap TLS under the blocked thread.
+        socket.socket.shutdown(sock, socket.SHUT_RDWR)
+    except OSError:
+        # Already closed.
+        pass
+
+
+def _run(callback: Callable[[], Any]) -> None:
+    try:
+        callback()
+    except Exception:
+        logger.debug("Failed to abort a cancelled pod operation.", exc_info=True)
@@ -0,0 +1,192 @@
+"""Compression of file transfers between the client and Pods.
+
+File contents otherwise pass through the API server proxy as raw bytes, which is often
+the bottleneck for large, compressible files such as logs and datasets. When enabled,
+each Pod is probed (once) for a `zstd` or `gzip` binary. Writes are then compressed on
+the client and decompressed in the container, and reads the reverse.
+
+Only transfers of at least `COMPRESSION_THRESHOLD_BYTES` are compressed: below that,
+the cost of (de)compressing outweighs the time saved on the wire. Writes whose first
+`_SAMPLE_BYTES` do not compress well (e.g. already compressed data) are sent raw too.
+`zstd` is only used if the optional `zstandard` package is installed on the client;
+`gzip` only needs the standard library.
+
+The thresholds were tuned with test/diagnostics/compression.
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import os
+import shlex
+import zlib
+from abc import ABC, abstractmethod
+from typing import IO, Any
+
+INSPECT_K8S_COMPRESSION = "INSPECT_K8S_COMPRESSION"
+COMPRESSION_THRESHOLD_BYTES = 64 * 1024
+_SAMPLE_BYTES = 64 * 1024
+# The compressed sample must be at most this fraction of its original size.
+_MAX_SAMPLE_RATIO = 0.9
+# Lists the codecs whose binaries are available in the container, in order of
+# preference. `wc` is needed to apply the threshold to reads.
+PROBE_COMMAND = [
+    "/bin/sh",
+    "-c",
+    "command -v wc >/dev/null || exit 0; "
+    "for codec in zstd gzip; do command -v $codec >/dev/null && echo $codec; done",
+]
+# Prefixes the output of a read command, to indicate whether it was compressed.
+_RAW_MARKER = b"r"
+_COMPRESSED_MARKER = b"c"
+
+
+def compression_enabled() -> bool:
+    """Whether file transfers should be compressed when the container supports it."""
+    return os.getenv(INSPECT_K8S_COMPRESSION, "false").lower() in {
+        "1",
+        "true",
+        "yes",
+        "y",
+    }
+
+
+class Codec(ABC):
+    """A compression format supported by both the client and a container."""
+
+    @property
+    @abstractmethod
+    def name(self) -> str:
+        """The name of the container's binary."""
+
+    @abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        pass
+
+    @abstractmethod
+    def decompressor(self) -> Any:
+        """An object with `decompress(data)` and `flush()`, as returned by zlib."""
+
+    @property
+    def compress_command(self) -> str:
+        """The command which compresses stdin to stdout in the container."""
+        return f"{self.name} -c -1"
+
+    @property
+    def decompress_command(self) -> str:
+        """The command which decompresses stdin to stdout in the container."""
+        return f"{self.name} -d -c"
+
+    def worth_compressing(self, data: bytes) -> bool:
+        """Whether `data` is large and compressible enough to send compressed."""
+        if len(data) < COMPRESSION_THRESHOLD_BYTES:
+            return False
+        sample = data[:_SAMPLE_BYTES]
+        return len(self.compress(sample)) <= len(sample) * _MAX_SAMPLE_RATIO
+
+
+class _Gzip(Codec):
+    name = "gzip"
+
+    def compress(self, data: bytes) -> bytes:
+        # Level 1: higher levels compress little more, at half the speed or less.
+        compressor = zlib.compressobj(1, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompressor(self) -> Any:
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+
+class _Zstd(Codec):
+    name = "zstd"
+
+    @property
+    def decompress_command(self) -> str:
+        return "zstd -d -c -q"
+
+    @property
+    def compress_command(self) -> str:
+        return "zstd -c -q -1"
+
+    def compress(self, data: bytes) -> bytes:
+        import zstandard  # type: ignore
+
+        return zstandard.ZstdCompressor().compress(data)
+
+    def decompressor(self) -> Any:
+        import zstandard  # type: ignore
+
+        return _ZstdDecompressor(zstandard.ZstdDecompressor().decompressobj())
+
+
+class _ZstdDecompressor:
+    """Gives a zstandard decompressobj the zlib interface (it has no usable flush)."""
+
+    def __init__(self, decompressobj: Any) -> None:
+        self._decompressobj = decompressobj
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._decompressobj.decompress(data)
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def codec_from_probe(stdout: str) -> Codec | None:
+    """The preferred codec supported by both the client and the probed container."""
+    available = stdout.split()
+    if "zstd" in available and importlib.util.find_spec("zstandard") is not None:
+        return _Zstd()
+    if "gzip" in available:
+        return _Gzip()
+    return None
+
+
+def read_script(codec: Codec) -> str:
+    """A script which writes the file `$1` (limited to `$2` bytes) to stdout.
+
+    The output is prefixed with a marker which indicates whether the file was
+    compressed: files smaller than the threshold are not, and nor is the output if the
+    file couldn't be read (in which case the script fails).
+    """
+    threshold = COMPRESSION_THRESHOLD_BYTES
+    raw, compressed = _RAW_MARKER.decode(), _COMPRESSED_MARKER.decode()
+    return (
+        f'if [ "$(head -c {threshold} "$1" 2>/dev/null | wc -c)" -lt {threshold} ]; '
+        f'then printf {raw}; exec head -c "$2" "$1"; fi; '
+        f'printf {compressed}; exec {codec.compress_command} < "$1"'
+    )
+
+
+def write_command(codec: Codec | None, copy_command: str, dst: str) -> str:
+    """Pipes the output of `copy_command` to `dst`, decompressing it with `codec`."""
+    if codec is None:
+        return f"{copy_command} > {shlex.quote(dst)}"
+    return f"{copy_command} | {codec.decompress_command} > {shlex.quote(dst)}"
+
+
+class DecompressingWriter:
+    """Writes the output of a `read_script` to `dst`, decompressing it if marked so."""
+
+    def __init__(self, dst: IO[bytes], codec: Codec) -> None:
+        self._dst = dst
+        self._codec = codec
+        self._decompressor: Any = None
+        self._marked = False
+
+    def write(self, data: bytes) -> None:
+        if not self._marked and data:
+            self._marked = True
+            if data[:1] == _COMPRESSED_MARKER:
+                self._decompressor = self._codec.decompressor()
+            data = data[1:]
+        if self._decompressor is None:
+            self._dst.write(data)
+        else:
+            self._dst.write(self._decompressor.decompress(data))
+
+    def flush(self) -> None:
+        """Write any remaining output. Call once the output has been written."""
+        if self._decompressor is not None:
+            self._dst.write(self._decompressor.flush())
+        self._dst.flush()
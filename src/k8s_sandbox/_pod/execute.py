@@ -1,24 +1,112 @@
+import asyncio
 import base64
 import re
 import shlex
-from contextlib import contextmanager
-from typing import Generator
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Generator
 
 from inspect_ai.util import ExecResult, OutputLimitExceededError
 from inspect_ai.util import SandboxEnvironmentLimits as limits
-from kubernetes.stream.ws_client import WSClient  # type: ignore[import-untyped]
+from kubernetes.stream.ws_client import (  # type: ignore[import-untyped]
+    ERROR_CHANNEL,
+    STDERR_CHANNEL,
+    STDOUT_CHANNEL,
+    WSClient,
+)
+from websocket import WebSocketException  # type: ignore[import-untyped]
 
+from k8s_sandbox._deadline import unbounded
+from k8s_sandbox._logger import log_warn
 from k8s_sandbox._pod.buffer import LimitedBuffer
+from k8s_sandbox._pod.cancellation import (
+    EXEC_ID_VARIABLE,
+    abort_websocket,
+    current_cancellation,
+    kill_command,
+    new_exec_id,
+    uncancellable,
+)
 from k8s_sandbox._pod.error import ExecutableNotFoundError, PodError
-from k8s_sandbox._pod.get_returncode import get_returncode
-from k8s_sandbox._pod.op import PodOperation
+from k8s_sandbox._pod.get_returncode import get_returncode, parse_returncode
+from k8s_sandbox._pod.op import (
+    API_TIMEOUT,
+    PodInfo,
+    PodOperation,
+    expect_stdin_closable,
+)
+from k8s_sandbox._pod.session import ShellSession, ShellSessionPool
+from k8s_sandbox._pod.websocket import ExecStream
 
 COMPLETED_SENTINEL = "completed-sentinel-value"
-COMPLETED_SENTINEL_PATTERN = re.compile(rf"<{COMPLETED_SENTINEL}-(\d+)>")
+# The returncode, optionally followed by the container identity (see
+# _CONTAINER_IDENTITY_SCRIPT).
+COMPLETED_SENTINEL_PATTERN = re.compile(
+    rf"<{COMPLETED_SENTINEL}-(\d+)(?:-(\d+\.[0-9a-f-]+))?>"
+)
+_COMPLETED_SENTINEL_PREFIX = f"<{COMPLETED_SENTINEL}-".encode()
+_COMPLETED_SENTINEL_BYTES_PATTERN = re.compile(
+    COMPLETED_SENTINEL_PATTERN.pattern.encode()
+)
+# Matches the start of a completed sentinel which may continue in the next frame.
+_PARTIAL_COMPLETED_SENTINEL_PATTERN = re.compile(
+    rf"<{COMPLETED_SENTINEL}-\d*(?:-\d*(?:\.[0-9a-f-]*)?)?".encode()
+)
+# Comfortably longer than any completed sentinel (including the container identity).
+_MAX_COMPLETED_SENTINEL_LENGTH = 128
+_EMPTY_VIEW = memoryview(b"")
+# Written to stdout and stderr before a command is run in a shell session, to tell the
+# command's output from any output of earlier commands' background processes.
+STARTED_SENTINEL = "started-sentinel-value"
 EXEC_USER_URL = "https://k8s-sandbox.aisi.org.uk/design/limitations#exec-user"
+# Sets $identity to "-<start time of PID 1>.<boot ID>", or to "" if either can't be
+# read. PID 1's start time (field 22 of /proc/1/stat, in clock ticks since boot)
+# changes whenever the container's process is restarted, and the boot ID guards
+# against the start time coinciding after the node reboots. Only shell builtins are
+# used so no processes are forked. The 2nd field of /proc/1/stat (the parenthesised
+# command name) may contain spaces, so everything up to its closing parenthesis is
+# stripped before splitting the remaining fields (which begin at field 3).
+_CONTAINER_IDENTITY_SCRIPT = """\
+identity=
+if read -r stat < /proc/1/stat && read -r boot_id < /proc/sys/kernel/random/boot_id
+then
+  set -- ${stat##*") "}
+  shift 19
+  identity="-$1.$boot_id"
+fi 2>/dev/null
+"""
+# Reads a script from stdin up to a line consisting of $1 and runs it, leaving the rest
+# of stdin to the script's command. This lets the command's input follow the script
+# as raw bytes when stdin can be closed, rather than be embedded in the script. Unlike
+# a shell reading its script, `read` never consumes input beyond the current line.
+_READ_SCRIPT = """\
+script=
+while IFS= read -r line && [ "$line" != "$1" ]; do
+  script="$script$line
+"
+done
+eval "$script"
+"""
 
 
 class ExecuteOperation(PodOperation):
+    def __init__(
+        self,
+        pod: PodInfo,
+        report_container_identity: bool = False,
+        sessions: ShellSessionPool | None = None,
+    ):
+        super().__init__(pod)
+        self._report_container_identity = report_container_identity
+        self._sessions = sessions
+        self.container_identity: str | None = None
+        """The identity of the container's process, as reported by the last exec.
+
+        Only set if `report_container_identity` is True and the command ran to
+        completion. Differs between two execs if and only if the container was
+        restarted (or the pod replaced) in between.
+        """
+
     def exec(
         self,
         cmd: list[str],
@@ -28,22 +116,154 @@ class ExecuteOperation(PodOperation):
         user: str | None,
         timeout: int | None,
     ) -> ExecResult[str]:
-        shell_script = self._build_shell_script(cmd, stdin, cwd, env, timeout)
-        with self._interactive_shell(user) as ws_client:
-            # Write the script to the shell's stdin rather than passing it as a command
-            # argument (-c) to better support potentially long commands.
-            self._write_stdin_chunked(ws_client, shell_script)
-            result = self._handle_shell_output(ws_client, user, timeout)
-        return result
+        exec_id = new_exec_id()
+        with self._killed_on_cancel(exec_id):
+            if self._sessions is not None:
+                return self._exec_in_session(
+                    cmd, stdin, cwd, env, user, timeout, exec_id
+                )
+            end_of_script = self._end_of_script(stdin)
+            with self._interactive_shell(user, end_of_script) as ws_client:
+                shell_script, raw_stdin = self._script_and_stdin(
+                    cmd,
+                    stdin,
+                    cwd,
+                    env,
+                    timeout,
+                    end_of_script,
+                    self._can_close_stdin(ws_client),
+                    exec_id,
+                )
+                # Write the script to the shell's stdin rather than passing it as a
+                # command argument (-c) to better support potentially long commands.
+                self._write_stdin_chunked(ws_client, shell_script)
+                if raw_stdin is not None:
+                    self._write_stdin_chunked(ws_client, raw_stdin)
+                    self._close_stdin(ws_client)
+                result = self._handle_shell_output(ws_client, user, timeout)
+            return result
+
+    @property
+    def uses_sessions(self) -> bool:
+        return self._sessions is not None
+
+    async def aexec(
+        self,
+        cmd: list[str],
+        stdin: str | bytes | None,
+        cwd: str | None,
+        env: dict[str, str],
+        user: str | None,
+        timeout: int | None,
+    ) -> ExecResult[str]:
+        """Like `exec`, but streams over the event loop (see `websocket.ExecStream`).
+
+        Persistent sessions are not supported.
+        """
+        exec_id = new_exec_id()
+        end_of_script = self._end_of_script(stdin)
+        try:
+            async with self._async_interactive_shell(user, end_of_script) as stream:
+                shell_script, raw_stdin = self._script_and_stdin(
+                    cmd,
+                    stdin,
+                    cwd,
+                    env,
+                    timeout,
+                    end_of_script,
+                    stream.can_close_stdin,
+                    exec_id,
+                )
+                await stream.write_stdin(shell_script.encode("utf-8"))
+                if raw_stdin is not None:
+                    await stream.write_stdin(raw_stdin)
+                    await stream.close_stdin()
+                return await self._async_handle_shell_output(stream, user, timeout)
+        except asyncio.CancelledError:
+            if exec_id is not None:
+                await self._akill(exec_id)
+            raise
 
     @contextmanager
-    def _interactive_shell(self, user: str | None) -> Generator[WSClient, None, None]:
-        command = ["/bin/sh"]
-        if user is not None:
-            command = ["runuser", "-u", user] + command
+    def _killed_on_cancel(self, exec_id: str | None) -> Generator[None, None, None]:
+        """Kill the command's processes if the exec is cancelled whilst it runs."""
+        try:
+            yield
+        except BaseException:
+            if exec_id is not None and current_cancellation().cancelled:
+                self._kill(exec_id)
+            raise
+
+    def _kill(self, exec_id: str) -> None:
+        # The exec's own websocket has been aborted, but the command runs on.
+        try:
+            with uncancellable(), unbounded(), self._kill_shell(exec_id) as ws_client:
+                ws_client.run_forever(timeout=API_TIMEOUT)
+        except Exception as e:
+            log_warn("Failed to kill cancelled command.", pod=self._pod.name, error=e)
+
+    @contextmanager
+    def _kill_shell(self, exec_id: str) -> Generator[WSClient, None, None]:
+        yield from self.create_websocket_client_for_exec(
+            command=kill_command(exec_id),
+            stderr=True,
+            stdin=False,
+            stdout=True,
+            binary=True,
+        )
+
+    async def _akill(self, exec_id: str) -> None:
+        try:
+            with unbounded():
+                async with ExecStream(
+                    self._pod, kill_command(exec_id), stdin=False
+                ) as stream:
+                    await asyncio.wait_for(_drain(stream), API_TIMEOUT)
+        except Exception as e:
+            log_warn("Failed to kill cancelled command.", pod=self._pod.name, error=e)
+
+    def _end_of_script(self, stdin: str | bytes | None) -> str | None:
+        """A line to end the script with, if its command's input is to follow it.
+
+        Only if the websocket is expected to negotiate v5.channel.k8s.io, in which
+        stdin can be closed once the input has been written.
+        """
+        if stdin is None or not expect_stdin_closable(self._pod.context_name):
+            return None
+        return f"<end-of-script-{uuid.uuid4().hex}>"
+
+    def _script_and_stdin(
+        self,
+        cmd: list[str],
+        stdin: str | bytes | None,
+        cwd: str | None,
+        env: dict[str, str],
+        timeout: int | None,
+        end_of_script: str | None,
+        can_close_stdin: bool,
+        exec_id: str | None = None,
+    ) -> tuple[str, bytes | None]:
+        """The script to write to the shell, and any input to write raw after it.
+
+        If v5.channel.k8s.io was not negotiated after all, the input is embedded in
+        the script as it would have been had `end_of_script` not been requested.
+        """
+        raw_stdin: bytes | None = None
+        if end_of_script is not None and can_close_stdin and stdin is not None:
+            raw_stdin = stdin if isinstance(stdin, bytes) else stdin.encode("utf-8")
+            stdin = None
+        shell_script = self._build_shell_script(cmd, stdin, cwd, env, timeout, exec_id)
+        if end_of_script is not None:
+            shell_script += f"{end_of_script}\n"
+        return shell_script, raw_stdin
+
+    @contextmanager
+    def _interactive_shell(
+        self, user: str | None, end_of_script: str | None = None
+    ) -> Generator[WSClient, None, None]:
         try:
             yield from self.create_websocket_client_for_exec(
-                command=command,
+                command=self._shell_command(user, end_of_script),
                 stderr=True,
                 stdin=True,
                 stdout=True,
@@ -53,13 +273,42 @@ class ExecuteOperation(PodOperation):
         # Raised if /bin/sh or runuser cannot be found in the Pod (not if a
         # user-supplied) command cannot be found.
         except ExecutableNotFoundError as e:
-            if 'error finding executable "runuser"' in str(e):
-                raise RuntimeError(
-                    f"When a user parameter ('{user}') is provided to exec(), the "
-                    f"runuser binary must be installed in the container. Docs: "
-                    f"{EXEC_USER_URL}"
-                ) from e
-            raise
+            raise self._shell_not_found(e, user)
+
+    @asynccontextmanager
+    async def _async_interactive_shell(
+        self, user: str | None, end_of_script: str | None = None
+    ) -> AsyncIterator[ExecStream]:
+        try:
+            async with ExecStream(
+                self._pod, self._shell_command(user, end_of_script), stdin=True
+            ) as stream:
+                yield stream
+        except ExecutableNotFoundError as e:
+            raise self._shell_not_found(e, user)
+
+    def _shell_command(
+        self, user: str | None, end_of_script: str | None = None
+    ) -> list[str]:
+        command = ["/bin/sh"]
+        if end_of_script is not None:
+            command += ["-c", _READ_SCRIPT, "sh", end_of_script]
+        if user is not None:
+            command = ["runuser", "-u", user] + command
+        return command
+
+    def _shell_not_found(
+        self, e: ExecutableNotFoundError, user: str | None
+    ) -> Exception:
+        if 'error finding executable "runuser"' in str(e):
+            error = RuntimeError(
+                f"When a user parameter ('{user}') is provided to exec(), the "
+                f"runuser binary must be installed in the container. Docs: "
+                f"{EXEC_USER_URL}"
+            )
+            error.__cause__ = e
+            return error
+        return e
 
     def _build_shell_script(
         self,
@@ -68,8 +317,11 @@ class ExecuteOperation(PodOperation):
         cwd: str | None,
         env: dict[str, str],
         timeout: int | None,
+        exec_id: str | None = None,
     ) -> str:
         def generate() -> Generator[str, None, None]:
+            if exec_id is not None:
+                yield f"export {EXEC_ID_VARIABLE}={exec_id}\n"
             if cwd is not None:
                 yield f"cd {shlex.quote(cwd)} || exit $?\n"
             for key, value in env.items():
@@ -79,12 +331,16 @@ class ExecuteOperation(PodOperation):
             yield f"{self._prefix_timeout(timeout)}{shlex.join(command)}\n"
             # Store the returncode so that the `echo` below doesn't overwrite it.
             yield "returncode=$?\n"
-            # Ensure stdout and stderr are flushed before writing the sentinel value.
-            yield "sync\n"
+            if self._report_container_identity:
+                yield _CONTAINER_IDENTITY_SCRIPT
             # Write a sentinel value to stdout to determine when the user command
             # has completed. Also write the returncode as we won't have access to it if
-            # we manually close the websocket connection.
-            yield f'echo -n "<{COMPLETED_SENTINEL}-$returncode>"\n'
+            # we manually close the websocket connection. stdout and stderr are
+            # separate streams, so write the sentinel to stderr too: once both have
+            # been received, all of the command's output is known to have been.
+            identity = "$identity" if self._report_container_identity else ""
+            completed = f"<{COMPLETED_SENTINEL}-$returncode"
+            yield f'echo -n "{completed}{identity}>"; echo -n "{completed}>" >&2\n'
             # Exit the shell. This won't actually close the websocket connection until
             # stdout and stderr (which have been inherited by the user command) are
             # closed. But it will force the echo above to be flushed.
@@ -92,6 +348,98 @@ class ExecuteOperation(PodOperation):
 
         return "".join(generate())
 
+    def _exec_in_session(
+        self,
+        cmd: list[str],
+        stdin: str | bytes | None,
+        cwd: str | None,
+        env: dict[str, str],
+        user: str | None,
+        timeout: int | None,
+        exec_id: str | None = None,
+    ) -> ExecResult[str]:
+        assert self._sessions is not None
+        token = uuid.uuid4().hex
+        shell_script = self._build_session_script(
+            token, cmd, stdin, cwd, env, timeout, exec_id
+        )
+        with self._sessions.checkout(user) as session:
+
+            def abort() -> None:
+                # The session's websocket outlives the operation which opened it.
+                if session.opened:
+                    abort_websocket(session.ws_client)
+
+            with current_cancellation().on_cancel(abort):
+                self._send_to_session(session, shell_script)
+                return self._handle_session_output(
+                    session.ws_client, token, user, timeout
+                )
+
+    def _send_to_session(self, session: ShellSession, shell_script: str) -> None:
+        """Write a script to a session's shell, reconnecting if the shell has gone.
+
+        The script is a single compound command which the shell won't run until it has
+        been received in full, so it's safe to resend it to a new shell if writing it
+        to an existing one fails.
+        """
+        if session.opened and session.alive():
+            try:
+                self._write_stdin_chunked(session.ws_client, shell_script)
+                return
+            except (OSError, WebSocketException):
+                pass
+        session.open(lambda: self._interactive_shell(session.user))
+        self._write_stdin_chunked(session.ws_client, shell_script)
+
+    def _build_session_script(
+        self,
+        token: str,
+        command: list[str],
+        stdin: str | bytes | None,
+        cwd: str | None,
+        env: dict[str, str],
+        timeout: int | None,
+        exec_id: str | None = None,
+    ) -> str:
+        def generate() -> Generator[str, None, None]:
+            started = f"<{STARTED_SENTINEL}-{token}>"
+            completed = f"<{COMPLETED_SENTINEL}-{token}-$returncode"
+            # Group the whole script in braces so that the shell doesn't run any of it
+            # until all of it has been received.
+            yield "{\n"
+            yield f'echo -n "{started}"; echo -n "{started}" >&2\n'
+            # Run the command in a subshell so that `cd`, `export` and `exit` don't
+            # affect the session's later commands.
+            yield "(\n"
+            if exec_id is not None:
+                yield f"export {EXEC_ID_VARIABLE}={exec_id}\n"
+            if cwd is not None:
+                yield f"cd {shlex.quote(cwd)} || exit $?\n"
+            for key, value in env.items():
+                yield f"export {shlex.quote(key)}={shlex.quote(value)}\n"
+            if stdin is not None:
+                yield self._pipe_user_input(stdin)
+                yield f"{self._prefix_timeout(timeout)}{shlex.join(command)}\n"
+            else:
+                # The session's stdin is the shell's script, which the command must
+                # not consume.
+                yield (
+                    f"{self._prefix_timeout(timeout)}{shlex.join(command)} </dev/null\n"
+                )
+            yield ")\n"
+            yield "returncode=$?\n"
+            identity = ""
+            if self._report_container_identity:
+                yield _CONTAINER_IDENTITY_SCRIPT
+                identity = "$identity"
+            # Write the sentinel to stderr too, so that all of the command's stderr is
+            # known to have been received once both have been.
+            yield f'echo -n "{completed}{identity}>"; echo -n "{completed}>" >&2\n'
+            yield "}\n"
+
+        return "".join(generate())
+
     def _pipe_user_input(self, stdin: str | bytes) -> str:
         # Encode the user-provided input as base64 for 2 reasons:
         # 1. To avoid issues with special characters (e.g. new lines) in the input.
@@ -101,7 +449,7 @@ class ExecuteOperation(PodOperation):
         ).decode("ascii")
         # Pipe user input. Simply writing it to the shell's stdin after a command e.g.
         # `cat` results in `cat` blocking indefinitely as there is no way to close the
-        # stdin stream in v4.channel.k8s.io.
+        # stdin stream in v4.channel.k8s.io (see `_READ_SCRIPT` for v5).
         return f"echo '{stdin_b64}' | base64 -d | "
 
     def _prefix_timeout(self, timeout: int | None) -> str:
@@ -119,6 +467,8 @@ class ExecuteOperation(PodOperation):
         def stream_output() -> tuple[ExecResult[str], bool]:
             stdout = LimitedBuffer(limits.MAX_EXEC_OUTPUT_SIZE)
             stderr = LimitedBuffer(limits.MAX_EXEC_OUTPUT_SIZE)
+            scanner = _CompletedSentinelScanner()
+            stderr_scanner = _CompletedSentinelScanner()
             returncode: int | None = None
             while ws_client.is_open():
                 try:
@@ -126,20 +476,17 @@ class ExecuteOperation(PodOperation):
                     # indefinitely until there is data to read.
                     ws_client.update(timeout=None)
                     # Note: `peek_*()` and `read_*()` may call `update(timeout=0)`.
-                    if ws_client.peek_stderr():
-                        stderr.append(ws_client.read_stderr())
-                    # Handle stdout _after_ stderr to guarantee that, if buffered, the
-                    # sentinel is actioned before the blocking `ws_client.update(None)`.
                     if ws_client.peek_stdout():
-                        frame = ws_client.read_stdout()
-                        # Assumption: The sentinel value is written to
-                        # stdout in a single frame, not split across frames.
-                        filtered, returncode = self._filter_sentinel_and_returncode(
-                            frame
-                        )
-                        stdout.append(filtered)
-                        if returncode is not None:
-                            ws_client.close()
+                        for chunk in scanner.feed(ws_client.read_stdout()):
+                            stdout.append(chunk)
+                        returncode = scanner.returncode
+                    if ws_client.peek_stderr():
+                        for chunk in stderr_scanner.feed(ws_client.read_stderr()):
+                            stderr.append(chunk)
+                    # Check for both sentinels _after_ reading both channels so that,
+                    # if buffered, they're actioned before the blocking `update(None)`.
+                    if returncode is not None and stderr_scanner.returncode is not None:
+                        ws_client.close()
                     self._verify_output_limit(stdout, stderr)
                 except (BrokenPipeError, ConnectionResetError) as e:
                     if returncode is not None:
@@ -152,8 +499,13 @@ class ExecuteOperation(PodOperation):
                         pod=self._pod.name,
                     ) from e
             saw_completed_sentinel = returncode is not None
+            self._remember_identity(scanner)
             # returncode won't be set if setup commands e.g. `cd` failed.
+            for chunk in stderr_scanner.flush():
+                stderr.append(chunk)
             if returncode is None:
+                for chunk in scanner.flush():
+                    stdout.append(chunk)
                 returncode = get_returncode(ws_client)
             return (
                 ExecResult(
@@ -166,6 +518,94 @@ class ExecuteOperation(PodOperation):
             )
 
         result, saw_completed_sentinel = stream_output()
+        return self._check_result(result, user, timeout, saw_completed_sentinel)
+
+    async def _async_handle_shell_output(
+        self, stream: ExecStream, user: str | None, timeout: int | None
+    ) -> ExecResult[str]:
+        stdout = LimitedBuffer(limits.MAX_EXEC_OUTPUT_SIZE)
+        stderr = LimitedBuffer(limits.MAX_EXEC_OUTPUT_SIZE)
+        scanner = _CompletedSentinelScanner()
+        stderr_scanner = _CompletedSentinelScanner()
+        status: bytes | None = None
+        returncode: int | None = None
+        async for channel, data in stream:
+            if channel == STDERR_CHANNEL:
+                for chunk in stderr_scanner.feed(data):
+                    stderr.append(chunk)
+            elif channel == STDOUT_CHANNEL:
+                for chunk in scanner.feed(data):
+                    stdout.append(chunk)
+                returncode = scanner.returncode
+            elif channel == ERROR_CHANNEL:
+                status = data
+            self._verify_output_limit(stdout, stderr)
+            if returncode is not None and stderr_scanner.returncode is not None:
+                break
+        saw_completed_sentinel = returncode is not None
+        self._remember_identity(scanner)
+        for chunk in stderr_scanner.flush():
+            stderr.append(chunk)
+        # returncode won't be set if setup commands e.g. `cd` failed.
+        if returncode is None:
+            for chunk in scanner.flush():
+                stdout.append(chunk)
+            returncode = parse_returncode(status)
+        result = ExecResult(
+            success=returncode == 0,
+            returncode=returncode,
+            stdout=str(stdout),
+            stderr=str(stderr),
+        )
+        return self._check_result(result, user, timeout, saw_completed_sentinel)
+
+    def _handle_session_output(
+        self, ws_client: WSClient, token: str, user: str | None, timeout: int | None
+    ) -> ExecResult[str]:
+        stdout = _SessionStream(token)
+        stderr = _SessionStream(token)
+        while ws_client.is_open() and not (stdout.completed and stderr.completed):
+            try:
+                ws_client.update(timeout=None)
+                if ws_client.peek_stderr():
+                    stderr.feed(ws_client.read_stderr())
+                if ws_client.peek_stdout():
+                    stdout.feed(ws_client.read_stdout())
+                self._verify_output_limit(stdout.output, stderr.output)
+            except (BrokenPipeError, ConnectionResetError) as e:
+                raise PodError(
+                    "WebSocket connection lost during exec", pod=self._pod.name
+                ) from e
+        if stdout.returncode is not None and stderr.completed:
+            self.container_identity = stdout.identity
+            result = ExecResult(
+                success=stdout.returncode == 0,
+                returncode=stdout.returncode,
+                stdout=str(stdout.output),
+                stderr=str(stderr.output),
+            )
+            return self._check_result(result, user, timeout, True)
+        if stdout.started:
+            raise PodError("Shell session ended during exec", pod=self._pod.name)
+        # The shell exited before running the command (e.g. runuser failed).
+        stdout.flush()
+        stderr.flush()
+        returncode = get_returncode(ws_client)
+        result = ExecResult(
+            success=returncode == 0,
+            returncode=returncode,
+            stdout=str(stdout.preamble),
+            stderr=str(stderr.preamble),
+        )
+        return self._check_result(result, user, timeout, False)
+
+    def _check_result(
+        self,
+        result: ExecResult[str],
+        user: str | None,
+        timeout: int | None,
+        saw_completed_sentinel: bool,
+    ) -> ExecResult[str]:
         # 124 is the exit code for the `timeout` command.
         if timeout is not None and result.returncode == 124:
             raise TimeoutError(f"Command timed out after {timeout}s. {result}")
@@ -192,16 +632,9 @@ class ExecuteOperation(PodOperation):
                 f"container must be running as root. Docs: {EXEC_USER_URL}\n{stderr}"
             )
 
-    def _filter_sentinel_and_returncode(self, frame: bytes) -> tuple[bytes, int | None]:
-        # latin-1 maps each byte 1:1 to a codepoint, so it decodes arbitrary binary
-        # without raising and re-encodes losslessly. We use it only to locate and strip
-        # the ASCII sentinel; the surrounding bytes round-trip unchanged.
-        # Assumption: the sentinel is not split across frames.
-        decoded = frame.decode("latin-1")
-        split_frame = re.split(COMPLETED_SENTINEL_PATTERN, decoded)
-        if len(split_frame) == 1:
-            return frame, None
-        return (split_frame[0] + split_frame[2]).encode("latin-1"), int(split_frame[1])
+    def _remember_identity(self, scanner: "_CompletedSentinelScanner") -> None:
+        if scanner.identity is not None:
+            self.container_identity = scanner.identity
 
     def _verify_output_limit(
         self, stdout: LimitedBuffer, stderr: LimitedBuffer
@@ -211,3 +644,170 @@ class ExecuteOperation(PodOperation):
                 limit_str=limits.MAX_EXEC_OUTPUT_SIZE_STR,
                 truncated_output=str(stdout) + str(stderr),
             )
+
+
+async def _drain(stream: ExecStream) -> None:
+    async for _ in stream:
+        pass
+
+
+class _SentinelScanner:
+    """Finds a sentinel in a stdout or stderr, even if it is split across frames.
+
+    Frames are searched with `bytes.find` and passed through as views rather than
+    copies. A trailing fragment of a frame which could be the start of the sentinel is
+    held back until the next frame.
+    """
+
+    def __init__(
+        self,
+        prefix: bytes,
+        pattern: re.Pattern[bytes],
+        partial_pattern: re.Pattern[bytes],
+        max_length: int,
+    ) -> None:
+        """Create the scanner.
+
+        Args:
+          prefix: The fixed start of the sentinel, whose only "<" is its first byte.
+          pattern: Matches the whole sentinel.
+          partial_pattern: Fully matches the start of a sentinel (beginning with
+            `prefix`) which may continue in the next frame.
+          max_length: Comfortably longer than any sentinel.
+        """
+        self._prefix = prefix
+        self._pattern = pattern
+        self._partial_pattern = partial_pattern
+        self._max_length = max_length
+        self._pending = b""
+        self.match: re.Match[bytes] | None = None
+
+    def feed(self, frame: bytes) -> tuple[memoryview, memoryview]:
+        """The output in a frame before the sentinel, and any after it.
+
+        The output before excludes anything held back. Once the sentinel has been
+        found (and `match` set), whole frames are output after it.
+        """
+        if self.match is not None:
+            return _EMPTY_VIEW, memoryview(frame)
+        data = self._pending + frame if self._pending else frame
+        self._pending = b""
+        view = memoryview(data)
+        search_from = 0
+        while (index := data.find(self._prefix, search_from)) != -1:
+            match = self._pattern.match(data, index)
+            if match is not None:
+                self.match = match
+                return view[:index], view[match.end() :]
+            if len(data) - index < self._max_length and self._partial_pattern.fullmatch(
+                data, index
+            ):
+                self._pending = data[index:]
+                return view[:index], _EMPTY_VIEW
+            # Output which merely resembles the sentinel.
+            search_from = index + 1
+        # The frame may end with the start of the prefix.
+        index = data.rfind(b"<", max(0, len(data) - len(self._prefix) + 1))
+        if index != -1 and self._prefix.startswith(data[index:]):
+            self._pending = data[index:]
+            return view[:index], _EMPTY_VIEW
+        return view, _EMPTY_VIEW
+
+    def flush(self) -> memoryview:
+        """Output held back when the stream ended without a sentinel."""
+        pending, self._pending = self._pending, b""
+        return memoryview(pending)
+
+
+class _CompletedSentinelScanner:
+    """Strips the completed sentinel from a one-off exec's stdout or stderr."""
+
+    def __init__(self) -> None:
+        self._scanner = _SentinelScanner(
+            _COMPLETED_SENTINEL_PREFIX,
+            _COMPLETED_SENTINEL_BYTES_PATTERN,
+            _PARTIAL_COMPLETED_SENTINEL_PATTERN,
+            _MAX_COMPLETED_SENTINEL_LENGTH,
+        )
+        self.returncode: int | None = None
+        self.identity: str | None = None
+
+    def feed(self, frame: bytes) -> list[memoryview]:
+        """The output in a frame, excluding the sentinel and anything held back."""
+        if self.returncode is not None:
+            # Anything after the sentinel isn't the command's output.
+            return []
+        before, after = self._scanner.feed(frame)
+        match = self._scanner.match
+        if match is None:
+            return [before]
+        self.returncode = int(match.group(1))
+        if match.group(2) is not None:
+            self.identity = match.group(2).decode("ascii")
+        return [before, after]
+
+    def flush(self) -> list[memoryview]:
+        """Output held back when the stream ended without a sentinel."""
+        return [self._scanner.flush()]
+
+
+class _SessionStream:
+    """The stdout or stderr of a command run in a shell session.
+
+    Output is only attributed to the command between its started and completed
+    sentinels, either of which may be split across frames.
+    """
+
+    def __init__(self, token: str) -> None:
+        started = f"<{STARTED_SENTINEL}-{token}>".encode()
+        started_pattern = re.compile(re.escape(started))
+        self._started = _SentinelScanner(
+            started, started_pattern, started_pattern, len(started) + 1
+        )
+        completed = f"<{COMPLETED_SENTINEL}-{token}-".encode()
+        self._completed = _SentinelScanner(
+            completed,
+            re.compile(re.escape(completed) + rb"(\d+)(?:-(\d+\.[0-9a-f-]+))?>"),
+            re.compile(re.escape(completed) + rb"\d*(?:-\d*(?:\.[0-9a-f-]*)?)?"),
+            len(completed) + _MAX_COMPLETED_SENTINEL_LENGTH,
+        )
+        self.output = LimitedBuffer(limits.MAX_EXEC_OUTPUT_SIZE)
+        # Output received before the started sentinel: either late output of earlier
+        # commands' background processes, or the error of a shell which failed to
+        # start.
+        self.preamble = LimitedBuffer(limits.MAX_EXEC_OUTPUT_SIZE)
+        self.returncode: int | None = None
+        self.identity: str | None = None
+
+    @property
+    def started(self) -> bool:
+        return self._started.match is not None
+
+    @property
+    def completed(self) -> bool:
+        return self.returncode is not None
+
+    def feed(self, frame: bytes) -> None:
+        if self.completed:
+            return
+        if not self.started:
+            before, after = self._started.feed(frame)
+            self.preamble.append(before)
+            if not self.started:
+                return
+            # The scanner searches bytes (a copy of at most the rest of one frame).
+            frame = after.tobytes()
+        before, _ = self._completed.feed(frame)
+        self.output.append(before)
+        match = self._completed.match
+        if match is not None:
+            self.returncode = int(match.group(1))
+            if match.group(2) is not None:
+                self.identity = match.group(2).decode("ascii")
+
+    def flush(self) -> None:
+        """Add output held back when the stream ended without the sentinels."""
+        if self.started:
+            self.output.append(self._completed.flush())
+        else:
+            self.preamble.append(self._started.flush())
@@ -4,11 +4,14 @@ import asyncio
 import contextvars
 import os
 from concurrent.futures import ThreadPoolExecutor
-from typing import Callable, TypeVar
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
 
 from inspect_ai.util import concurrency
 
+from k8s_sandbox._deadline import DeadlineExceededError, paused, within_deadline
 from k8s_sandbox._logger import log_debug
+from k8s_sandbox._pod.cancellation import Cancellation
 
 T = TypeVar("T")
 
@@ -82,13 +85,54 @@ class PodOpExecutor:
         of the number of ongoing operations. Other than the user display, the
         use of the semaphore is redundant.
 
+        If the caller is cancelled, or its deadline passes (see `_deadline`),
+        so is the operation (see `cancellation`): one which has yet to start never
+        runs, and one which is running is aborted rather than left to occupy its
+        thread. The time spent waiting for a free slot extends the deadline.
+
         This method is async-safe but not thread-safe.
         """
-        async with concurrency("pod-op", self._max_workers):
+        async with self._slot():
             # run_in_executor does not propagate the caller's context into the
             # worker thread, so pass it directly to preserve Inspect
             # sandbox config overrides
             context = contextvars.copy_context()
-            return await asyncio.get_event_loop().run_in_executor(
-                self._executor, lambda: context.run(callable)
-            )
+            cancellation = Cancellation()
+            context.run(cancellation.bind)
+            try:
+                return await within_deadline(
+                    asyncio.get_event_loop().run_in_executor(
+                        self._executor, lambda: context.run(callable)
+                    )
+                )
+            except (asyncio.CancelledError, DeadlineExceededError):
+                cancellation.cancel()
+                raise
+
+    async def queue_async_operation(self, operation: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run an asynchronous pod operation on the event loop and return the result.
+
+        Such operations don't occupy a thread, but are subject to the same limit on
+        the number of concurrent operations (and the same user display) as those
+        queued with `queue_operation`, and to the current deadline (which is likewise
+        extended by the time spent waiting for a free slot).
+
+        This method is async-safe but not thread-safe.
+        """
+        async with self._slot():
+            return await within_deadline(operation())
+
+    @asynccontextmanager
+    async def _slot(self) -> AsyncIterator[None]:
+        """Hold one of the `max_pod_ops` slots, pausing the deadline until it's free.
+
+        Otherwise, an exec queued behind others would raise a TimeoutError (as if its
+        command had timed out) without its command ever having started.
+        """
+        async with AsyncExitStack() as stack:
+            with paused():
+                await stack.enter_async_context(
+                    concurrency("pod-op", self._max_workers)
+                )
+            yield
@@ -0,0 +1,205 @@
+"""A process-wide scheduler of websocket keepalive frames.
+
+Containerd's CRI streaming server closes WebSocket connections that receive no data
+frames within stream_idle_timeout (default 4h). Standard WebSocket pings do NOT reset
+this timer because the Python kubernetes client negotiates the v4.channel.k8s.io
+subprotocol [1], whose server-side handler uses golang.org/x/net/websocket. That
+library's Receive() silently consumes ping/pong control frames in an internal loop
+[2][3] without returning to the caller, so the resetTimeout() call in wsstream/conn.go
+(which sits *before* Receive()) is never re-executed.
+
+Writing to the resize channel (channel 4) sends a real data frame that causes
+Receive() to return, triggering resetTimeout() [4]. The resize handler silently
+ignores the payload since no TTY is allocated for non-interactive exec sessions.
+
+Rather than a thread per websocket, a single thread sends these frames to every open
+websocket, but only to those which haven't been written to for
+`_KEEPALIVE_INTERVAL_SECONDS`. Most exec, read and write operations finish well within
+that, so they never receive a keepalive frame. Websockets are kept on a timer wheel:
+a ring of slots, one per `_TICK_SECONDS`, each holding the websockets which are next
+due to be checked in that tick, so that each tick only visits the websockets which
+are due.
+
+[1] https://github.com/kubernetes-client/python/blob/6fb1fd723eeb8880626118aeb95ebb1a7c73d5ad/kubernetes/base/stream/ws_client.py#L468-L472
+[2] https://github.com/golang/net/blob/2914f46773171f4fa13e276df1135bafef677801/websocket/websocket.go#L339-L349
+[3] https://github.com/golang/net/blob/2914f46773171f4fa13e276df1135bafef677801/websocket/hybi.go#L290-L302
+[4] https://github.com/kubernetes/kubernetes/blob/77b02b7ad40d36cd803856de5ba5922c947cb0aa/staging/src/k8s.io/apimachinery/pkg/util/httpstream/wsstream/conn.go#L348-L356
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import math
+import threading
+import time
+
+from kubernetes.stream.ws_client import (  # type: ignore[import-untyped]
+    RESIZE_CHANNEL,
+    WSClient,
+)
+
+# Interval between WebSocket keepalive frames. Containerd's CRI streaming server
+# enforces a stream_idle_timeout (default 4h [1]) that closes connections with no
+# data activity. Sending a resize-channel data frame resets the idle timer via
+# resetTimeout() in the server's wsstream conn.go read loop [2]. 30 seconds is well
+# under any realistic idle timeout while adding negligible overhead.
+#
+# [1] https://github.com/kubernetes/kubernetes/blob/db9fcfeed29b860d8dd7188bc1903c4709977890/staging/src/k8s.io/kubelet/pkg/cri/streaming/server.go#L100-L105
+# [2] https://github.com/kubernetes/kubernetes/blob/77b02b7ad40d36cd803856de5ba5922c947cb0aa/staging/src/k8s.io/apimachinery/pkg/util/httpstream/wsstream/conn.go#L348-L356
+_KEEPALIVE_INTERVAL_SECONDS = 30
+# The resolution of the timer wheel.
+_TICK_SECONDS = 1.0
+KEEPALIVE_PAYLOAD = json.dumps({"Width": 80, "Height": 24}).encode()  # Arbitrary size
+
+logger = logging.getLogger(__name__)
+
+
+class _Tracked:
+    """A websocket tracked by the `KeepaliveScheduler`."""
+
+    def __init__(self, ws_client: WSClient) -> None:
+        self.ws_client = ws_client
+        self.last_write = time.monotonic()
+        self.due_tick = 0
+        self.stopped = False
+
+
+class KeepaliveScheduler:
+    """Sends keepalive frames to idle websockets from a single daemon thread.
+
+    The thread is started when the first websocket is registered and waits without
+    waking whilst no websockets are registered. This class is thread-safe.
+    """
+
+    _instance: KeepaliveScheduler | None = None
+    _instance_lock = threading.Lock()
+
+    def __init__(
+        self,
+        interval: float = _KEEPALIVE_INTERVAL_SECONDS,
+        tick: float = _TICK_SECONDS,
+    ) -> None:
+        self._interval = interval
+        self._tick = tick
+        # A websocket is never scheduled more than `interval` ahead, so with this
+        # many slots no slot holds websockets due in different revolutions.
+        self._slots: list[list[_Tracked]] = [
+            [] for _ in range(math.ceil(interval / tick) + 2)
+        ]
+        self._handles: dict[int, _Tracked] = {}
+        self._condition = threading.Condition()
+        self._next_tick = self._current_tick()
+        self._thread: threading.Thread | None = None
+
+    @classmethod
+    def get_instance(cls) -> KeepaliveScheduler:
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    @property
+    def tracked_count(self) -> int:
+        """The number of websockets registered."""
+        with self._condition:
+            return len(self._handles)
+
+    @property
+    def idle_count(self) -> int:
+        """The number of registered websockets not written to for an interval."""
+        now = time.monotonic()
+        with self._condition:
+            return sum(
+                now - handle.last_write >= self._interval
+                for handle in self._handles.values()
+            )
+
+    def register(self, ws_client: WSClient) -> None:
+        """Start sending keepalive frames to the websocket whilst it is idle."""
+        handle = _Tracked(ws_client)
+        with self._condition:
+            if not self._handles:
+                # Nothing was scheduled whilst idle, so there's no need to catch up.
+                self._next_tick = self._current_tick()
+            self._handles[id(ws_client)] = handle
+            self._schedule(handle, handle.last_write + self._interval)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="ws-keepalive", daemon=True
+                )
+                self._thread.start()
+            self._condition.notify()
+
+    def touch(self, ws_client: WSClient) -> None:
+        """Record that data has been written to the websocket, deferring keepalives."""
+        handle = self._handles.get(id(ws_client))
+        if handle is not None:
+            handle.last_write = time.monotonic()
+
+    def unregister(self, ws_client: WSClient) -> None:
+        """Stop sending keepalive frames to the websocket, e.g. as it is closing."""
+        with self._condition:
+            handle = self._handles.pop(id(ws_client), None)
+            if handle is not None:
+                handle.stopped = True
+
+    def _current_tick(self) -> int:
+        return math.floor(time.monotonic() / self._tick)
+
+    def _schedule(self, handle: _Tracked, due: float) -> None:
+        # Must be called with the lock held.
+        handle.due_tick = max(math.ceil(due / self._tick), self._next_tick)
+        self._slots[handle.due_tick % len(self._slots)].append(handle)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._handles:
+                    self._condition.wait()
+                due = self._take_due()
+            for handle in due:
+                self._check(handle)
+            with self._condition:
+                timeout = self._next_tick * self._tick - time.monotonic()
+                if timeout > 0:
+                    self._condition.wait(timeout)
+
+    def _take_due(self) -> list[_Tracked]:
+        """Empty the slots of all ticks up to now. Must be called with the lock held."""
+        current = self._current_tick()
+        due: list[_Tracked] = []
+        while self._next_tick <= current:
+            slot = self._slots[self._next_tick % len(self._slots)]
+            due.extend(
+                handle
+                for handle in slot
+                if not handle.stopped and handle.due_tick <= self._next_tick
+            )
+            slot[:] = [
+                handle
+                for handle in slot
+                if not handle.stopped and handle.due_tick > self._next_tick
+            ]
+            self._next_tick += 1
+        return due
+
+    def _check(self, handle: _Tracked) -> None:
+        now = time.monotonic()
+        if now - handle.last_write >= self._interval:
+            try:
+                if not handle.ws_client.is_open():
+                    self.unregister(handle.ws_client)
+                    return
+                handle.ws_client.write_channel(RESIZE_CHANNEL, KEEPALIVE_PAYLOAD)
+                handle.last_write = time.monotonic()
+            except Exception:
+                logger.debug(
+                    "Failed to send k8s websocket keepalive frame, bailing out",
+                    exc_info=True,
+                )
+                self.unregister(handle.ws_client)
+                return
+        with self._condition:
+            if not handle.stopped:
+                self._schedule(handle, handle.last_write + self._interval)
@@ -1,15 +1,19 @@
-import json
 import logging
 import threading
+import time
 from abc import ABC
 from dataclasses import dataclass
 from typing import Generator, Literal
 
 from kubernetes.stream import stream  # type: ignore
-from kubernetes.stream.ws_client import RESIZE_CHANNEL, WSClient  # type: ignore
+from kubernetes.stream.ws_client import STDIN_CHANNEL, WSClient  # type: ignore
 
+from k8s_sandbox._deadline import bounded
 from k8s_sandbox._kubernetes_api import k8s_client
+from k8s_sandbox._pod.cache import pod_cache
+from k8s_sandbox._pod.cancellation import abort_websocket, current_cancellation
 from k8s_sandbox._pod.error import ContainerRestartedError, PodReplacedError
+from k8s_sandbox._pod.keepalive import KeepaliveScheduler
 from k8s_sandbox._pod.snapshot import read_pod
 
 # The duration to wait for an initial response from the k8s API server.
@@ -18,19 +22,26 @@ from k8s_sandbox._pod.snapshot import read_pod
 # https://github.com/kubernetes-client/python/blob/master/examples/watch/timeout-settings.md
 API_TIMEOUT = 60
 
-# Interval between WebSocket keepalive frames. Containerd's CRI streaming server
-# enforces a stream_idle_timeout (default 4h [1]) that closes connections with no
-# data activity. Sending a resize-channel data frame resets the idle timer via
-# resetTimeout() in the server's wsstream conn.go read loop [2]. 30 seconds is well
-# under any realistic idle timeout while adding negligible overhead.
-#
-# [1] https://github.com/kubernetes/kubernetes/blob/db9fcfeed29b860d8dd7188bc1903c4709977890/staging/src/k8s.io/kubelet/pkg/cri/streaming/server.go#L100-L105
-# [2] https://github.com/kubernetes/kubernetes/blob/77b02b7ad40d36cd803856de5ba5922c947cb0aa/staging/src/k8s.io/apimachinery/pkg/util/httpstream/wsstream/conn.go#L348-L356
-_KEEPALIVE_INTERVAL_SECONDS = 30
 # Maximum size of a single WebSocket stdin frame. Larger single writes (tens of
 # MiB) make the kubelet/API-server/TLS layer reset the connection
 # (ConnectionResetError / ssl.SSLEOFError), so stdin is written in chunks.
 _STDIN_CHUNK_SIZE = 1024**2  # 1 MiB
+# The bounds of the frames sized by `AdaptiveFrameSize`, and the time it aims to take
+# to send each frame.
+_MIN_FRAME_SIZE = 64 * 1024
+_TARGET_FRAME_SECONDS = 0.05
+# Files written or read as ranges over several streams are split at multiples of this
+# (the `dd` block size).
+RANGE_ALIGNMENT = 1024**2
+# The exec subprotocol in which a channel (i.e. stdin) can be closed. The API server
+# negotiates it from Kubernetes 1.30 and the kubernetes client offers it from v36.
+V5_CHANNEL_PROTOCOL = "v5.channel.k8s.io"
+
+# Whether the API server of each kubeconfig context last negotiated
+# v5.channel.k8s.io. The command run by an exec is chosen before its websocket
+# protocol is negotiated, so this is used to predict it.
+_closable_stdin_by_context: dict[str | None, bool] = {}
+_closable_stdin_lock = threading.Lock()
 
 logger = logging.getLogger(__name__)
 
@@ -66,15 +77,44 @@ class PodOperation(ABC):
     def __init__(self, pod: PodInfo):
         self._pod = pod
 
-    def _write_stdin_chunked(self, ws_client: WSClient, data: str | bytes) -> None:
+    def _write_stdin_chunked(
+        self,
+        ws_client: WSClient,
+        data: str | bytes | memoryview,
+        frames: "AdaptiveFrameSize | None" = None,
+    ) -> None:
         """Write ``data`` to the stdin channel in ``_STDIN_CHUNK_SIZE`` frames.
 
         Used by both exec and write_file (see ``_STDIN_CHUNK_SIZE`` for why we
         chunk). The slice type is preserved: ``str`` -> text frames, ``bytes``
-        -> binary frames.
+        (or ``memoryview``) -> binary frames.
+
+        If ``frames`` is given, it sizes the frames instead (up to the same limit).
         """
-        for i in range(0, len(data), _STDIN_CHUNK_SIZE):
-            ws_client.write_stdin(data[i : i + _STDIN_CHUNK_SIZE])
+        if frames is None:
+            for i in range(0, len(data), _STDIN_CHUNK_SIZE):
+                ws_client.write_stdin(_frame_data(data[i : i + _STDIN_CHUNK_SIZE]))
+        else:
+            i = 0
+            while i < len(data):
+                chunk = _frame_data(data[i : i + frames.size])
+                start = time.monotonic()
+                ws_client.write_stdin(chunk)
+                frames.observe(len(chunk), time.monotonic() - start)
+                i += len(chunk)
+        KeepaliveScheduler.get_instance().touch(ws_client)
+
+    def _can_close_stdin(self, ws_client: WSClient) -> bool:
+        """Whether stdin can be closed, i.e. v5.channel.k8s.io was negotiated."""
+        subprotocol = getattr(ws_client, "subprotocol", None)
+        return subprotocol == V5_CHANNEL_PROTOCOL and hasattr(
+            ws_client, "close_channel"
+        )
+
+    def _close_stdin(self, ws_client: WSClient) -> None:
+        """Close stdin so that the command reads EOF. Requires `_can_close_stdin`."""
+        ws_client.close_channel(STDIN_CHANNEL)
+        KeepaliveScheduler.get_instance().touch(ws_client)
 
     def create_websocket_client_for_exec(
         self, **kwargs
@@ -88,22 +128,20 @@ class PodOperation(ABC):
             container=self._pod.default_container_name,
             _preload_content=False,
             # This is the timeout for the API request, not the command itself.
-            _request_timeout=API_TIMEOUT,
+            _request_timeout=bounded(API_TIMEOUT),
             **kwargs,
         )
-        stop_keepalive = threading.Event()
-        keepalive = threading.Thread(
-            target=_send_keepalive,
-            args=(ws_client, stop_keepalive),
-            daemon=True,
-            name="ws-keepalive",
-        )
+        keepalive = KeepaliveScheduler.get_instance()
         try:
+            remember_stdin_closable(
+                self._pod.context_name, self._can_close_stdin(ws_client)
+            )
             self._discard_duplicate_channel(ws_client)
-            keepalive.start()
-            yield ws_client
+            keepalive.register(ws_client)
+            with current_cancellation().on_cancel(lambda: abort_websocket(ws_client)):
+                yield ws_client
         finally:
-            stop_keepalive.set()
+            keepalive.unregister(ws_client)
             ws_client.close()
 
     def _discard_duplicate_channel(self, ws_client: WSClient) -> None:
@@ -135,6 +173,48 @@ class PodOperation(ABC):
         ws_client._all = _IgnoredIO()
 
 
+class AdaptiveFrameSize:
+    """Sizes stdin frames from the throughput at which recent frames were sent.
+
+    Sending a frame blocks whilst the connection applies backpressure, so the time
+    taken to send each one measures the throughput the connection sustains. Frames are
+    sized to take about `_TARGET_FRAME_SECONDS` at that throughput (between
+    `_MIN_FRAME_SIZE` and `_STDIN_CHUNK_SIZE`): large frames when the connection keeps
+    up, and small ones which don't overwhelm it when it doesn't.
+    """
+
+    def __init__(self) -> None:
+        self.size = _MIN_FRAME_SIZE
+        self._throughput: float | None = None
+
+    def observe(self, sent: int, seconds: float) -> None:
+        """Record that `sent` bytes took `seconds` to send."""
+        throughput = sent / max(seconds, 1e-6)
+        if self._throughput is None:
+            self._throughput = throughput
+        else:
+            # Smooth out the variation between individual frames.
+            self._throughput = 0.7 * self._throughput + 0.3 * throughput
+        size = int(self._throughput * _TARGET_FRAME_SECONDS)
+        self.size = max(_MIN_FRAME_SIZE, min(_STDIN_CHUNK_SIZE, size))
+
+
+def _frame_data(data: str | bytes | memoryview) -> str | bytes:
+    # The kubernetes client only sends `bytes` (not any buffer) as binary frames.
+    return data.tobytes() if isinstance(data, memoryview) else data
+
+
+def expect_stdin_closable(context_name: str | None) -> bool:
+    """Whether the next exec in the context is expected to be able to close stdin."""
+    with _closable_stdin_lock:
+        return _closable_stdin_by_context.get(context_name, False)
+
+
+def remember_stdin_closable(context_name: str | None, closable: bool) -> None:
+    with _closable_stdin_lock:
+        _closable_stdin_by_context[context_name] = closable
+
+
 def check_for_pod_restart(pod: PodInfo) -> None:
     """Check whether the pod has been replaced or its container has restarted.
 
@@ -150,8 +230,16 @@ def check_for_pod_restart(pod: PodInfo) -> None:
         RuntimeError: the named container is no longer present on the pod
             (treated as a permanent misconfiguration).
     """
-    api = k8s_client(pod.context_name)
-    snapshot = read_pod(api, name=pod.name, namespace=pod.namespace)
+    cache = pod_cache(pod.context_name, pod.namespace)
+    snapshot = cache.get(pod.name) if cache is not None else None
+    if snapshot is None:
+        api = k8s_client(pod.context_name)
+        snapshot = read_pod(
+            api,
+            name=pod.name,
+            namespace=pod.namespace,
+            request_timeout=bounded(API_TIMEOUT),
+        )
     if snapshot.uid != pod.uid:
         # Capture the new pod's restart count for the default container so the
         # caller can refresh its full cached identity atomically.
@@ -181,42 +269,6 @@ def check_for_pod_restart(pod: PodInfo) -> None:
         )
 
 
-def _send_keepalive(ws_client: WSClient, stop: threading.Event) -> None:
-    """Send periodic resize-channel frames to prevent idle timeout.
-
-    Containerd's CRI streaming server closes WebSocket connections that receive no
-    data frames within stream_idle_timeout (default 4h). Standard WebSocket pings do
-    NOT reset this timer because the Python kubernetes client negotiates the
-    v4.channel.k8s.io subprotocol [1], whose server-side handler uses
-    golang.org/x/net/websocket. That library's Receive() silently consumes ping/pong
-    control frames in an internal loop [2][3] without returning to the caller, so the
-    resetTimeout() call in wsstream/conn.go (which sits *before* Receive()) is never
-    re-executed.
-
-    Writing to the resize channel (channel 4) sends a real data frame that causes
-    Receive() to return, triggering resetTimeout() [4]. The resize handler silently
-    ignores the payload since no TTY is allocated for non-interactive exec sessions.
-
-    [1] https://github.com/kubernetes-client/python/blob/6fb1fd723eeb8880626118aeb95ebb1a7c73d5ad/kubernetes/base/stream/ws_client.py#L468-L472
-    [2] https://github.com/golang/net/blob/2914f46773171f4fa13e276df1135bafef677801/websocket/websocket.go#L339-L349
-    [3] https://github.com/golang/net/blob/2914f46773171f4fa13e276df1135bafef677801/websocket/hybi.go#L290-L302
-    [4] https://github.com/kubernetes/kubernetes/blob/77b02b7ad40d36cd803856de5ba5922c947cb0aa/staging/src/k8s.io/apimachinery/pkg/util/httpstream/wsstream/conn.go#L348-L356
-    """
-    payload = json.dumps({"Width": 80, "Height": 24}).encode()  # Size is arbitrary
-    while not stop.wait(_KEEPALIVE_INTERVAL_SECONDS):
-        try:
-            if ws_client.is_open():
-                ws_client.write_channel(RESIZE_CHANNEL, payload)
-            else:
-                break
-        except Exception:
-            logger.debug(
-                "Failed to send k8s websocket keepalive frame, bailing out",
-                exc_info=True,
-            )
-            break
-
-
 def raise_for_known_read_write_errors(stderr: str) -> None:
     # The Inspect Sandbox interface asks us to raise specific exceptions for recognised
     # error messages.
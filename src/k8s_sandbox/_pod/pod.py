@@ -1,18 +1,54 @@
 from __future__ import annotations
 
+import asyncio
 import dataclasses
+import hashlib
 import logging
+import math
+import os
 from pathlib import Path
-from typing import IO, Callable, Literal, TypeVar
+from typing import IO, Awaitable, Callable, Literal, TypeVar, cast
 
-from inspect_ai.util import ExecResult
+from inspect_ai.util import ExecResult, OutputLimitExceededError
+from inspect_ai.util import SandboxEnvironmentLimits as limits
 
-from k8s_sandbox._pod.error import ContainerRestartedError, PodReplacedError
+from k8s_sandbox._pod.compression import (
+    PROBE_COMMAND,
+    Codec,
+    codec_from_probe,
+    compression_enabled,
+)
+from k8s_sandbox._pod.error import (
+    ContainerRestartedError,
+    PodError,
+    PodReplacedError,
+)
 from k8s_sandbox._pod.execute import ExecuteOperation
 from k8s_sandbox._pod.executor import PodOpExecutor
-from k8s_sandbox._pod.op import PodInfo, check_for_pod_restart
-from k8s_sandbox._pod.read import ReadFileOperation
-from k8s_sandbox._pod.write import WriteFileOperation
+from k8s_sandbox._pod.op import RANGE_ALIGNMENT, PodInfo, check_for_pod_restart
+from k8s_sandbox._pod.read import (
+    FILE_SIZE_COMMAND,
+    PARALLEL_READ_THRESHOLD_BYTES,
+    RangeWriter,
+    ReadFileOperation,
+    ReadFilesOperation,
+    ReadRangeOperation,
+    read_streams,
+)
+from k8s_sandbox._pod.session import ShellSessionPool, exec_sessions_enabled
+from k8s_sandbox._pod.websocket import async_streams_enabled, async_streams_supported
+from k8s_sandbox._pod.write import (
+    PARALLEL_WRITE_THRESHOLD_BYTES,
+    VERIFY_WRITTEN_COMMAND,
+    WriteFileOperation,
+    WriteFilesOperation,
+    WriteRangeOperation,
+    write_streams,
+)
+from k8s_sandbox._pod.write_cache import WriteCache, write_cache_enabled
+
+INSPECT_K8S_CONCURRENT_RESTART_CHECK = "INSPECT_K8S_CONCURRENT_RESTART_CHECK"
+INSPECT_K8S_IN_BAND_RESTART_CHECK = "INSPECT_K8S_IN_BAND_RESTART_CHECK"
 
 T = TypeVar("T")
 
@@ -39,6 +75,14 @@ class Pod:
             initial_restart_count,
             restarted_container_behavior,
         )
+        # The container identity last reported by an exec (see
+        # ExecuteOperation.container_identity), once a restart check has passed.
+        self._container_identity: str | None = None
+        self._sessions = ShellSessionPool()
+        # The compression supported by the container, once it has been probed.
+        self._codec: Codec | None = None
+        self._codec_probed = False
+        self._write_cache = WriteCache()
 
     @property
     def info(self) -> PodInfo:
@@ -49,6 +93,11 @@ class Pod:
         """
         return self._info
 
+    @property
+    def write_cache(self) -> WriteCache:
+        """The files written to the pod, to skip identical rewrites (if enabled)."""
+        return self._write_cache
+
     async def check_for_pod_restart(
         self,
     ) -> PodReplacedError | ContainerRestartedError | None:
@@ -69,26 +118,31 @@ class Pod:
     ) -> PodReplacedError | ContainerRestartedError | None:
         try:
             check_for_pod_restart(self._info)
-        except PodReplacedError as e:
+        except (PodReplacedError, ContainerRestartedError) as e:
+            return self._handle_restart(e)
+        return None
+
+    def _handle_restart(
+        self, e: PodReplacedError | ContainerRestartedError
+    ) -> PodReplacedError | ContainerRestartedError:
+        """Refresh the cached identity, then warn or raise per the configured policy."""
+        # The files written to the previous container may no longer exist.
+        self._write_cache.clear()
+        if isinstance(e, PodReplacedError):
             self._info = dataclasses.replace(
                 self._info,
                 uid=e.new_uid,
                 initial_restart_count=e.new_restart_count,
             )
-            if self._info.restarted_container_behavior == "warn":
-                logger.warning(str(e))
-                return e
-            raise
-        except ContainerRestartedError as e:
+        else:
             self._info = dataclasses.replace(
                 self._info,
                 initial_restart_count=e.restart_count,
             )
-            if self._info.restarted_container_behavior == "warn":
-                logger.warning(str(e))
-                return e
-            raise
-        return None
+        if self._info.restarted_container_behavior == "warn":
+            logger.warning(str(e))
+            return e
+        raise e
 
     async def exec(
         self,
@@ -143,17 +197,123 @@ class Pod:
             elapsed. This is enforced by the `timeout` command on the pod. This will not
             terminate background processes started by cmd.
         """
-        warned_restart = await self.check_for_pod_restart()
-        executor = ExecuteOperation(self._info)
-        result = await self._run_async(
-            lambda: executor.exec(cmd, stdin, cwd, env, user, timeout)
-        )
+        self._write_cache.command_started()
+        try:
+            if (
+                _in_band_restart_check_enabled()
+                and self._container_identity is not None
+            ):
+                result, warned_restart = await self._exec_with_in_band_restart_check(
+                    cmd, stdin, cwd, env, user, timeout
+                )
+            elif _concurrent_restart_check_enabled():
+                result, warned_restart = await self._exec_with_concurrent_restart_check(
+                    cmd, stdin, cwd, env, user, timeout
+                )
+            else:
+                warned_restart = await self.check_for_pod_restart()
+                executor = self._execute_operation()
+                result = await self._execute(
+                    executor, cmd, stdin, cwd, env, user, timeout
+                )
+                self._remember_container_identity(executor)
+        finally:
+            self._write_cache.command_finished()
         if not result.success:
             if warned_restart is not None:
                 raise warned_restart
             await self._diagnose_restart_after_failed_exec()
         return result
 
+    async def _exec_with_concurrent_restart_check(
+        self,
+        cmd: list[str],
+        stdin: str | bytes | None,
+        cwd: str | None,
+        env: dict[str, str],
+        user: str | None,
+        timeout: int | None,
+    ) -> tuple[ExecResult[str], PodReplacedError | ContainerRestartedError | None]:
+        """Execute a command whilst checking for a pod restart, rather than before.
+
+        This saves the latency of the restart check on every exec. The outcome is as
+        if the check had run first, other than that the command has been run by the
+        time a detected restart is raised (with ``restarted_container_behavior`` of
+        ``"raise"``). If the exec itself raises, a detected restart is raised in its
+        place, with the exec's exception as the context.
+        """
+        check = asyncio.ensure_future(self.check_for_pod_restart())
+        executor = self._execute_operation()
+        try:
+            result = await self._execute(executor, cmd, stdin, cwd, env, user, timeout)
+        except Exception as e:
+            restart = await _detected_restart(check)
+            if restart is not None:
+                raise restart from e
+            raise
+        except BaseException:
+            # e.g. cancellation of this exec.
+            check.cancel()
+            raise
+        warned_restart = await check
+        self._remember_container_identity(executor)
+        return result, warned_restart
+
+    async def _exec_with_in_band_restart_check(
+        self,
+        cmd: list[str],
+        stdin: str | bytes | None,
+        cwd: str | None,
+        env: dict[str, str],
+        user: str | None,
+        timeout: int | None,
+    ) -> tuple[ExecResult[str], PodReplacedError | ContainerRestartedError | None]:
+        """Execute a command, detecting a restart from the identity the shell reports.
+
+        No request is made of the API server unless the reported container identity
+        differs from the last one, in which case the pod is read to tell a replaced
+        pod from a restarted container. As with the concurrent check, the command has
+        been run by the time a detected restart is raised.
+        """
+        executor = self._execute_operation()
+        result = await self._execute(executor, cmd, stdin, cwd, env, user, timeout)
+        identity = executor.container_identity
+        # No identity is reported if the command didn't run to completion (e.g. `cd`
+        # failed), in which case a failed exec is diagnosed by the caller as usual.
+        if identity is None or identity == self._container_identity:
+            return result, None
+        try:
+            restart = await self.check_for_pod_restart()
+        except (PodReplacedError, ContainerRestartedError):
+            self._container_identity = identity
+            raise
+        # Only now, so that the restart is detected again if the check failed.
+        self._container_identity = identity
+        if restart is None:
+            # The API server hasn't caught up with the restart (e.g. the pod cache is
+            # lagging). Trust the in-band signal: the container's process is new.
+            restart = self._handle_restart(
+                ContainerRestartedError(
+                    pod_name=self._info.name,
+                    container_name=self._info.default_container_name,
+                    restart_count=self._info.initial_restart_count + 1,
+                    last_reason="unknown",
+                )
+            )
+        return result, restart
+
+    def _execute_operation(self) -> ExecuteOperation:
+        return ExecuteOperation(
+            self._info,
+            report_container_identity=_in_band_restart_check_enabled(),
+            sessions=self._sessions if exec_sessions_enabled() else None,
+        )
+
+    def _remember_container_identity(self, executor: ExecuteOperation) -> None:
+        """Use the identity reported by an exec which followed a restart check."""
+        if _in_band_restart_check_enabled() and executor.container_identity:
+            self._container_identity = executor.container_identity
+
     async def _diagnose_restart_after_failed_exec(self) -> None:
         try:
             restart = await self.check_for_pod_restart()
@@ -179,9 +339,131 @@ class Pod:
           dst (Path): The path to write the file to on the pod. Relative paths will be
             resolved relative to the pod's default working directory.
         """
+        codec = await self._transfer_codec()
         await self.check_for_pod_restart()
-        writer = WriteFileOperation(self._info)
-        await self._run_async(lambda: writer.write_file(data, dst))
+        if not (write_cache_enabled() and WriteCache.cacheable(data)):
+            await self._write_file(data, dst, codec)
+            return
+        sha256 = WriteCache.digest(data)
+        if self._write_cache.written(dst, sha256, len(data)):
+            # If no command has been run in the container, nothing can have modified
+            # the file (and a restart would have cleared the cache).
+            if self._write_cache.trusted() or (
+                await self._remote_sha256(dst) == sha256
+            ):
+                self._write_cache.hits += 1
+                logger.debug(
+                    "Skipped rewriting unchanged %s to %s", dst, self._info.name
+                )
+                return
+        self._write_cache.misses += 1
+        self._write_cache.forget(dst)
+        await self._write_file(data, dst, codec)
+        self._write_cache.record(dst, sha256, len(data))
+
+    async def _write_file(self, data: bytes, dst: Path, codec: Codec | None) -> None:
+        streams = write_streams()
+        if streams > 1 and len(data) >= PARALLEL_WRITE_THRESHOLD_BYTES:
+            await self._write_file_in_ranges(data, dst, streams)
+        else:
+            await self._write(WriteFileOperation(self._info, codec), data, dst)
+
+    async def _write_file_in_ranges(self, data: bytes, dst: Path, streams: int) -> None:
+        """Write a large file as ranges over concurrent streams, then verify it."""
+        # Create (or truncate) the file, into which each range is then written.
+        await self._write(WriteFileOperation(self._info), b"", dst)
+        range_size = RANGE_ALIGNMENT * math.ceil(len(data) / streams / RANGE_ALIGNMENT)
+        view = memoryview(data)
+        sha256 = asyncio.ensure_future(asyncio.to_thread(_sha256, data))
+        await _gather_or_cancel(
+            [
+                self._write(
+                    WriteRangeOperation(self._info, offset),
+                    view[offset : offset + range_size],
+                    dst,
+                )
+                for offset in range(0, len(data), range_size)
+            ]
+        )
+        await self._verify_written(dst, len(data), await sha256)
+
+    async def _write(
+        self, writer: WriteFileOperation, data: bytes | memoryview, dst: Path
+    ) -> None:
+        if self._stream_on_event_loop():
+            await self._run_on_event_loop(lambda: writer.awrite_file(data, dst))
+        else:
+            await self._run_async(lambda: writer.write_file(data, dst))
+
+    async def _verify_written(self, dst: Path, size: int, sha256: str) -> None:
+        """Check the size and (if `sha256sum` is available) sha256 of a file."""
+        # Not `self.exec()`: the caller has just checked for a restart, and verifying
+        # modifies nothing.
+        result = await self._execute(
+            self._execute_operation(),
+            VERIFY_WRITTEN_COMMAND + [dst.as_posix()],
+            None,
+            None,
+            {},
+            None,
+            None,
+        )
+        written = result.stdout.split()[:2]
+        expected = [str(size), sha256]
+        if len(written) == 1:
+            logger.debug(
+                "sha256sum is not available in %s; verified only the size of %s",
+                self._info.name,
+                dst,
+            )
+            expected = expected[:1]
+        if written != expected:
+            raise PodError(
+                "File written in ranges to pod does not match.",
+                file=dst.as_posix(),
+                size=size,
+                sha256=sha256,
+                result=result,
+            )
+
+    async def _remote_sha256(self, path: Path) -> str | None:
+        """The sha256 of a file on the pod, or None if it couldn't be hashed."""
+        # Not `self.exec()`: the caller has just checked for a restart, and hashing
+        # modifies nothing.
+        result = await self._execute(
+            self._execute_operation(),
+            ["sha256sum", path.as_posix()],
+            None,
+            None,
+            {},
+            None,
+            None,
+        )
+        return result.stdout.split()[0] if result.success and result.stdout else None
+
+    async def write_files(self, files: dict[Path, bytes]) -> dict[Path, Exception]:
+        """
+        Write several files from the client to paths on the pod in a single exec.
+
+        Existing files on the pod will be overwritten. Each file is written
+        independently of the others.
+
+        Args:
+          files (dict[Path, bytes]): The contents to write to the pod, keyed by the
+            path to write them to. Relative paths will be resolved relative to the
+            pod's default working directory.
+
+        Returns:
+          The exception for each file which could not be written, as `write_file`
+          would have raised it.
+        """
+        await self.check_for_pod_restart()
+        for dst in files:
+            self._write_cache.forget(dst)
+        writer = WriteFilesOperation(self._info)
+        if self._stream_on_event_loop():
+            return await self._run_on_event_loop(lambda: writer.awrite_files(files))
+        return await self._run_async(lambda: writer.write_files(files))
 
     async def read_file(self, src: Path, dst: IO[bytes]) -> None:
         """
@@ -195,11 +477,220 @@ class Pod:
             relative to the pod's default working directory.
           dst (IO[bytes]): A file-like object to write the file to on the client system.
         """
+        codec = await self._transfer_codec()
+        await self.check_for_pod_restart()
+        streams = read_streams()
+        if streams > 1 and _supports_positional_writes(dst):
+            size = await self._file_size(src)
+            if size is not None and size >= PARALLEL_READ_THRESHOLD_BYTES:
+                await self._read_file_in_ranges(src, dst, size, streams)
+                return
+        await self._read(ReadFileOperation(self._info, codec), src, dst)
+
+    async def _read_file_in_ranges(
+        self, src: Path, dst: IO[bytes], size: int, streams: int
+    ) -> None:
+        """Read a large file as ranges over concurrent streams, written in place."""
+        if size > limits.MAX_READ_FILE_SIZE:
+            raise OutputLimitExceededError(
+                limit_str=limits.MAX_READ_FILE_SIZE_STR, truncated_output=None
+            )
+        # Anything buffered must be written before the ranges are written around it.
+        dst.flush()
+        start_position = dst.tell()
+        range_size = RANGE_ALIGNMENT * math.ceil(size / streams / RANGE_ALIGNMENT)
+        ranges = [
+            (offset, min(range_size, size - offset))
+            for offset in range(0, size, range_size)
+        ]
+        writers = [
+            RangeWriter(dst.fileno(), start_position + offset, length)
+            for offset, length in ranges
+        ]
+        await _gather_or_cancel(
+            [
+                self._read(
+                    ReadRangeOperation(self._info, offset, length),
+                    src,
+                    cast(IO[bytes], writer),
+                )
+                for (offset, length), writer in zip(ranges, writers)
+            ]
+        )
+        if sum(writer.written for writer in writers) != size:
+            raise PodError(
+                "File read in ranges from pod shrank whilst it was read.",
+                file=src.as_posix(),
+                size=size,
+            )
+        # Leave dst positioned as if the file had been written to it sequentially.
+        dst.seek(start_position + size)
+
+    async def _read(self, reader: ReadFileOperation, src: Path, dst: IO[bytes]) -> None:
+        if self._stream_on_event_loop():
+            await self._run_on_event_loop(lambda: reader.aread_file(src, dst))
+        else:
+            await self._run_async(lambda: reader.read_file(src, dst))
+
+    async def _file_size(self, path: Path) -> int | None:
+        """The size of a regular file on the pod, or None if it couldn't be read."""
+        # Not `self.exec()`: the caller has just checked for a restart.
+        result = await self._execute(
+            self._execute_operation(),
+            FILE_SIZE_COMMAND + [path.as_posix()],
+            None,
+            None,
+            {},
+            None,
+            None,
+        )
+        try:
+            return int(result.stdout) if result.success else None
+        except ValueError:
+            return None
+
+    async def read_files(self, srcs: list[Path]) -> dict[Path, bytes | Exception]:
+        """
+        Read several files from the pod (as a single tar archive) into memory.
+
+        Args:
+          srcs (list[Path]): The paths to the files on the pod. Relative paths will be
+            resolved relative to the pod's default working directory.
+
+        Returns:
+          The contents of each file, or the exception `read_file` would have raised
+          for it.
+        """
         await self.check_for_pod_restart()
-        reader = ReadFileOperation(self._info)
-        await self._run_async(lambda: reader.read_file(src, dst))
+        reader = ReadFilesOperation(self._info)
+        if self._stream_on_event_loop():
+            return await self._run_on_event_loop(lambda: reader.aread_files(srcs))
+        return await self._run_async(lambda: reader.read_files(srcs))
+
+    async def read_dir(self, src: Path) -> dict[str, bytes]:
+        """
+        Read the regular files within a directory on the pod (recursively) into memory.
+
+        Args:
+          src (Path): The path to the directory on the pod. Relative paths will be
+            resolved relative to the pod's default working directory.
+
+        Returns:
+          The contents of each file, keyed by its path relative to src.
+        """
+        await self.check_for_pod_restart()
+        reader = ReadFilesOperation(self._info)
+        if self._stream_on_event_loop():
+            return await self._run_on_event_loop(lambda: reader.aread_dir(src))
+        return await self._run_async(lambda: reader.read_dir(src))
+
+    async def _transfer_codec(self) -> Codec | None:
+        """The codec to compress file transfers with, probing the container once."""
+        if not compression_enabled():
+            return None
+        if self._codec_probed:
+            return self._codec
+        result = await self.exec(PROBE_COMMAND, None, None, {}, None, None)
+        self._codec = codec_from_probe(result.stdout) if result.success else None
+        self._codec_probed = True
+        logger.debug(
+            "Probed %s for compression: %s",
+            self._info.name,
+            self._codec.name if self._codec else "none",
+        )
+        return self._codec
+
+    async def _execute(
+        self,
+        executor: ExecuteOperation,
+        cmd: list[str],
+        stdin: str | bytes | None,
+        cwd: str | None,
+        env: dict[str, str],
+        user: str | None,
+        timeout: int | None,
+    ) -> ExecResult[str]:
+        if self._stream_on_event_loop() and not executor.uses_sessions:
+            return await self._run_on_event_loop(
+                lambda: executor.aexec(cmd, stdin, cwd, env, user, timeout)
+            )
+        return await self._run_async(
+            lambda: executor.exec(cmd, stdin, cwd, env, user, timeout)
+        )
+
+    def _stream_on_event_loop(self) -> bool:
+        return async_streams_enabled() and async_streams_supported(
+            self._info.context_name
+        )
+
+    def close_sessions(self) -> None:
+        """Close the idle shell sessions used to execute commands, if any."""
+        self._sessions.close()
 
     async def _run_async(self, callable: Callable[[], T]) -> T:
         """Run a synchronous function asynchronously."""
         executor = PodOpExecutor.get_instance()
         return await executor.queue_operation(callable)
+
+    async def _run_on_event_loop(self, operation: Callable[[], Awaitable[T]]) -> T:
+        """Run an asynchronous function, subject to the pod op concurrency limit."""
+        executor = PodOpExecutor.get_instance()
+        return await executor.queue_async_operation(operation)
+
+
+async def _detected_restart(
+    check: asyncio.Future[PodReplacedError | ContainerRestartedError | None],
+) -> PodReplacedError | ContainerRestartedError | None:
+    """The restart detected by a restart check, whether it was raised or returned."""
+    try:
+        return await check
+    except (PodReplacedError, ContainerRestartedError) as e:
+        return e
+    except Exception:
+        logger.debug("Restart check failed alongside a failed exec.", exc_info=True)
+        return None
+
+
+def _concurrent_restart_check_enabled() -> bool:
+    return os.getenv(INSPECT_K8S_CONCURRENT_RESTART_CHECK, "false").lower() in {
+        "1",
+        "true",
+        "yes",
+        "y",
+    }
+
+
+def _in_band_restart_check_enabled() -> bool:
+    return os.getenv(INSPECT_K8S_IN_BAND_RESTART_CHECK, "false").lower() in {
+        "1",
+        "true",
+        "yes",
+        "y",
+    }
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _supports_positional_writes(file: IO[bytes]) -> bool:
+    if not hasattr(os, "pwrite"):
+        # e.g. on Windows.
+        return False
+    try:
+        file.fileno()
+    except (AttributeError, OSError):
+        return False
+    return True
+
+
+async def _gather_or_cancel(operations: list[Awaitable[None]]) -> None:
+    """Run the operations concurrently, cancelling the rest if any of them fails."""
+    tasks = [asyncio.ensure_future(operation) for operation in operations]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
@@ -1,32 +1,132 @@
+import math
+import os
+import re
+import tarfile
+import tempfile
 from contextlib import contextmanager
 from pathlib import Path
 from typing import IO, Generator
 
 from inspect_ai.util import OutputLimitExceededError
 from inspect_ai.util import SandboxEnvironmentLimits as limits
-from kubernetes.stream.ws_client import WSClient  # type: ignore[import-untyped]
+from kubernetes.stream.ws_client import (  # type: ignore[import-untyped]
+    ERROR_CHANNEL,
+    STDERR_CHANNEL,
+    STDOUT_CHANNEL,
+    WSClient,
+)
 
 from k8s_sandbox._pod.buffer import LimitedBuffer
+from k8s_sandbox._pod.compression import Codec, DecompressingWriter, read_script
 from k8s_sandbox._pod.error import PodError
-from k8s_sandbox._pod.get_returncode import get_returncode
+from k8s_sandbox._pod.get_returncode import get_returncode, parse_returncode
 from k8s_sandbox._pod.op import (
+    RANGE_ALIGNMENT,
+    PodInfo,
     PodOperation,
     raise_for_known_read_write_errors,
 )
+from k8s_sandbox._pod.websocket import ExecStream
+
+# Archives up to this size are spooled in memory rather than to a temporary file.
+_SPOOL_SIZE = 1024 * 1024
+# Links each readable path (the arguments) into a staging directory, named by its
+# index, and archives them to stdout. The error reading each other path is written to
+# stderr after a marker.
+_READ_FILES_SCRIPT = """\
+staging=$(mktemp -d) || exit
+trap 'rm -rf "$staging"' EXIT
+i=0
+readable=
+for src do
+  case $src in /*) ;; *) src="$PWD/$src" ;; esac
+  if [ -d "$src" ]; then
+    printf '\\n<read-error-%s>\\n%s: Is a directory\\n' "$i" "$src" >&2
+  elif error=$(head -c 0 "$src" 2>&1); then
+    ln -s "$src" "$staging/$i" && readable="$readable $i"
+  else
+    printf '\\n<read-error-%s>\\n%s\\n' "$i" "$error" >&2
+  fi
+  i=$((i + 1))
+done
+[ -z "$readable" ] || tar -c -h -f - -C "$staging" $readable
+"""
+_READ_ERROR_PATTERN = re.compile(r"\n<read-error-(\d+)>\n")
+INSPECT_K8S_READ_STREAMS = "INSPECT_K8S_READ_STREAMS"
+# Files at least this large are read over several streams, if enabled.
+PARALLEL_READ_THRESHOLD_BYTES = 64 * 1024**2
+# Prints the size of the file `$1`, if it is a regular file.
+FILE_SIZE_COMMAND = ["/bin/sh", "-c", '[ -f "$1" ] && stat -c %s "$1"', "sh"]
+
+
+def read_streams() -> int:
+    """The number of streams to read each large file over (1, by default)."""
+    try:
+        return max(1, int(os.environ[INSPECT_K8S_READ_STREAMS]))
+    except (KeyError, ValueError):
+        return 1
 
 
 class ReadFileOperation(PodOperation):
+    def __init__(self, pod: PodInfo, codec: Codec | None = None) -> None:
+        """Create the operation.
+
+        Args:
+          pod: The Pod to read from.
+          codec: The compression supported by the container, if any. Files which are
+            large enough are compressed with it.
+        """
+        super().__init__(pod)
+        self._codec = codec
+
     def read_file(self, src: Path, dst: IO[bytes]) -> None:
         with self._start_read_command(src) as ws_client:
             self._handle_stream_output(ws_client, dst)
 
-    @contextmanager
-    def _start_read_command(self, src: Path) -> Generator[WSClient, None, None]:
+    async def aread_file(self, src: Path, dst: IO[bytes]) -> None:
+        """Like `read_file`, but streams over the event loop."""
+        stderr = LimitedBuffer(limits.MAX_EXEC_OUTPUT_SIZE)
+        start_position = dst.tell()
+        sink = self._sink(dst)
+        status: bytes | None = None
+        command = [str(part) for part in self._read_command(src)]
+        async with ExecStream(self._pod, command, stdin=False) as stream:
+            async for channel, data in stream:
+                if channel == STDOUT_CHANNEL:
+                    sink.write(data)
+                    self._verify_output_limit(dst.tell() - start_position)
+                elif channel == STDERR_CHANNEL:
+                    stderr.append(data)
+                elif channel == ERROR_CHANNEL:
+                    status = data
+        self._raise_for_returncode(parse_returncode(status), str(stderr))
+        sink.flush()
+
+    def _read_command(self, src: Path) -> list[str | int]:
         # Limit number of bytes read (-c) to 1 byte over the limit (to detect if the
         # file is too large).
-        command = ["head", "-c", limits.MAX_READ_FILE_SIZE + 1, src.as_posix()]
+        limit = limits.MAX_READ_FILE_SIZE + 1
+        if self._codec is not None:
+            return [
+                "/bin/sh",
+                "-c",
+                read_script(self._codec),
+                "sh",
+                src.as_posix(),
+                limit,
+            ]
+        return ["head", "-c", limit, src.as_posix()]
+
+    def _sink(self, dst: IO[bytes]) -> IO[bytes] | DecompressingWriter:
+        """Where to write the command's output, decompressing it if needs be."""
+        if self._codec is None:
+            return dst
+        return DecompressingWriter(dst, self._codec)
+
+    @contextmanager
+    def _start_read_command(self, src: Path) -> Generator[WSClient, None, None]:
         yield from self.create_websocket_client_for_exec(
-            command=command,
+            command=self._read_command(src),
             stderr=True,
             stdin=False,
             stdout=True,
@@ -38,6 +138,7 @@ class ReadFileOperation(PodOperation):
         # `head` should not produce large amounts of stderr, but limit it nonetheless.
         stderr = LimitedBuffer(limits.MAX_EXEC_OUTPUT_SIZE)
         start_position = dst.tell()
+        sink = self._sink(dst)
         # Stream the response, writing it to dst as we go to avoid holding the whole
         # response in memory.
         while ws_client.is_open():
@@ -45,23 +146,243 @@ class ReadFileOperation(PodOperation):
             # data to read.
             ws_client.update(timeout=None)
             if ws_client.peek_stdout():
-                dst.write(ws_client.read_stdout())
+                sink.write(ws_client.read_stdout())
                 self._verify_output_limit(dst.tell() - start_position)
             if ws_client.peek_stderr():
                 stderr.append(ws_client.read_stderr())
-        returncode = get_returncode(ws_client)
+        self._raise_for_returncode(get_returncode(ws_client), str(stderr))
+        sink.flush()
+
+    def _raise_for_returncode(self, returncode: int, stderr: str) -> None:
         if returncode != 0:
-            stderr_str = str(stderr)
-            raise_for_known_read_write_errors(stderr_str)
+            raise_for_known_read_write_errors(stderr)
             raise PodError(
                 "Unrecognised error reading file from pod.",
                 returncode=returncode,
-                stderr=stderr_str,
+                stderr=stderr,
             )
-        dst.flush()
 
     def _verify_output_limit(self, bytes_written: int) -> None:
         if bytes_written > limits.MAX_READ_FILE_SIZE:
             raise OutputLimitExceededError(
                 limit_str=limits.MAX_READ_FILE_SIZE_STR, truncated_output=None
             )
+
+
+class ReadRangeOperation(ReadFileOperation):
+    """Reads a range of a file, to read a large file over several streams.
+
+    The range must start at a multiple of `RANGE_ALIGNMENT`. Use a `RangeWriter` as the
+    destination, to write the range at its offset.
+    """
+
+    def __init__(self, pod: PodInfo, offset: int, length: int) -> None:
+        """Create the operation.
+
+        Args:
+          pod: The Pod to read from.
+          offset: The offset in the file at which the range starts.
+          length: The length of the range.
+        """
+        super().__init__(pod)
+        assert offset % RANGE_ALIGNMENT == 0, "ranges must be aligned"
+        self._offset = offset
+        self._length = length
+
+    def _read_command(self, src: Path) -> list[str | int]:
+        return [
+            "dd",
+            f"if={src.as_posix()}",
+            f"bs={RANGE_ALIGNMENT}",
+            f"skip={self._offset // RANGE_ALIGNMENT}",
+            f"count={math.ceil(self._length / RANGE_ALIGNMENT)}",
+        ]
+
+
+class RangeWriter:
+    """Writes a range of a file read by `ReadRangeOperation` to its offset in `fd`.
+
+    Uses positional writes, so that ranges can be written concurrently. Anything read
+    beyond the range (if the file has grown since its size was read) is discarded.
+    """
+
+    def __init__(self, fd: int, position: int, length: int) -> None:
+        self._fd = fd
+        self._position = position
+        self._length = length
+        self.written = 0
+
+    def write(self, data: bytes) -> int:
+        view = memoryview(data)[: self._length - self.written]
+        size = len(view)
+        while view:
+            written = os.pwrite(self._fd, view, self._position + self.written)
+            self.written += written
+            view = view[written:]
+        return size
+
+    def tell(self) -> int:
+        return self.written
+
+    def flush(self) -> None:
+        pass
+
+
+class ReadFilesOperation(PodOperation):
+    """Reads several files, or a directory, from the pod as a single tar archive.
+
+    The archive is spooled on the client and limited to `MAX_READ_FILE_SIZE` bytes, as
+    a single `read_file` is. Requires `tar` on the pod (and `mktemp` to read files).
+    """
+
+    def read_files(self, srcs: list[Path]) -> dict[Path, bytes | Exception]:
+        """Read the files from the pod.
+
+        Returns:
+          The contents of each file, or the exception `read_file` would have raised for
+          it.
+        """
+        with tempfile.SpooledTemporaryFile(_SPOOL_SIZE) as archive:
+            with self._start_archive_command(self._read_files_command(srcs)) as ws:
+                stderr = self._handle_archive_output(ws, archive)
+            return self._files(srcs, archive, stderr)
+
+    async def aread_files(self, srcs: list[Path]) -> dict[Path, bytes | Exception]:
+        """Like `read_files`, but streams over the event loop."""
+        with tempfile.SpooledTemporaryFile(_SPOOL_SIZE) as archive:
+            command = self._read_files_command(srcs)
+            stderr = await self._ahandle_archive_output(command, archive)
+            return self._files(srcs, archive, stderr)
+
+    def read_dir(self, src: Path) -> dict[str, bytes]:
+        """Read the regular files within a directory (recursively) from the pod.
+
+        Returns:
+          The contents of each file, keyed by its path relative to `src`.
+        """
+        with tempfile.SpooledTemporaryFile(_SPOOL_SIZE) as archive:
+            with self._start_archive_command(self._read_dir_command(src)) as ws:
+                self._handle_archive_output(ws, archive)
+            return _regular_files(archive)
+
+    async def aread_dir(self, src: Path) -> dict[str, bytes]:
+        """Like `read_dir`, but streams over the event loop."""
+        with tempfile.SpooledTemporaryFile(_SPOOL_SIZE) as archive:
+            await self._ahandle_archive_output(self._read_dir_command(src), archive)
+            return _regular_files(archive)
+
+    def _read_files_command(self, srcs: list[Path]) -> list[str]:
+        return ["/bin/sh", "-c", _READ_FILES_SCRIPT, "sh"] + [
+            src.as_posix() for src in srcs
+        ]
+
+    def _read_dir_command(self, src: Path) -> list[str]:
+        return ["tar", "-c", "-f", "-", "-C", src.as_posix(), "."]
+
+    @contextmanager
+    def _start_archive_command(
+        self, command: list[str]
+    ) -> Generator[WSClient, None, None]:
+        yield from self.create_websocket_client_for_exec(
+            command=command,
+            stderr=True,
+            stdin=False,
+            stdout=True,
+            # Leave stdout (and stderr) as binary.
+            binary=True,
+        )
+
+    def _handle_archive_output(self, ws_client: WSClient, dst: IO[bytes]) -> str:
+        stderr = LimitedBuffer(limits.MAX_EXEC_OUTPUT_SIZE)
+        while ws_client.is_open():
+            ws_client.update(timeout=None)
+            if ws_client.peek_stdout():
+                dst.write(ws_client.read_stdout())
+                _verify_archive_limit(dst.tell())
+            if ws_client.peek_stderr():
+                stderr.append(ws_client.read_stderr())
+        _raise_for_archive_returncode(get_returncode(ws_client), str(stderr))
+        dst.seek(0)
+        return str(stderr)
+
+    async def _ahandle_archive_output(self, command: list[str], dst: IO[bytes]) -> str:
+        stderr = LimitedBuffer(limits.MAX_EXEC_OUTPUT_SIZE)
+        status: bytes | None = None
+        async with ExecStream(self._pod, command, stdin=False) as stream:
+            async for channel, data in stream:
+                if channel == STDOUT_CHANNEL:
+                    dst.write(data)
+                    _verify_archive_limit(dst.tell())
+                elif channel == STDERR_CHANNEL:
+                    stderr.append(data)
+                elif channel == ERROR_CHANNEL:
+                    status = data
+        _raise_for_archive_returncode(parse_returncode(status), str(stderr))
+        dst.seek(0)
+        return str(stderr)
+
+    def _files(
+        self, srcs: list[Path], archive: IO[bytes], stderr: str
+    ) -> dict[Path, bytes | Exception]:
+        parts = _READ_ERROR_PATTERN.split(stderr)
+        errors = {
+            int(index): _read_error(error)
+            for index, error in zip(parts[1::2], parts[2::2])
+        }
+        contents = _regular_files(archive)
+        files: dict[Path, bytes | Exception] = {}
+        for index, src in enumerate(srcs):
+            if index in errors:
+                files[src] = errors[index]
+            elif str(index) in contents:
+                files[src] = contents[str(index)]
+            else:
+                files[src] = PodError(
+                    "File missing from archive read from pod.", stderr=stderr
+                )
+        return files
+
+
+def _regular_files(archive: IO[bytes]) -> dict[str, bytes]:
+    """The contents of each regular file in the archive, keyed by relative path."""
+    if not archive.read(1):
+        # Nothing was archived.
+        return {}
+    archive.seek(0)
+    files: dict[str, bytes] = {}
+    with tarfile.open(fileobj=archive, mode="r:") as tar:
+        for member in tar:
+            # Hard links are resolved, e.g. if the same file was read twice.
+            if not (member.isfile() or member.islnk()):
+                continue
+            extracted = tar.extractfile(member)
+            if extracted is not None:
+                name = member.name.removeprefix("./")
+                files[name] = extracted.read()
+    return files
+
+
+def _raise_for_archive_returncode(returncode: int, stderr: str) -> None:
+    if returncode != 0:
+        raise_for_known_read_write_errors(stderr)
+        raise PodError(
+            "Unrecognised error reading files from pod.",
+            returncode=returncode,
+            stderr=stderr,
+        )
+
+
+def _verify_archive_limit(size: int) -> None:
+    if size > limits.MAX_READ_FILE_SIZE:
+        raise OutputLimitExceededError(
+            limit_str=limits.MAX_READ_FILE_SIZE_STR, truncated_output=None
+        )
+
+
+def _read_error(stderr: str) -> Exception:
+    """The exception `read_file` would have raised for the error reading a file."""
+    try:
+        raise_for_known_read_write_errors(stderr)
+    except OSError as e:
+        return e
+    return PodError("Unrecognised error reading file from pod.", stderr=stderr)
@@ -0,0 +1,130 @@
+"""Long-lived shells in which successive commands are executed.
+
+Each exec otherwise opens a new ``connect_get_namespaced_pod_exec`` websocket: a TLS
+handshake, a hop through the API server and the setup of a kubelet stream, followed
+by the start of a new ``/bin/sh`` (and ``runuser``) process in the container. When
+enabled, each Pod instead keeps an idle shell per user whose websocket stays open
+between commands. Commands are written to the shell's stdin and their completion is
+detected by the same sentinel protocol as a one-off exec.
+
+A session runs one command at a time. Concurrent execs as the same user each open
+their own session, and only one idle session per user is retained afterwards.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from contextlib import AbstractContextManager, ExitStack, contextmanager
+from typing import Callable, Iterator
+
+from kubernetes.stream.ws_client import WSClient  # type: ignore[import-untyped]
+
+INSPECT_K8S_EXEC_SESSIONS = "INSPECT_K8S_EXEC_SESSIONS"
+
+logger = logging.getLogger(__name__)
+
+
+def exec_sessions_enabled() -> bool:
+    """Whether commands should be executed in persistent shell sessions."""
+    return os.getenv(INSPECT_K8S_EXEC_SESSIONS, "false").lower() in {
+        "1",
+        "true",
+        "yes",
+        "y",
+    }
+
+
+class ShellSession:
+    """A shell in a container, connected over a websocket which outlives commands.
+
+    Not thread-safe: a session is used by one exec at a time (see
+    `ShellSessionPool.checkout`).
+    """
+
+    def __init__(self, user: str | None) -> None:
+        self.user = user
+        self._stack = ExitStack()
+        self._ws_client: WSClient | None = None
+
+    @property
+    def ws_client(self) -> WSClient:
+        assert self._ws_client is not None, "The session has not been opened."
+        return self._ws_client
+
+    @property
+    def opened(self) -> bool:
+        return self._ws_client is not None
+
+    def open(self, shell: Callable[[], AbstractContextManager[WSClient]]) -> None:
+        """Start the shell, closing any shell which this session previously held."""
+        self.close()
+        self._ws_client = self._stack.enter_context(shell())
+
+    def alive(self) -> bool:
+        """Whether the shell is still connected and can accept a command.
+
+        Processes any frames already received so that a shell which has exited (e.g.
+        because its container restarted) is noticed before a command is written to it.
+        """
+        if self._ws_client is None:
+            return False
+        try:
+            self._ws_client.update(timeout=0)
+            return self._ws_client.is_open()
+        except Exception:
+            logger.debug("Shell session is no longer usable.", exc_info=True)
+            return False
+
+    def close(self) -> None:
+        self._ws_client = None
+        try:
+            self._stack.close()
+        except Exception:
+            logger.debug("Failed to close shell session.", exc_info=True)
+        self._stack = ExitStack()
+
+
+class ShellSessionPool:
+    """The idle shell sessions of a Pod, at most one per user.
+
+    This class is thread-safe.
+    """
+
+    def __init__(self) -> None:
+        self._idle: dict[str | None, ShellSession] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @contextmanager
+    def checkout(self, user: str | None) -> Iterator[ShellSession]:
+        """Take the user's idle session (or a new, unopened one) for one command.
+
+        The session is returned to the pool if the command completes, and closed if it
+        raises, as the shell may still be running the command.
+        """
+        with self._lock:
+            session = self._idle.pop(user, None)
+        if session is None:
+            session = ShellSession(user)
+        try:
+            yield session
+        except BaseException:
+            session.close()
+            raise
+        with self._lock:
+            keep = not self._closed and user not in self._idle
+            if keep:
+                self._idle[user] = session
+        if not keep:
+            session.close()
+
+    def close(self) -> None:
+        """Close all idle sessions. Sessions in use are closed when returned."""
+        with self._lock:
+            self._closed = True
+            sessions = list(self._idle.values())
+            self._idle.clear()
+        for session in sessions:
+            session.close()
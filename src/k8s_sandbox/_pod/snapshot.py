@@ -36,6 +36,10 @@ class ContainerStatus:
     name: str
     restart_count: int
     last_terminated_reason: str | None
+    ready: bool = False
+    waiting_reason: str | None = None
+    """Why the container is not yet running (e.g. ``ImagePullBackOff``), if waiting."""
+    waiting_message: str | None = None
 
 
 @dataclass(frozen=True)
@@ -53,6 +57,12 @@ class PodSnapshot:
     container_names: tuple[str, ...]
     """Container names from the pod spec, in declared order."""
     container_statuses: tuple[ContainerStatus, ...] | None
+    init_container_statuses: tuple[ContainerStatus, ...] = ()
+    phase: str | None = None
+    ready: bool = False
+    """Whether the pod's ``Ready`` condition is true."""
+    deleting: bool = False
+    """Whether the pod has a deletion timestamp (i.e. is terminating)."""
 
     def status_for(self, container_name: str) -> ContainerStatus | None:
         if self.container_statuses is None:
@@ -67,17 +77,26 @@ class PodSnapshot:
         return status.restart_count if status is not None else 0
 
 
-def read_pod(api: client.CoreV1Api, name: str, namespace: str) -> PodSnapshot:
+def read_pod(
+    api: client.CoreV1Api,
+    name: str,
+    namespace: str,
+    request_timeout: float | None = None,
+) -> PodSnapshot:
     """Read a single pod, bypassing the kubernetes client's model deserialization."""
     # _preload_content is passed through to the generated client's **kwargs at
     # runtime but is absent from the typed stubs, hence the call-arg ignore.
+    # A float is a total timeout. Only passed if given, leaving the default otherwise.
+    timeout: dict[str, Any] = {}
+    if request_timeout is not None:
+        timeout["_request_timeout"] = request_timeout
     response = cast(
         HTTPResponse,
         api.read_namespaced_pod(  # type: ignore[call-arg]
-            name=name, namespace=namespace, _preload_content=False
+            name=name, namespace=namespace, _preload_content=False, **timeout
         ),
     )
-    return _parse_pod(json.loads(response.data))
+    return parse_pod(json.loads(response.data))
 
 
 def list_pods(
@@ -92,10 +111,11 @@ def list_pods(
         ),
     )
     body = json.loads(response.data)
-    return [_parse_pod(item) for item in body.get("items", [])]
+    return [parse_pod(item) for item in body.get("items", [])]
 
 
-def _parse_pod(pod: dict[str, Any]) -> PodSnapshot:
+def parse_pod(pod: dict[str, Any]) -> PodSnapshot:
+    """Parse a pod from its raw JSON representation (as returned by the API)."""
     metadata = pod.get("metadata") or {}
     spec = pod.get("spec") or {}
     status = pod.get("status") or {}
@@ -109,19 +129,33 @@ def _parse_pod(pod: dict[str, Any]) -> PodSnapshot:
         if raw_statuses is not None
         else None
     )
+    conditions = status.get("conditions") or []
     return PodSnapshot(
         name=name,
         uid=uid,
         labels=metadata.get("labels") or {},
         container_names=tuple(c["name"] for c in spec.get("containers") or []),
         container_statuses=container_statuses,
+        init_container_statuses=tuple(
+            _parse_container_status(cs)
+            for cs in status.get("initContainerStatuses") or []
+        ),
+        phase=status.get("phase"),
+        ready=any(
+            c.get("type") == "Ready" and c.get("status") == "True" for c in conditions
+        ),
+        deleting=metadata.get("deletionTimestamp") is not None,
     )
 
 
 def _parse_container_status(cs: dict[str, Any]) -> ContainerStatus:
     terminated = (cs.get("lastState") or {}).get("terminated") or {}
+    waiting = (cs.get("state") or {}).get("waiting") or {}
     return ContainerStatus(
         name=cs["name"],
         restart_count=cs.get("restartCount", 0),
         last_terminated_reason=terminated.get("reason"),
+        ready=cs.get("ready", False),
+        waiting_reason=waiting.get("reason"),
+        waiting_message=waiting.get("message"),
     )
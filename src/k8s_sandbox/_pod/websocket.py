@@ -0,0 +1,433 @@
+"""An asyncio client for the exec streams of Kubernetes Pods.
+
+The kubernetes client's ``WSClient`` is synchronous, so each in-flight exec, read or
+write otherwise occupies a ``PodOpExecutor`` thread blocked on its socket. When
+enabled, these operations instead run on the event loop over a minimal RFC 6455
+websocket client, so that the number of concurrent operations is limited by sockets
+rather than threads.
+
+Only what the exec subresource requires is implemented: the ``v5.channel.k8s.io`` and
+``v4.channel.k8s.io`` subprotocols (in which each binary message is prefixed with its
+channel number, and v5 adds a message to close a channel), fragmented messages,
+ping/pong and closing handshakes. Connections through an HTTP
+proxy are not supported, in which case the threaded implementation is used.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import ssl
+import struct
+import time
+from dataclasses import dataclass
+from types import TracebackType
+from typing import Any
+from urllib.parse import quote, urlencode, urlparse
+
+import certifi
+from kubernetes.client.exceptions import ApiException  # type: ignore
+from kubernetes.stream.ws_client import (  # type: ignore[import-untyped]
+    RESIZE_CHANNEL,
+    STDIN_CHANNEL,
+)
+
+from k8s_sandbox._deadline import bounded
+from k8s_sandbox._kubernetes_api import k8s_client
+from k8s_sandbox._logger import log_debug
+from k8s_sandbox._pod.error import PodError
+from k8s_sandbox._pod.keepalive import _KEEPALIVE_INTERVAL_SECONDS, KEEPALIVE_PAYLOAD
+from k8s_sandbox._pod.op import (
+    _STDIN_CHUNK_SIZE,
+    API_TIMEOUT,
+    V5_CHANNEL_PROTOCOL,
+    AdaptiveFrameSize,
+    PodInfo,
+    remember_stdin_closable,
+)
+
+INSPECT_K8S_ASYNC_STREAMS = "INSPECT_K8S_ASYNC_STREAMS"
+V4_CHANNEL_PROTOCOL = "v4.channel.k8s.io"
+
+_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+# Signals, in v5.channel.k8s.io, that the channel which follows has been closed.
+_CLOSE_CHANNEL = 255
+_OP_CONTINUATION = 0x0
+_OP_TEXT = 0x1
+_OP_BINARY = 0x2
+_OP_CLOSE = 0x8
+_OP_PING = 0x9
+_OP_PONG = 0xA
+_CLOSE_NORMAL = 1000
+_MAX_HANDSHAKE_BYTES = 64 * 1024
+
+_ssl_contexts: dict[tuple[Any, ...], ssl.SSLContext] = {}
+# Whether each kube context's cluster is reached through an HTTP proxy.
+_proxied: dict[str | None, bool] = {}
+
+
+def async_streams_enabled() -> bool:
+    """Whether pod operations should stream over the event loop."""
+    return os.getenv(INSPECT_K8S_ASYNC_STREAMS, "false").lower() in {
+        "1",
+        "true",
+        "yes",
+        "y",
+    }
+
+
+def async_streams_supported(context_name: str | None) -> bool:
+    """Whether the cluster can be reached without an HTTP proxy.
+
+    This is checked once per context, as getting a client may load the kubeconfig,
+    which would block the event loop.
+    """
+    if context_name not in _proxied:
+        configuration = k8s_client(context_name).api_client.configuration  # type: ignore[attr-defined]
+        _proxied[context_name] = bool(configuration.proxy)
+    return not _proxied[context_name]
+
+
+@dataclass(frozen=True)
+class _Endpoint:
+    host: str
+    port: int
+    path: str
+    ssl: ssl.SSLContext | None
+    server_hostname: str | None
+    headers: dict[str, str]
+
+
+class ExecStream:
+    """A websocket connected to a command run by a Pod's exec subresource.
+
+    Use as an async context manager, which opens the connection and closes it on exit.
+    Iterate over the stream for each (channel, data) message received from the
+    server; iteration ends once the server has closed the connection.
+    """
+
+    def __init__(self, pod: PodInfo, command: list[str], stdin: bool) -> None:
+        self._pod = pod
+        self._command = command
+        self._stdin = stdin
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._write_lock = asyncio.Lock()
+        self._keepalive: asyncio.Task[None] | None = None
+        self._close_sent = False
+        self._closed = False
+        self.subprotocol: str | None = None
+
+    async def __aenter__(self) -> ExecStream:
+        # This is the timeout for connecting, not for the command itself.
+        await asyncio.wait_for(self._connect(), bounded(API_TIMEOUT))
+        self._keepalive = asyncio.create_task(self._send_keepalive())
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        await self.close()
+
+    def __aiter__(self) -> ExecStream:
+        return self
+
+    async def __anext__(self) -> tuple[int, bytes]:
+        message = await self.receive()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+    async def write_stdin(
+        self, data: bytes | memoryview, frames: AdaptiveFrameSize | None = None
+    ) -> None:
+        """Write to the command's stdin, in frames of at most `_STDIN_CHUNK_SIZE`.
+
+        If `frames` is given, it sizes the frames instead (up to the same limit).
+        """
+        view = memoryview(data)
+        if frames is None:
+            for i in range(0, len(view), _STDIN_CHUNK_SIZE):
+                await self.send(STDIN_CHANNEL, view[i : i + _STDIN_CHUNK_SIZE])
+            return
+        i = 0
+        while i < len(view):
+            chunk = view[i : i + frames.size]
+            start = time.monotonic()
+            await self.send(STDIN_CHANNEL, chunk)
+            frames.observe(len(chunk), time.monotonic() - start)
+            i += len(chunk)
+
+    @property
+    def can_close_stdin(self) -> bool:
+        """Whether v5.channel.k8s.io was negotiated, in which stdin can be closed."""
+        return self.subprotocol == V5_CHANNEL_PROTOCOL
+
+    async def close_stdin(self) -> None:
+        """Close the command's stdin so that it reads EOF. Requires v5."""
+        assert self.can_close_stdin, "stdin can only be closed in v5.channel.k8s.io"
+        await self._send_frame(_OP_BINARY, bytes([_CLOSE_CHANNEL, STDIN_CHANNEL]))
+
+    async def send(self, channel: int, data: bytes | memoryview) -> None:
+        await self._send_frame(_OP_BINARY, bytes([channel]) + data)
+
+    async def receive(self) -> tuple[int, bytes] | None:
+        """The next message received, or None once the connection has closed.
+
+        Raises:
+            PodError: The connection was lost before the server closed it.
+        """
+        while not self._closed:
+            message = await self._receive_message()
+            if message is None:
+                return None
+            # The server sends a message with no data for each channel on connect.
+            if len(message) > 1:
+                return message[0], message[1:]
+        return None
+
+    async def close(self) -> None:
+        if self._keepalive is not None:
+            self._keepalive.cancel()
+            self._keepalive = None
+        writer, self._writer = self._writer, None
+        self._closed = True
+        if writer is None:
+            return
+        try:
+            if not self._close_sent:
+                self._close_sent = True
+                writer.write(_frame(_OP_CLOSE, struct.pack("!H", _CLOSE_NORMAL)))
+            writer.close()
+            await writer.wait_closed()
+        except Exception as e:
+            log_debug("Failed to close exec websocket cleanly.", error=e)
+
+    async def _connect(self) -> None:
+        # Loading the client, resolving credentials (which may run an exec plugin or
+        # refresh a token) and reading certificates all block, so run them in a thread.
+        loop = asyncio.get_running_loop()
+        endpoint = await loop.run_in_executor(
+            None, lambda: _endpoint(self._pod, self._command, self._stdin)
+        )
+        self._reader, self._writer = await asyncio.open_connection(
+            endpoint.host,
+            endpoint.port,
+            ssl=endpoint.ssl,
+            server_hostname=endpoint.server_hostname,
+        )
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        lines = [
+            f"GET {endpoint.path} HTTP/1.1",
+            f"Host: {endpoint.host}:{endpoint.port}",
+            "Upgrade: websocket",
+            "Connection: Upgrade",
+            f"Sec-WebSocket-Key: {key}",
+            "Sec-WebSocket-Version: 13",
+            f"Sec-WebSocket-Protocol: {V5_CHANNEL_PROTOCOL}, {V4_CHANNEL_PROTOCOL}",
+            *(f"{name}: {value}" for name, value in endpoint.headers.items()),
+        ]
+        self._writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await self._writer.drain()
+        try:
+            response = await self._reader.readuntil(b"\r\n\r\n")
+        except asyncio.LimitOverrunError as e:
+            raise ApiException(status=0, reason="Handshake response too long.") from e
+        except asyncio.IncompleteReadError as e:
+            raise ApiException(
+                status=0, reason="Connection closed during handshake."
+            ) from e
+        status, headers = _parse_handshake_response(response)
+        if status != 101:
+            body = await self._read_error_body(headers)
+            raise ApiException(status=status, reason=body or "Handshake failed.")
+        expected = base64.b64encode(
+            hashlib.sha1(key.encode("ascii") + _GUID).digest()
+        ).decode("ascii")
+        if headers.get("sec-websocket-accept") != expected:
+            raise ApiException(status=0, reason="Invalid Sec-WebSocket-Accept header.")
+        self.subprotocol = headers.get("sec-websocket-protocol")
+        remember_stdin_closable(self._pod.context_name, self.can_close_stdin)
+
+    async def _read_error_body(self, headers: dict[str, str]) -> str:
+        assert self._reader is not None
+        try:
+            length = min(int(headers.get("content-length", "0")), _MAX_HANDSHAKE_BYTES)
+            body = await asyncio.wait_for(self._reader.readexactly(length), 5)
+        except (ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            return ""
+        try:
+            return json.loads(body).get("message", "")
+        except ValueError:
+            return body.decode("utf-8", errors="replace")
+
+    async def _receive_message(self) -> bytes | None:
+        """Read frames until a complete data message, handling control frames."""
+        fragments: list[bytes] = []
+        while True:
+            try:
+                fin, opcode, payload = await self._read_frame()
+            except (asyncio.IncompleteReadError, ConnectionError, ssl.SSLError) as e:
+                if self._close_sent:
+                    self._closed = True
+                    return None
+                raise PodError(
+                    "WebSocket connection lost during exec", pod=self._pod.name
+                ) from e
+            if opcode == _OP_CLOSE:
+                self._closed = True
+                if not self._close_sent:
+                    self._close_sent = True
+                    await self._send_frame(_OP_CLOSE, payload[:2], force=True)
+                return None
+            if opcode == _OP_PING:
+                await self._send_frame(_OP_PONG, payload)
+                continue
+            if opcode == _OP_PONG:
+                continue
+            if opcode not in (_OP_TEXT, _OP_BINARY, _OP_CONTINUATION):
+                raise PodError("Unexpected websocket opcode.", opcode=opcode)
+            fragments.append(payload)
+            if fin:
+                return b"".join(fragments)
+
+    async def _read_frame(self) -> tuple[bool, int, bytes]:
+        assert self._reader is not None
+        head = await self._reader.readexactly(2)
+        length = head[1] & 0x7F
+        if length == 126:
+            (length,) = struct.unpack("!H", await self._reader.readexactly(2))
+        elif length == 127:
+            (length,) = struct.unpack("!Q", await self._reader.readexactly(8))
+        mask = await self._reader.readexactly(4) if head[1] & 0x80 else None
+        payload = await self._reader.readexactly(length)
+        if mask is not None:
+            payload = _apply_mask(payload, mask)
+        return bool(head[0] & 0x80), head[0] & 0x0F, payload
+
+    async def _send_frame(
+        self, opcode: int, payload: bytes, force: bool = False
+    ) -> None:
+        writer = self._writer
+        if writer is None or (self._close_sent and not force):
+            raise PodError("WebSocket connection is closed", pod=self._pod.name)
+        async with self._write_lock:
+            writer.write(_frame(opcode, payload))
+            try:
+                await writer.drain()
+            except (ConnectionError, ssl.SSLError) as e:
+                raise PodError(
+                    "WebSocket connection lost during exec", pod=self._pod.name
+                ) from e
+
+    async def _send_keepalive(self) -> None:
+        """Send periodic resize-channel frames (see `keepalive` for why)."""
+        while True:
+            await asyncio.sleep(_KEEPALIVE_INTERVAL_SECONDS)
+            try:
+                await self.send(RESIZE_CHANNEL, KEEPALIVE_PAYLOAD)
+            except Exception as e:
+                log_debug("Failed to send keepalive frame, bailing out.", error=e)
+                return
+
+
+def _endpoint(pod: PodInfo, command: list[str], stdin: bool) -> _Endpoint:
+    api_client = k8s_client(pod.context_name).api_client  # type: ignore[attr-defined]
+    configuration = api_client.configuration
+    url = urlparse(configuration.host)
+    secure = url.scheme == "https"
+    query = [("command", part) for part in command] + [
+        ("container", pod.default_container_name),
+        ("stdin", str(stdin).lower()),
+        ("stdout", "true"),
+        ("stderr", "true"),
+        ("tty", "false"),
+    ]
+    path = (
+        f"{url.path.rstrip('/')}/api/v1/namespaces/{quote(pod.namespace)}/pods/"
+        f"{quote(pod.name)}/exec?{urlencode(query)}"
+    )
+    headers: dict[str, str] = {}
+    # Resolves the bearer token, calling any refresh hook (e.g. an exec plugin).
+    auth = configuration.auth_settings().get("BearerToken")
+    if auth and auth.get("value"):
+        headers["Authorization"] = auth["value"]
+    return _Endpoint(
+        host=url.hostname or "",
+        port=url.port or (443 if secure else 80),
+        path=path,
+        ssl=_ssl_context(configuration) if secure else None,
+        server_hostname=(configuration.tls_server_name or url.hostname)
+        if secure
+        else None,
+        headers=headers,
+    )
+
+
+def _ssl_context(configuration: Any) -> ssl.SSLContext:
+    """An SSL context configured as the kubernetes client's websockets would be."""
+    key = (
+        configuration.verify_ssl,
+        configuration.ssl_ca_cert,
+        configuration.assert_hostname,
+        configuration.cert_file,
+        configuration.key_file,
+    )
+    context = _ssl_contexts.get(key)
+    if context is None:
+        context = ssl.create_default_context(
+            cafile=configuration.ssl_ca_cert or certifi.where()
+        )
+        if not configuration.verify_ssl:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        elif configuration.assert_hostname is False:
+            context.check_hostname = False
+        if configuration.cert_file:
+            context.load_cert_chain(configuration.cert_file, configuration.key_file)
+        _ssl_contexts[key] = context
+    return context
+
+
+def _parse_handshake_response(response: bytes) -> tuple[int, dict[str, str]]:
+    status_line, *header_lines = response.decode("latin-1").split("\r\n")
+    try:
+        status = int(status_line.split(" ", 2)[1])
+    except (IndexError, ValueError):
+        raise ApiException(status=0, reason=f"Invalid handshake: {status_line!r}")
+    headers = {}
+    for line in header_lines:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return status, headers
+
+
+def _frame(opcode: int, payload: bytes) -> bytes:
+    """A final, masked (as all frames sent by a client must be) frame."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, 0x80 | length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 0x80 | 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 0x80 | 127, length)
+    mask = os.urandom(4)
+    return header + mask + _apply_mask(payload, mask)
+
+
+def _apply_mask(data: bytes, mask: bytes) -> bytes:
+    length = len(data)
+    if length == 0:
+        return b""
+    # XOR as (arbitrarily large) integers, which is far faster than byte by byte.
+    repeated = (mask * (length // 4 + 1))[:length]
+    return (
+        int.from_bytes(data, "little") ^ int.from_bytes(repeated, "little")
+    ).to_bytes(length, "little")
@@ -1,47 +1,285 @@
+import io
+import os
+import re
 import shlex
+import tarfile
 from contextlib import contextmanager
 from pathlib import Path
 from typing import Generator
 
-from kubernetes.stream.ws_client import WSClient  # type: ignore[import-untyped]
+from inspect_ai.util import SandboxEnvironmentLimits as limits
+from kubernetes.stream.ws_client import (  # type: ignore[import-untyped]
+    ERROR_CHANNEL,
+    STDERR_CHANNEL,
+    STDOUT_CHANNEL,
+    WSClient,
+)
 
+from k8s_sandbox._pod.buffer import LimitedBuffer
+from k8s_sandbox._pod.compression import Codec, write_command
 from k8s_sandbox._pod.error import PodError
-from k8s_sandbox._pod.get_returncode import get_returncode
+from k8s_sandbox._pod.get_returncode import get_returncode, parse_returncode
 from k8s_sandbox._pod.op import (
+    RANGE_ALIGNMENT,
+    AdaptiveFrameSize,
+    PodInfo,
     PodOperation,
+    expect_stdin_closable,
     raise_for_known_read_write_errors,
 )
+from k8s_sandbox._pod.websocket import ExecStream
+
+# Extracts the archive written to stdin into a staging directory and sources the
+# script within it, which copies each file from there to its destination.
+_WRITE_FILES_SCRIPT = (
+    "staging=$(mktemp -d) || exit; "
+    "trap 'rm -rf \"$staging\"' EXIT; "
+    'tar -x -f - -C "$staging" && . "$staging/script"'
+)
+_WRITE_ERROR_PATTERN = re.compile(r"\n<write-error-(\d+)>\n")
+INSPECT_K8S_WRITE_STREAMS = "INSPECT_K8S_WRITE_STREAMS"
+# Files at least this large are written over several streams, if enabled.
+PARALLEL_WRITE_THRESHOLD_BYTES = 64 * 1024**2
+# Prints the size of the file `$1` and then, if `sha256sum` is available, its sha256.
+# The size falls back from `wc` to `stat` to `ls`, one of which every image has.
+VERIFY_WRITTEN_COMMAND = [
+    "/bin/sh",
+    "-c",
+    'f=$1; wc -c < "$f" 2>/dev/null || stat -c %s "$f" 2>/dev/null || '
+    '{ set -- $(ls -ln "$f") && echo "$5"; }; '
+    'if command -v sha256sum >/dev/null 2>&1; then sha256sum "$f"; fi',
+    "sh",
+]
+
+
+def write_streams() -> int:
+    """The number of streams to write each large file over (1, by default)."""
+    try:
+        return max(1, int(os.environ[INSPECT_K8S_WRITE_STREAMS]))
+    except (KeyError, ValueError):
+        return 1
 
 
 class WriteFileOperation(PodOperation):
-    def write_file(self, data: bytes, dst: Path) -> None:
-        with self._start_write_command(dst, len(data)) as ws_client:
-            self._write_stdin_chunked(ws_client, data)
+    def __init__(self, pod: PodInfo, codec: Codec | None = None) -> None:
+        """Create the operation.
+
+        Args:
+          pod: The Pod to write to.
+          codec: The compression supported by the container, if any. Files which are
+            worth compressing are compressed with it.
+        """
+        super().__init__(pod)
+        self._codec = codec
+        # Sizes the stdin frames, if they shouldn't all be `_STDIN_CHUNK_SIZE`.
+        self._frames: AdaptiveFrameSize | None = None
+
+    def write_file(self, data: bytes | memoryview, dst: Path) -> None:
+        data, codec = self._payload(data)
+        if expect_stdin_closable(self._pod.context_name):
+            with self._start_write_command(dst, None, codec) as ws_client:
+                if self._can_close_stdin(ws_client):
+                    self._write_stdin_chunked(ws_client, data, self._frames)
+                    self._close_stdin(ws_client)
+                    self._handle_stream_output(ws_client)
+                    return
+            # v5.channel.k8s.io was not negotiated after all, so `cat` would never
+            # exit. Closing the websocket ends it (leaving an empty file) instead.
+        with self._start_write_command(dst, len(data), codec) as ws_client:
+            self._write_stdin_chunked(ws_client, data, self._frames)
             self._handle_stream_output(ws_client)
 
+    async def awrite_file(self, data: bytes | memoryview, dst: Path) -> None:
+        """Like `write_file`, but streams over the event loop."""
+        data, codec = self._payload(data)
+        if expect_stdin_closable(self._pod.context_name):
+            command = self._write_command(dst, None, codec)
+            async with ExecStream(self._pod, command, stdin=True) as stream:
+                if stream.can_close_stdin:
+                    await stream.write_stdin(data, self._frames)
+                    await stream.close_stdin()
+                    await self._ahandle_stream_output(stream)
+                    return
+        command = self._write_command(dst, len(data), codec)
+        async with ExecStream(self._pod, command, stdin=True) as stream:
+            await stream.write_stdin(data, self._frames)
+            await self._ahandle_stream_output(stream)
+
+    def _payload(
+        self, data: bytes | memoryview
+    ) -> tuple[bytes | memoryview, Codec | None]:
+        """The data to send, and the codec it was compressed with (if any)."""
+        if (
+            self._codec is not None
+            and isinstance(data, bytes)
+            and self._codec.worth_compressing(data)
+        ):
+            return self._codec.compress(data), self._codec
+        return data, None
+
+    async def _ahandle_stream_output(self, stream: ExecStream) -> None:
+        # stderr is not expected to be large, but limit it nonetheless.
+        stderr = LimitedBuffer(limits.MAX_EXEC_OUTPUT_SIZE)
+        status: bytes | None = None
+        async for channel, message in stream:
+            if channel == STDERR_CHANNEL:
+                stderr.append(message)
+            elif channel == ERROR_CHANNEL:
+                status = message
+        self._raise_for_returncode(parse_returncode(status), str(stderr))
+
     @contextmanager
     def _start_write_command(
-        self, dst: Path, file_size: int
+        self, dst: Path, file_size: int | None, codec: Codec | None
     ) -> Generator[WSClient, None, None]:
+        yield from self.create_websocket_client_for_exec(
+            command=self._write_command(dst, file_size, codec),
+            stderr=True,
+            stdin=True,
+            stdout=True,
+            # Read stdout and stderr as text. Has no effect on stdin.
+            binary=False,
+        )
+
+    def _write_command(
+        self, dst: Path, file_size: int | None, codec: Codec | None
+    ) -> list[str]:
+        """The command to write stdin to `dst`.
+
+        Args:
+          dst: The path of the file to write.
+          file_size: The number of bytes to write, if stdin will not be closed after
+            they have been (as it cannot be in v4.channel.k8s.io). Otherwise None, to
+            copy stdin until it is closed.
+          codec: The codec stdin was compressed with, if any.
+        """
         mkdir_command = f"mkdir -p {shlex.quote(dst.parent.as_posix())}"
-        # Use `head` with `-c <file size>` because we have no way of closing the stdin
-        # stream in v4.channel.k8s.io (which means the websocket connection would never
-        # close).
-        head_command = f"head -c {file_size}"
-        dst_quoted = shlex.quote(dst.as_posix())
+        # Use `head` with `-c <file size>` if we have no way of closing the stdin
+        # stream (which means the websocket connection would never close).
+        copy_command = "cat" if file_size is None else f"head -c {file_size}"
         # The shell (e.g. ash) execs into the trailing `head`, whose stdout is the
         # file, so nothing holds the exec stdout pipe open. Its EOF makes the runtime
         # close stdin mid-write and `head -c N` then exits 0, silently truncating.
         # fd 3 survives the exec and keeps that pipe open.
         # https://github.com/UKGovernmentBEIS/inspect_k8s_sandbox/issues/225
         keep_stdout_open = "exec 3>&1"
-        command = [
+        return [
             "/bin/sh",
             "-c",
-            f"{keep_stdout_open}; {mkdir_command} && {head_command} > {dst_quoted}",
+            f"{keep_stdout_open}; {mkdir_command} && "
+            + write_command(codec, copy_command, dst.as_posix()),
         ]
+
+    def _handle_stream_output(self, ws_client: WSClient) -> None:
+        # Wait until the websocket connection is closed. All stderr will be stored by us
+        # in memory anyway so there is no value in streaming it.
+        ws_client.run_forever()
+        self._raise_for_returncode(get_returncode(ws_client), ws_client.read_stderr())
+
+    def _raise_for_returncode(self, returncode: int, stderr: str) -> None:
+        if returncode != 0:
+            raise_for_known_read_write_errors(stderr)
+            raise PodError(
+                "Unrecognised error writing file to pod.",
+                returncode=returncode,
+                stderr=stderr,
+            )
+
+
+class WriteRangeOperation(WriteFileOperation):
+    """Writes a range of a file in place, to write a large file over several streams.
+
+    The file must already exist: bytes outside of the range are left as they are. The
+    range must start at a multiple of `RANGE_ALIGNMENT`. Stdin frames are sized from
+    the throughput of the stream (see `AdaptiveFrameSize`).
+    """
+
+    def __init__(self, pod: PodInfo, offset: int) -> None:
+        """Create the operation.
+
+        Args:
+          pod: The Pod to write to.
+          offset: The offset in the file at which the range starts.
+        """
+        super().__init__(pod)
+        assert offset % RANGE_ALIGNMENT == 0, "ranges must be aligned"
+        self._offset = offset
+        self._frames = AdaptiveFrameSize()
+
+    def _write_command(
+        self, dst: Path, file_size: int | None, codec: Codec | None
+    ) -> list[str]:
+        copy_command = "cat" if file_size is None else f"head -c {file_size}"
+        dd_command = (
+            f"dd of={shlex.quote(dst.as_posix())} bs={RANGE_ALIGNMENT} "
+            f"seek={self._offset // RANGE_ALIGNMENT} conv=notrunc"
+        )
+        # `dd` writes each (possibly short) read from the pipe as it is, so the range
+        # is written contiguously from the offset.
+        return ["/bin/sh", "-c", f"{copy_command} | {dd_command}"]
+
+
+class WriteFilesOperation(PodOperation):
+    """Writes several files to the pod in a single exec.
+
+    The files are packed into a tar archive which is extracted into a staging
+    directory on the pod. Each file is then copied to its destination as `write_file`
+    would write it: creating parent directories and overwriting (rather than
+    replacing) existing files. Files are written independently, so a file which
+    cannot be written (e.g. due to a permission error) does not stop the others.
+
+    Requires `tar` and `mktemp` on the pod, and space for a second copy of the files
+    in its temporary directory whilst they are written.
+    """
+
+    def write_files(self, files: dict[Path, bytes]) -> dict[Path, Exception]:
+        """Write the files (a mapping of destination to contents) to the pod.
+
+        Returns:
+          The exception for each file which could not be written, mapped in the same
+          way as `write_file` would have raised it.
+        """
+        archive = _archive(files)
+        with self._start_write_files_command() as ws_client:
+            self._write_stdin_chunked(ws_client, archive)
+            if self._can_close_stdin(ws_client):
+                self._close_stdin(ws_client)
+            # Otherwise `tar` stops reading at the end of the archive.
+            ws_client.run_forever()
+            return self._file_errors(
+                files,
+                get_returncode(ws_client),
+                ws_client.read_stdout(),
+                ws_client.read_stderr(),
+            )
+
+    async def awrite_files(self, files: dict[Path, bytes]) -> dict[Path, Exception]:
+        """Like `write_files`, but streams over the event loop."""
+        archive = _archive(files)
+        # Neither is expected to be large, but limit them nonetheless.
+        stdout = LimitedBuffer(limits.MAX_EXEC_OUTPUT_SIZE)
+        stderr = LimitedBuffer(limits.MAX_EXEC_OUTPUT_SIZE)
+        status: bytes | None = None
+        command = ["/bin/sh", "-c", _WRITE_FILES_SCRIPT]
+        async with ExecStream(self._pod, command, stdin=True) as stream:
+            await stream.write_stdin(archive)
+            if stream.can_close_stdin:
+                await stream.close_stdin()
+            async for channel, message in stream:
+                if channel == STDOUT_CHANNEL:
+                    stdout.append(message)
+                elif channel == STDERR_CHANNEL:
+                    stderr.append(message)
+                elif channel == ERROR_CHANNEL:
+                    status = message
+        return self._file_errors(
+            files, parse_returncode(status), str(stdout), str(stderr)
+        )
+
+    @contextmanager
+    def _start_write_files_command(self) -> Generator[WSClient, None, None]:
         yield from self.create_websocket_client_for_exec(
-            command=command,
+            command=["/bin/sh", "-c", _WRITE_FILES_SCRIPT],
             stderr=True,
             stdin=True,
             stdout=True,
@@ -49,16 +287,57 @@ class WriteFileOperation(PodOperation):
             binary=False,
         )
 
-    def _handle_stream_output(self, ws_client: WSClient) -> None:
-        # Wait until the websocket connection is closed. All stderr will be stored by us
-        # in memory anyway so there is no value in streaming it.
-        ws_client.run_forever()
-        returncode = get_returncode(ws_client)
+    def _file_errors(
+        self, files: dict[Path, bytes], returncode: int, stdout: str, stderr: str
+    ) -> dict[Path, Exception]:
         if returncode != 0:
-            stderr = ws_client.read_stderr()
+            # The archive could not be extracted, so no file has been written.
             raise_for_known_read_write_errors(stderr)
             raise PodError(
-                "Unrecognised error writing file to pod.",
+                "Unrecognised error writing files to pod.",
                 returncode=returncode,
                 stderr=stderr,
             )
+        dsts = list(files)
+        parts = _WRITE_ERROR_PATTERN.split(stdout)
+        return {
+            dsts[int(index)]: _write_error(error)
+            for index, error in zip(parts[1::2], parts[2::2])
+        }
+
+
+def _archive(files: dict[Path, bytes]) -> bytes:
+    """A tar archive of the files (named by index) and the script to write them."""
+    lines = []
+    for index, dst in enumerate(files):
+        parent = shlex.quote(dst.parent.as_posix())
+        dst_quoted = shlex.quote(dst.as_posix())
+        lines.append(
+            f'{{ mkdir -p {parent} && cat "$staging/{index}" > {dst_quoted}; }} '
+            f'2> "$staging/error" || '
+            f"{{ printf '\\n<write-error-{index}>\\n'; cat \"$staging/error\"; }}"
+        )
+    buffer = io.BytesIO()
+    # USTAR for compatibility with e.g. busybox `tar`. The archive is padded to a
+    # whole record, so that `tar` need not wait for stdin to be closed.
+    with tarfile.open(fileobj=buffer, mode="w", format=tarfile.USTAR_FORMAT) as tar:
+        _add(tar, "script", "\n".join(lines).encode())
+        for index, data in enumerate(files.values()):
+            _add(tar, str(index), data)
+    return buffer.getvalue()
+
+
+def _add(tar: tarfile.TarFile, name: str, data: bytes) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mode = 0o600
+    tar.addfile(info, io.BytesIO(data))
+
+
+def _write_error(stderr: str) -> Exception:
+    """The exception `write_file` would have raised for the error writing a file."""
+    try:
+        raise_for_known_read_write_errors(stderr)
+    except OSError as e:
+        return e
+    return PodError("Unrecognised error writing file to pod.", stderr=stderr)
@@ -0,0 +1,100 @@
+"""A per-Pod record of the files written to it, so that identical rewrites are skipped.
+
+Solvers often write the same helper scripts and binaries into a Pod on every turn. When
+enabled, the Pod remembers the sha256 and size of each file it has written. Rewriting
+a file with the same contents is skipped.
+
+The file may have been modified since it was written: by a command which was running
+at the time, by one run since, or by a process which an earlier command left running in
+the background. So once any command has been run in the container, the container is
+first asked for the file's sha256 (a single exec of `sha256sum`) and the upload is only
+skipped if it matches. Until then (e.g. whilst a solver sets up its tools) a rewrite
+costs no request at all. Files smaller than `VERIFY_THRESHOLD_BYTES` are always
+written, as verifying them would cost as much as writing them. The record is cleared
+whenever the Pod is found to have been replaced or its container restarted.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+INSPECT_K8S_WRITE_CACHE = "INSPECT_K8S_WRITE_CACHE"
+VERIFY_THRESHOLD_BYTES = 64 * 1024
+
+
+def write_cache_enabled() -> bool:
+    """Whether identical rewrites of files should be skipped."""
+    return os.getenv(INSPECT_K8S_WRITE_CACHE, "false").lower() in {
+        "1",
+        "true",
+        "yes",
+        "y",
+    }
+
+
+@dataclass(frozen=True)
+class _Entry:
+    sha256: str
+    size: int
+
+
+class WriteCache:
+    """The contents of the files written to a Pod, keyed by path.
+
+    `hits` counts the writes which were skipped and `misses` those which were uploaded
+    (of the files large enough to be cached).
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[str, _Entry] = {}
+        # The commands started in the container, and those of them still running.
+        self._started = 0
+        self._running = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def cacheable(data: bytes) -> bool:
+        return len(data) >= VERIFY_THRESHOLD_BYTES
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def written(self, dst: Path, sha256: str, size: int) -> bool:
+        """Whether these contents were the last to be written to `dst`."""
+        return self._entries.get(dst.as_posix()) == _Entry(sha256, size)
+
+    def trusted(self) -> bool:
+        """Whether written files can only have been changed by writes.
+
+        That is, no command has been run in the container, so none is running and none
+        can have left processes running in the background.
+        """
+        return self._started == 0 and self._running == 0
+
+    def record(self, dst: Path, sha256: str, size: int) -> None:
+        self._entries[dst.as_posix()] = _Entry(sha256, size)
+
+    def command_started(self) -> None:
+        self._started += 1
+        self._running += 1
+
+    def command_finished(self) -> None:
+        self._running -= 1
+
+    def forget(self, dst: Path) -> None:
+        self._entries.pop(dst.as_posix(), None)
+
+    def clear(self) -> None:
+        """Forget every file, as the container has been replaced or restarted."""
+        self._entries.clear()
+        # The processes of the old container are gone, other than those of the
+        # commands still (as far as we know) running.
+        self._started = self._running
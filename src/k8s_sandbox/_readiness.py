@@ -0,0 +1,310 @@
+"""Wait for a release's Pods to become ready using a Kubernetes watch.
+
+`helm install --wait` polls the release's resources on an interval, so a sample
+typically waits for seconds after its Pods are already Ready. Watching the release's
+Pods instead means that the wait ends as soon as the last Pod reports Ready.
+
+Watching the container states also allows waiting to end early when a Pod reaches a
+state from which it will not become ready without intervention (e.g.
+``ImagePullBackOff``), rather than only failing once the full timeout has elapsed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import suppress
+from typing import Any, cast
+
+from kubernetes import client  # type: ignore
+from kubernetes.client.exceptions import ApiException  # type: ignore
+from kubernetes.watch.watch import iter_resp_lines  # type: ignore
+from urllib3 import HTTPResponse
+
+from k8s_sandbox._kubernetes_api import k8s_client
+from k8s_sandbox._logger import log_trace
+from k8s_sandbox._pod.snapshot import ContainerStatus, PodSnapshot, parse_pod
+
+INSPECT_K8S_READINESS_WATCH = "INSPECT_K8S_READINESS_WATCH"
+# A container in CrashLoopBackOff is only considered to have failed once it has
+# restarted this many times; some containers crash a few times whilst e.g. a
+# dependency starts up.
+CRASH_LOOP_RESTART_THRESHOLD = 3
+# Container waiting reasons which will not resolve without intervention.
+_FAILED_WAITING_REASONS = {
+    "ImagePullBackOff",
+    "InvalidImageName",
+    "ErrImageNeverPull",
+    "CreateContainerConfigError",
+}
+# The maximum duration of a single watch request. Watches are re-established (from the
+# last seen resourceVersion) until the deadline.
+_MAX_WATCH_SECONDS = 60
+_HTTP_GONE = 410
+
+
+class PodFailedError(Exception):
+    """A release's Pod has reached a state from which it will not become ready."""
+
+
+def readiness_watch_enabled() -> bool:
+    """Whether `helm install` should use a watch rather than `--wait`."""
+    return os.getenv(INSPECT_K8S_READINESS_WATCH, "false").lower() in {
+        "1",
+        "true",
+        "yes",
+        "y",
+    }
+
+
+async def wait_for_release_ready(
+    context_name: str | None, namespace: str, release_name: str, timeout: int
+) -> None:
+    """Wait until every Pod of a release is Ready.
+
+    The Pods expected are those of the release's StatefulSets and Deployments (per
+    their replica counts) plus any other Pods with the release's instance label.
+
+    The Kubernetes client is synchronous, so the watch runs in a dedicated thread
+    (rather than the default executor, which it could otherwise occupy for minutes).
+
+    Raises:
+        PodFailedError: If a Pod fails in a way that won't resolve itself.
+        TimeoutError: If the Pods are not all Ready within the timeout.
+        ApiException: If the Kubernetes API returns an error.
+    """
+    loop = asyncio.get_running_loop()
+    done: asyncio.Future[None] = loop.create_future()
+    watcher = _ReadinessWatcher(
+        context_name, namespace, release_name, time.monotonic() + timeout
+    )
+
+    def finish(error: BaseException | None) -> None:
+        if done.done():
+            return
+        if error is None:
+            done.set_result(None)
+        else:
+            done.set_exception(error)
+
+    def run() -> None:
+        error: BaseException | None = None
+        try:
+            watcher.run()
+        except BaseException as e:
+            error = e
+        # The loop may have been closed if the wait was abandoned.
+        with suppress(RuntimeError):
+            loop.call_soon_threadsafe(finish, error)
+
+    threading.Thread(
+        target=run, name=f"inspect-k8s-readiness-{release_name}", daemon=True
+    ).start()
+    try:
+        await done
+    finally:
+        watcher.stop()
+
+
+def pod_failure(pod: PodSnapshot) -> str | None:
+    """Describe why a Pod will not become ready, or None if it still might."""
+    if pod.phase == "Failed":
+        return f"Pod '{pod.name}' has failed."
+    for status in pod.init_container_statuses + (pod.container_statuses or ()):
+        if _container_failed(status):
+            detail = f": {status.waiting_message}" if status.waiting_message else ""
+            return (
+                f"Container '{status.name}' of Pod '{pod.name}' is in state "
+                f"{status.waiting_reason}{detail}"
+            )
+    return None
+
+
+class ReleaseReadiness:
+    """Tracks whether a release's Pods are all Ready, from a list then watch events."""
+
+    def __init__(self, expected_pods: int) -> None:
+        self._expected_pods = expected_pods
+        self._pods: dict[str, PodSnapshot] = {}
+
+    def reset(self, pods: list[dict[str, Any]]) -> None:
+        self._pods = {}
+        for pod in pods:
+            self.update("ADDED", pod)
+
+    def update(self, event_type: str, pod: dict[str, Any]) -> None:
+        snapshot = parse_pod(pod)
+        if event_type == "DELETED":
+            self._pods.pop(snapshot.name, None)
+        else:
+            self._pods[snapshot.name] = snapshot
+
+    def is_ready(self) -> bool:
+        """Whether every Pod is Ready.
+
+        Raises:
+            PodFailedError: If any Pod will not become ready.
+        """
+        for pod in self._pods.values():
+            failure = pod_failure(pod)
+            if failure is not None:
+                raise PodFailedError(failure)
+        # Terminating Pods (e.g. from a previous install attempt) will be replaced.
+        live = [pod for pod in self._pods.values() if not pod.deleting]
+        return len(live) >= self._expected_pods and all(pod.ready for pod in live)
+
+    def not_ready(self) -> list[str]:
+        return [pod.name for pod in self._pods.values() if not pod.ready]
+
+
+def _container_failed(status: ContainerStatus) -> bool:
+    if status.waiting_reason in _FAILED_WAITING_REASONS:
+        return True
+    return (
+        status.waiting_reason == "CrashLoopBackOff"
+        and status.restart_count >= CRASH_LOOP_RESTART_THRESHOLD
+    )
+
+
+class _ReadinessWatcher:
+    """Lists then watches a release's Pods. Only run() is called from its thread."""
+
+    def __init__(
+        self,
+        context_name: str | None,
+        namespace: str,
+        release_name: str,
+        deadline: float,
+    ) -> None:
+        self._context_name = context_name
+        self._namespace = namespace
+        self._release_name = release_name
+        self._selector = f"app.kubernetes.io/instance={release_name}"
+        self._deadline = deadline
+        self._stopped = threading.Event()
+        self._response: HTTPResponse | None = None
+
+    def stop(self) -> None:
+        self._stopped.set()
+        # Closing the response unblocks the watch thread if it's waiting for an event.
+        response = self._response
+        if response is not None:
+            response.close()
+
+    def run(self) -> None:
+        api = k8s_client(self._context_name)
+        readiness = ReleaseReadiness(self._expected_pods(api))
+        resource_version: str | None = None
+        while not self._stopped.is_set():
+            if resource_version is None:
+                resource_version = self._list(api, readiness)
+            if readiness.is_ready():
+                return
+            remaining = self._deadline - time.monotonic()
+            if remaining <= 0:
+                log_trace(
+                    "Release did not become ready.",
+                    release=self._release_name,
+                    not_ready=readiness.not_ready(),
+                )
+                raise TimeoutError(
+                    f"Pods {readiness.not_ready()} of release "
+                    f"'{self._release_name}' did not become ready."
+                )
+            try:
+                resource_version = self._watch(
+                    api, readiness, resource_version, remaining
+                )
+            except Exception:
+                if self._stopped.is_set():
+                    return
+                raise
+
+    def _expected_pods(self, api: client.CoreV1Api) -> int:
+        apps = client.AppsV1Api(api.api_client)  # type: ignore[attr-defined]
+        expected = 0
+        for list_workloads in (
+            apps.list_namespaced_stateful_set,
+            apps.list_namespaced_deployment,
+        ):
+            # See snapshot.read_pod for why _preload_content needs a call-arg ignore.
+            body = _json(
+                list_workloads(  # type: ignore[call-arg]
+                    self._namespace,
+                    label_selector=self._selector,
+                    _preload_content=False,
+                )
+            )
+            for item in body.get("items", []):
+                replicas = (item.get("spec") or {}).get("replicas")
+                expected += 1 if replicas is None else replicas
+        return expected
+
+    def _list(self, api: client.CoreV1Api, readiness: ReleaseReadiness) -> str:
+        body = _json(
+            api.list_namespaced_pod(  # type: ignore[call-arg]
+                self._namespace,
+                label_selector=self._selector,
+                _preload_content=False,
+            )
+        )
+        readiness.reset(body.get("items", []))
+        return body["metadata"]["resourceVersion"]
+
+    def _watch(
+        self,
+        api: client.CoreV1Api,
+        readiness: ReleaseReadiness,
+        resource_version: str,
+        remaining: float,
+    ) -> str | None:
+        """Apply watch events until Ready, the watch ends or its history expires.
+
+        Returns:
+            The last resourceVersion seen, or None if the Pods must be re-listed.
+        """
+        # The kubernetes Watch helper only tracks resourceVersions when it
+        # deserializes events into models, which is slow (see snapshot.py), so
+        # consume the raw event stream directly.
+        response = cast(
+            HTTPResponse,
+            api.list_namespaced_pod(  # type: ignore[call-arg]
+                self._namespace,
+                label_selector=self._selector,
+                watch=True,
+                allow_watch_bookmarks=True,
+                resource_version=resource_version,
+                timeout_seconds=max(1, int(min(remaining, _MAX_WATCH_SECONDS))),
+                _preload_content=False,
+            ),
+        )
+        self._response = response
+        try:
+            for line in iter_resp_lines(response):
+                if not line:
+                    continue
+                event = json.loads(line)
+                obj = event["object"]
+                if event["type"] == "ERROR":
+                    if obj.get("code") == _HTTP_GONE:
+                        return None
+                    raise ApiException(
+                        status=obj.get("code"), reason=obj.get("message")
+                    )
+                resource_version = obj["metadata"]["resourceVersion"]
+                if event["type"] != "BOOKMARK":
+                    readiness.update(event["type"], obj)
+                    if readiness.is_ready():
+                        break
+        finally:
+            self._response = None
+            response.close()
+            response.release_conn()
+        return resource_version
+
+
+def _json(response: object) -> dict[str, Any]:
+    return json.loads(cast(HTTPResponse, response).data)
@@ -1,12 +1,24 @@
 from __future__ import annotations
 
+import mmap
+import os
 import re
 import shlex
 import sys
 import tempfile
-from contextlib import contextmanager
+from contextlib import asynccontextmanager, contextmanager
 from pathlib import Path
-from typing import Any, Generator, Literal, cast, overload
+from typing import (
+    IO,
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Generator,
+    Literal,
+    cast,
+    overload,
+)
 
 import websocket
 from inspect_ai.solver._task_state import sample_state
@@ -23,15 +35,24 @@ from inspect_ai.util import (
 )
 from kubernetes.client.exceptions import ApiException
 from pydantic import BaseModel, TypeAdapter
-from tenacity import retry_if_exception, stop_after_attempt, wait_exponential_jitter
+from tenacity import (
+    RetryCallState,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential_jitter,
+)
 from tenacity.asyncio import AsyncRetrying
+from tenacity.stop import stop_base
+from tenacity.wait import wait_base
 
+from k8s_sandbox._deadline import deadline, exceeded, remaining
 from k8s_sandbox._error import K8sError
 from k8s_sandbox._helm import (
     DEFAULT_CHART,
     Release,
     StaticValuesSource,
     ValuesSource,
+    _get_environ_int,
 )
 from k8s_sandbox._kubernetes_api import validate_context_name
 from k8s_sandbox._logger import (
@@ -85,21 +106,84 @@ _PERMANENT_TYPES = (
 )
 
 
+# The time allowed for an exec beyond its timeout: for the restart check, connecting,
+# the grace period of `timeout -k 5s`, reading the output and any retries.
+_EXEC_DEADLINE_GRACE_SECONDS = 30
+
+
+# The deadline of a file operation (e.g. `read_file()`), which has no timeout of its
+# own. 0 (the default) disables it, as large files may legitimately take a long time.
+INSPECT_K8S_FILE_OP_DEADLINE = "INSPECT_K8S_FILE_OP_DEADLINE"
+_DEFAULT_FILE_OP_DEADLINE_SECONDS = 0
+
+
+def _file_op_deadline() -> int | None:
+    seconds = _get_environ_int(
+        INSPECT_K8S_FILE_OP_DEADLINE, _DEFAULT_FILE_OP_DEADLINE_SECONDS
+    )
+    return seconds if seconds > 0 else None
+
+
+# The size of the chunks `read_file_to()` passes to an async sink.
+_SINK_CHUNK_SIZE = 1024**2  # 1 MiB
+
+
+class _stop_at_deadline(stop_base):
+    """Stop once the current deadline (if any) has passed."""
+
+    def __call__(self, retry_state: RetryCallState) -> bool:
+        return exceeded()
+
+
+class _wait_within_deadline(wait_base):
+    """Wait as `wait` does, but no longer than the time left until the deadline."""
+
+    def __init__(self, wait: wait_base) -> None:
+        self._wait = wait
+
+    def __call__(self, retry_state: RetryCallState) -> float:
+        seconds = self._wait(retry_state)
+        left = remaining()
+        return seconds if left is None else min(seconds, left)
+
+
 def _retry() -> AsyncRetrying:
     # Must create a new instance per call: AsyncRetrying.__aiter__ returns
     # `self` and mutates _retry_state, so a shared instance is not safe for
     # concurrent use.
     return AsyncRetrying(
-        stop=stop_after_attempt(5),
-        wait=wait_exponential_jitter(initial=1, max=10),
+        stop=stop_after_attempt(5) | _stop_at_deadline(),
+        wait=_wait_within_deadline(wait_exponential_jitter(initial=1, max=10)),
         retry=retry_if_exception(
-            lambda e: isinstance(e, _TRANSIENT_TYPES)
-            and not isinstance(e, _PERMANENT_TYPES)
+            lambda e: (
+                isinstance(e, _TRANSIENT_TYPES) and not isinstance(e, _PERMANENT_TYPES)
+            )
         ),
         reraise=True,
     )
 
 
+def _decode(data: bytes | Exception) -> str | Exception:
+    """Decode a file's contents as utf-8, or return the error reading or decoding it."""
+    if isinstance(data, Exception):
+        return data
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError as e:
+        return e
+
+
+@contextmanager
+def _mapped(file: IO[bytes]) -> Generator[bytes | mmap.mmap, None, None]:
+    """Map a file's contents into memory, read-only."""
+    if os.fstat(file.fileno()).st_size == 0:
+        # An empty file cannot be mapped.
+        yield b""
+        return
+    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield mapped
+
+
 @sandboxenv(name="k8s")
 class K8sSandboxEnvironment(SandboxEnvironment):
     """An Inspect sandbox environment for a Kubernetes (k8s) cluster."""
@@ -225,7 +309,7 @@ class K8sSandboxEnvironment(SandboxEnvironment):
             sample_uuid=sample_uuid,
             extra_values=extra_values,
         )
-        await HelmReleaseManager.get_instance().install(release)
+        release = await HelmReleaseManager.get_instance().install(release)
         return reorder_default_first(await get_sandboxes(release, resolved_config))
 
     @classmethod
@@ -236,6 +320,8 @@ class K8sSandboxEnvironment(SandboxEnvironment):
         environments: dict[str, SandboxEnvironment],
         interrupted: bool,
     ) -> None:
+        for environment in environments.values():
+            cast(K8sSandboxEnvironment, environment)._pod.close_sessions()
         # If we were interrupted, wait until the end of the task to cleanup (this
         # enables us to show output for the cleanup operation).
         if interrupted:
@@ -243,7 +329,9 @@ class K8sSandboxEnvironment(SandboxEnvironment):
         sandbox: K8sSandboxEnvironment = cast(
             K8sSandboxEnvironment, next(iter(environments.values()))
         )
-        await HelmReleaseManager.get_instance().uninstall(sandbox.release, quiet=True)
+        await HelmReleaseManager.get_instance().uninstall(
+            sandbox.release, quiet=True, pod_count=len(environments)
+        )
 
     async def exec(
         self,
@@ -275,7 +363,10 @@ class K8sSandboxEnvironment(SandboxEnvironment):
             user = self._config.default_user
 
         op = "K8s execute command in Pod"
-        with self._log_op(op, expected_exceptions, **log_kwargs):
+        # Bound the whole call, not just the command, so that it can't take minutes
+        # longer than its timeout when the cluster is under stress.
+        seconds = None if timeout is None else timeout + _EXEC_DEADLINE_GRACE_SECONDS
+        with self._log_op(op, expected_exceptions, **log_kwargs), deadline(seconds):
             async for attempt in _retry():
                 with attempt:
                     result = await self._pod.exec(
@@ -288,11 +379,51 @@ class K8sSandboxEnvironment(SandboxEnvironment):
         data = contents.encode("utf-8") if isinstance(contents, str) else contents
         # Do not log these at error level or re-raise as enriched K8sError.
         expected_exceptions = (PermissionError, IsADirectoryError)
-        with self._log_op("K8s write file to Pod", expected_exceptions, file=file):
+        with (
+            self._log_op("K8s write file to Pod", expected_exceptions, file=file),
+            deadline(_file_op_deadline()),
+        ):
             async for attempt in _retry():
                 with attempt:
                     await self._pod.write_file(data, Path(file))
 
+    async def write_files(self, files: dict[str, str | bytes]) -> dict[str, Exception]:
+        """Write several files to the sandbox environment in a single operation.
+
+        Equivalent to calling `write_file()` for each file, but the files are packed
+        into one archive and written by a single exec, which is much faster for many
+        small files. The files are written independently, so every file which can be
+        written is, even if others cannot.
+
+        Args:
+          files: The contents to write (`str` is encoded as utf-8), keyed by path.
+
+        Returns:
+          The exception `write_file()` would have raised (e.g. PermissionError or
+          IsADirectoryError) for each file which could not be written, keyed by path.
+          Empty if every file was written.
+        """
+        if not files:
+            return {}
+        data = {
+            Path(file): contents.encode("utf-8")
+            if isinstance(contents, str)
+            else contents
+            for file, contents in files.items()
+        }
+        # Do not log these at error level or re-raise as enriched K8sError.
+        expected_exceptions = (PermissionError, IsADirectoryError)
+        with (
+            self._log_op(
+                "K8s write files to Pod", expected_exceptions, files=list(files)
+            ),
+            deadline(_file_op_deadline()),
+        ):
+            async for attempt in _retry():
+                with attempt:
+                    errors = await self._pod.write_files(data)
+        return {file: errors[Path(file)] for file in files if Path(file) in errors}
+
     @overload
     async def read_file(self, file: str, text: Literal[True] = True) -> str: ...
 
@@ -303,24 +434,157 @@ class K8sSandboxEnvironment(SandboxEnvironment):
         # Create and open a temporary file on the client system which the file will be
         # written to.
         with tempfile.NamedTemporaryFile("w+b") as temp_file:
-            # Do not log these at error level or re-raise as enriched K8sError.
-            expected_exceptions = (
-                FileNotFoundError,
-                UnicodeDecodeError,
-                PermissionError,
-                IsADirectoryError,
-                OutputLimitExceededError,
-            )
-            with self._log_op("K8s read file from Pod", expected_exceptions, file=file):
-                async for attempt in _retry():
-                    with attempt:
-                        temp_file.seek(0)
-                        temp_file.truncate()
-                        await self._pod.read_file(Path(file), temp_file)
+            await self._read_file_into(file, temp_file)
+            if not text:
                 temp_file.seek(0)
-                return (
-                    temp_file.read() if not text else temp_file.read().decode("utf-8")
-                )
+                return temp_file.read()
+            # Decode from a mapping of the file, rather than from a copy of its bytes.
+            with _mapped(temp_file) as data:
+                return str(data, "utf-8")
+
+    async def read_file_to(
+        self,
+        file: str,
+        dst: str | os.PathLike[str] | IO[bytes] | Callable[[bytes], Awaitable[Any]],
+    ) -> None:
+        """Stream a file from the sandbox environment to a local file or async sink.
+
+        Unlike `read_file()`, the file's contents are never held in memory, so many
+        large files can be read at once.
+
+        Args:
+          file: The path of the file in the sandbox environment.
+          dst: The local path to write the file to (which is overwritten), a
+            seekable binary file object to write it to from its current position, or
+            an async callable (e.g. an async file's `write`) which is awaited with
+            each chunk of the file in turn. A sink is only given the file once it has
+            been read in full to a temporary file, so it never sees the partial
+            output of a read which is retried.
+        """
+        if isinstance(dst, (str, os.PathLike)):
+            with open(dst, "w+b") as local_file:
+                await self._read_file_into(file, local_file)
+        elif callable(dst):
+            with tempfile.TemporaryFile("w+b") as temp_file:
+                await self._read_file_into(file, temp_file)
+                temp_file.seek(0)
+                while chunk := temp_file.read(_SINK_CHUNK_SIZE):
+                    await dst(chunk)
+        else:
+            await self._read_file_into(file, dst)
+
+    @asynccontextmanager
+    async def read_file_mapped(self, file: str) -> AsyncIterator[memoryview]:
+        """Read a file from the sandbox environment into a memory-mapped buffer.
+
+        The file is streamed to an anonymous temporary file which is then mapped
+        read-only, so its contents are paged in from disk as they are accessed rather
+        than held in the eval process's memory.
+
+        ```py
+        async with sandbox.read_file_mapped("/data/model.bin") as view:
+            header = bytes(view[:16])
+        ```
+
+        Args:
+          file: The path of the file in the sandbox environment.
+
+        Yields:
+          A read-only view of the file's contents, which is released and unmapped
+          when the block exits. Any views taken of it must be released first.
+        """
+        with tempfile.TemporaryFile("w+b") as temp_file:
+            await self._read_file_into(file, temp_file)
+            with _mapped(temp_file) as data, memoryview(data) as view:
+                yield view
+
+    async def _read_file_into(self, file: str, dst: IO[bytes]) -> None:
+        """Stream a file from the Pod to dst, from its current position."""
+        start_position = dst.tell()
+        # Do not log these at error level or re-raise as enriched K8sError.
+        expected_exceptions = (
+            FileNotFoundError,
+            PermissionError,
+            IsADirectoryError,
+            OutputLimitExceededError,
+        )
+        with (
+            self._log_op("K8s read file from Pod", expected_exceptions, file=file),
+            deadline(_file_op_deadline()),
+        ):
+            async for attempt in _retry():
+                with attempt:
+                    dst.seek(start_position)
+                    dst.truncate()
+                    await self._pod.read_file(Path(file), dst)
+        dst.flush()
+
+    @overload
+    async def read_files(
+        self, files: list[str], text: Literal[True] = True
+    ) -> dict[str, str | Exception]: ...
+
+    @overload
+    async def read_files(
+        self, files: list[str], text: Literal[False]
+    ) -> dict[str, bytes | Exception]: ...
+
+    async def read_files(
+        self, files: list[str], text: bool = True
+    ) -> dict[str, str | Exception] | dict[str, bytes | Exception]:
+        """Read several files from the sandbox environment in a single operation.
+
+        The files are streamed from the Pod as one tar archive, which is limited in
+        size as a single `read_file()` is.
+
+        Args:
+          files: The paths of the files to read.
+          text: Whether to decode the files as utf-8.
+
+        Returns:
+          The contents of each file, or the exception `read_file()` would have raised
+          for it (e.g. FileNotFoundError or UnicodeDecodeError).
+        """
+        # Do not log these at error level or re-raise as enriched K8sError.
+        expected_exceptions = (PermissionError, OutputLimitExceededError)
+        with (
+            self._log_op("K8s read files from Pod", expected_exceptions, files=files),
+            deadline(_file_op_deadline()),
+        ):
+            async for attempt in _retry():
+                with attempt:
+                    contents = await self._pod.read_files([Path(f) for f in files])
+        read = [contents[Path(file)] for file in files]
+        if not text:
+            return dict(zip(files, read))
+        return {file: _decode(data) for file, data in zip(files, read)}
+
+    async def read_dir(self, dir: str) -> dict[str, bytes]:
+        """Read the regular files within a directory of the sandbox environment.
+
+        The directory is read recursively and streamed from the Pod as one tar archive,
+        which is limited in size as a single `read_file()` is.
+
+        Args:
+          dir: The path of the directory to read.
+
+        Returns:
+          The contents of each file, keyed by its path relative to `dir`.
+        """
+        # Do not log these at error level or re-raise as enriched K8sError.
+        expected_exceptions = (
+            FileNotFoundError,
+            PermissionError,
+            OutputLimitExceededError,
+        )
+        with (
+            self._log_op("K8s read dir from Pod", expected_exceptions, dir=dir),
+            deadline(_file_op_deadline()),
+        ):
+            async for attempt in _retry():
+                with attempt:
+                    files = await self._pod.read_dir(Path(dir))
+        return files
 
     async def connection(self, *, user: str | None = None) -> SandboxConnection:
         if user is None:
@@ -430,6 +694,10 @@ class K8sSandboxEnvironmentConfig(BaseModel, frozen=True):
     restarted_container_behavior: Literal["warn", "raise"] = "warn"
     max_pod_ops: int | None = None
     """Maximum number of concurrent pod operations. Defaults to cpu_count * 4."""
+    install_engine: Literal["helm", "apply"] = "helm"
+    """How each sample's resources are installed. "helm" runs `helm install` per sample.
+    "apply" renders the chart once per task and applies each sample's objects directly
+    via the Kubernetes API."""
 
 
 def _key_to_pascal(key: str) -> str:
@@ -536,6 +804,7 @@ def _create_release(
         config.restarted_container_behavior,
         sample_uuid=sample_uuid,
         extra_values=extra_values,
+        install_engine=config.install_engine,
     )
 
 
@@ -549,6 +818,7 @@ class _ResolvedConfig(BaseModel, frozen=True):
     restarted_container_behavior: Literal["warn", "raise"]
     compose_config: BaseModel | None = None
     max_pod_ops: int | None
+    install_engine: Literal["helm", "apply"] = "helm"
 
 
 def _create_values_source(config: _ResolvedConfig) -> ValuesSource:
@@ -615,6 +885,7 @@ def _validate_and_resolve_k8s_sandbox_config(
             default_user=config.default_user,
             restarted_container_behavior=config.restarted_container_behavior,
             max_pod_ops=config.max_pod_ops,
+            install_engine=config.install_engine,
         )
     if isinstance(config, ComposeConfig):
         return _ResolvedConfig(
@@ -0,0 +1,102 @@
+import os
+import random
+import statistics
+import time
+
+from inspect_ai import Task, eval, task
+from inspect_ai.dataset import MemoryDataset, Sample
+from inspect_ai.model import ChatMessageAssistant, ModelOutput
+from inspect_ai.scorer import includes
+from inspect_ai.solver import Generate, TaskState, solver
+from inspect_ai.util import sandbox
+
+from k8s_sandbox._pod.compression import INSPECT_K8S_COMPRESSION
+
+# Measures the throughput of sandbox.write_file() and sandbox.read_file() with and
+# without compression, for compressible (log-like) and incompressible (random) payloads
+# of a range of sizes. Used to tune the compression threshold.
+
+success_str = "compression_measured"
+sizes = [16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, 16 * 1024 * 1024]
+
+
+@task
+def compression_task(repeats: int):
+    return Task(
+        dataset=MemoryDataset([Sample(input="Input", target=success_str)]),
+        sandbox="k8s",
+        solver=[throughput_solver(repeats)],
+        scorer=includes(),
+        max_messages=1,
+    )
+
+
+@solver
+def throughput_solver(repeats: int):
+    async def solve(state: TaskState, generate: Generate):
+        result = await measure(repeats)
+        state.messages.append(ChatMessageAssistant(content=result, source="generate"))
+        state.output = ModelOutput.from_content(model="mock", content=result)
+        return state
+
+    return solve
+
+
+def payload(kind: str, size: int) -> bytes:
+    if kind == "random":
+        return random.randbytes(size)
+    lines: list[str] = []
+    length = 0
+    while length < size:
+        line = (
+            f"2026-01-01T00:00:00 INFO step={len(lines)} loss={random.random():.4f}\n"
+        )
+        lines.append(line)
+        length += len(line)
+    return "".join(lines).encode()[:size]
+
+
+async def measure(repeats: int) -> str:
+    lines = [success_str]
+    for kind in ("compressible", "random"):
+        for size in sizes:
+            data = payload(kind, size)
+            # Interleave the variants so that both see the same load over time.
+            seconds: dict[str, list[float]] = {}
+            for _ in range(repeats):
+                for compression in ("false", "true"):
+                    os.environ[INSPECT_K8S_COMPRESSION] = compression
+                    start = time.perf_counter()
+                    await sandbox().write_file("payload", data)
+                    write = time.perf_counter() - start
+                    start = time.perf_counter()
+                    read = await sandbox().read_file("payload", text=False)
+                    seconds.setdefault(f"write {compression}", []).append(write)
+                    seconds.setdefault(f"read {compression}", []).append(
+                        time.perf_counter() - start
+                    )
+                    if read != data:
+                        return f"error\n{kind} {size} read back different data"
+            for name, samples in seconds.items():
+                op, compression = name.split()
+                throughput = size / statistics.median(samples) / 1024 / 1024
+                lines.append(
+                    f"{kind} {size // 1024} KiB {op} "
+                    f"{'compressed' if compression == 'true' else 'raw'}: "
+                    f"{throughput:.1f} MiB/s"
+                )
+    print("\n".join(lines[1:]))
+    return "\n".join(lines)
+
+
+def run_diagnostic_eval(repeats: int = 10) -> float:
+    logs = eval(
+        tasks=[compression_task(repeats)],
+        model="mockllm/model",
+    )
+    assert logs[0].results is not None
+    return logs[0].results.scores[0].metrics["accuracy"].value
+
+
+if __name__ == "__main__":
+    run_diagnostic_eval()
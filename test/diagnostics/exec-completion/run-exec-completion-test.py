@@ -0,0 +1,86 @@
+import statistics
+import time
+from pathlib import Path
+
+from inspect_ai import Task, eval, task
+from inspect_ai.dataset import MemoryDataset, Sample
+from inspect_ai.model import ChatMessageAssistant, ModelOutput
+from inspect_ai.scorer import includes
+from inspect_ai.solver import Generate, TaskState, solver
+from inspect_ai.util import SandboxEnvironmentSpec, sandbox
+
+from k8s_sandbox._sandbox_environment import (
+    K8sSandboxEnvironmentConfig,
+)
+
+# Measures the latency of sandbox.exec() on a node whose page cache is kept dirty, with
+# and without the `sync` which the exec script used to run before writing its
+# completion sentinel. The `sync` variant runs `sync` as part of the command itself,
+# which costs the same as the script running it.
+
+success_str = "exec_completion_measured"
+
+
+@task
+def exec_completion_task(execs: int):
+    return Task(
+        dataset=MemoryDataset([Sample(input="Input", target=success_str)]),
+        sandbox=SandboxEnvironmentSpec(
+            "k8s",
+            K8sSandboxEnvironmentConfig(
+                chart=str(Path(__file__).parent / "loaded-chart"),
+                values=None,
+            ),
+        ),
+        solver=[latency_solver(execs)],
+        scorer=includes(),
+        max_messages=1,
+    )
+
+
+@solver
+def latency_solver(execs: int):
+    async def solve(state: TaskState, generate: Generate):
+        result = await measure(execs)
+        state.messages.append(ChatMessageAssistant(content=result, source="generate"))
+        state.output = ModelOutput.from_content(model="mock", content=result)
+        return state
+
+    return solve
+
+
+async def measure(execs: int) -> str:
+    lines = [success_str]
+    # Interleave the variants so that both see the same load over time.
+    latencies: dict[str, list[float]] = {"without sync": [], "with sync": []}
+    for _ in range(execs):
+        for name, cmd in (("without sync", ["true"]), ("with sync", ["sync"])):
+            start = time.perf_counter()
+            result = await sandbox().exec(cmd, timeout=120)
+            latencies[name].append(time.perf_counter() - start)
+            if not result.success:
+                return f"error\n{name} exec failed\n{result}"
+    for name, samples in latencies.items():
+        samples.sort()
+        p95 = samples[int(len(samples) * 0.95) - 1]
+        lines.append(
+            f"{name}: median {statistics.median(samples) * 1000:.1f} ms, "
+            f"p95 {p95 * 1000:.1f} ms, max {samples[-1] * 1000:.1f} ms"
+        )
+    print("\n".join(lines[1:]))
+    return "\n".join(lines)
+
+
+def run_diagnostic_eval(epochs: int = 5, execs: int = 100) -> float:
+    logs = eval(
+        tasks=[exec_completion_task(execs)],
+        model="mockllm/model",
+        max_samples=epochs,
+        epochs=epochs,
+    )
+    assert logs[0].results is not None
+    return logs[0].results.scores[0].metrics["accuracy"].value
+
+
+if __name__ == "__main__":
+    run_diagnostic_eval()
@@ -201,6 +201,8 @@ def test_labels(
         assert labels.items() <= service["metadata"]["labels"].items()
     for deployment in _get_documents(documents, "Deployment"):
         assert labels.items() <= deployment["metadata"]["labels"].items()
+    for config_map in _get_documents(documents, "ConfigMap"):
+        assert labels.items() <= (config_map["metadata"].get("labels") or {}).items()
 
 
 def test_no_service_account_by_default(chart_dir: Path) -> None:
@@ -0,0 +1,133 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from k8s_sandbox._pod import cache as cache_module
+from k8s_sandbox._pod.cache import SANDBOX_LABEL_SELECTOR, PodCache, pod_cache
+
+
+def _pod(
+    name: str,
+    uid: str = "uid-1",
+    release: str = "abc",
+    ready: bool = True,
+    resource_version: str = "1",
+) -> dict:
+    return {
+        "metadata": {
+            "name": name,
+            "uid": uid,
+            "resourceVersion": resource_version,
+            "labels": {"app.kubernetes.io/instance": release},
+        },
+        "spec": {"containers": [{"name": "default"}]},
+        "status": {
+            "conditions": [{"type": "Ready", "status": "True" if ready else "False"}],
+            "containerStatuses": [{"name": "default", "restartCount": 0}],
+        },
+    }
+
+
+def _listed(*pods: dict) -> MagicMock:
+    response = MagicMock()
+    response.data = json.dumps(
+        {"metadata": {"resourceVersion": "1"}, "items": list(pods)}
+    ).encode()
+    return response
+
+
+def _stream(*events: dict) -> MagicMock:
+    response = MagicMock()
+    response.stream.return_value = [
+        "".join(json.dumps(event) + "\n" for event in events).encode()
+    ]
+    return response
+
+
+def _synced_cache(*pods: dict) -> PodCache:
+    cache = PodCache(None, "ns")
+    api = MagicMock()
+    api.list_namespaced_pod.return_value = _listed(*pods)
+    cache._list(api)
+    return cache
+
+
+def test_pod_cache_disabled_by_default() -> None:
+    assert pod_cache(None, "ns") is None
+
+
+def test_pod_cache_is_shared_per_namespace(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv(cache_module.INSPECT_K8S_POD_CACHE, "true")
+    monkeypatch.setattr(cache_module, "_caches", {})
+
+    with patch.object(PodCache, "start") as start:
+        first = pod_cache(None, "ns")
+        assert pod_cache(None, "ns") is first
+        assert pod_cache(None, "other") is not first
+
+    assert start.call_count == 2
+
+
+def test_unsynced_cache_serves_nothing() -> None:
+    cache = PodCache(None, "ns")
+
+    assert cache.get("a") is None
+    assert cache.release_pods("abc") is None
+
+
+def test_list_populates_cache() -> None:
+    cache = PodCache(None, "ns")
+    api = MagicMock()
+    api.list_namespaced_pod.return_value = _listed(_pod("a"), _pod("b"))
+
+    assert cache._list(api) == "1"
+
+    assert api.list_namespaced_pod.call_args.kwargs["label_selector"] == (
+        SANDBOX_LABEL_SELECTOR
+    )
+    snapshot = cache.get("a")
+    assert snapshot is not None and snapshot.uid == "uid-1"
+
+
+def test_watch_applies_events() -> None:
+    cache = _synced_cache(_pod("a"), _pod("b"))
+    api = MagicMock()
+    api.list_namespaced_pod.return_value = _stream(
+        {"type": "MODIFIED", "object": _pod("a", uid="uid-2", resource_version="2")},
+        {"type": "DELETED", "object": _pod("b", resource_version="3")},
+        {"type": "BOOKMARK", "object": {"metadata": {"resourceVersion": "4"}}},
+    )
+
+    assert cache._watch(api, "1") == "4"
+
+    snapshot = cache.get("a")
+    assert snapshot is not None and snapshot.uid == "uid-2"
+    assert cache.get("b") is None
+
+
+def test_watch_requests_relist_when_history_expires() -> None:
+    cache = _synced_cache()
+    api = MagicMock()
+    api.list_namespaced_pod.return_value = _stream(
+        {"type": "ERROR", "object": {"code": 410, "message": "too old"}}
+    )
+
+    assert cache._watch(api, "1") is None
+
+
+def test_stale_cache_serves_nothing() -> None:
+    cache = _synced_cache(_pod("a"))
+
+    with patch("k8s_sandbox._pod.cache.time.monotonic", return_value=1e12):
+        assert cache.get("a") is None
+
+
+def test_release_pods_only_served_once_all_ready() -> None:
+    cache = _synced_cache(_pod("a"), _pod("b", ready=False), _pod("c", release="xyz"))
+
+    assert cache.release_pods("abc") is None
+    pods = cache.release_pods("xyz")
+    assert pods is not None and [pod.name for pod in pods] == ["c"]
+    raw = cache.raw_release_pods("abc")
+    assert raw is not None and len(raw) == 2
@@ -0,0 +1,190 @@
+import asyncio
+import os
+import socket
+import subprocess
+import threading
+import time
+from types import SimpleNamespace
+from typing import Generator
+from unittest.mock import patch
+
+import pytest
+
+from k8s_sandbox._pod.cancellation import (
+    EXEC_ID_VARIABLE,
+    INSPECT_K8S_KILL_ON_CANCEL,
+    Cancellation,
+    abort_websocket,
+    current_cancellation,
+    kill_command,
+    new_exec_id,
+    uncancellable,
+)
+from k8s_sandbox._pod.execute import ExecuteOperation
+from k8s_sandbox._pod.executor import PodOpExecutor
+
+
+@pytest.fixture(autouse=True)
+def isolated_executor() -> Generator:
+    # Inspect's limit on concurrent pod ops is global, and set by its first use.
+    with patch("k8s_sandbox._pod.executor.concurrency"):
+        yield
+
+
+def test_callbacks_run_once_on_cancel() -> None:
+    cancellation = Cancellation()
+    calls: list[str] = []
+
+    with cancellation.on_cancel(lambda: calls.append("a")):
+        cancellation.cancel()
+        cancellation.cancel()
+
+    assert calls == ["a"]
+    assert cancellation.cancelled
+
+
+def test_callback_runs_immediately_if_already_cancelled() -> None:
+    cancellation = Cancellation()
+    cancellation.cancel()
+    calls: list[str] = []
+
+    with cancellation.on_cancel(lambda: calls.append("a")):
+        assert calls == ["a"]
+
+
+def test_callback_not_run_after_its_context() -> None:
+    cancellation = Cancellation()
+    calls: list[str] = []
+
+    with cancellation.on_cancel(lambda: calls.append("a")):
+        pass
+    cancellation.cancel()
+
+    assert calls == []
+
+
+def test_failing_callback_does_not_stop_others() -> None:
+    cancellation = Cancellation()
+    calls: list[str] = []
+
+    def fail() -> None:
+        raise RuntimeError("boom")
+
+    with (
+        cancellation.on_cancel(fail),
+        cancellation.on_cancel(lambda: calls.append("b")),
+    ):
+        cancellation.cancel()
+
+    assert calls == ["b"]
+
+
+def test_uncancellable() -> None:
+    cancellation = Cancellation()
+    cancellation.bind()
+    cancellation.cancel()
+
+    with uncancellable():
+        assert not current_cancellation().cancelled
+    assert current_cancellation() is cancellation
+
+
+async def test_cancelling_caller_releases_executor_thread() -> None:
+    executor = PodOpExecutor(max_pod_ops=1)
+    started = threading.Event()
+    released = threading.Event()
+
+    def blocking_op() -> None:
+        aborted = threading.Event()
+        with current_cancellation().on_cancel(aborted.set):
+            started.set()
+            aborted.wait(10)
+        released.set()
+
+    task = asyncio.create_task(executor.queue_operation(blocking_op))
+    await asyncio.to_thread(started.wait, 5)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert await asyncio.to_thread(released.wait, 5)
+    # The only thread is free for the next operation.
+    assert await asyncio.wait_for(executor.queue_operation(lambda: 1), 5) == 1
+
+
+async def test_operations_are_not_cancelled_by_default() -> None:
+    executor = PodOpExecutor(max_pod_ops=1)
+
+    cancelled = await executor.queue_operation(lambda: current_cancellation().cancelled)
+
+    assert cancelled is False
+
+
+def test_abort_websocket_wakes_blocked_reader() -> None:
+    ours, theirs = socket.socketpair()
+    received: list[bytes] = []
+    reader = threading.Thread(target=lambda: received.append(ours.recv(1)))
+    reader.start()
+    time.sleep(0.1)
+
+    abort_websocket(SimpleNamespace(sock=SimpleNamespace(sock=ours)))
+
+    reader.join(5)
+    assert not reader.is_alive()
+    assert received == [b""]
+    # Aborting again (or a websocket without a socket) is harmless.
+    abort_websocket(SimpleNamespace(sock=SimpleNamespace(sock=ours)))
+    abort_websocket(SimpleNamespace(sock=None))
+    ours.close()
+    theirs.close()
+
+
+def test_new_exec_id_only_if_enabled(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv(INSPECT_K8S_KILL_ON_CANCEL, raising=False)
+    assert new_exec_id() is None
+
+    monkeypatch.setenv(INSPECT_K8S_KILL_ON_CANCEL, "true")
+    assert new_exec_id() != new_exec_id()
+
+
+def test_scripts_mark_processes_with_exec_id() -> None:
+    op = ExecuteOperation(SimpleNamespace())  # type: ignore[arg-type]
+
+    script = op._build_shell_script(["sleep", "1"], None, None, {}, None, "abc")
+    session_script = op._build_session_script(
+        "token", ["sleep", "1"], None, None, {}, None, "abc"
+    )
+
+    assert f"export {EXEC_ID_VARIABLE}=abc\n" in script
+    assert f"export {EXEC_ID_VARIABLE}=abc\n" in session_script
+    assert EXEC_ID_VARIABLE not in op._build_shell_script(
+        ["sleep", "1"], None, None, {}, None
+    )
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self"), reason="Requires /proc.")
+def test_kill_command_kills_marked_processes_only() -> None:
+    marked = subprocess.Popen(
+        ["sh", "-c", f"export {EXEC_ID_VARIABLE}=abc; exec sleep 30"]
+    )
+    unmarked = subprocess.Popen(
+        ["sh", "-c", f"export {EXEC_ID_VARIABLE}=other; exec sleep 30"]
+    )
+    try:
+        # Wait for the environment variable to be exported.
+        time.sleep(0.2)
+
+        subprocess.run(kill_command("abc"), check=True, timeout=10)
+
+        assert marked.wait(5) == -9
+        assert unmarked.poll() is None
+    finally:
+        for process in (marked, unmarked):
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self"), reason="Requires /proc.")
+def test_kill_command_without_marked_processes_succeeds() -> None:
+    assert subprocess.run(kill_command("none"), timeout=10).returncode == 0
@@ -149,3 +149,34 @@ def test_pod_auto_refreshes_restart_count_after_container_restart():
             uid="uid-OLD", container_name="default", restart_count=4
         )
         pod._check_for_pod_restart_sync()
+
+
+def test_restart_check_served_from_pod_cache():
+    cache = MagicMock()
+    cache.get.return_value = MagicMock(
+        uid="uid-NEW", restart_count_for=MagicMock(return_value=0)
+    )
+    with (
+        patch("k8s_sandbox._pod.op.pod_cache", return_value=cache),
+        patch("k8s_sandbox._pod.op.k8s_client") as mock_client,
+    ):
+        with pytest.raises(PodReplacedError):
+            check_for_pod_restart(_pod_info(uid="uid-1"))
+
+    cache.get.assert_called_once_with("agent-env-abc-default-0")
+    mock_client.return_value.read_namespaced_pod.assert_not_called()
+
+
+def test_restart_check_falls_back_to_get_on_cache_miss():
+    cache = MagicMock()
+    cache.get.return_value = None
+    with (
+        patch("k8s_sandbox._pod.op.pod_cache", return_value=cache),
+        patch("k8s_sandbox._pod.op.k8s_client") as mock_client,
+    ):
+        mock_client.return_value.read_namespaced_pod.return_value = _k8s_pod(
+            uid="uid-1", container_name="default", restart_count=0
+        )
+        check_for_pod_restart(_pod_info())
+
+    mock_client.return_value.read_namespaced_pod.assert_called_once()
@@ -0,0 +1,89 @@
+import io
+import os
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from k8s_sandbox._pod.compression import (
+    COMPRESSION_THRESHOLD_BYTES,
+    INSPECT_K8S_COMPRESSION,
+    DecompressingWriter,
+    _Gzip,
+    codec_from_probe,
+    compression_enabled,
+    read_script,
+)
+
+_COMPRESSIBLE = b"step=1 loss=0.25 msg=training progress ok\n" * 10000
+
+
+@pytest.mark.parametrize("value,expected", [("true", True), ("0", False)])
+def test_compression_enabled(
+    monkeypatch: pytest.MonkeyPatch, value: str, expected: bool
+) -> None:
+    monkeypatch.setenv(INSPECT_K8S_COMPRESSION, value)
+
+    assert compression_enabled() == expected
+
+
+def test_codec_from_probe_prefers_zstd_if_installed_on_client(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(
+        "importlib.util.find_spec", lambda name: None if name == "zstandard" else True
+    )
+
+    assert codec_from_probe("zstd\ngzip\n").name == "gzip"  # type: ignore[union-attr]
+    assert codec_from_probe("zstd\n") is None
+    assert codec_from_probe("") is None
+
+
+def test_worth_compressing() -> None:
+    codec = _Gzip()
+
+    assert codec.worth_compressing(_COMPRESSIBLE)
+    assert not codec.worth_compressing(_COMPRESSIBLE[: COMPRESSION_THRESHOLD_BYTES - 1])
+    assert not codec.worth_compressing(os.urandom(COMPRESSION_THRESHOLD_BYTES * 2))
+
+
+def test_zstd_round_trip() -> None:
+    pytest.importorskip("zstandard")
+    codec = codec_from_probe("zstd\ngzip\n")
+    assert codec is not None and codec.name == "zstd"
+    decompressor = codec.decompressor()
+
+    decompressed = decompressor.decompress(codec.compress(_COMPRESSIBLE))
+
+    assert decompressed + decompressor.flush() == _COMPRESSIBLE
+
+
+@pytest.mark.parametrize("size", [0, 10, COMPRESSION_THRESHOLD_BYTES, 400000])
+def test_read_script_round_trip(tmp_path: Path, size: int) -> None:
+    src = tmp_path / "src"
+    src.write_bytes(_COMPRESSIBLE[:size])
+    output = subprocess.run(
+        ["sh", "-c", read_script(_Gzip()), "sh", str(src), "1000000"],
+        capture_output=True,
+        check=True,
+    ).stdout
+    dst = io.BytesIO()
+    writer = DecompressingWriter(dst, _Gzip())
+
+    # Split the output to exercise streaming decompression.
+    for i in range(0, len(output), 1000):
+        writer.write(output[i : i + 1000])
+    writer.flush()
+
+    assert dst.getvalue() == _COMPRESSIBLE[:size]
+    assert output[:1] == (b"c" if size >= COMPRESSION_THRESHOLD_BYTES else b"r")
+
+
+def test_read_script_fails_for_missing_file(tmp_path: Path) -> None:
+    result = subprocess.run(
+        ["sh", "-c", read_script(_Gzip()), "sh", str(tmp_path / "missing"), "10"],
+        capture_output=True,
+    )
+
+    assert result.returncode != 0
+    assert b"No such file or directory" in result.stderr
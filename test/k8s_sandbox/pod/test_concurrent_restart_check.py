@@ -0,0 +1,129 @@
+import threading
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from inspect_ai.util import ExecResult
+
+from k8s_sandbox._pod.error import ContainerRestartedError
+from k8s_sandbox._pod.pod import INSPECT_K8S_CONCURRENT_RESTART_CHECK, Pod
+
+# Reuse the mock helpers from the existing restart tests.
+from test.k8s_sandbox.pod.test_check_for_pod_restart import _k8s_pod, _make_pod
+
+
+@pytest.fixture(autouse=True)
+def _concurrent_restart_check(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv(INSPECT_K8S_CONCURRENT_RESTART_CHECK, "true")
+
+
+def _result(success: bool) -> ExecResult[str]:
+    return ExecResult(
+        success=success, returncode=0 if success else 1, stdout="", stderr=""
+    )
+
+
+async def _exec(pod: Pod) -> ExecResult[str]:
+    return await pod.exec(
+        cmd=["echo", "hello"], stdin=None, cwd=None, env={}, user=None, timeout=None
+    )
+
+
+async def test_restart_check_runs_concurrently_with_exec() -> None:
+    exec_started = threading.Event()
+    overlapped = []
+
+    def read_pod(**kwargs: Any) -> Any:
+        overlapped.append(exec_started.wait(timeout=5))
+        return _k8s_pod(uid="uid-OLD", container_name="default", restart_count=0)
+
+    def exec(*args: Any) -> ExecResult[str]:
+        exec_started.set()
+        return _result(True)
+
+    with (
+        patch("k8s_sandbox._pod.op.k8s_client") as mock_client,
+        patch("k8s_sandbox._pod.pod.ExecuteOperation") as mock_exec_cls,
+    ):
+        mock_client.return_value.read_namespaced_pod.side_effect = read_pod
+        mock_exec_cls.return_value.exec.side_effect = exec
+
+        result = await _exec(_make_pod())
+
+    assert result.success
+    assert overlapped == [True]
+
+
+async def test_restart_raised_even_if_exec_succeeds() -> None:
+    with (
+        patch("k8s_sandbox._pod.op.k8s_client") as mock_client,
+        patch("k8s_sandbox._pod.pod.ExecuteOperation") as mock_exec_cls,
+    ):
+        mock_client.return_value.read_namespaced_pod.return_value = _k8s_pod(
+            uid="uid-OLD", container_name="default", restart_count=1
+        )
+        mock_exec_cls.return_value.exec.return_value = _result(True)
+
+        with pytest.raises(ContainerRestartedError):
+            await _exec(_make_pod("raise"))
+
+
+async def test_warned_restart_raised_if_exec_fails() -> None:
+    with (
+        patch("k8s_sandbox._pod.op.k8s_client") as mock_client,
+        patch("k8s_sandbox._pod.pod.ExecuteOperation") as mock_exec_cls,
+    ):
+        mock_client.return_value.read_namespaced_pod.return_value = _k8s_pod(
+            uid="uid-OLD", container_name="default", restart_count=1
+        )
+        mock_exec_cls.return_value.exec.return_value = _result(False)
+
+        with pytest.raises(ContainerRestartedError):
+            await _exec(_make_pod("warn"))
+
+
+async def test_warned_restart_not_raised_if_exec_succeeds() -> None:
+    with (
+        patch("k8s_sandbox._pod.op.k8s_client") as mock_client,
+        patch("k8s_sandbox._pod.pod.ExecuteOperation") as mock_exec_cls,
+    ):
+        mock_client.return_value.read_namespaced_pod.return_value = _k8s_pod(
+            uid="uid-OLD", container_name="default", restart_count=1
+        )
+        mock_exec_cls.return_value.exec.return_value = _result(True)
+
+        result = await _exec(_make_pod("warn"))
+
+    assert result.success
+
+
+@pytest.mark.parametrize("behavior", ["warn", "raise"])
+async def test_restart_raised_as_cause_of_exec_exception(behavior: str) -> None:
+    exec_error = RuntimeError("connection reset")
+    with (
+        patch("k8s_sandbox._pod.op.k8s_client") as mock_client,
+        patch("k8s_sandbox._pod.pod.ExecuteOperation") as mock_exec_cls,
+    ):
+        mock_client.return_value.read_namespaced_pod.return_value = _k8s_pod(
+            uid="uid-OLD", container_name="default", restart_count=1
+        )
+        mock_exec_cls.return_value.exec.side_effect = exec_error
+
+        with pytest.raises(ContainerRestartedError) as exc_info:
+            await _exec(_make_pod(behavior))
+
+    assert exc_info.value.__cause__ is exec_error
+
+
+async def test_exec_exception_raised_if_no_restart() -> None:
+    with (
+        patch("k8s_sandbox._pod.op.k8s_client") as mock_client,
+        patch("k8s_sandbox._pod.pod.ExecuteOperation") as mock_exec_cls,
+    ):
+        mock_client.return_value.read_namespaced_pod.return_value = _k8s_pod(
+            uid="uid-OLD", container_name="default", restart_count=0
+        )
+        mock_exec_cls.return_value.exec.side_effect = RuntimeError("connection reset")
+
+        with pytest.raises(RuntimeError, match="connection reset"):
+            await _exec(_make_pod())
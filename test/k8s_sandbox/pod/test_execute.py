@@ -1,5 +1,6 @@
+import re
 from contextlib import contextmanager
-from typing import Generator
+from typing import Generator, cast
 from unittest.mock import MagicMock, patch
 
 import pytest
@@ -28,8 +29,16 @@ def _make_ws_client(
     """
     ws = MagicMock(spec=WSClient)
 
+    if stderr_frames is None:
+        # The exec script writes the completed sentinel to stderr as well as stdout.
+        stderr_frames = [
+            match.group(0) + b">"
+            if (match := re.search(rb"<completed-sentinel-value-\d+", frame))
+            else b""
+            for frame in stdout_frames
+        ]
     stdout_queue = list(stdout_frames)
-    stderr_queue = list(stderr_frames or [])
+    stderr_queue = list(stderr_frames)
     current_stdout: bytes | None = None
     current_stderr: bytes | None = None
     closed = False
@@ -179,7 +188,7 @@ class TestNonUtf8Output:
     def test_binary_byte_on_stderr(self) -> None:
         ws = _make_ws_client(
             stdout_frames=[b"<completed-sentinel-value-0>"],
-            stderr_frames=[b"warn \xbb done\n"],
+            stderr_frames=[b"warn \xbb done\n<completed-sentinel-value-0>"],
         )
 
         executor = ExecuteOperation(MagicMock())
@@ -204,7 +213,9 @@ class TestRunuserErrors:
     def test_user_command_runuser_error_with_sentinel_returns_result(self) -> None:
         ws = _make_ws_client(
             stdout_frames=[b"<completed-sentinel-value-1>"],
-            stderr_frames=[b"runuser: user foo does not exist\n"],
+            stderr_frames=[
+                b"runuser: user foo does not exist\n<completed-sentinel-value-1>"
+            ],
         )
 
         executor = ExecuteOperation(MagicMock())
@@ -266,6 +277,29 @@ class TestConnectionResetWithoutSentinel:
             executor._handle_shell_output(ws, user=None, timeout=None)
 
 
+class TestCompletionSentinels:
+    def test_waits_for_stderr_sentinel_after_stdout_sentinel(self) -> None:
+        ws = _make_ws_client(
+            stdout_frames=[b"out<completed-sentinel-value-3>", b"", b""],
+            stderr_frames=[b"err 1\n", b"err 2\n", b"<completed-sentinel-value-3>"],
+        )
+
+        executor = ExecuteOperation(MagicMock())
+        result = executor._handle_shell_output(ws, user=None, timeout=None)
+
+        assert (result.returncode, result.stdout) == (3, "out")
+        assert result.stderr == "err 1\nerr 2\n"
+        cast(MagicMock, ws.close).assert_called()
+
+    def test_script_does_not_sync(self) -> None:
+        script = ExecuteOperation(MagicMock())._build_shell_script(
+            ["true"], None, None, {}, None
+        )
+
+        assert "sync" not in script.splitlines()
+        assert 'echo -n "<completed-sentinel-value-$returncode>" >&2' in script
+
+
 class TestExecChunksStdin:
     def test_exec_writes_shell_script_in_chunks(
         self, monkeypatch: pytest.MonkeyPatch
@@ -277,7 +311,7 @@ class TestExecChunksStdin:
 
         @contextmanager
         def fake_interactive_shell(
-            user: str | None,
+            user: str | None, end_of_script: str | None = None
         ) -> Generator[MagicMock, None, None]:
             yield ws
 
@@ -298,3 +332,34 @@ class TestExecChunksStdin:
         assert ws.write_stdin.call_count > 1
         assert all(len(c.args[0]) <= 16 for c in ws.write_stdin.call_args_list)
         assert result is sentinel
+
+    def test_exec_streams_raw_stdin_and_closes_it_in_v5(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setattr(op_module, "_closable_stdin_by_context", {None: True})
+        ws = MagicMock(spec=WSClient)
+        ws.subprotocol = op_module.V5_CHANNEL_PROTOCOL
+        shells: list[str | None] = []
+
+        @contextmanager
+        def fake_interactive_shell(
+            user: str | None, end_of_script: str | None = None
+        ) -> Generator[MagicMock, None, None]:
+            shells.append(end_of_script)
+            yield ws
+
+        op = ExecuteOperation(MagicMock(context_name=None))
+        monkeypatch.setattr(op, "_interactive_shell", fake_interactive_shell)
+        sentinel = ExecResult(success=True, returncode=0, stdout="", stderr="")
+        monkeypatch.setattr(op, "_handle_shell_output", lambda *a, **k: sentinel)
+
+        op.exec(["cat"], stdin=b"\0raw", cwd=None, env={}, user=None, timeout=None)
+
+        [end_of_script] = shells
+        assert end_of_script is not None
+        expected_script = op._build_shell_script(["cat"], None, None, {}, None)
+        assert [call.args[0] for call in ws.write_stdin.call_args_list] == [
+            f"{expected_script}{end_of_script}\n",
+            b"\0raw",
+        ]
+        ws.close_channel.assert_called_once_with(0)
@@ -0,0 +1,173 @@
+import os
+import subprocess
+from typing import Any
+from unittest.mock import MagicMock, patch
+
+import pytest
+from inspect_ai.util import ExecResult
+
+from k8s_sandbox._pod.error import ContainerRestartedError, PodReplacedError
+from k8s_sandbox._pod.execute import ExecuteOperation, _CompletedSentinelScanner
+from k8s_sandbox._pod.pod import INSPECT_K8S_IN_BAND_RESTART_CHECK, Pod
+
+# Reuse the mock helpers from the existing restart tests.
+from test.k8s_sandbox.pod.test_check_for_pod_restart import _k8s_pod, _make_pod
+
+
+@pytest.fixture(autouse=True)
+def _in_band_restart_check(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv(INSPECT_K8S_IN_BAND_RESTART_CHECK, "true")
+
+
+def _fake_exec_operation(identities: list[str | None], success: bool = True) -> Any:
+    """An ExecuteOperation class whose execs report the given identities in turn."""
+
+    def create(*args: Any, **kwargs: Any) -> MagicMock:
+        assert kwargs["report_container_identity"] is True
+        operation = MagicMock()
+
+        def exec(*args: Any) -> ExecResult[str]:
+            operation.container_identity = identities.pop(0)
+            return ExecResult(
+                success=success, returncode=0 if success else 1, stdout="", stderr=""
+            )
+
+        operation.exec.side_effect = exec
+        return operation
+
+    return create
+
+
+async def _exec(pod: Pod) -> ExecResult[str]:
+    return await pod.exec(
+        cmd=["echo", "hello"], stdin=None, cwd=None, env={}, user=None, timeout=None
+    )
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/1/stat"), reason="Requires procfs.")
+def test_shell_script_reports_container_identity() -> None:
+    operation = ExecuteOperation(MagicMock(), report_container_identity=True)
+    script = operation._build_shell_script(["true"], None, None, {}, None)
+
+    stdout = subprocess.run(
+        ["sh"], input=script.encode(), capture_output=True, check=True
+    ).stdout
+
+    scanner = _CompletedSentinelScanner()
+    assert b"".join([*scanner.feed(stdout), *scanner.flush()]) == b""
+    assert scanner.returncode == 0
+    with open("/proc/sys/kernel/random/boot_id") as f:
+        boot_id = f.read().strip()
+    with open("/proc/1/stat") as f:
+        start_time = f.read().rsplit(")", 1)[1].split()[19]
+    assert scanner.identity == f"{start_time}.{boot_id}"
+
+
+async def test_api_is_only_read_until_identity_is_known() -> None:
+    with (
+        patch("k8s_sandbox._pod.op.k8s_client") as mock_client,
+        patch(
+            "k8s_sandbox._pod.pod.ExecuteOperation",
+            _fake_exec_operation(["1.boot", "1.boot", "1.boot"]),
+        ),
+    ):
+        read_pod = mock_client.return_value.read_namespaced_pod
+        read_pod.return_value = _k8s_pod(
+            uid="uid-OLD", container_name="default", restart_count=0
+        )
+        pod = _make_pod("raise")
+
+        for _ in range(3):
+            assert (await _exec(pod)).success
+
+    assert read_pod.call_count == 1
+
+
+async def test_changed_identity_is_classified_by_the_api() -> None:
+    with (
+        patch("k8s_sandbox._pod.op.k8s_client") as mock_client,
+        patch(
+            "k8s_sandbox._pod.pod.ExecuteOperation",
+            _fake_exec_operation(["1.boot", "2.boot", "2.boot"]),
+        ),
+    ):
+        read_pod = mock_client.return_value.read_namespaced_pod
+        read_pod.return_value = _k8s_pod(
+            uid="uid-OLD", container_name="default", restart_count=0
+        )
+        pod = _make_pod("raise")
+        await _exec(pod)
+        read_pod.return_value = _k8s_pod(
+            uid="uid-NEW", container_name="default", restart_count=0
+        )
+
+        with pytest.raises(PodReplacedError):
+            await _exec(pod)
+        # The new identity is the baseline for later execs.
+        assert (await _exec(pod)).success
+
+    assert read_pod.call_count == 2
+    assert pod.info.uid == "uid-NEW"
+
+
+async def test_changed_identity_is_a_restart_even_if_api_lags() -> None:
+    with (
+        patch("k8s_sandbox._pod.op.k8s_client") as mock_client,
+        patch(
+            "k8s_sandbox._pod.pod.ExecuteOperation",
+            _fake_exec_operation(["1.boot", "2.boot"]),
+        ),
+    ):
+        mock_client.return_value.read_namespaced_pod.return_value = _k8s_pod(
+            uid="uid-OLD", container_name="default", restart_count=0
+        )
+        pod = _make_pod("raise")
+        await _exec(pod)
+
+        with pytest.raises(ContainerRestartedError) as excinfo:
+            await _exec(pod)
+
+    assert excinfo.value.restart_count == 1
+    assert pod.info.initial_restart_count == 1
+
+
+async def test_warned_restart_raised_if_exec_fails() -> None:
+    with (
+        patch("k8s_sandbox._pod.op.k8s_client") as mock_client,
+        patch(
+            "k8s_sandbox._pod.pod.ExecuteOperation",
+            _fake_exec_operation(["1.boot", "2.boot"], success=False),
+        ),
+    ):
+        read_pod = mock_client.return_value.read_namespaced_pod
+        read_pod.return_value = _k8s_pod(
+            uid="uid-OLD", container_name="default", restart_count=0
+        )
+        pod = _make_pod("warn")
+        await _exec(pod)
+        read_pod.return_value = _k8s_pod(
+            uid="uid-OLD", container_name="default", restart_count=1
+        )
+
+        with pytest.raises(ContainerRestartedError):
+            await _exec(pod)
+
+
+async def test_missing_identity_falls_back_to_api() -> None:
+    with (
+        patch("k8s_sandbox._pod.op.k8s_client") as mock_client,
+        patch(
+            "k8s_sandbox._pod.pod.ExecuteOperation",
+            _fake_exec_operation([None, None]),
+        ),
+    ):
+        read_pod = mock_client.return_value.read_namespaced_pod
+        read_pod.return_value = _k8s_pod(
+            uid="uid-OLD", container_name="default", restart_count=0
+        )
+        pod = _make_pod("raise")
+
+        await _exec(pod)
+        await _exec(pod)
+
+    assert read_pod.call_count == 2
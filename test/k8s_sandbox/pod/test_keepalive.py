@@ -1,38 +1,88 @@
-import threading
 from time import sleep
-from unittest.mock import Mock, patch
+from unittest.mock import Mock
 
 from kubernetes.stream.ws_client import RESIZE_CHANNEL  # type: ignore
 
-from k8s_sandbox._pod.op import _send_keepalive
+from k8s_sandbox._pod.keepalive import KEEPALIVE_PAYLOAD, KeepaliveScheduler
 
 
-def test_send_keepalive_sends_frames_and_stops():
+def _ws_client(is_open: bool = True) -> Mock:
     ws_client = Mock()
-    ws_client.is_open.return_value = True
-    stop = threading.Event()
+    ws_client.is_open.return_value = is_open
+    return ws_client
 
-    with patch("k8s_sandbox._pod.op._KEEPALIVE_INTERVAL_SECONDS", 0.05):
-        t = threading.Thread(target=_send_keepalive, args=(ws_client, stop))
-        t.start()
-        sleep(0.2)
-        stop.set()
-        t.join(timeout=1)
 
-    assert ws_client.write_channel.call_count >= 2
+def test_sends_frames_to_idle_websocket_until_unregistered():
+    scheduler = KeepaliveScheduler(interval=0.05, tick=0.01)
+    ws_client = _ws_client()
+
+    scheduler.register(ws_client)
+    sleep(0.3)
+    scheduler.unregister(ws_client)
+    sent = ws_client.write_channel.call_count
+    sleep(0.1)
+
+    assert sent >= 2
+    assert ws_client.write_channel.call_count == sent
     for call in ws_client.write_channel.call_args_list:
-        assert call[0][0] == RESIZE_CHANNEL
+        assert call[0] == (RESIZE_CHANNEL, KEEPALIVE_PAYLOAD)
 
 
-def test_send_keepalive_exits_when_socket_closes():
-    ws_client = Mock()
-    ws_client.is_open.return_value = False
-    stop = threading.Event()
+def test_does_not_send_frames_to_active_websocket():
+    scheduler = KeepaliveScheduler(interval=0.1, tick=0.01)
+    active = _ws_client()
+    idle = _ws_client()
+    scheduler.register(active)
+    scheduler.register(idle)
+
+    for _ in range(15):
+        scheduler.touch(active)
+        sleep(0.02)
+
+    active.write_channel.assert_not_called()
+    assert idle.write_channel.call_count >= 1
 
-    with patch("k8s_sandbox._pod.op._KEEPALIVE_INTERVAL_SECONDS", 0.01):
-        t = threading.Thread(target=_send_keepalive, args=(ws_client, stop))
-        t.start()
-        t.join(timeout=1)
 
-    assert t.is_alive() is False
+def test_stops_tracking_closed_websocket():
+    scheduler = KeepaliveScheduler(interval=0.02, tick=0.01)
+    ws_client = _ws_client(is_open=False)
+
+    scheduler.register(ws_client)
+    sleep(0.1)
+
     ws_client.write_channel.assert_not_called()
+    assert scheduler.tracked_count == 0
+
+
+def test_stops_tracking_websocket_which_fails_to_send():
+    scheduler = KeepaliveScheduler(interval=0.02, tick=0.01)
+    ws_client = _ws_client()
+    ws_client.write_channel.side_effect = BrokenPipeError()
+
+    scheduler.register(ws_client)
+    sleep(0.1)
+
+    assert ws_client.write_channel.call_count == 1
+    assert scheduler.tracked_count == 0
+
+
+def test_counts_tracked_and_idle_websockets():
+    # A coarse tick so that no keepalive frame is sent during the test.
+    scheduler = KeepaliveScheduler(interval=0.05, tick=10)
+    first = _ws_client()
+    second = _ws_client()
+
+    scheduler.register(first)
+    sleep(0.1)
+    scheduler.register(second)
+    tracked, idle = scheduler.tracked_count, scheduler.idle_count
+    scheduler.unregister(first)
+    scheduler.unregister(second)
+
+    assert (tracked, idle) == (2, 1)
+    assert (scheduler.tracked_count, scheduler.idle_count) == (0, 0)
+    first.write_channel.assert_not_called()
+
+
+def test_get_instance_is_shared():
+    assert KeepaliveScheduler.get_instance() is KeepaliveScheduler.get_instance()
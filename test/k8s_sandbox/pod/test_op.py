@@ -4,7 +4,7 @@ import pytest
 from kubernetes.stream.ws_client import WSClient  # type: ignore[import-untyped]
 
 import k8s_sandbox._pod.op as op_module
-from k8s_sandbox._pod.op import PodOperation
+from k8s_sandbox._pod.op import AdaptiveFrameSize, PodOperation
 
 
 class _ConcretePodOp(PodOperation):
@@ -49,3 +49,30 @@ def test_write_stdin_chunked_default_chunk_size_splits_oversized_payload() -> No
     assert op_module._STDIN_CHUNK_SIZE == 1024**2
     assert ws.write_stdin.call_count == 2
     assert len(ws.write_stdin.call_args_list[0].args[0]) == op_module._STDIN_CHUNK_SIZE
+
+
+def test_write_stdin_chunked_sizes_frames_adaptively() -> None:
+    ws = MagicMock(spec=WSClient)
+    frames = AdaptiveFrameSize()
+    data = memoryview(bytes(range(256)) * 4096)
+
+    _make_op()._write_stdin_chunked(ws, data, frames)
+
+    written = [call.args[0] for call in ws.write_stdin.call_args_list]
+    assert all(type(frame) is bytes for frame in written)
+    assert b"".join(written) == data
+    assert len(written[0]) == op_module._MIN_FRAME_SIZE
+
+
+def test_adaptive_frame_size_follows_throughput() -> None:
+    frames = AdaptiveFrameSize()
+
+    for _ in range(10):
+        frames.observe(frames.size, 0.001)
+    fast = frames.size
+    for _ in range(20):
+        frames.observe(frames.size, 5.0)
+    slow = frames.size
+
+    assert fast == op_module._STDIN_CHUNK_SIZE
+    assert slow == op_module._MIN_FRAME_SIZE
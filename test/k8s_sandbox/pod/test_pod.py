@@ -1,59 +1,88 @@
-from unittest.mock import MagicMock
+from k8s_sandbox._pod.execute import _CompletedSentinelScanner
 
-from k8s_sandbox._pod.execute import ExecuteOperation
 
+def _scan(frames: list[bytes]) -> tuple[bytes, int | None, str | None]:
+    scanner = _CompletedSentinelScanner()
+    output = b""
+    for frame in frames:
+        output += b"".join(scanner.feed(frame))
+        if scanner.returncode is not None:
+            break
+    else:
+        output += b"".join(scanner.flush())
+    return output, scanner.returncode, scanner.identity
 
-def test_filter_sentinel_and_returncode():
-    executor = ExecuteOperation(MagicMock())
-    frame = b"before<completed-sentinel-value-42>after"
 
-    assert executor._filter_sentinel_and_returncode(frame) == (b"beforeafter", 42)
+def test_scanner_strips_sentinel():
+    assert _scan([b"before<completed-sentinel-value-42>after"]) == (
+        b"beforeafter",
+        42,
+        None,
+    )
 
 
-def test_filter_sentinel_and_returncode_new_lines():
-    executor = ExecuteOperation(MagicMock())
-    frame = b"a\nb<completed-sentinel-value-42>\nc\nd"
+def test_scanner_strips_sentinel_new_lines():
+    assert _scan([b"a\nb<completed-sentinel-value-42>\nc\nd"]) == (
+        b"a\nb\nc\nd",
+        42,
+        None,
+    )
 
-    assert executor._filter_sentinel_and_returncode(frame) == (b"a\nb\nc\nd", 42)
 
+def test_scanner_strips_sentinel_not_present():
+    assert _scan([b"stdout"]) == (b"stdout", None, None)
 
-def test_filter_sentinel_and_returncode_not_present():
-    executor = ExecuteOperation(MagicMock())
-    frame = b"stdout"
 
-    assert executor._filter_sentinel_and_returncode(frame) == (b"stdout", None)
+def test_scanner_strips_sentinel_empty():
+    assert _scan([b""]) == (b"", None, None)
 
 
-def test_filter_sentinel_and_returncode_empty():
-    executor = ExecuteOperation(MagicMock())
-    frame = b""
+def test_scanner_strips_sentinel_nothing_preceeding():
+    assert _scan([b"<completed-sentinel-value-42>after"]) == (b"after", 42, None)
 
-    assert executor._filter_sentinel_and_returncode(frame) == (b"", None)
 
+def test_scanner_strips_sentinel_nothing_following():
+    assert _scan([b"before<completed-sentinel-value-42>"]) == (b"before", 42, None)
 
-def test_filter_sentinel_and_returncode_nothing_preceeding():
-    executor = ExecuteOperation(MagicMock())
-    frame = b"<completed-sentinel-value-42>after"
 
-    assert executor._filter_sentinel_and_returncode(frame) == (b"after", 42)
+def test_scanner_strips_sentinel_0():
+    assert _scan([b"<completed-sentinel-value-0>"]) == (b"", 0, None)
 
 
-def test_filter_sentinel_and_returncode_nothing_following():
-    executor = ExecuteOperation(MagicMock())
-    frame = b"before<completed-sentinel-value-42>"
+def test_scanner_strips_sentinel_255():
+    assert _scan([b"<completed-sentinel-value-255>"]) == (b"", 255, None)
 
-    assert executor._filter_sentinel_and_returncode(frame) == (b"before", 42)
 
+def test_scanner_strips_sentinel_with_container_identity():
+    frame = b"before<completed-sentinel-value-42-1234.52c7a194-99b1-42f2>after"
 
-def test_filter_sentinel_and_returncode_0():
-    executor = ExecuteOperation(MagicMock())
-    frame = b"<completed-sentinel-value-0>"
+    assert _scan([frame]) == (b"beforeafter", 42, "1234.52c7a194-99b1-42f2")
 
-    assert executor._filter_sentinel_and_returncode(frame) == (b"", 0)
 
+def test_scanner_handles_sentinel_split_across_frames():
+    stdout = b"before<completed-sentinel-value-42-1234.52c7a194-99b1>"
 
-def test_filter_sentinel_and_returncode_255():
-    executor = ExecuteOperation(MagicMock())
-    frame = b"<completed-sentinel-value-255>"
+    for i in range(len(stdout) + 1):
+        for j in range(i, len(stdout) + 1):
+            frames = [stdout[:i], stdout[i:j], stdout[j:]]
+            assert _scan(frames) == (b"before", 42, "1234.52c7a194-99b1"), frames
 
-    assert executor._filter_sentinel_and_returncode(frame) == (b"", 255)
+
+def test_scanner_passes_through_output_resembling_sentinel():
+    frames = [b"a <completed-sentinel-val", b"ue-x> b <", b"completed-sent"]
+
+    assert _scan(frames) == (b"".join(frames), None, None)
+
+
+def test_scanner_finds_sentinel_after_output_resembling_it():
+    frames = [b"<completed-sentinel-value-1", b"2<completed-sentinel-value-0>"]
+
+    assert _scan(frames) == (b"<completed-sentinel-value-12", 0, None)
+
+
+def test_scanner_does_not_copy_frames_without_sentinel():
+    frame = b"x" * 1000
+
+    [view] = _CompletedSentinelScanner().feed(frame)
+
+    assert view.obj is frame
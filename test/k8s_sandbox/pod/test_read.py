@@ -0,0 +1,52 @@
+import io
+import tarfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Generator
+from unittest.mock import MagicMock
+
+import pytest
+from kubernetes.stream.ws_client import WSClient  # type: ignore[import-untyped]
+
+import k8s_sandbox._pod.read as read_module
+from k8s_sandbox._pod.read import ReadFilesOperation
+
+
+def _archive(files: dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def test_read_files_demultiplexes_archive_and_errors(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    op = ReadFilesOperation(MagicMock())
+    ws = MagicMock(spec=WSClient)
+    archive = _archive({"0": b"first", "2": b"third"})
+    stdout = [archive[:700], archive[700:]]
+    ws.is_open.side_effect = [True, True, False]
+    ws.peek_stdout.side_effect = lambda: bool(stdout)
+    ws.read_stdout.side_effect = lambda: stdout.pop(0)
+    ws.peek_stderr.side_effect = [True, False]
+    ws.read_stderr.return_value = b"\n<read-error-1>\nhead: /b: Permission denied\n"
+
+    @contextmanager
+    def fake_start_archive_command(
+        command: list[str],
+    ) -> Generator[MagicMock, None, None]:
+        assert command[4:] == ["/a", "/b", "c"]
+        yield ws
+
+    monkeypatch.setattr(op, "_start_archive_command", fake_start_archive_command)
+    monkeypatch.setattr(read_module, "get_returncode", lambda ws_client: 0)
+
+    files = op.read_files([Path("/a"), Path("/b"), Path("c")])
+
+    assert files[Path("/a")] == b"first"
+    assert isinstance(files[Path("/b")], PermissionError)
+    assert files[Path("c")] == b"third"
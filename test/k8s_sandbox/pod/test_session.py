@@ -0,0 +1,296 @@
+import os
+import queue
+import subprocess
+import threading
+import time
+from contextlib import contextmanager, suppress
+from typing import Generator, Iterator
+from unittest.mock import MagicMock, patch
+
+import pytest
+from inspect_ai.util import OutputLimitExceededError
+
+from k8s_sandbox._pod.execute import ExecuteOperation, _SessionStream
+from k8s_sandbox._pod.session import INSPECT_K8S_EXEC_SESSIONS, ShellSessionPool
+
+# Reuse the mock helpers from the existing restart tests.
+from test.k8s_sandbox.pod.test_check_for_pod_restart import _k8s_pod, _make_pod
+
+
+class _LocalShell:
+    """A stand-in for a WSClient connected to /bin/sh, backed by a local process."""
+
+    def __init__(self, command: list[str]) -> None:
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self._frames: queue.Queue[tuple[str, bytes]] = queue.Queue()
+        self._pending = {"stdout": b"", "stderr": b""}
+        self._open_streams = 2
+        for name in ("stdout", "stderr"):
+            threading.Thread(target=self._pump, args=(name,), daemon=True).start()
+
+    def _pump(self, name: str) -> None:
+        stream = getattr(self.process, name)
+        while data := os.read(stream.fileno(), 4096):
+            self._frames.put((name, data))
+        self._frames.put((name, b""))
+
+    def write_stdin(self, data: str | bytes) -> None:
+        assert self.process.stdin is not None
+        # Like a websocket, accept input even if the shell has exited.
+        with suppress(BrokenPipeError):
+            self.process.stdin.write(data.encode() if isinstance(data, str) else data)
+            self.process.stdin.flush()
+
+    def update(self, timeout: float | None = None) -> None:
+        try:
+            frames = [self._frames.get(timeout=timeout)] if timeout != 0 else []
+        except queue.Empty:
+            frames = []
+        while not self._frames.empty():
+            frames.append(self._frames.get())
+        for name, data in frames:
+            if data:
+                self._pending[name] += data
+            else:
+                self._open_streams -= 1
+
+    def is_open(self) -> bool:
+        return self._open_streams > 0 or any(self._pending.values())
+
+    def peek_stdout(self) -> bool:
+        return bool(self._pending["stdout"])
+
+    def peek_stderr(self) -> bool:
+        return bool(self._pending["stderr"])
+
+    def read_stdout(self) -> bytes:
+        data, self._pending["stdout"] = self._pending["stdout"], b""
+        return data
+
+    def read_stderr(self) -> bytes:
+        data, self._pending["stderr"] = self._pending["stderr"], b""
+        return data
+
+    def read_channel(self, channel: int) -> str:
+        returncode = self.process.wait()
+        if returncode == 0:
+            return '{"status": "Success"}'
+        return (
+            '{"status": "Failure", "message": "", "details": {"causes": '
+            f'[{{"reason": "ExitCode", "message": "{returncode}"}}]}}}}'
+        )
+
+    def close(self) -> None:
+        self.process.kill()
+        self.process.wait()
+
+
+class _LocalShells:
+    def __init__(self, command: list[str]) -> None:
+        self.command = command
+        self.opened: list[_LocalShell] = []
+
+    @contextmanager
+    def __call__(self, user: str | None) -> Generator[_LocalShell, None, None]:
+        shell = _LocalShell(self.command)
+        self.opened.append(shell)
+        try:
+            yield shell
+        finally:
+            shell.close()
+
+
+@pytest.fixture
+def shells() -> Iterator[_LocalShells]:
+    shells = _LocalShells(["sh"])
+    with patch.object(
+        ExecuteOperation,
+        "_interactive_shell",
+        lambda self, user: shells(user),
+    ):
+        yield shells
+
+
+def _exec(
+    sessions: ShellSessionPool,
+    cmd: list[str],
+    stdin: str | None = None,
+    cwd: str | None = None,
+    env: dict[str, str] | None = None,
+):
+    operation = ExecuteOperation(MagicMock(), sessions=sessions)
+    return operation.exec(cmd, stdin, cwd, env or {}, None, None)
+
+
+def test_commands_share_a_shell(shells: _LocalShells) -> None:
+    sessions = ShellSessionPool()
+
+    first = _exec(sessions, ["sh", "-c", "echo out; echo err >&2; exit 3"])
+    second = _exec(sessions, ["echo", "hello"])
+
+    assert (first.returncode, first.stdout, first.stderr) == (3, "out\n", "err\n")
+    assert (second.returncode, second.stdout, second.stderr) == (0, "hello\n", "")
+    assert len(shells.opened) == 1
+
+
+def test_cwd_env_and_exit_do_not_leak_between_commands(
+    shells: _LocalShells, tmp_path
+) -> None:
+    sessions = ShellSessionPool()
+
+    _exec(sessions, ["true"], cwd=str(tmp_path), env={"FOO": "bar"})
+    _exec(sessions, ["sh", "-c", "exit 1"])
+    result = _exec(sessions, ["sh", "-c", 'echo "$PWD ${FOO:-unset}"'])
+
+    assert result.stdout == f"{os.getcwd()} unset\n"
+    assert len(shells.opened) == 1
+
+
+def test_failed_cd_returns_unsuccessful_result(shells: _LocalShells) -> None:
+    sessions = ShellSessionPool()
+
+    result = _exec(sessions, ["true"], cwd="/does/not/exist")
+
+    assert result.returncode != 0
+    assert "/does/not/exist" in result.stderr
+    assert _exec(sessions, ["true"]).success
+
+
+def test_stdin(shells: _LocalShells) -> None:
+    sessions = ShellSessionPool()
+
+    piped = _exec(sessions, ["cat"], stdin="line 1\nline 2")
+    # Without input, the command must not consume the session's script.
+    unpiped = _exec(sessions, ["cat"])
+
+    assert piped.stdout == "line 1\nline 2"
+    assert unpiped.stdout == ""
+    assert _exec(sessions, ["echo", "after"]).stdout == "after\n"
+
+
+def test_late_output_of_background_process_is_discarded(
+    shells: _LocalShells,
+) -> None:
+    sessions = ShellSessionPool()
+
+    _exec(sessions, ["sh", "-c", "(sleep 0.1; echo late; echo late >&2) &"])
+    time.sleep(0.5)
+    result = _exec(sessions, ["echo", "next"])
+
+    assert (result.stdout, result.stderr) == ("next\n", "")
+
+
+def test_reconnects_if_shell_has_exited(shells: _LocalShells) -> None:
+    sessions = ShellSessionPool()
+    _exec(sessions, ["true"])
+
+    shells.opened[0].close()
+    result = _exec(sessions, ["echo", "hello"])
+
+    assert result.stdout == "hello\n"
+    assert len(shells.opened) == 2
+
+
+def test_session_closed_if_exec_raises(
+    shells: _LocalShells, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr("k8s_sandbox._pod.execute.limits.MAX_EXEC_OUTPUT_SIZE", 10)
+    sessions = ShellSessionPool()
+
+    with pytest.raises(OutputLimitExceededError):
+        _exec(sessions, ["sh", "-c", "yes | head -c 1000"])
+    result = _exec(sessions, ["echo", "ok"])
+
+    assert result.stdout == "ok\n"
+    assert len(shells.opened) == 2
+    assert shells.opened[0].process.returncode is not None
+
+
+def test_shell_which_fails_to_start_returns_its_error() -> None:
+    shells = _LocalShells(["sh", "-c", "echo 'runuser: oops' >&2; exit 1"])
+    with patch.object(
+        ExecuteOperation, "_interactive_shell", lambda self, user: shells(user)
+    ):
+        result = _exec(ShellSessionPool(), ["true"])
+
+    assert result.returncode == 1
+    assert result.stderr == "runuser: oops\n"
+
+
+@pytest.mark.parametrize("frame_size", [1, 2, 5, 7, 16, 64])
+def test_session_stream_finds_sentinels_split_across_frames(frame_size: int) -> None:
+    token = "0123abcd"
+    data = (
+        b"late <output>"
+        + f"<started-sentinel-value-{token}>".encode()
+        + b"out <put> <completed-sentinel-value-other-1>"
+        + f"<completed-sentinel-value-{token}-3-12345.0a1b-2c3d>".encode()
+        + b"ignored"
+    )
+    stream = _SessionStream(token)
+
+    for i in range(0, len(data), frame_size):
+        stream.feed(data[i : i + frame_size])
+
+    assert stream.started
+    assert stream.completed
+    assert str(stream.preamble) == "late <output>"
+    assert str(stream.output) == "out <put> <completed-sentinel-value-other-1>"
+    assert (stream.returncode, stream.identity) == (3, "12345.0a1b-2c3d")
+
+
+def test_session_stream_flushes_partial_sentinel_to_preamble() -> None:
+    stream = _SessionStream("0123abcd")
+
+    stream.feed(b"error <started-sent")
+    stream.flush()
+
+    assert not stream.started
+    assert str(stream.preamble) == "error <started-sent"
+
+
+def test_pool_keeps_one_idle_session_per_user() -> None:
+    pool = ShellSessionPool()
+
+    with pool.checkout("a") as first, pool.checkout("a") as second:
+        assert first is not second
+    with pool.checkout("a") as third, pool.checkout("b") as fourth:
+        pass
+
+    assert third in (first, second)
+    assert fourth not in (first, second)
+
+
+def test_closed_pool_does_not_keep_sessions() -> None:
+    pool = ShellSessionPool()
+    with pool.checkout(None) as session:
+        session.close = MagicMock()  # type: ignore[method-assign]
+        pool.close()
+
+    session.close.assert_called_once()
+    with pool.checkout(None) as other:
+        assert other is not session
+
+
+async def test_pod_executes_in_sessions_when_enabled(
+    shells: _LocalShells, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv(INSPECT_K8S_EXEC_SESSIONS, "true")
+    with patch("k8s_sandbox._pod.op.k8s_client") as mock_client:
+        mock_client.return_value.read_namespaced_pod.return_value = _k8s_pod(
+            uid="uid-OLD", container_name="default", restart_count=0
+        )
+        pod = _make_pod()
+
+        for i in range(3):
+            result = await pod.exec(["echo", str(i)], None, None, {}, None, None)
+            assert result.stdout == f"{i}\n"
+        pod.close_sessions()
+
+    assert len(shells.opened) == 1
+    assert shells.opened[0].process.returncode is not None
@@ -6,8 +6,8 @@ import pytest
 from k8s_sandbox._pod.snapshot import (
     ContainerStatus,
     PodSnapshot,
-    _parse_pod,
     list_pods,
+    parse_pod,
     read_pod,
 )
 
@@ -51,7 +51,7 @@ def test_parse_pod_extracts_key_fields():
     )
 
     # Act
-    snapshot = _parse_pod(body)
+    snapshot = parse_pod(body)
 
     # Assert
     assert snapshot == PodSnapshot(
@@ -67,17 +67,48 @@ def test_parse_pod_extracts_key_fields():
     )
 
 
+def test_parse_pod_extracts_readiness_fields():
+    body = _pod_body(
+        container_statuses=[
+            {
+                "name": "default",
+                "ready": False,
+                "state": {"waiting": {"reason": "ImagePullBackOff", "message": "m"}},
+            }
+        ]
+    )
+    body["metadata"]["deletionTimestamp"] = "2024-01-01T00:00:00Z"
+    body["status"]["phase"] = "Running"
+    body["status"]["conditions"] = [{"type": "Ready", "status": "True"}]
+    body["status"]["initContainerStatuses"] = [{"name": "init", "ready": True}]
+
+    snapshot = parse_pod(body)
+
+    assert snapshot.ready
+    assert snapshot.deleting
+    assert snapshot.phase == "Running"
+    assert snapshot.status_for("default") == ContainerStatus(
+        name="default",
+        restart_count=0,
+        last_terminated_reason=None,
+        ready=False,
+        waiting_reason="ImagePullBackOff",
+        waiting_message="m",
+    )
+    assert [cs.name for cs in snapshot.init_container_statuses] == ["init"]
+
+
 def test_parse_pod_distinguishes_missing_statuses_from_empty():
     # Kubelet hasn't published container statuses yet -> None, not ().
-    no_statuses = _parse_pod(_pod_body())
-    empty_statuses = _parse_pod(_pod_body(container_statuses=[]))
+    no_statuses = parse_pod(_pod_body())
+    empty_statuses = parse_pod(_pod_body(container_statuses=[]))
 
     assert no_statuses.container_statuses is None
     assert empty_statuses.container_statuses == ()
 
 
 def test_parse_pod_defaults_missing_optional_fields():
-    snapshot = _parse_pod(_pod_body())
+    snapshot = parse_pod(_pod_body())
 
     assert snapshot.labels == {}
     assert snapshot.container_names == ()
@@ -85,7 +116,7 @@ def test_parse_pod_defaults_missing_optional_fields():
 
 def test_parse_pod_raises_when_identity_missing():
     with pytest.raises(ValueError, match="metadata.name or metadata.uid"):
-        _parse_pod({"metadata": {"name": "no-uid"}})
+        parse_pod({"metadata": {"name": "no-uid"}})
 
 
 @pytest.mark.parametrize(
@@ -93,7 +124,7 @@ def test_parse_pod_raises_when_identity_missing():
     [("default", 3), ("sidecar", 0), ("absent", 0)],
 )
 def test_restart_count_for(container_name: str, expected: int):
-    snapshot = _parse_pod(
+    snapshot = parse_pod(
         _pod_body(
             container_statuses=[{"name": "default", "restartCount": 3}],
         )
@@ -103,7 +134,7 @@ def test_restart_count_for(container_name: str, expected: int):
 
 
 def test_restart_count_for_is_zero_when_statuses_unpublished():
-    snapshot = _parse_pod(_pod_body())
+    snapshot = parse_pod(_pod_body())
 
     assert snapshot.restart_count_for("default") == 0
 
@@ -123,6 +154,17 @@ def test_read_pod_requests_raw_json_and_parses():
     assert snapshot.uid == "uid-42"
 
 
+def test_read_pod_passes_request_timeout():
+    api = MagicMock()
+    api.read_namespaced_pod.return_value = _raw_response(_pod_body(uid="uid-42"))
+
+    read_pod(api, name="pod", namespace="ns", request_timeout=2.5)
+
+    api.read_namespaced_pod.assert_called_once_with(
+        name="pod", namespace="ns", _preload_content=False, _request_timeout=2.5
+    )
+
+
 def test_list_pods_parses_all_items():
     # Arrange
     api = MagicMock()
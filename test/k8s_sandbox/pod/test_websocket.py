@@ -0,0 +1,919 @@
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import signal
+import struct
+import threading
+from pathlib import Path
+from typing import Any, AsyncIterator, Iterator
+from unittest.mock import MagicMock, patch
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from inspect_ai.util import ExecResult, OutputLimitExceededError
+from inspect_ai.util import SandboxEnvironmentLimits as limits
+from kubernetes.client.exceptions import ApiException  # type: ignore
+
+from k8s_sandbox._pod import op as op_module
+from k8s_sandbox._pod import pod as pod_module
+from k8s_sandbox._pod import websocket as websocket_module
+from k8s_sandbox._pod.cancellation import INSPECT_K8S_KILL_ON_CANCEL
+from k8s_sandbox._pod.compression import INSPECT_K8S_COMPRESSION, _Gzip
+from k8s_sandbox._pod.error import ContainerRestartedError, PodError
+from k8s_sandbox._pod.execute import _READ_SCRIPT, ExecuteOperation
+from k8s_sandbox._pod.executor import PodOpExecutor
+from k8s_sandbox._pod.op import RANGE_ALIGNMENT, PodInfo
+from k8s_sandbox._pod.pod import Pod
+from k8s_sandbox._pod.read import (
+    INSPECT_K8S_READ_STREAMS,
+    ReadFileOperation,
+    ReadFilesOperation,
+)
+from k8s_sandbox._pod.websocket import (
+    _GUID,
+    INSPECT_K8S_ASYNC_STREAMS,
+    _apply_mask,
+    _frame,
+    async_streams_supported,
+)
+from k8s_sandbox._pod.write import (
+    INSPECT_K8S_WRITE_STREAMS,
+    VERIFY_WRITTEN_COMMAND,
+    WriteFileOperation,
+    WriteFilesOperation,
+    WriteRangeOperation,
+)
+from k8s_sandbox._pod.write_cache import INSPECT_K8S_WRITE_CACHE
+
+# Reuse the mock helpers from the existing restart tests.
+from test.k8s_sandbox.pod.test_check_for_pod_restart import _k8s_pod, _make_pod
+
+
+class _ExecServer:
+    """A local stand-in for the exec subresource, running commands as subprocesses.
+
+    Implements the server side of v5.channel.k8s.io (if `v5`) and v4.channel.k8s.io,
+    fragmenting larger messages and pinging the client to exercise those parts of the
+    client.
+    """
+
+    def __init__(self, status: int = 101, v5: bool = True) -> None:
+        self.status = status
+        self.v5 = v5
+        self.requests: list[dict[str, Any]] = []
+        self.pongs = 0
+        self._server: asyncio.Server | None = None
+        self._handlers: set[asyncio.Task[Any]] = set()
+
+    @property
+    def host(self) -> str:
+        assert self._server is not None
+        port = self._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+
+    async def stop(self) -> None:
+        assert self._server is not None
+        self._server.close()
+        await self._server.wait_closed()
+        # Let the commands of connections which the client closed exit.
+        if self._handlers:
+            await asyncio.wait(self._handlers, timeout=10)
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        task = asyncio.current_task()
+        assert task is not None
+        self._handlers.add(task)
+        request = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+        request_line, *header_lines = request.split("\r\n")
+        headers = {
+            name.strip().lower(): value.strip()
+            for name, _, value in (line.partition(":") for line in header_lines)
+            if name
+        }
+        url = urlparse(request_line.split(" ")[1])
+        query = parse_qs(url.query)
+        self.requests.append({"path": url.path, "query": query, "headers": headers})
+        if self.status != 101:
+            body = json.dumps({"message": "pods is forbidden"}).encode()
+            writer.write(
+                f"HTTP/1.1 {self.status} Forbidden\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+            writer.close()
+            return
+        accept = base64.b64encode(
+            hashlib.sha1(headers["sec-websocket-key"].encode() + _GUID).digest()
+        ).decode()
+        offered = [p.strip() for p in headers["sec-websocket-protocol"].split(",")]
+        protocol = "v4.channel.k8s.io"
+        if self.v5 and "v5.channel.k8s.io" in offered:
+            protocol = "v5.channel.k8s.io"
+        writer.write(
+            (
+                "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                f"Connection: Upgrade\r\nSec-WebSocket-Accept: {accept}\r\n"
+                f"Sec-WebSocket-Protocol: {protocol}\r\n\r\n"
+            ).encode()
+        )
+        for channel in (0, 1, 2, 3):
+            writer.write(self._frame(0x2, bytes([channel])))
+        writer.write(self._frame(0x9, b"ping"))
+        process = await asyncio.create_subprocess_exec(
+            *query["command"],
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        receiving = asyncio.create_task(self._receive(reader, writer, process))
+        await asyncio.gather(
+            self._pump(process.stdout, 1, writer), self._pump(process.stderr, 2, writer)
+        )
+        returncode = await process.wait()
+        status: dict[str, Any] = {"status": "Success"}
+        if returncode != 0:
+            status = {
+                "status": "Failure",
+                "message": "command terminated with non-zero exit code",
+                "details": {
+                    "causes": [{"reason": "ExitCode", "message": str(returncode)}]
+                },
+            }
+        try:
+            writer.write(self._frame(0x2, b"\x03" + json.dumps(status).encode()))
+            writer.write(self._frame(0x8, struct.pack("!H", 1000)))
+            await writer.drain()
+            await asyncio.wait_for(receiving, 5)
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        if process.stdin is not None:
+            process.stdin.close()
+        writer.close()
+
+    async def _receive(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        process: asyncio.subprocess.Process,
+    ) -> None:
+        while True:
+            try:
+                head = await reader.readexactly(2)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+            assert head[1] & 0x80, "Client frames must be masked."
+            length = head[1] & 0x7F
+            if length == 126:
+                (length,) = struct.unpack("!H", await reader.readexactly(2))
+            elif length == 127:
+                (length,) = struct.unpack("!Q", await reader.readexactly(8))
+            mask = await reader.readexactly(4)
+            payload = _apply_mask(await reader.readexactly(length), mask)
+            opcode = head[0] & 0x0F
+            if opcode == 0xA:
+                self.pongs += 1
+            elif opcode == 0x8:
+                break
+            elif payload == b"\xff\x00" and process.stdin is not None:
+                process.stdin.close()
+            elif payload[0] == 0 and process.stdin is not None:
+                process.stdin.write(payload[1:])
+                await process.stdin.drain()
+        # The client closed the connection (e.g. on seeing the sentinel). Close stdin
+        # too, in case the process has children which outlive it.
+        if process.stdin is not None:
+            process.stdin.close()
+        if process.returncode is None:
+            process.kill()
+
+    async def _pump(
+        self, stream: asyncio.StreamReader | None, channel: int, writer: Any
+    ) -> None:
+        assert stream is not None
+        while data := await stream.read(65536):
+            message = bytes([channel]) + data
+            try:
+                if len(message) > 1000:
+                    # Send larger messages in two fragments.
+                    writer.write(self._frame(0x2, message[:500], fin=False))
+                    writer.write(self._frame(0x0, message[500:]))
+                else:
+                    writer.write(self._frame(0x2, message))
+                await writer.drain()
+            except ConnectionError:
+                return
+
+    def _frame(self, opcode: int, payload: bytes, fin: bool = True) -> bytes:
+        first = (0x80 if fin else 0) | opcode
+        if len(payload) < 126:
+            header = struct.pack("!BB", first, len(payload))
+        elif len(payload) < 1 << 16:
+            header = struct.pack("!BBH", first, 126, len(payload))
+        else:
+            header = struct.pack("!BBQ", first, 127, len(payload))
+        return header + payload
+
+
+@pytest.fixture(autouse=True)
+def forget_negotiated_protocols(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(op_module, "_closable_stdin_by_context", {})
+
+
+@pytest.fixture
+async def server() -> AsyncIterator[_ExecServer]:
+    server = _ExecServer()
+    await server.start()
+    configuration = MagicMock(proxy=None, host=server.host)
+    configuration.auth_settings.return_value = {
+        "BearerToken": {"value": "Bearer my-token"}
+    }
+    with patch("k8s_sandbox._pod.websocket.k8s_client") as mock_client:
+        mock_client.return_value.api_client.configuration = configuration
+        yield server
+    await server.stop()
+
+
+def _pod_info() -> PodInfo:
+    return PodInfo(
+        name="agent-env-abc-default-0",
+        namespace="ns",
+        context_name=None,
+        default_container_name="default",
+        uid="uid-1",
+        initial_restart_count=0,
+        restarted_container_behavior="raise",
+    )
+
+
+async def _aexec(
+    cmd: list[str], stdin: str | None = None, cwd: str | None = None
+) -> ExecResult[str]:
+    return await ExecuteOperation(_pod_info()).aexec(cmd, stdin, cwd, {}, None, None)
+
+
+async def test_exec(server: _ExecServer) -> None:
+    result = await _aexec(["sh", "-c", "echo out; echo err >&2; exit 3"])
+
+    assert (result.returncode, result.stdout, result.stderr) == (3, "out\n", "err\n")
+    request = server.requests[0]
+    assert request["path"] == "/api/v1/namespaces/ns/pods/agent-env-abc-default-0/exec"
+    assert request["query"]["command"] == ["/bin/sh"]
+    assert request["query"]["container"] == ["default"]
+    assert request["headers"]["authorization"] == "Bearer my-token"
+    assert server.pongs == 1
+
+
+async def test_credentials_are_resolved_off_the_event_loop(
+    server: _ExecServer,
+) -> None:
+    threads: list[threading.Thread] = []
+    configuration = MagicMock(proxy=None, host=server.host)
+
+    def auth_settings() -> dict[str, Any]:
+        threads.append(threading.current_thread())
+        return {"BearerToken": {"value": "Bearer my-token"}}
+
+    configuration.auth_settings.side_effect = auth_settings
+    with patch("k8s_sandbox._pod.websocket.k8s_client") as mock_client:
+        mock_client.return_value.api_client.configuration = configuration
+        await _aexec(["true"])
+
+    assert threads and threading.current_thread() not in threads
+
+
+@pytest.mark.parametrize("proxy", [None, "http://proxy:3128"])
+def test_async_streams_supported_is_checked_once_per_context(
+    monkeypatch: pytest.MonkeyPatch, proxy: str | None
+) -> None:
+    monkeypatch.setattr(websocket_module, "_proxied", {})
+    with patch("k8s_sandbox._pod.websocket.k8s_client") as mock_client:
+        mock_client.return_value.api_client.configuration = MagicMock(proxy=proxy)
+
+        for _ in range(3):
+            assert async_streams_supported("ctx-a") == (proxy is None)
+        assert async_streams_supported("ctx-b") == (proxy is None)
+
+    assert [c.args for c in mock_client.call_args_list] == [("ctx-a",), ("ctx-b",)]
+
+
+async def test_exec_with_stdin(server: _ExecServer) -> None:
+    result = await _aexec(["cat"], stdin="hello\nworld")
+
+    assert result.stdout == "hello\nworld"
+
+
+async def test_exec_large_output_is_reassembled(server: _ExecServer) -> None:
+    result = await _aexec(["sh", "-c", "head -c 300000 /dev/zero | tr '\\0' x"])
+
+    assert result.stdout == "x" * 300000
+
+
+async def test_exec_returncode_from_status_channel(server: _ExecServer) -> None:
+    # The shell exits before writing the sentinel.
+    result = await _aexec(["true"], cwd="/does/not/exist")
+
+    assert not result.success
+    assert result.returncode == 2
+    assert "/does/not/exist" in result.stderr
+
+
+async def test_read_and_write_file(server: _ExecServer, tmp_path: Path) -> None:
+    data = bytes(range(256)) * 6000
+    dst = tmp_path / "dir" / "file.bin"
+
+    await WriteFileOperation(_pod_info()).awrite_file(data, dst)
+    read = io.BytesIO()
+    await ReadFileOperation(_pod_info()).aread_file(dst, read)
+
+    assert dst.read_bytes() == data
+    assert read.getvalue() == data
+
+
+async def test_read_missing_file_raises(server: _ExecServer, tmp_path: Path) -> None:
+    with pytest.raises(FileNotFoundError):
+        await ReadFileOperation(_pod_info()).aread_file(
+            tmp_path / "missing", io.BytesIO()
+        )
+
+
+async def test_handshake_failure_raises_api_exception(server: _ExecServer) -> None:
+    server.status = 403
+
+    with pytest.raises(ApiException) as excinfo:
+        await _aexec(["true"])
+
+    assert excinfo.value.status == 403
+    assert "pods is forbidden" in str(excinfo.value)
+
+
+async def test_exec_streams_raw_stdin_once_v5_is_negotiated(
+    server: _ExecServer,
+) -> None:
+    data = bytes(range(256)) * 4000
+    stdin = data.decode("latin-1")
+
+    first = await _aexec(["sh", "-c", "wc -c"], stdin="abc")
+    second = await _aexec(["sh", "-c", "od -An -v -tx1 | tr -d ' \n'"], stdin=stdin)
+
+    assert first.stdout.strip() == "3"
+    assert second.stdout == stdin.encode("utf-8").hex()
+    # The protocol isn't known before the first exec, so its input is embedded.
+    assert server.requests[0]["query"]["command"] == ["/bin/sh"]
+    assert server.requests[1]["query"]["command"][:3] == ["/bin/sh", "-c", _READ_SCRIPT]
+
+
+async def test_exec_embeds_stdin_if_v5_is_not_negotiated(
+    server: _ExecServer,
+) -> None:
+    await _aexec(["true"])
+    server.v5 = False
+
+    result = await _aexec(["cat"], stdin="hello")
+
+    assert result.stdout == "hello"
+    assert server.requests[1]["query"]["command"][:3] == ["/bin/sh", "-c", _READ_SCRIPT]
+
+
+async def test_write_file_closes_stdin_once_v5_is_negotiated(
+    server: _ExecServer, tmp_path: Path
+) -> None:
+    await WriteFileOperation(_pod_info()).awrite_file(b"first", tmp_path / "a")
+    await WriteFileOperation(_pod_info()).awrite_file(b"second", tmp_path / "b")
+
+    assert (tmp_path / "a").read_bytes() == b"first"
+    assert (tmp_path / "b").read_bytes() == b"second"
+    assert "head -c 5" in server.requests[0]["query"]["command"][2]
+    assert "&& cat >" in server.requests[1]["query"]["command"][2]
+
+
+async def test_write_file_falls_back_if_v5_is_not_negotiated(
+    server: _ExecServer, tmp_path: Path
+) -> None:
+    await _aexec(["true"])
+    server.v5 = False
+
+    await WriteFileOperation(_pod_info()).awrite_file(b"data", tmp_path / "f")
+
+    assert (tmp_path / "f").read_bytes() == b"data"
+    assert "head -c 4" in server.requests[-1]["query"]["command"][2]
+
+
+async def test_read_and_write_compressed_file(
+    server: _ExecServer, tmp_path: Path
+) -> None:
+    data = b"step=1 loss=0.25 msg=training progress ok\n" * 10000
+    dst = tmp_path / "dir" / "file.log"
+
+    await WriteFileOperation(_pod_info(), _Gzip()).awrite_file(data, dst)
+    read = io.BytesIO()
+    await ReadFileOperation(_pod_info(), _Gzip()).aread_file(dst, read)
+
+    assert dst.read_bytes() == data
+    assert read.getvalue() == data
+    assert "gzip -d -c" in server.requests[0]["query"]["command"][2]
+    assert "gzip -c -1" in server.requests[1]["query"]["command"][2]
+
+
+async def test_write_files(server: _ExecServer, tmp_path: Path) -> None:
+    files = {
+        tmp_path / "a": b"first",
+        tmp_path / "new dir" / "b": bytes(range(256)) * 1000,
+        tmp_path / "empty": b"",
+    }
+    (tmp_path / "a").write_bytes(b"overwritten")
+
+    errors = await WriteFilesOperation(_pod_info()).awrite_files(files)
+
+    assert errors == {}
+    for path, data in files.items():
+        assert path.read_bytes() == data
+    assert len(server.requests) == 1
+
+
+async def test_write_files_reports_errors_per_file(
+    server: _ExecServer, tmp_path: Path
+) -> None:
+    (tmp_path / "dir").mkdir()
+    (tmp_path / "file").write_bytes(b"")
+    files = {
+        tmp_path / "dir": b"x",
+        tmp_path / "ok": b"ok",
+        tmp_path / "file" / "child": b"y",
+    }
+
+    errors = await WriteFilesOperation(_pod_info()).awrite_files(files)
+
+    assert list(errors) == [tmp_path / "dir", tmp_path / "file" / "child"]
+    assert isinstance(errors[tmp_path / "dir"], IsADirectoryError)
+    assert isinstance(errors[tmp_path / "file" / "child"], PodError)
+    assert (tmp_path / "ok").read_bytes() == b"ok"
+
+
+async def test_write_files_without_closing_stdin(
+    server: _ExecServer, tmp_path: Path
+) -> None:
+    server.v5 = False
+
+    errors = await WriteFilesOperation(_pod_info()).awrite_files(
+        {tmp_path / "f": b"data" * 10000}
+    )
+
+    assert errors == {}
+    assert (tmp_path / "f").read_bytes() == b"data" * 10000
+
+
+async def test_read_files(server: _ExecServer, tmp_path: Path) -> None:
+    (tmp_path / "a").write_bytes(b"first")
+    (tmp_path / "b").write_bytes(bytes(range(256)) * 1000)
+    (tmp_path / "dir").mkdir()
+    srcs = [tmp_path / "a", tmp_path / "missing", tmp_path / "b", tmp_path / "dir"]
+
+    files = await ReadFilesOperation(_pod_info()).aread_files(srcs + [srcs[0]])
+
+    assert list(files) == srcs
+    assert files[tmp_path / "a"] == b"first"
+    assert files[tmp_path / "b"] == bytes(range(256)) * 1000
+    assert isinstance(files[tmp_path / "missing"], FileNotFoundError)
+    assert isinstance(files[tmp_path / "dir"], IsADirectoryError)
+    assert len(server.requests) == 1
+
+
+async def test_read_files_none_readable(server: _ExecServer, tmp_path: Path) -> None:
+    files = await ReadFilesOperation(_pod_info()).aread_files([tmp_path / "missing"])
+
+    assert isinstance(files[tmp_path / "missing"], FileNotFoundError)
+
+
+async def test_read_dir(server: _ExecServer, tmp_path: Path) -> None:
+    (tmp_path / "sub" / "empty").mkdir(parents=True)
+    (tmp_path / "a").write_bytes(b"first")
+    (tmp_path / "sub" / "b").write_bytes(b"second")
+    (tmp_path / "link").symlink_to(tmp_path / "a")
+
+    files = await ReadFilesOperation(_pod_info()).aread_dir(tmp_path)
+
+    assert files == {"a": b"first", "sub/b": b"second"}
+
+
+async def test_read_missing_dir_raises(server: _ExecServer, tmp_path: Path) -> None:
+    with pytest.raises(FileNotFoundError):
+        await ReadFilesOperation(_pod_info()).aread_dir(tmp_path / "missing")
+
+
+def _running(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Orphans aren't necessarily reaped here, so zombies count as exited.
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+@pytest.mark.parametrize("kill", [True, False])
+async def test_cancelled_exec_kills_command_if_enabled(
+    server: _ExecServer,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    kill: bool,
+) -> None:
+    monkeypatch.setenv(INSPECT_K8S_KILL_ON_CANCEL, str(kill))
+    pid_file = tmp_path / "pid"
+    # The server only stops the shell, not the command's background processes.
+    command = f"sleep 30 & echo $! > {pid_file}; wait"
+    task = asyncio.create_task(_aexec(["sh", "-c", command]))
+    for _ in range(100):
+        if pid_file.exists() and pid_file.read_text().strip():
+            break
+        await asyncio.sleep(0.05)
+    pid = int(pid_file.read_text())
+
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    try:
+        assert _running(pid) != kill
+    finally:
+        if _running(pid):
+            os.kill(pid, signal.SIGKILL)
+
+
+async def test_read_files_enforces_limit(
+    server: _ExecServer, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(limits, "MAX_READ_FILE_SIZE", 10000)
+    (tmp_path / "a").write_bytes(b"a" * 20000)
+
+    with pytest.raises(OutputLimitExceededError):
+        await ReadFilesOperation(_pod_info()).aread_files([tmp_path / "a"])
+
+
+@pytest.mark.parametrize("length", [0, 125, 126, 65535, 65536])
+def test_frame_lengths(length: int) -> None:
+    payload = bytes(range(256)) * (length // 256 + 1)
+    payload = payload[:length]
+
+    frame = _frame(0x2, payload)
+
+    header = {125: 2, 126: 4, 65535: 4, 65536: 10}.get(length, 2)
+    assert frame[0] == 0x82
+    mask = frame[header : header + 4]
+    assert _apply_mask(frame[header + 4 :], mask) == payload
+
+
+async def test_pod_streams_on_event_loop_when_enabled(
+    server: _ExecServer, monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    monkeypatch.setenv(INSPECT_K8S_ASYNC_STREAMS, "true")
+    with (
+        patch("k8s_sandbox._pod.op.k8s_client") as mock_client,
+        patch("k8s_sandbox._pod.pod.async_streams_supported", return_value=True),
+        patch.object(
+            PodOpExecutor,
+            "queue_operation",
+            autospec=True,
+            side_effect=PodOpExecutor.queue_operation,
+        ) as queue_operation,
+    ):
+        mock_client.return_value.read_namespaced_pod.return_value = _k8s_pod(
+            uid="uid-OLD", container_name="default", restart_count=0
+        )
+        pod = _make_pod()
+
+        result = await pod.exec(["echo", "hi"], None, None, {}, None, None)
+        await pod.write_file(b"data", tmp_path / "f")
+
+    assert result.stdout == "hi\n"
+    assert (tmp_path / "f").read_bytes() == b"data"
+    # Only the restart checks ran in threads.
+    assert queue_operation.call_count == 2
+
+
+async def test_pod_probes_for_compression_once(
+    server: _ExecServer, monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    monkeypatch.setenv(INSPECT_K8S_ASYNC_STREAMS, "true")
+    monkeypatch.setenv(INSPECT_K8S_COMPRESSION, "true")
+    data = b"step=1 loss=0.25 msg=training progress ok\n" * 10000
+    with (
+        patch("k8s_sandbox._pod.op.k8s_client") as mock_client,
+        patch("k8s_sandbox._pod.pod.async_streams_supported", return_value=True),
+    ):
+        mock_client.return_value.read_namespaced_pod.return_value = _k8s_pod(
+            uid="uid-OLD", container_name="default", restart_count=0
+        )
+        pod = _make_pod()
+
+        await pod.write_file(data, tmp_path / "a")
+        await pod.write_file(data, tmp_path / "b")
+
+    commands = [request["query"]["command"] for request in server.requests]
+    assert (tmp_path / "a").read_bytes() == data
+    assert (tmp_path / "b").read_bytes() == data
+    # zstd or gzip, depending on whether zstandard is installed.
+    assert sum(" -d -c" in command[-1] for command in commands) == 2
+    assert len(commands) == 3
+
+
+@pytest.fixture
+def cached_pod(server: _ExecServer, monkeypatch: pytest.MonkeyPatch) -> Iterator[Pod]:
+    monkeypatch.setenv(INSPECT_K8S_ASYNC_STREAMS, "true")
+    monkeypatch.setenv(INSPECT_K8S_WRITE_CACHE, "true")
+    with (
+        patch("k8s_sandbox._pod.op.k8s_client") as mock_client,
+        patch("k8s_sandbox._pod.pod.async_streams_supported", return_value=True),
+    ):
+        mock_client.return_value.read_namespaced_pod.return_value = _k8s_pod(
+            uid="uid-OLD", container_name="default", restart_count=0
+        )
+        yield _make_pod()
+
+
+async def test_pod_skips_rewriting_unchanged_file(
+    server: _ExecServer, cached_pod: Pod, tmp_path: Path
+) -> None:
+    data = b"#!/bin/sh\n" * 10000
+
+    await cached_pod.write_file(data, tmp_path / "tool")
+    await cached_pod.write_file(data, tmp_path / "tool")
+    # Smaller files are always written.
+    await cached_pod.write_file(b"small", tmp_path / "small")
+    await cached_pod.write_file(b"small", tmp_path / "small")
+
+    commands = [request["query"]["command"] for request in server.requests]
+    assert sum("mkdir -p" in command[-1] for command in commands) == 3
+    assert (cached_pod.write_cache.hits, cached_pod.write_cache.misses) == (1, 1)
+
+
+async def test_pod_rewrite_costs_no_exec_if_no_command_has_run(
+    server: _ExecServer, cached_pod: Pod, tmp_path: Path
+) -> None:
+    data = b"#!/bin/sh\n" * 10000
+    await cached_pod.write_file(data, tmp_path / "tool")
+    requests = len(server.requests)
+
+    await cached_pod.write_file(data, tmp_path / "tool")
+
+    assert len(server.requests) == requests
+    assert cached_pod.write_cache.hits == 1
+
+
+async def test_pod_verifies_rewrite_once_a_command_has_run(
+    server: _ExecServer, cached_pod: Pod, tmp_path: Path
+) -> None:
+    data = b"#!/bin/sh\n" * 10000
+    await cached_pod.write_file(data, tmp_path / "tool")
+    await cached_pod.exec(["true"], None, None, {}, None, None)
+    requests = len(server.requests)
+
+    await cached_pod.write_file(data, tmp_path / "tool")
+    await cached_pod.write_file(data, tmp_path / "tool")
+
+    # The command may have left processes behind, so every rewrite is verified, each
+    # with a single exec.
+    assert len(server.requests) == requests + 2
+    assert (cached_pod.write_cache.hits, cached_pod.write_cache.misses) == (2, 1)
+
+
+async def test_pod_rewrites_file_changed_by_command_running_during_write(
+    cached_pod: Pod, tmp_path: Path
+) -> None:
+    data = b"#!/bin/sh\n" * 10000
+    tool = (tmp_path / "tool").as_posix()
+    command = asyncio.ensure_future(
+        cached_pod.exec(
+            ["sh", "-c", 'sleep 0.5; echo modified > "$1"', "sh", tool],
+            None,
+            None,
+            {},
+            None,
+            None,
+        )
+    )
+    await asyncio.sleep(0.1)
+    await cached_pod.write_file(data, tmp_path / "tool")
+    await command
+
+    await cached_pod.write_file(data, tmp_path / "tool")
+
+    assert (tmp_path / "tool").read_bytes() == data
+    assert (cached_pod.write_cache.hits, cached_pod.write_cache.misses) == (0, 2)
+
+
+async def test_pod_rewrites_file_changed_in_container(
+    cached_pod: Pod, tmp_path: Path
+) -> None:
+    data = b"#!/bin/sh\n" * 10000
+    await cached_pod.write_file(data, tmp_path / "tool")
+    await cached_pod.exec(
+        ["sh", "-c", 'echo modified > "$1"', "sh", (tmp_path / "tool").as_posix()],
+        None,
+        None,
+        {},
+        None,
+        None,
+    )
+
+    await cached_pod.write_file(data, tmp_path / "tool")
+
+    assert (tmp_path / "tool").read_bytes() == data
+    assert (cached_pod.write_cache.hits, cached_pod.write_cache.misses) == (0, 2)
+
+
+async def test_pod_forgets_written_files_on_restart(
+    cached_pod: Pod, tmp_path: Path
+) -> None:
+    await cached_pod.write_file(b"#!/bin/sh\n" * 10000, tmp_path / "tool")
+    assert len(cached_pod.write_cache) == 1
+
+    with pytest.raises(ContainerRestartedError):
+        cached_pod._handle_restart(
+            ContainerRestartedError(
+                pod_name="pod",
+                container_name="default",
+                restart_count=1,
+                last_reason="OOMKilled",
+            )
+        )
+
+    assert len(cached_pod.write_cache) == 0
+
+
+async def test_write_range_writes_in_place(server: _ExecServer, tmp_path: Path) -> None:
+    dst = tmp_path / "file"
+    dst.write_bytes(b"a" * (3 * RANGE_ALIGNMENT))
+
+    await WriteRangeOperation(_pod_info(), RANGE_ALIGNMENT).awrite_file(
+        b"b" * 1000, dst
+    )
+
+    assert dst.read_bytes() == (
+        b"a" * RANGE_ALIGNMENT + b"b" * 1000 + b"a" * (2 * RANGE_ALIGNMENT - 1000)
+    )
+
+
+@pytest.fixture
+def parallel_pod(server: _ExecServer, monkeypatch: pytest.MonkeyPatch) -> Iterator[Pod]:
+    monkeypatch.setenv(INSPECT_K8S_ASYNC_STREAMS, "true")
+    monkeypatch.setenv(INSPECT_K8S_WRITE_STREAMS, "4")
+    monkeypatch.setattr(pod_module, "PARALLEL_WRITE_THRESHOLD_BYTES", 0)
+    with (
+        patch("k8s_sandbox._pod.op.k8s_client") as mock_client,
+        patch("k8s_sandbox._pod.pod.async_streams_supported", return_value=True),
+    ):
+        mock_client.return_value.read_namespaced_pod.return_value = _k8s_pod(
+            uid="uid-OLD", container_name="default", restart_count=0
+        )
+        yield _make_pod()
+
+
+async def test_pod_writes_large_file_in_ranges(
+    server: _ExecServer, parallel_pod: Pod, tmp_path: Path
+) -> None:
+    data = bytes(range(256)) * (14 * RANGE_ALIGNMENT // 1024)  # 3.5 MiB
+    dst = tmp_path / "dir" / "file"
+    dst.parent.mkdir()
+    dst.write_bytes(b"x" * (5 * RANGE_ALIGNMENT))
+
+    await parallel_pod.write_file(data, dst)
+
+    assert dst.read_bytes() == data
+    commands = [request["query"]["command"][-1] for request in server.requests]
+    assert sum("conv=notrunc" in command for command in commands) == 4
+
+
+async def test_pod_raises_if_ranges_do_not_match(
+    parallel_pod: Pod, monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    monkeypatch.setattr(pod_module, "_sha256", lambda data: "0" * 64)
+
+    with pytest.raises(PodError, match="does not match"):
+        await parallel_pod.write_file(b"data" * 1000, tmp_path / "file")
+
+
+@pytest.mark.parametrize(
+    ("missing", "size_only"),
+    [(["sha256sum"], True), (["wc"], False), (["wc", "stat"], False)],
+)
+async def test_pod_verifies_ranges_without_missing_tools(
+    parallel_pod: Pod,
+    monkeypatch: pytest.MonkeyPatch,
+    caplog: pytest.LogCaptureFixture,
+    tmp_path: Path,
+    missing: list[str],
+    size_only: bool,
+) -> None:
+    # Stand in for an image without the tools.
+    command = list(VERIFY_WRITTEN_COMMAND)
+    for tool in missing:
+        command = [part.replace(tool, f"no-such-{tool}") for part in command]
+    monkeypatch.setattr(pod_module, "VERIFY_WRITTEN_COMMAND", command)
+    caplog.set_level(logging.DEBUG, logger=pod_module.__name__)
+
+    await parallel_pod.write_file(b"data" * 1000, tmp_path / "file")
+
+    assert (tmp_path / "file").read_bytes() == b"data" * 1000
+    assert ("verified only the size" in caplog.text) == size_only
+
+
+async def test_pod_does_not_recheck_for_restart_to_verify_ranges(
+    parallel_pod: Pod, tmp_path: Path
+) -> None:
+    with patch.object(
+        parallel_pod, "check_for_pod_restart", wraps=parallel_pod.check_for_pod_restart
+    ) as check:
+        await parallel_pod.write_file(b"data" * 1000, tmp_path / "file")
+
+    assert check.call_count == 1
+
+
+@pytest.fixture
+def ranged_read_pod(
+    server: _ExecServer, monkeypatch: pytest.MonkeyPatch
+) -> Iterator[Pod]:
+    monkeypatch.setenv(INSPECT_K8S_ASYNC_STREAMS, "true")
+    monkeypatch.setenv(INSPECT_K8S_READ_STREAMS, "4")
+    monkeypatch.setattr(pod_module, "PARALLEL_READ_THRESHOLD_BYTES", RANGE_ALIGNMENT)
+    with (
+        patch("k8s_sandbox._pod.op.k8s_client") as mock_client,
+        patch("k8s_sandbox._pod.pod.async_streams_supported", return_value=True),
+    ):
+        mock_client.return_value.read_namespaced_pod.return_value = _k8s_pod(
+            uid="uid-OLD", container_name="default", restart_count=0
+        )
+        yield _make_pod()
+
+
+async def test_pod_reads_large_file_in_ranges(
+    server: _ExecServer, ranged_read_pod: Pod, tmp_path: Path
+) -> None:
+    data = bytes(range(256)) * (14 * RANGE_ALIGNMENT // 1024)  # 3.5 MiB
+    (tmp_path / "file").write_bytes(data)
+
+    with (tmp_path / "dst").open("w+b") as dst:
+        dst.write(b"prefix")
+        await ranged_read_pod.read_file(tmp_path / "file", dst)
+        position = dst.tell()
+        dst.seek(0)
+        read = dst.read()
+
+    assert read == b"prefix" + data
+    assert position == len(read)
+    commands = [request["query"]["command"] for request in server.requests]
+    assert sum(command[0] == "dd" for command in commands) == 4
+
+
+async def test_pod_does_not_recheck_for_restart_to_size_ranged_read(
+    ranged_read_pod: Pod, tmp_path: Path
+) -> None:
+    (tmp_path / "file").write_bytes(b"x" * 4 * RANGE_ALIGNMENT)
+
+    with (
+        patch.object(
+            ranged_read_pod,
+            "check_for_pod_restart",
+            wraps=ranged_read_pod.check_for_pod_restart,
+        ) as check,
+        (tmp_path / "dst").open("w+b") as dst,
+    ):
+        await ranged_read_pod.read_file(tmp_path / "file", dst)
+
+    assert check.call_count == 1
+
+
+async def test_pod_reads_small_file_and_file_object_in_one_stream(
+    server: _ExecServer, ranged_read_pod: Pod, tmp_path: Path
+) -> None:
+    data = bytes(range(256)) * (8 * RANGE_ALIGNMENT // 1024)
+    (tmp_path / "small").write_bytes(b"small")
+    (tmp_path / "large").write_bytes(data)
+
+    with (tmp_path / "dst").open("w+b") as dst:
+        await ranged_read_pod.read_file(tmp_path / "small", dst)
+    buffer = io.BytesIO()
+    await ranged_read_pod.read_file(tmp_path / "large", buffer)
+
+    assert buffer.getvalue() == data
+    commands = [request["query"]["command"] for request in server.requests]
+    assert not any(command[0] == "dd" for command in commands)
+
+
+async def test_pod_ranged_read_enforces_limit(
+    ranged_read_pod: Pod, monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    monkeypatch.setattr(limits, "MAX_READ_FILE_SIZE", RANGE_ALIGNMENT)
+    (tmp_path / "file").write_bytes(b"a" * (2 * RANGE_ALIGNMENT))
+
+    with pytest.raises(OutputLimitExceededError):
+        with (tmp_path / "dst").open("w+b") as dst:
+            await ranged_read_pod.read_file(tmp_path / "file", dst)
@@ -1,3 +1,5 @@
+import io
+import tarfile
 from contextlib import contextmanager
 from pathlib import Path
 from typing import Generator
@@ -7,7 +9,8 @@ import pytest
 from kubernetes.stream.ws_client import WSClient  # type: ignore[import-untyped]
 
 import k8s_sandbox._pod.op as op_module
-from k8s_sandbox._pod.write import WriteFileOperation
+import k8s_sandbox._pod.write as write_module
+from k8s_sandbox._pod.write import WriteFileOperation, WriteFilesOperation
 
 
 def test_write_file_writes_data_via_chunked_helper(
@@ -20,7 +23,7 @@ def test_write_file_writes_data_via_chunked_helper(
 
     @contextmanager
     def fake_start_write_command(
-        dst: Path, file_size: int
+        dst: Path, file_size: int, codec: None
     ) -> Generator[MagicMock, None, None]:
         captured["file_size"] = file_size
         yield ws
@@ -34,3 +37,29 @@ def test_write_file_writes_data_via_chunked_helper(
     assert captured["file_size"] == len(data)
     assert b"".join(call.args[0] for call in ws.write_stdin.call_args_list) == data
     assert ws.write_stdin.call_count > 1
+
+
+def test_write_files_maps_errors_to_files(monkeypatch: pytest.MonkeyPatch) -> None:
+    op = WriteFilesOperation(MagicMock())
+    ws = MagicMock(spec=WSClient)
+    ws.read_stdout.return_value = (
+        "\n<write-error-1>\nsh: 1: cannot create /b: Permission denied\n"
+    )
+    ws.read_stderr.return_value = ""
+
+    @contextmanager
+    def fake_start_write_files_command() -> Generator[MagicMock, None, None]:
+        yield ws
+
+    monkeypatch.setattr(
+        op, "_start_write_files_command", fake_start_write_files_command
+    )
+    monkeypatch.setattr(write_module, "get_returncode", lambda ws_client: 0)
+
+    errors = op.write_files({Path("/a"): b"a", Path("/b"): b"b"})
+
+    assert list(errors) == [Path("/b")]
+    assert isinstance(errors[Path("/b")], PermissionError)
+    ws.run_forever.assert_called_once()
+    with tarfile.open(fileobj=io.BytesIO(ws.write_stdin.call_args.args[0])) as tar:
+        assert tar.getnames() == ["script", "0", "1"]
@@ -0,0 +1,226 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from kubernetes.client.exceptions import ApiException  # type: ignore
+
+from k8s_sandbox._adaptive import (
+    DECREASE_FACTOR,
+    AdaptiveLimiter,
+    adaptive_concurrency,
+    is_overload_error,
+    record_overload,
+)
+from k8s_sandbox._helm import _semaphore
+
+
+def test_initial_limit_is_clamped_to_bounds() -> None:
+    assert AdaptiveLimiter("x", initial=100, minimum=1, maximum=10).limit == 10
+    assert AdaptiveLimiter("x", initial=1, minimum=4, maximum=10).limit == 4
+
+
+@pytest.mark.parametrize(("minimum", "maximum"), [(0, 10), (5, 4)])
+def test_invalid_bounds_raise(minimum: int, maximum: int) -> None:
+    with pytest.raises(ValueError, match="Invalid adaptive concurrency bounds"):
+        AdaptiveLimiter("x", initial=4, minimum=minimum, maximum=maximum)
+
+
+def test_additive_increase() -> None:
+    limiter = AdaptiveLimiter("x", initial=4, minimum=1, maximum=10)
+
+    # Roughly +1 per `limit` successful operations.
+    for _ in range(5):
+        limiter.record_success(1.0)
+
+    assert limiter.limit == 5
+
+
+def test_increase_is_capped_at_maximum() -> None:
+    limiter = AdaptiveLimiter("x", initial=4, minimum=1, maximum=4)
+
+    for _ in range(10):
+        limiter.record_success(1.0)
+
+    assert limiter.limit == 4
+
+
+def test_multiplicative_decrease_with_cooldown() -> None:
+    limiter = AdaptiveLimiter("x", initial=10, minimum=1, maximum=20)
+
+    limiter.record_overload("test")
+    limiter.record_overload("test")
+
+    assert limiter.limit == int(10 * DECREASE_FACTOR)
+
+
+def test_decrease_is_floored_at_minimum() -> None:
+    limiter = AdaptiveLimiter("x", initial=3, minimum=2, maximum=20)
+
+    with patch("k8s_sandbox._adaptive.DECREASE_COOLDOWN_SECONDS", 0):
+        for _ in range(5):
+            limiter.record_overload("test")
+
+    assert limiter.limit == 2
+
+
+def test_slow_operation_decreases_limit() -> None:
+    limiter = AdaptiveLimiter("x", initial=10, minimum=1, maximum=20)
+    for _ in range(5):
+        limiter.record_success(1.0)
+    before = limiter.limit
+
+    limiter.record_success(10.0)
+
+    assert limiter.limit < before
+
+
+def test_fast_outlier_does_not_make_typical_latency_an_overload_signal() -> None:
+    limiter = AdaptiveLimiter("x", initial=10, minimum=1, maximum=20)
+    limiter.record_success(0.1)
+    for _ in range(5):
+        limiter.record_success(1.0)
+    before = limiter.limit
+
+    # 20x the fastest operation, but typical of recent operations.
+    limiter.record_success(2.0)
+
+    assert limiter.limit >= before
+
+
+async def test_permit_enforces_limit() -> None:
+    limiter = AdaptiveLimiter("test-enforce", initial=2, minimum=1, maximum=4)
+    peak = 0
+    gate = asyncio.Event()
+
+    async def operation() -> None:
+        nonlocal peak
+        async with limiter.permit():
+            peak = max(peak, limiter.in_use)
+            await gate.wait()
+
+    tasks = [asyncio.create_task(operation()) for _ in range(5)]
+    await asyncio.sleep(0.01)
+    assert limiter.in_use == 2
+    gate.set()
+    await asyncio.gather(*tasks)
+
+    assert peak == 2
+    assert limiter.in_use == 0
+
+
+async def test_permit_decreases_limit_on_overload_error() -> None:
+    limiter = AdaptiveLimiter("test-overload", initial=10, minimum=1, maximum=20)
+
+    with pytest.raises(RuntimeError):
+        async with limiter.permit():
+            raise RuntimeError("Error: context deadline exceeded")
+
+    assert limiter.limit == 7
+    assert limiter.in_use == 0
+
+
+async def test_permit_ignores_other_errors() -> None:
+    limiter = AdaptiveLimiter("test-other", initial=10, minimum=1, maximum=20)
+
+    with pytest.raises(RuntimeError):
+        async with limiter.permit():
+            raise RuntimeError("Error: chart not found")
+
+    assert limiter.limit == 10
+
+
+@pytest.mark.parametrize(
+    ("error", "expected"),
+    [
+        (ApiException(status=429), True),
+        (ApiException(status=503), True),
+        (ApiException(status=404), False),
+        (TimeoutError(), True),
+        (RuntimeError("the server is currently unable to handle the request"), True),
+        (RuntimeError("resource not ready"), False),
+    ],
+)
+def test_is_overload_error(error: BaseException, expected: bool) -> None:
+    assert is_overload_error(error) == expected
+
+
+def test_is_overload_error_follows_cause() -> None:
+    error = RuntimeError("Failed to apply manifest.")
+    error.__cause__ = ApiException(status=500)
+
+    assert is_overload_error(error)
+
+
+async def test_record_overload_by_name() -> None:
+    limiter = adaptive_concurrency("test-by-name", initial=10, minimum=1, maximum=20)
+
+    record_overload("test-by-name", "resourcequota conflict")
+    record_overload("does-not-exist", "ignored")
+
+    assert limiter.limit == 7
+
+
+class _ResizableDisplay:
+    def __init__(self) -> None:
+        self._concurrency = 64
+
+    @property
+    def concurrency(self) -> int:
+        return self._concurrency
+
+    @concurrency.setter
+    def concurrency(self, value: int) -> None:
+        self._concurrency = value
+
+
+async def test_limit_is_shown_on_resizable_display() -> None:
+    display = _ResizableDisplay()
+    limiter = AdaptiveLimiter("test-display", initial=5, minimum=1, maximum=64)
+    with patch("k8s_sandbox._adaptive.concurrency") as mock_concurrency:
+        mock_concurrency.return_value.__aenter__.return_value = display
+        async with limiter.permit():
+            assert display.concurrency == 5
+        limiter.record_overload("test")
+        assert display.concurrency == 3
+
+    mock_concurrency.assert_called_with("test-display", 64, key="test-display-adaptive")
+
+
+async def test_display_limit_never_falls_below_permits_in_use() -> None:
+    display = _ResizableDisplay()
+    limiter = AdaptiveLimiter("test-display", initial=5, minimum=1, maximum=64)
+    held = [asyncio.Event() for _ in range(5)]
+    release = asyncio.Event()
+
+    async def hold(entered: asyncio.Event) -> None:
+        async with limiter.permit():
+            entered.set()
+            await release.wait()
+
+    with patch("k8s_sandbox._adaptive.concurrency") as mock_concurrency:
+        mock_concurrency.return_value.__aenter__.return_value = display
+        tasks = [asyncio.ensure_future(hold(event)) for event in held]
+        for event in held:
+            await event.wait()
+        limiter.record_overload("test")
+        # Lowering it to 3 would block a holder yet to enter the display's semaphore.
+        assert display.concurrency == 5
+        release.set()
+        await asyncio.gather(*tasks)
+
+    # The successes released since have increased it a little.
+    assert display.concurrency == limiter.limit < 5
+
+
+async def test_semaphore_is_adaptive_when_enabled(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("INSPECT_HELM_ADAPTIVE_CONCURRENCY", "true")
+    monkeypatch.setenv("INSPECT_HELM_ADAPTIVE_MAX", "32")
+
+    async with _semaphore("test-helm-adaptive", 8):
+        pass
+
+    limiter = adaptive_concurrency("test-helm-adaptive", 0, 1, 1)
+    assert limiter.maximum == 32
+    assert limiter.limit == 8
@@ -0,0 +1,194 @@
+from unittest.mock import MagicMock
+
+from kubernetes.dynamic.exceptions import ResourceNotFoundError  # type: ignore
+
+from k8s_sandbox._apply import (
+    FALLBACK_KINDS,
+    FIELD_MANAGER,
+    INSTANCE_LABEL,
+    RELEASE_NAME_PLACEHOLDER,
+    _apply_objects,
+    _delete_objects,
+    _find_applied_releases,
+    applied_kinds,
+    parse_manifest,
+)
+from k8s_sandbox._cleanup import RELEASE_LABEL
+
+MANIFEST = f"""---
+# Source: agent-env/templates/services.yaml
+apiVersion: apps/v1
+kind: StatefulSet
+metadata:
+  name: agent-env-{RELEASE_NAME_PLACEHOLDER}-default
+  labels:
+    app.kubernetes.io/name: agent-env
+spec:
+  selector:
+    matchLabels:
+      app.kubernetes.io/instance: {RELEASE_NAME_PLACEHOLDER}
+  template:
+    metadata:
+      labels:
+        inspect/service: default
+---
+# Source: agent-env/templates/coredns.yaml
+apiVersion: v1
+kind: ConfigMap
+metadata:
+  name: {RELEASE_NAME_PLACEHOLDER}-coredns-configmap
+---
+# Source: agent-env/templates/pvc.yaml
+---
+apiVersion: v1
+kind: ServiceAccount
+metadata:
+  name: agent-env-{RELEASE_NAME_PLACEHOLDER}
+"""
+
+
+def test_parse_manifest_substitutes_release_name() -> None:
+    objects = parse_manifest(MANIFEST, "abcdefgh", {})
+
+    names = [obj["metadata"]["name"] for obj in objects]
+    assert "agent-env-abcdefgh-default" in names
+    assert all(RELEASE_NAME_PLACEHOLDER not in name for name in names)
+    statefulset = next(obj for obj in objects if obj["kind"] == "StatefulSet")
+    assert statefulset["spec"]["selector"]["matchLabels"] == {
+        INSTANCE_LABEL: "abcdefgh"
+    }
+
+
+def test_parse_manifest_skips_empty_documents() -> None:
+    objects = parse_manifest(MANIFEST, "abcdefgh", {})
+
+    assert len(objects) == 3
+
+
+def test_parse_manifest_sorts_into_install_order() -> None:
+    objects = parse_manifest(MANIFEST, "abcdefgh", {})
+
+    assert [obj["kind"] for obj in objects] == [
+        "ServiceAccount",
+        "ConfigMap",
+        "StatefulSet",
+    ]
+
+
+def test_parse_manifest_labels_objects_and_pod_templates() -> None:
+    objects = parse_manifest(MANIFEST, "abcdefgh", {"inspectSampleUUID": "uuid"})
+
+    for obj in objects:
+        assert obj["metadata"]["labels"][INSTANCE_LABEL] == "abcdefgh"
+        assert obj["metadata"]["labels"]["inspectSampleUUID"] == "uuid"
+    statefulset = next(obj for obj in objects if obj["kind"] == "StatefulSet")
+    assert statefulset["metadata"]["labels"]["app.kubernetes.io/name"] == "agent-env"
+    assert statefulset["spec"]["template"]["metadata"]["labels"] == {
+        "inspect/service": "default",
+        INSTANCE_LABEL: "abcdefgh",
+        "inspectSampleUUID": "uuid",
+    }
+
+
+def test_parse_manifest_returns_independent_objects_per_release() -> None:
+    first = parse_manifest(MANIFEST, "aaaaaaaa", {})
+    second = parse_manifest(MANIFEST, "bbbbbbbb", {})
+
+    assert first[0]["metadata"]["labels"][INSTANCE_LABEL] == "aaaaaaaa"
+    assert second[0]["metadata"]["labels"][INSTANCE_LABEL] == "bbbbbbbb"
+
+
+def test_applied_kinds_are_distinct_and_ordered() -> None:
+    objects = parse_manifest(MANIFEST + MANIFEST, "abcdefgh", {})
+
+    assert applied_kinds(objects) == [
+        ("v1", "ServiceAccount"),
+        ("v1", "ConfigMap"),
+        ("apps/v1", "StatefulSet"),
+    ]
+
+
+def test_apply_objects_uses_server_side_apply() -> None:
+    client = MagicMock()
+    objects = parse_manifest(MANIFEST, "abcdefgh", {})
+
+    _apply_objects(client, "ns", objects)
+
+    assert client.server_side_apply.call_count == 3
+    for call, obj in zip(client.server_side_apply.call_args_list, objects):
+        assert call.kwargs["body"] is obj
+        assert call.kwargs["namespace"] == "ns"
+        assert call.kwargs["field_manager"] == FIELD_MANAGER
+        assert call.kwargs["force_conflicts"] is True
+
+
+def test_apply_objects_omits_namespace_for_cluster_scoped_kinds() -> None:
+    client = MagicMock()
+    client.resources.get.return_value.namespaced = False
+    objects = parse_manifest(MANIFEST, "abcdefgh", {})
+
+    _apply_objects(client, "ns", objects[:1])
+
+    assert client.server_side_apply.call_args.kwargs["namespace"] is None
+
+
+def test_delete_objects_uses_label_selector_in_reverse_order() -> None:
+    client = MagicMock()
+    client.resources.get.side_effect = lambda api_version, kind: MagicMock(kind=kind)
+    kinds = [("v1", "ConfigMap"), ("apps/v1", "StatefulSet")]
+
+    _delete_objects(client, "ns", "abcdefgh", kinds)
+
+    assert [call.args[0].kind for call in client.delete.call_args_list] == [
+        "StatefulSet",
+        "ConfigMap",
+    ]
+    for call in client.delete.call_args_list:
+        assert call.kwargs["label_selector"] == f"{INSTANCE_LABEL}=abcdefgh"
+
+
+def test_delete_objects_skips_kinds_not_served() -> None:
+    client = MagicMock()
+
+    def get(api_version: str, kind: str) -> MagicMock:
+        if kind == "CiliumNetworkPolicy":
+            raise ResourceNotFoundError(kind)
+        return MagicMock()
+
+    client.resources.get.side_effect = get
+    kinds = [("v1", "ConfigMap"), ("cilium.io/v2", "CiliumNetworkPolicy")]
+
+    _delete_objects(client, "ns", "abcdefgh", kinds)
+
+    assert client.delete.call_count == 1
+
+
+def test_delete_objects_falls_back_to_common_kinds_by_release_label() -> None:
+    client = MagicMock()
+    client.resources.get.side_effect = lambda api_version, kind: MagicMock(kind=kind)
+
+    _delete_objects(client, "ns", "abcdefgh", [])
+
+    assert [call.args[0].kind for call in client.delete.call_args_list] == [
+        kind for _, kind in reversed(FALLBACK_KINDS)
+    ]
+    for call in client.delete.call_args_list:
+        assert call.kwargs["label_selector"] == f"{RELEASE_LABEL}=abcdefgh"
+
+
+def test_find_applied_releases_reads_release_label() -> None:
+    client = MagicMock()
+
+    def get(resource: MagicMock, namespace: str, label_selector: str) -> MagicMock:
+        assert label_selector == "inspectSandbox=true"
+        items = [
+            {"metadata": {"labels": {RELEASE_LABEL: "abcdefgh"}}},
+            {"metadata": {"labels": {RELEASE_LABEL: "ijklmnop"}}},
+            {"metadata": {"labels": {}}},
+        ]
+        return MagicMock(to_dict=lambda: {"items": items})
+
+    client.get.side_effect = get
+
+    assert _find_applied_releases(client, "ns") == ["abcdefgh", "ijklmnop"]
+    assert client.get.call_count == len(FALLBACK_KINDS)
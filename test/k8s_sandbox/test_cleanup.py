@@ -0,0 +1,148 @@
+import base64
+import gzip
+import json
+from typing import Any
+from unittest.mock import MagicMock, patch
+
+import pytest
+from kubernetes.client.exceptions import ApiException  # type: ignore
+
+from k8s_sandbox._cleanup import (
+    RELEASE_LABEL,
+    bulk_uninstall,
+    covered_kinds,
+    decode_release_record,
+)
+
+
+def _manifest(release_name: str, labelled: bool = True) -> str:
+    labels = f"\n  labels:\n    {RELEASE_LABEL}: {release_name}" if labelled else ""
+    return f"""---
+apiVersion: v1
+kind: ConfigMap
+metadata:
+  name: {release_name}-coredns-configmap{labels}
+---
+apiVersion: apps/v1
+kind: StatefulSet
+metadata:
+  name: agent-env-{release_name}-default{labels}
+"""
+
+
+def _release(name: str, labelled: bool = True, **fields: Any) -> dict[str, Any]:
+    return {
+        "name": name,
+        "namespace": "ns",
+        "version": 1,
+        "manifest": _manifest(name, labelled),
+        **fields,
+    }
+
+
+def _secret(release: dict[str, Any], compress: bool = True) -> dict[str, Any]:
+    encoded = json.dumps(release).encode()
+    if compress:
+        encoded = gzip.compress(encoded)
+    data = base64.b64encode(base64.b64encode(encoded)).decode()
+    return {"data": {"release": data}}
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_decode_release_record(compress: bool) -> None:
+    release = _release("aaaaaaaa")
+
+    assert decode_release_record(_secret(release, compress)["data"]["release"]) == (
+        release
+    )
+
+
+def test_covered_kinds_of_labelled_release() -> None:
+    assert covered_kinds(_release("aaaaaaaa")) == [
+        ("v1", "ConfigMap"),
+        ("apps/v1", "StatefulSet"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "release",
+    [
+        pytest.param(_release("aaaaaaaa", labelled=False), id="unlabelled"),
+        pytest.param(_release("aaaaaaaa", hooks=[{"name": "x"}]), id="hooks"),
+        pytest.param(
+            _release("aaaaaaaa")
+            | {"manifest": _manifest("aaaaaaaa") + "  namespace: other\n"},
+            id="other-namespace",
+        ),
+    ],
+)
+def test_release_not_covered(release: dict[str, Any]) -> None:
+    assert covered_kinds(release) is None
+
+
+@pytest.fixture
+def clients() -> Any:
+    core = MagicMock()
+    dynamic = MagicMock()
+    dynamic.resources.get.side_effect = lambda api_version, kind: MagicMock(
+        kind=kind, namespaced=True
+    )
+    dynamic.get.return_value.to_dict.return_value = {"items": []}
+    with (
+        patch("k8s_sandbox._cleanup.k8s_client", return_value=core),
+        patch("k8s_sandbox._cleanup.k8s_dynamic_client", return_value=dynamic),
+    ):
+        yield core, dynamic
+
+
+def _list_secrets(core: MagicMock, *releases: dict[str, Any]) -> None:
+    response = MagicMock()
+    response.data = json.dumps({"items": [_secret(r) for r in releases]}).encode()
+    core.list_namespaced_secret.return_value = response
+
+
+async def test_bulk_uninstall_deletes_covered_releases_by_label(clients: Any) -> None:
+    core, dynamic = clients
+    _list_secrets(core, _release("aaaaaaaa"), _release("bbbbbbbb", labelled=False))
+
+    remaining = await bulk_uninstall(
+        ["aaaaaaaa", "bbbbbbbb", "cccccccc"], "ns", None, timeout=10, quiet=True
+    )
+
+    # Unlabelled releases and those without a release record are left for Helm.
+    assert remaining == ["bbbbbbbb", "cccccccc"]
+    assert [call.args[0].kind for call in dynamic.delete.call_args_list] == [
+        "StatefulSet",
+        "ConfigMap",
+    ]
+    for call in dynamic.delete.call_args_list:
+        assert call.kwargs["label_selector"] == f"{RELEASE_LABEL} in (aaaaaaaa)"
+    core.delete_collection_namespaced_secret.assert_called_once_with(
+        "ns", label_selector="owner=helm,name in (aaaaaaaa)"
+    )
+
+
+async def test_bulk_uninstall_keeps_release_records_if_delete_fails(
+    clients: Any,
+) -> None:
+    core, dynamic = clients
+    _list_secrets(core, _release("aaaaaaaa"))
+    dynamic.delete.side_effect = ApiException(status=500)
+
+    remaining = await bulk_uninstall(["aaaaaaaa"], "ns", None, timeout=10, quiet=True)
+
+    assert remaining == ["aaaaaaaa"]
+    core.delete_collection_namespaced_secret.assert_not_called()
+
+
+async def test_bulk_uninstall_skips_cluster_scoped_kinds(clients: Any) -> None:
+    core, dynamic = clients
+    _list_secrets(core, _release("aaaaaaaa"))
+    dynamic.resources.get.side_effect = lambda api_version, kind: MagicMock(
+        kind=kind, namespaced=kind != "ConfigMap"
+    )
+
+    remaining = await bulk_uninstall(["aaaaaaaa"], "ns", None, timeout=10, quiet=True)
+
+    assert remaining == ["aaaaaaaa"]
+    dynamic.delete.assert_not_called()
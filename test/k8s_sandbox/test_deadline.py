@@ -0,0 +1,271 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Generator
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from tenacity import RetryCallState, wait_fixed
+
+from k8s_sandbox import _sandbox_environment
+from k8s_sandbox._deadline import (
+    DeadlineExceededError,
+    bounded,
+    deadline,
+    exceeded,
+    paused,
+    remaining,
+    unbounded,
+    within_deadline,
+)
+from k8s_sandbox._pod.cancellation import current_cancellation
+from k8s_sandbox._pod.error import PodError
+from k8s_sandbox._pod.executor import PodOpExecutor
+from k8s_sandbox._sandbox_environment import (
+    _EXEC_DEADLINE_GRACE_SECONDS,
+    INSPECT_K8S_FILE_OP_DEADLINE,
+    _stop_at_deadline,
+    _wait_within_deadline,
+)
+
+from .test_exec_retry import _make_sandbox, _make_sandbox_with_mock_pod
+
+
+@pytest.fixture
+def isolated_executor() -> Generator:
+    # Inspect's limit on concurrent pod ops is global, and set by its first use.
+    with patch("k8s_sandbox._pod.executor.concurrency"):
+        yield
+
+
+def test_no_deadline_by_default() -> None:
+    assert remaining() is None
+    assert not exceeded()
+    assert bounded(60) == 60
+
+
+def test_deadline_bounds_timeouts() -> None:
+    with deadline(10):
+        left = remaining()
+        assert left is not None and 9 < left <= 10
+        assert bounded(60) <= 10
+        assert bounded(1) == 1
+    assert remaining() is None
+
+
+def test_inner_deadline_cannot_extend_outer() -> None:
+    with deadline(1):
+        with deadline(100):
+            left = remaining()
+            assert left is not None and left <= 1
+        with deadline(None):
+            assert remaining() is not None
+
+
+def test_bounded_raises_once_exceeded() -> None:
+    with deadline(0):
+        assert exceeded()
+        with pytest.raises(DeadlineExceededError):
+            bounded(60)
+
+
+def test_unbounded() -> None:
+    with deadline(0), unbounded():
+        assert remaining() is None
+
+
+def test_deadline_exceeded_is_a_timeout() -> None:
+    assert issubclass(DeadlineExceededError, TimeoutError)
+
+
+async def test_within_deadline_cancels_slow_operation() -> None:
+    with deadline(0.1):
+        with pytest.raises(DeadlineExceededError):
+            await within_deadline(asyncio.sleep(10))
+
+
+async def test_within_deadline_propagates_operation_timeout() -> None:
+    async def times_out() -> None:
+        raise TimeoutError("Command timed out")
+
+    with deadline(10):
+        with pytest.raises(TimeoutError, match="Command timed out"):
+            await within_deadline(times_out())
+
+
+async def test_executor_aborts_operation_at_deadline(isolated_executor: None) -> None:
+    executor = PodOpExecutor(max_pod_ops=1)
+    released = threading.Event()
+
+    def blocking_op() -> None:
+        aborted = threading.Event()
+        with current_cancellation().on_cancel(aborted.set):
+            aborted.wait(10)
+        released.set()
+
+    with deadline(0.2):
+        with pytest.raises(DeadlineExceededError):
+            await executor.queue_operation(blocking_op)
+
+    assert await asyncio.to_thread(released.wait, 5)
+
+
+async def test_executor_sees_deadline_in_thread(isolated_executor: None) -> None:
+    executor = PodOpExecutor(max_pod_ops=1)
+
+    with deadline(10):
+        left = await executor.queue_operation(remaining)
+
+    assert left is not None and left <= 10
+
+
+async def test_executor_does_not_count_waiting_for_a_slot() -> None:
+    executor = PodOpExecutor(max_pod_ops=1)
+    slot = asyncio.Semaphore(1)
+
+    @asynccontextmanager
+    async def one_slot(name: str, limit: int) -> AsyncIterator[None]:
+        async with slot:
+            yield
+
+    async def hold_slot() -> None:
+        async with slot:
+            await asyncio.sleep(0.4)
+
+    with patch("k8s_sandbox._pod.executor.concurrency", one_slot):
+        holder = asyncio.ensure_future(hold_slot())
+        await asyncio.sleep(0)
+        with deadline(0.2):
+            assert await executor.queue_operation(lambda: "ran") == "ran"
+            # The deadline was extended by the wait.
+            left = remaining()
+            assert left is not None and left > 0
+        await holder
+
+
+def test_paused_extends_deadline() -> None:
+    with deadline(0.1):
+        with paused():
+            time.sleep(0.2)
+        assert not exceeded()
+        left = remaining()
+        assert left is not None and left <= 0.1
+
+
+def test_paused_extends_enclosing_deadline() -> None:
+    with deadline(0.1), deadline(10):
+        with paused():
+            time.sleep(0.2)
+        assert not exceeded()
+
+
+def test_retry_waits_no_longer_than_deadline() -> None:
+    wait = _wait_within_deadline(wait_fixed(10))
+    state = MagicMock(spec=RetryCallState)
+
+    assert wait(state) == 10
+    with deadline(0.5):
+        assert wait(state) <= 0.5
+
+
+def test_retry_stops_at_deadline() -> None:
+    stop = _stop_at_deadline()
+    state = MagicMock(spec=RetryCallState)
+
+    assert not stop(state)
+    with deadline(10):
+        assert not stop(state)
+    with deadline(0):
+        assert stop(state)
+
+
+async def test_exec_gives_up_at_deadline(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(_sandbox_environment, "_EXEC_DEADLINE_GRACE_SECONDS", 0)
+    sandbox, mock_exec = _make_sandbox_with_mock_pod()
+
+    async def slow_transient_failure(*args: object) -> None:
+        # As the pod op executor would, give up at the deadline.
+        await within_deadline(asyncio.sleep(0.3))
+        raise PodError("WebSocket connection lost during exec")
+
+    mock_exec.side_effect = slow_transient_failure
+    start = time.monotonic()
+
+    with pytest.raises(TimeoutError):
+        await sandbox.exec(["sleep", "1"], timeout=1)
+
+    # Without a deadline, 5 attempts with exponential backoff would take ~15s.
+    assert time.monotonic() - start < 3
+    assert 1 <= mock_exec.call_count < 5
+
+
+async def test_exec_without_timeout_has_no_deadline() -> None:
+    sandbox, mock_exec = _make_sandbox_with_mock_pod()
+    seen: list[float | None] = []
+
+    async def record(*args: object) -> MagicMock:
+        seen.append(remaining())
+        return MagicMock()
+
+    mock_exec.side_effect = record
+
+    await sandbox.exec(["true"])
+    await sandbox.exec(["true"], timeout=5)
+
+    assert seen[0] is None
+    assert seen[1] is not None and seen[1] <= 5 + _EXEC_DEADLINE_GRACE_SECONDS
+
+
+@pytest.mark.parametrize(
+    "call",
+    [
+        lambda sandbox: sandbox.read_file("/file"),
+        lambda sandbox: sandbox.read_files(["/file"]),
+        lambda sandbox: sandbox.read_dir("/dir"),
+        lambda sandbox: sandbox.write_file("/file", "contents"),
+        lambda sandbox: sandbox.write_files({"/file": "contents"}),
+    ],
+)
+async def test_file_ops_have_a_deadline(
+    monkeypatch: pytest.MonkeyPatch, call: Callable[[Any], Awaitable[object]]
+) -> None:
+    monkeypatch.setenv(INSPECT_K8S_FILE_OP_DEADLINE, "60")
+    sandbox, mock_pod = _make_sandbox()
+    seen: list[float | None] = []
+
+    def recorder(result: object) -> AsyncMock:
+        async def record(*args: object) -> object:
+            seen.append(remaining())
+            return result
+
+        return AsyncMock(side_effect=record)
+
+    mock_pod.read_file = recorder(None)
+    mock_pod.read_files = recorder({Path("/file"): b""})
+    mock_pod.read_dir = recorder({})
+    mock_pod.write_file = recorder(None)
+    mock_pod.write_files = recorder({})
+
+    await call(sandbox)
+
+    assert len(seen) == 1
+    assert seen[0] is not None and seen[0] <= 60
+
+
+async def test_file_ops_have_no_deadline_by_default(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.delenv(INSPECT_K8S_FILE_OP_DEADLINE, raising=False)
+    sandbox, mock_pod = _make_sandbox()
+    seen: list[float | None] = []
+
+    async def record(*args: object) -> None:
+        seen.append(remaining())
+
+    mock_pod.write_file = AsyncMock(side_effect=record)
+
+    await sandbox.write_file("/file", "contents")
+
+    assert seen == [None]
@@ -1,6 +1,8 @@
+import json
 from unittest.mock import MagicMock, patch
 
 from kubernetes.client import (  # type: ignore
+    ApiClient,
     CoreV1Event,
     CoreV1EventList,
     V1ContainerState,
@@ -37,7 +39,10 @@ def _pod(
 
 def _patch_client(pods, events=None):
     client = MagicMock()
-    client.list_namespaced_pod.return_value = V1PodList(items=pods)
+    # Pods are read as raw JSON (see snapshot.py).
+    client.list_namespaced_pod.return_value.data = json.dumps(
+        ApiClient().sanitize_for_serialization(V1PodList(items=pods))
+    ).encode()
     client.list_namespaced_event.return_value = CoreV1EventList(items=events or [])
     return patch("k8s_sandbox._diagnostics.k8s_client", return_value=client)
 
@@ -0,0 +1,107 @@
+import asyncio
+import json
+from typing import Any
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import k8s_sandbox._events as events_module
+from k8s_sandbox._events import (
+    _SchedulingEventInformer,
+    _Subscriber,
+    subscribe_to_scheduling_events,
+)
+
+
+def _event(object_name: str, message: str = "Insufficient nvidia.com/gpu") -> dict:
+    return {
+        "metadata": {"resourceVersion": "2"},
+        "involvedObject": {"name": object_name},
+        "message": message,
+    }
+
+
+def _stream(*events: dict) -> MagicMock:
+    response = MagicMock()
+    response.stream.return_value = [
+        "".join(json.dumps(event) + "\n" for event in events).encode()
+    ]
+    return response
+
+
+@pytest.fixture
+def no_threads() -> Any:
+    with patch.object(_SchedulingEventInformer, "start"):
+        yield
+    events_module._informers.clear()
+
+
+async def test_events_dispatched_to_subscribers_of_release() -> None:
+    informer = _SchedulingEventInformer(None, "ns")
+    received: dict[str, list[dict]] = {"abcdefgh": [], "zzzzzzzz": []}
+    for release_name, events in received.items():
+        informer.add(
+            release_name, _Subscriber(asyncio.get_running_loop(), events.append)
+        )
+
+    informer.dispatch(_event("agent-env-abcdefgh-default-0"))
+    informer.dispatch(_event("agent-env-xabcdefgh-default-0"))
+    await asyncio.sleep(0)
+
+    assert len(received["abcdefgh"]) == 1
+    assert received["zzzzzzzz"] == []
+
+
+@pytest.mark.usefixtures("no_threads")
+async def test_subscribers_share_one_informer_per_namespace() -> None:
+    with subscribe_to_scheduling_events(None, "ns", "aaaaaaaa", print):
+        with subscribe_to_scheduling_events(None, "ns", "bbbbbbbb", print):
+            with subscribe_to_scheduling_events(None, "other", "cccccccc", print):
+                assert len(events_module._informers) == 2
+            informer = events_module._informers[(None, "ns")]
+        assert events_module._informers[(None, "ns")] is informer
+
+    assert events_module._informers == {}
+    assert informer._stopped.is_set()
+
+
+def test_list_dispatches_existing_events() -> None:
+    informer = _SchedulingEventInformer(None, "ns")
+    informer.dispatch = MagicMock()  # type: ignore[method-assign]
+    api = MagicMock()
+    api.list_namespaced_event.return_value.data = json.dumps(
+        {"metadata": {"resourceVersion": "1"}, "items": [_event("x")]}
+    ).encode()
+
+    assert informer._list(api) == "1"
+
+    informer.dispatch.assert_called_once()
+    assert (
+        api.list_namespaced_event.call_args.kwargs["field_selector"]
+        == "reason=FailedScheduling"
+    )
+
+
+def test_watch_dispatches_events_and_tracks_resource_version() -> None:
+    informer = _SchedulingEventInformer(None, "ns")
+    informer.dispatch = MagicMock()  # type: ignore[method-assign]
+    api = MagicMock()
+    api.list_namespaced_event.return_value = _stream(
+        {"type": "BOOKMARK", "object": {"metadata": {"resourceVersion": "2"}}},
+        {"type": "ADDED", "object": _event("agent-env-abcdefgh-default-0")},
+    )
+
+    assert informer._watch(api, "1") == "2"
+
+    informer.dispatch.assert_called_once()
+    assert api.list_namespaced_event.call_args.kwargs["resource_version"] == "1"
+
+
+def test_watch_requests_relist_when_history_expires() -> None:
+    informer = _SchedulingEventInformer(None, "ns")
+    api = MagicMock()
+    api.list_namespaced_event.return_value = _stream(
+        {"type": "ERROR", "object": {"code": 410, "message": "too old"}}
+    )
+
+    assert informer._watch(api, "1") is None
@@ -365,3 +365,32 @@ class TestWriteFileRetryExhausted:
             await sandbox.write_file("/tmp/test.txt", "hello")
 
         assert mock_write.call_count == 5
+
+
+class TestWriteFiles:
+    """write_files retries as a whole, and reports every file which failed."""
+
+    async def test_transient_error_is_retried(self) -> None:
+        sandbox, mock_pod = _make_sandbox()
+        mock_pod.write_files = AsyncMock(
+            side_effect=[PodError("WebSocket connection lost"), {}]
+        )
+
+        errors = await sandbox.write_files({"/tmp/a": "a"})
+
+        assert errors == {}
+        assert mock_pod.write_files.call_count == 2
+
+    async def test_every_error_is_returned(self) -> None:
+        sandbox, mock_pod = _make_sandbox()
+        denied = PermissionError("denied")
+        directory = IsADirectoryError("is a directory")
+        mock_pod.write_files = AsyncMock(
+            return_value={Path("/tmp/c"): directory, Path("/tmp/a"): denied}
+        )
+
+        errors = await sandbox.write_files(
+            {"/tmp/a": "a", "/tmp/b": "b", "/tmp/c": "c"}
+        )
+
+        assert errors == {"/tmp/a": denied, "/tmp/c": directory}
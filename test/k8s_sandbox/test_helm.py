@@ -1,8 +1,10 @@
 import asyncio
 import logging
 import tempfile
+from contextlib import contextmanager, suppress
 from pathlib import Path
-from unittest.mock import MagicMock, patch
+from typing import Any, Callable, Iterator
+from unittest.mock import patch
 
 import pytest
 import yaml
@@ -19,12 +21,14 @@ from k8s_sandbox._helm import (
     _get_helm_major_version,
     _get_wait_flag,
     _helm_escape,
+    _rendered_manifests,
     _run_subprocess,
     get_all_release_names,
     uninstall,
     validate_no_null_values,
 )
 from k8s_sandbox._kubernetes_api import get_default_namespace, k8s_client
+from k8s_sandbox._readiness import PodFailedError
 from k8s_sandbox._sandbox_environment import _key_to_pascal, _metadata_to_extra_values
 
 
@@ -556,80 +560,70 @@ def test_get_wait_flag_is_cached() -> None:
         mock.assert_called_once()
 
 
-def _make_gpu_scheduling_event(release_name: str) -> MagicMock:
-    event = MagicMock()
-    event.involved_object.name = f"agent-env-{release_name}-default-abc123"
-    event.message = "0/3 nodes available: 3 Insufficient nvidia.com/gpu."
-    return event
+def _subscription_delivering(*messages: str) -> Any:
+    """Stands in for the shared event watch, delivering an event per message."""
 
+    @contextmanager
+    def subscribe(
+        context_name: str | None,
+        namespace: str,
+        release_name: str,
+        callback: Callable[[dict[str, Any]], None],
+    ) -> Iterator[None]:
+        loop = asyncio.get_running_loop()
+        for message in messages:
+            loop.call_soon(callback, {"message": message})
+        yield
 
-async def test_watcher_logs_on_gpu_scheduling_event(
-    caplog: LogCaptureFixture,
-) -> None:
-    release = Release(__file__, None, ValuesSource.none(), None)
-    mock_k8s = MagicMock()
-    mock_k8s.list_namespaced_event.return_value.items = [
-        _make_gpu_scheduling_event(release.release_name)
-    ]
+    return subscribe
 
-    with patch("k8s_sandbox._helm.k8s_client", return_value=mock_k8s):
-        with patch("k8s_sandbox._helm._SCHEDULING_POLL_INTERVAL", 0):
-            with caplog.at_level(logging.WARNING):
-                await release._watch_for_scheduling_events()
 
-    assert "GPU node" in caplog.text
-    mock_k8s.list_namespaced_event.assert_called_once()
+async def _watch_briefly(release: Release) -> None:
+    with suppress(asyncio.TimeoutError):
+        await asyncio.wait_for(release._watch_for_scheduling_events(), 0.1)
 
 
-async def test_watcher_does_not_log_for_non_gpu_event(
+async def test_watcher_logs_on_gpu_scheduling_event(
     caplog: LogCaptureFixture,
 ) -> None:
     release = Release(__file__, None, ValuesSource.none(), None)
-    event = MagicMock()
-    event.involved_object.name = f"agent-env-{release.release_name}-default-abc123"
-    event.message = "0/3 nodes available: 3 Insufficient memory."
-    mock_k8s = MagicMock()
-    # Return a non-GPU event, then raise to terminate the polling loop.
-    mock_k8s.list_namespaced_event.side_effect = [
-        MagicMock(items=[event]),
-        Exception("terminate"),
-    ]
+    subscribe = _subscription_delivering(
+        "0/3 nodes available: 3 Insufficient memory.",
+        "0/3 nodes available: 3 Insufficient nvidia.com/gpu.",
+        "0/3 nodes available: 3 Insufficient nvidia.com/gpu.",
+    )
 
-    with patch("k8s_sandbox._helm.k8s_client", return_value=mock_k8s):
-        with patch("k8s_sandbox._helm._SCHEDULING_POLL_INTERVAL", 0):
-            with caplog.at_level(logging.WARNING):
-                await release._watch_for_scheduling_events()
+    with patch("k8s_sandbox._helm.subscribe_to_scheduling_events", subscribe):
+        with caplog.at_level(logging.WARNING):
+            await release._watch_for_scheduling_events()
 
-    assert "GPU node" not in caplog.text
+    assert caplog.text.count("No GPU node") == 1
 
 
-async def test_watcher_does_not_log_for_different_release(
+async def test_watcher_does_not_log_for_non_gpu_event(
     caplog: LogCaptureFixture,
 ) -> None:
     release = Release(__file__, None, ValuesSource.none(), None)
-    mock_k8s = MagicMock()
-    mock_k8s.list_namespaced_event.side_effect = [
-        MagicMock(items=[_make_gpu_scheduling_event("differentrelease")]),
-        Exception("terminate"),
-    ]
+    subscribe = _subscription_delivering("0/3 nodes available: 3 Insufficient memory.")
 
-    with patch("k8s_sandbox._helm.k8s_client", return_value=mock_k8s):
-        with patch("k8s_sandbox._helm._SCHEDULING_POLL_INTERVAL", 0):
-            with caplog.at_level(logging.WARNING):
-                await release._watch_for_scheduling_events()
+    with patch("k8s_sandbox._helm.subscribe_to_scheduling_events", subscribe):
+        with caplog.at_level(logging.WARNING):
+            await _watch_briefly(release)
 
     assert "GPU node" not in caplog.text
 
 
-async def test_watcher_exits_gracefully_on_k8s_client_error(
+async def test_watcher_exits_gracefully_on_subscription_error(
     caplog: LogCaptureFixture,
 ) -> None:
     release = Release(__file__, None, ValuesSource.none(), None)
 
-    with patch("k8s_sandbox._helm.k8s_client", side_effect=Exception("no kubeconfig")):
-        with patch("k8s_sandbox._helm._SCHEDULING_POLL_INTERVAL", 0):
-            with caplog.at_level(logging.WARNING):
-                await release._watch_for_scheduling_events()  # must not raise
+    with patch(
+        "k8s_sandbox._helm.subscribe_to_scheduling_events",
+        side_effect=Exception("no kubeconfig"),
+    ):
+        with caplog.at_level(logging.WARNING):
+            await release._watch_for_scheduling_events()  # must not raise
 
     assert "GPU node" not in caplog.text
 
@@ -778,3 +772,203 @@ async def test_install_error_omits_diagnostics_when_unavailable() -> None:
             await release._raise_install_error(result)
 
     assert "Helm install failed." in str(excinfo.value)
+
+
+def test_config_digest_depends_on_values_content(tmp_path: Path) -> None:
+    values = tmp_path / "values.yaml"
+    values.write_text("services: {}\n")
+    release = Release(__file__, None, StaticValuesSource(values), None)
+    same = Release(__file__, None, StaticValuesSource(values), None)
+
+    digest = release.config_digest()
+    same_digest = same.config_digest()
+    values.write_text("services: {default: {}}\n")
+    changed_digest = Release(
+        __file__, None, StaticValuesSource(values), None
+    ).config_digest()
+
+    assert same_digest == digest
+    assert changed_digest != digest
+
+
+def test_config_digest_depends_on_extra_values() -> None:
+    release = Release(__file__, None, ValuesSource.none(), None)
+    other = Release(__file__, None, ValuesSource.none(), None, extra_values={"a": "b"})
+
+    assert release.config_digest() != other.config_digest()
+
+
+def test_clone_has_same_config_but_new_name() -> None:
+    release = Release(
+        __file__,
+        None,
+        ValuesSource.none(),
+        None,
+        sample_uuid="abc",
+        extra_values={"a": "b"},
+    )
+
+    clone = release.clone()
+
+    assert clone.config_digest() == release.config_digest()
+    assert clone.release_name != release.release_name
+    assert clone.sample_uuid is None
+
+
+@pytest.fixture
+def _clear_rendered_manifests() -> object:
+    with patch.dict("k8s_sandbox._helm._rendered_manifests", clear=True):
+        yield
+
+
+@pytest.mark.usefixtures("_clear_rendered_manifests")
+async def test_apply_engine_renders_once_per_config() -> None:
+    manifest = "apiVersion: v1\nkind: ConfigMap\nmetadata:\n  name: cm-zzrlsezz\n"
+    releases = [
+        Release(
+            __file__,
+            None,
+            ValuesSource.none(),
+            None,
+            sample_uuid=f"uuid-{i}",
+            install_engine="apply",
+        )
+        for i in range(3)
+    ]
+    template = ExecResult(success=True, returncode=0, stdout=manifest, stderr="")
+
+    with (
+        patch("k8s_sandbox._helm._run_subprocess", return_value=template) as mock_run,
+        patch("k8s_sandbox._helm.apply_objects") as mock_apply,
+        patch("k8s_sandbox._helm.wait_for_release_ready"),
+    ):
+        await asyncio.gather(*(release.install() for release in releases))
+
+    mock_run.assert_called_once()
+    assert mock_run.call_args[0][1][:2] == ["template", "zzrlsezz"]
+    applied = {
+        call.args[2][0]["metadata"]["name"]: call.args[2][0]["metadata"]["labels"]
+        for call in mock_apply.call_args_list
+    }
+    for i, release in enumerate(releases):
+        labels = applied[f"cm-{release.release_name}"]
+        assert labels["inspectSampleUUID"] == f"uuid-{i}"
+        assert labels["app.kubernetes.io/instance"] == release.release_name
+
+
+@pytest.mark.usefixtures("_clear_rendered_manifests")
+async def test_apply_engine_does_not_cache_failed_render() -> None:
+    release = Release(__file__, None, ValuesSource.none(), None, install_engine="apply")
+    failure = ExecResult(success=False, returncode=1, stdout="", stderr="bad chart")
+
+    with patch("k8s_sandbox._helm._run_subprocess", return_value=failure):
+        with pytest.raises(RuntimeError, match="Helm template failed"):
+            await release.install()
+
+    assert not _rendered_manifests
+
+
+@pytest.mark.usefixtures("_clear_rendered_manifests")
+async def test_apply_engine_raises_when_not_ready() -> None:
+    manifest = "apiVersion: v1\nkind: ConfigMap\nmetadata:\n  name: cm\n"
+    release = Release(__file__, None, ValuesSource.none(), None, install_engine="apply")
+    template = ExecResult(success=True, returncode=0, stdout=manifest, stderr="")
+
+    with (
+        patch("k8s_sandbox._helm._run_subprocess", return_value=template),
+        patch("k8s_sandbox._helm.apply_objects"),
+        patch(
+            "k8s_sandbox._helm.wait_for_release_ready",
+            side_effect=TimeoutError("Pods ['pod-0'] did not become ready."),
+        ),
+        patch("k8s_sandbox._helm.describe_release_pods", return_value="ImagePull"),
+    ):
+        with pytest.raises(RuntimeError) as excinfo:
+            await release._install(None, upgrade=False)
+
+    assert "did not become ready" in str(excinfo.value)
+    assert "ImagePull" in str(excinfo.value)
+
+
+async def test_apply_engine_uninstall_deletes_applied_kinds() -> None:
+    release = Release(__file__, None, ValuesSource.none(), None, install_engine="apply")
+    release._applied_kinds = [("v1", "ConfigMap")]
+
+    with (
+        patch("k8s_sandbox._helm.delete_objects") as mock_delete,
+        patch("k8s_sandbox._helm._run_subprocess") as mock_run,
+    ):
+        await release.uninstall(quiet=True)
+
+    mock_run.assert_not_called()
+    mock_delete.assert_called_once()
+    assert mock_delete.call_args.args[2] == release.release_name
+    assert mock_delete.call_args.args[3] == [("v1", "ConfigMap")]
+
+
+async def test_apply_engine_install_cancelled_before_parse_deletes_by_label() -> None:
+    release = Release(__file__, None, ValuesSource.none(), None, install_engine="apply")
+
+    with (
+        patch.object(
+            release, "_rendered_manifest", side_effect=asyncio.CancelledError()
+        ),
+        patch("k8s_sandbox._helm.delete_objects") as mock_delete,
+    ):
+        with pytest.raises(asyncio.CancelledError):
+            await release.install()
+
+    # No kinds were recorded, so the fallback kinds are deleted.
+    mock_delete.assert_called_once()
+    assert mock_delete.call_args.args[2] == release.release_name
+    assert not mock_delete.call_args.args[3]
+
+
+def test_config_digest_depends_on_install_engine() -> None:
+    helm = Release(__file__, None, ValuesSource.none(), None)
+    apply = Release(__file__, None, ValuesSource.none(), None, install_engine="apply")
+
+    assert helm.config_digest() != apply.config_digest()
+    assert apply.clone().install_engine == "apply"
+
+
+async def test_readiness_watch_replaces_helm_wait(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("INSPECT_K8S_READINESS_WATCH", "true")
+    release = Release(__file__, None, ValuesSource.none(), None)
+    success = ExecResult(success=True, returncode=0, stdout="", stderr="")
+
+    with (
+        patch("k8s_sandbox._helm._run_subprocess", return_value=success) as mock_run,
+        patch("k8s_sandbox._helm.wait_for_release_ready") as mock_wait,
+    ):
+        await release.install()
+
+    args = mock_run.call_args[0][1]
+    assert not any(arg.startswith("--wait") for arg in args)
+    mock_wait.assert_called_once()
+    assert mock_wait.call_args.args[2] == release.release_name
+
+
+async def test_readiness_watch_pod_failure_includes_diagnostics(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("INSPECT_K8S_READINESS_WATCH", "true")
+    release = Release(__file__, None, ValuesSource.none(), None)
+    success = ExecResult(success=True, returncode=0, stdout="", stderr="")
+
+    with (
+        patch("k8s_sandbox._helm._run_subprocess", return_value=success),
+        patch(
+            "k8s_sandbox._helm.wait_for_release_ready",
+            side_effect=PodFailedError("Container 'default' is in ImagePullBackOff"),
+        ),
+        patch("k8s_sandbox._helm.describe_release_pods", return_value="no such image"),
+    ):
+        with pytest.raises(RuntimeError) as excinfo:
+            await release._install(None, upgrade=False)
+
+    assert "A sandbox pod failed to start." in str(excinfo.value)
+    assert "ImagePullBackOff" in str(excinfo.value)
+    assert "no such image" in str(excinfo.value)
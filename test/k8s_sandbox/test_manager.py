@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from typing import cast
 
@@ -9,6 +10,7 @@ from k8s_sandbox._helm import Release
 from k8s_sandbox._manager import (
     HelmReleaseManager,
     uninstall_all_unmanaged_releases,
+    uninstall_unmanaged_release,
 )
 from k8s_sandbox._sandbox_environment import K8sSandboxEnvironment
 
@@ -97,13 +99,30 @@ def _stub_unmanaged_releases(
     releases: list[str],
     failing: set[str],
     confirm: bool = True,
+    applied: list[str] | None = None,
 ) -> list[str]:
-    """Stubs out the cluster, returning the list which records uninstall attempts."""
+    """Stubs out the cluster, returning the list which records uninstall attempts.
+
+    `applied` are the releases found by label, which `helm list` doesn't include.
+    Uninstalls of those are recorded with an "applied:" prefix.
+    """
     attempted: list[str] = []
 
     async def fake_get_all_release_names(namespace: str, context_name: str | None):
         return releases
 
+    async def fake_find_applied_releases(
+        context_name: str | None, namespace: str
+    ) -> list[str]:
+        return applied or []
+
+    async def fake_uninstall_applied(
+        release_name: str, namespace: str, context_name: str | None, quiet: bool
+    ) -> None:
+        attempted.append(f"applied:{release_name}")
+        if release_name in failing:
+            raise RuntimeError(f"Failed to delete release objects. {release_name}")
+
     async def fake_uninstall(
         release_name: str, namespace: str, context_name: str | None, quiet: bool
     ) -> None:
@@ -118,6 +137,10 @@ def _stub_unmanaged_releases(
         manager_module, "get_all_release_names", fake_get_all_release_names
     )
     monkeypatch.setattr(manager_module, "helm_uninstall", fake_uninstall)
+    monkeypatch.setattr(
+        manager_module, "find_applied_releases", fake_find_applied_releases
+    )
+    monkeypatch.setattr(manager_module, "uninstall_applied", fake_uninstall_applied)
     monkeypatch.setattr(manager_module.Confirm, "ask", lambda *args, **kwargs: confirm)
     return attempted
 
@@ -187,3 +210,298 @@ async def test_cleanup_all_uninstalls_nothing_when_not_confirmed(
 
     assert attempted == []
     assert "Cancelled." in capsys.readouterr().out
+
+
+async def test_cleanup_all_deletes_releases_found_by_label(
+    monkeypatch: pytest.MonkeyPatch, capsys: CaptureFixture[str]
+) -> None:
+    attempted = _stub_unmanaged_releases(
+        monkeypatch,
+        ["aaaaaaaa"],
+        failing={"cccccccc"},
+        applied=["aaaaaaaa", "bbbbbbbb", "cccccccc"],
+    )
+
+    failed = await uninstall_all_unmanaged_releases()
+
+    # Releases known to Helm are uninstalled by Helm, the rest by label.
+    assert attempted == ["aaaaaaaa", "applied:bbbbbbbb", "applied:cccccccc"]
+    assert failed == ["cccccccc"]
+    assert "Failed to uninstall 1 of 3" in capsys.readouterr().out
+
+
+async def test_cleanup_all_uninstalls_helm_releases_if_finding_by_label_fails(
+    monkeypatch: pytest.MonkeyPatch, capsys: CaptureFixture[str]
+) -> None:
+    attempted = _stub_unmanaged_releases(monkeypatch, ["aaaaaaaa"], failing=set())
+
+    async def fail(context_name: str | None, namespace: str) -> list[str]:
+        raise RuntimeError("Forbidden")
+
+    monkeypatch.setattr(manager_module, "find_applied_releases", fail)
+
+    await uninstall_all_unmanaged_releases()
+
+    assert attempted == ["aaaaaaaa"]
+    assert "Complete." in capsys.readouterr().out
+
+
+async def test_cleanup_one_deletes_objects_left_by_either_engine(
+    monkeypatch: pytest.MonkeyPatch, capsys: CaptureFixture[str]
+) -> None:
+    attempted = _stub_unmanaged_releases(monkeypatch, [], failing=set())
+
+    await uninstall_unmanaged_release("aaaaaaaa")
+
+    assert attempted == ["aaaaaaaa", "applied:aaaaaaaa"]
+
+
+class _FakePoolableRelease(_FakeRelease):
+    """A _FakeRelease which can be pooled, recording the releases cloned from it."""
+
+    _counter = 0
+
+    def __init__(self, digest: str = "digest", fail_install: bool = False) -> None:
+        _FakePoolableRelease._counter += 1
+        super().__init__(f"rel{_FakePoolableRelease._counter:05d}")
+        self.digest = digest
+        self.sample_uuid: str | None = None
+        self.restarted_container_behavior = "warn"
+        self.fail_install = fail_install
+        self.installed = False
+        self.clones: list[_FakePoolableRelease] = []
+
+    def config_digest(self) -> str:
+        return self.digest
+
+    def clone(self) -> "_FakePoolableRelease":
+        clone = _FakePoolableRelease(self.digest, self.fail_install)
+        self.clones.append(clone)
+        return clone
+
+    async def install(self) -> None:
+        if self.fail_install:
+            raise RuntimeError("Helm install failed.")
+        self.installed = True
+
+
+def _pooled_manager(
+    monkeypatch: pytest.MonkeyPatch, size: int = 2
+) -> HelmReleaseManager:
+    monkeypatch.setenv(manager_module.INSPECT_HELM_WARM_POOL_SIZE, str(size))
+    return HelmReleaseManager()
+
+
+async def _settle() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def test_pool_disabled_by_default() -> None:
+    manager = HelmReleaseManager()
+    release = _FakePoolableRelease()
+
+    installed = await manager.install(cast(Release, release))
+
+    assert installed is release
+    assert release.installed
+    assert release.clones == []
+
+
+async def test_pool_miss_installs_release_and_fills_pool(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    manager = _pooled_manager(monkeypatch, size=2)
+    release = _FakePoolableRelease()
+
+    installed = await manager.install(cast(Release, release))
+    await _settle()
+
+    assert installed is release
+    assert release.installed
+    assert len(release.clones) == 2
+    assert all(clone.installed for clone in release.clones)
+
+
+async def test_pool_hit_hands_out_warm_release(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    manager = _pooled_manager(monkeypatch, size=1)
+    first = _FakePoolableRelease()
+    await manager.install(cast(Release, first))
+    await _settle()
+    second = _FakePoolableRelease()
+    second.sample_uuid = "sample-2"
+    second.restarted_container_behavior = "raise"
+
+    installed = cast(_FakePoolableRelease, await manager.install(cast(Release, second)))
+    await _settle()
+
+    assert installed is first.clones[0]
+    assert not second.installed
+    assert installed.sample_uuid == "sample-2"
+    assert installed.restarted_container_behavior == "raise"
+    # The pool was topped back up using the second release as the template.
+    assert len(second.clones) == 1
+    assert second.clones[0].installed
+
+
+async def test_pool_is_keyed_by_config_digest(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    manager = _pooled_manager(monkeypatch, size=1)
+    await manager.install(cast(Release, _FakePoolableRelease("a")))
+    await _settle()
+    other = _FakePoolableRelease("b")
+
+    installed = await manager.install(cast(Release, other))
+
+    assert installed is other
+
+
+async def test_pool_drained_on_uninstall_all(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    manager = _pooled_manager(monkeypatch, size=2)
+    release = _FakePoolableRelease()
+    await manager.install(cast(Release, release))
+    await _settle()
+
+    await manager.uninstall_all(print_only=True)
+
+    assert all(clone.uninstall_attempted for clone in release.clones)
+    # The sample's own release is left alone when only printing instructions.
+    assert not release.uninstall_attempted
+
+
+async def test_pool_failed_background_install_is_uninstalled(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    manager = _pooled_manager(monkeypatch, size=1)
+    release = _FakePoolableRelease()
+    await manager.install(cast(Release, release))
+    second = _FakePoolableRelease(fail_install=True)
+    await _settle()
+
+    installed = await manager.install(cast(Release, second))
+    await _settle()
+
+    assert installed is release.clones[0]
+    assert second.clones[0].uninstall_attempted
+
+
+def test_pool_size_must_not_be_negative(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv(manager_module.INSPECT_HELM_WARM_POOL_SIZE, "-1")
+
+    with pytest.raises(ValueError):
+        HelmReleaseManager()
+
+
+class _FakeSlowRelease(_FakeRelease):
+    """A _FakeRelease whose uninstall blocks until released, recording the order."""
+
+    def __init__(
+        self,
+        release_name: str,
+        order: list[str],
+        gate: asyncio.Event,
+        error: Exception | None = None,
+    ) -> None:
+        super().__init__(release_name, error)
+        self._order = order
+        self._gate = gate
+
+    async def uninstall(self, quiet: bool) -> None:
+        self._order.append(self.release_name)
+        await self._gate.wait()
+        await super().uninstall(quiet)
+
+
+def _reaping_manager(
+    monkeypatch: pytest.MonkeyPatch, workers: int = 8
+) -> HelmReleaseManager:
+    monkeypatch.setenv(manager_module.INSPECT_HELM_BACKGROUND_UNINSTALL, "true")
+    monkeypatch.setenv("INSPECT_MAX_HELM_UNINSTALL", str(workers))
+    return HelmReleaseManager()
+
+
+async def test_background_uninstall_returns_immediately(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    manager = _reaping_manager(monkeypatch)
+    gate = asyncio.Event()
+    release = _FakeSlowRelease("aaaaaaaa", [], gate)
+    await _install(manager, release)
+
+    await asyncio.wait_for(manager.uninstall(cast(Release, release), quiet=True), 1)
+    await _settle()
+
+    assert not release.uninstall_attempted
+    gate.set()
+    await manager.uninstall_all(print_only=True)
+    assert release.uninstall_attempted
+
+
+async def test_background_uninstall_largest_release_first(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    manager = _reaping_manager(monkeypatch, workers=1)
+    order: list[str] = []
+    gate = asyncio.Event()
+    first = _FakeSlowRelease("first", order, gate)
+    small = _FakeSlowRelease("small", order, gate)
+    large = _FakeSlowRelease("large", order, gate)
+    for release in (first, small, large):
+        await _install(manager, release)
+
+    # The single worker is busy with the first release whilst the others are queued.
+    await manager.uninstall(cast(Release, first), quiet=True, pod_count=1)
+    await _settle()
+    await manager.uninstall(cast(Release, small), quiet=True, pod_count=1)
+    await manager.uninstall(cast(Release, large), quiet=True, pod_count=5)
+    gate.set()
+    await manager.uninstall_all(print_only=False)
+
+    assert order == ["first", "large", "small"]
+
+
+async def test_background_uninstall_failures_reported_on_uninstall_all(
+    monkeypatch: pytest.MonkeyPatch, caplog: LogCaptureFixture
+) -> None:
+    manager = _reaping_manager(monkeypatch)
+    gate = asyncio.Event()
+    gate.set()
+    failing = _FakeSlowRelease(
+        "bbbbbbbb", [], gate, RuntimeError("Helm uninstall failed.")
+    )
+    await _install(manager, failing)
+    await manager.uninstall(cast(Release, failing), quiet=True)
+
+    with caplog.at_level(logging.ERROR):
+        await manager.uninstall_all(print_only=False)
+
+    assert "Failed to uninstall Helm release 'bbbbbbbb'" in caplog.text
+
+
+async def test_uninstall_all_in_bulk_falls_back_for_remaining_releases(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("INSPECT_K8S_BULK_CLEANUP", "true")
+    manager = HelmReleaseManager()
+    bulk = _FakeRelease("aaaaaaaa")
+    custom = _FakeRelease("bbbbbbbb")
+    await _install(manager, bulk)
+    await _install(manager, custom)
+
+    async def fake_bulk_uninstall(
+        release_names: list[str], *args: object, **kwargs: object
+    ) -> list[str]:
+        assert release_names == ["aaaaaaaa", "bbbbbbbb"]
+        return ["bbbbbbbb"]
+
+    monkeypatch.setattr(manager_module, "bulk_uninstall", fake_bulk_uninstall)
+
+    await manager.uninstall_all(print_only=False)
+
+    assert not bulk.uninstall_attempted
+    assert custom.uninstall_attempted
@@ -0,0 +1,166 @@
+import io
+import mmap
+from pathlib import Path
+
+import pytest
+import websocket
+from tenacity import wait_none
+
+from k8s_sandbox import _sandbox_environment
+from k8s_sandbox._sandbox_environment import K8sSandboxEnvironment
+
+from .test_exec_retry import _make_sandbox_with_mock_read
+
+
+@pytest.fixture(autouse=True)
+def _no_retry_wait(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Disable tenacity's exponential backoff in tests."""
+    original = _sandbox_environment._retry
+
+    def _fast_retry():
+        r = original()
+        r.wait = wait_none()
+        return r
+
+    monkeypatch.setattr(_sandbox_environment, "_retry", _fast_retry)
+
+
+def _sandbox_reading(content: bytes, fail_first: bool = False) -> K8sSandboxEnvironment:
+    sandbox, mock_read = _make_sandbox_with_mock_read()
+    calls = 0
+
+    async def impl(src: Path, dst):
+        nonlocal calls
+        calls += 1
+        # Write part of the file before failing, as an interrupted stream would.
+        dst.write(content[:3])
+        if fail_first and calls == 1:
+            raise websocket.WebSocketConnectionClosedException("closed")
+        dst.write(content[3:])
+
+    mock_read.side_effect = impl
+    return sandbox
+
+
+async def test_read_file_to_path(tmp_path: Path) -> None:
+    sandbox = _sandbox_reading(b"file-content")
+    dst = tmp_path / "file"
+    dst.write_bytes(b"previous contents which are longer")
+
+    await sandbox.read_file_to("/tmp/file", dst)
+
+    assert dst.read_bytes() == b"file-content"
+
+
+async def test_read_file_to_path_str(tmp_path: Path) -> None:
+    sandbox = _sandbox_reading(b"file-content")
+
+    await sandbox.read_file_to("/tmp/file", str(tmp_path / "file"))
+
+    assert (tmp_path / "file").read_bytes() == b"file-content"
+
+
+async def test_read_file_to_file_object_from_its_position() -> None:
+    sandbox = _sandbox_reading(b"file-content")
+    dst = io.BytesIO(b"header:")
+    dst.seek(0, io.SEEK_END)
+
+    await sandbox.read_file_to("/tmp/file", dst)
+
+    assert dst.getvalue() == b"header:file-content"
+
+
+async def test_read_file_to_discards_partial_output_on_retry() -> None:
+    sandbox = _sandbox_reading(b"file-content", fail_first=True)
+    dst = io.BytesIO(b"header:")
+    dst.seek(0, io.SEEK_END)
+
+    await sandbox.read_file_to("/tmp/file", dst)
+
+    assert dst.getvalue() == b"header:file-content"
+
+
+async def test_read_file_to_async_sink() -> None:
+    sandbox = _sandbox_reading(b"file-content", fail_first=True)
+    chunks: list[bytes] = []
+
+    async def sink(chunk: bytes) -> None:
+        chunks.append(chunk)
+
+    await sandbox.read_file_to("/tmp/file", sink)
+
+    assert b"".join(chunks) == b"file-content"
+
+
+async def test_read_file_to_async_sink_in_chunks(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(_sandbox_environment, "_SINK_CHUNK_SIZE", 5)
+    sandbox = _sandbox_reading(b"file-content")
+    chunks: list[bytes] = []
+
+    async def sink(chunk: bytes) -> None:
+        chunks.append(chunk)
+
+    await sandbox.read_file_to("/tmp/file", sink)
+
+    assert chunks == [b"file-", b"conte", b"nt"]
+
+
+async def test_read_file_to_empty_file_does_not_call_async_sink() -> None:
+    sandbox = _sandbox_reading(b"")
+    chunks: list[bytes] = []
+
+    async def sink(chunk: bytes) -> None:
+        chunks.append(chunk)
+
+    await sandbox.read_file_to("/tmp/file", sink)
+
+    assert chunks == []
+
+
+async def test_read_file_mapped() -> None:
+    sandbox = _sandbox_reading(b"file-content", fail_first=True)
+
+    async with sandbox.read_file_mapped("/tmp/file") as view:
+        assert view.readonly
+        assert view.tobytes() == b"file-content"
+
+    with pytest.raises(ValueError):
+        view.tobytes()
+
+
+async def test_read_file_mapped_is_unmapped_on_exit() -> None:
+    sandbox = _sandbox_reading(b"file-content")
+
+    async with sandbox.read_file_mapped("/tmp/file") as view:
+        mapped = view.obj
+        assert isinstance(mapped, mmap.mmap)
+
+    assert mapped.closed
+
+
+async def test_read_file_mapped_empty_file() -> None:
+    sandbox = _sandbox_reading(b"")
+
+    async with sandbox.read_file_mapped("/tmp/file") as view:
+        assert view.tobytes() == b""
+
+
+async def test_read_file_text_decodes_mapped_file() -> None:
+    sandbox = _sandbox_reading("héllo wörld".encode())
+
+    assert await sandbox.read_file("/tmp/file") == "héllo wörld"
+
+
+async def test_read_file_text_empty_file() -> None:
+    sandbox = _sandbox_reading(b"")
+
+    assert await sandbox.read_file("/tmp/file") == ""
+
+
+async def test_read_file_invalid_utf8_raises() -> None:
+    sandbox = _sandbox_reading(b"\xff\xfe\xfd\xfc")
+
+    with pytest.raises(UnicodeDecodeError):
+        await sandbox.read_file("/tmp/file")
@@ -0,0 +1,232 @@
+import json
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from k8s_sandbox._readiness import (
+    CRASH_LOOP_RESTART_THRESHOLD,
+    PodFailedError,
+    ReleaseReadiness,
+    _ReadinessWatcher,
+    wait_for_release_ready,
+)
+
+
+def _pod(
+    name: str = "agent-env-abc-default-0",
+    *,
+    ready: bool = False,
+    waiting_reason: str | None = None,
+    restart_count: int = 0,
+    init: bool = False,
+    deleting: bool = False,
+    resource_version: str = "1",
+) -> dict:
+    status: dict = {
+        "name": "default",
+        "restartCount": restart_count,
+        "ready": ready,
+        "state": (
+            {"waiting": {"reason": waiting_reason, "message": "details"}}
+            if waiting_reason
+            else {"running": {}}
+        ),
+    }
+    metadata: dict = {
+        "name": name,
+        "uid": f"uid-{name}",
+        "resourceVersion": resource_version,
+    }
+    if deleting:
+        metadata["deletionTimestamp"] = "2024-01-01T00:00:00Z"
+    return {
+        "metadata": metadata,
+        "spec": {"containers": [{"name": "default"}]},
+        "status": {
+            "phase": "Pending",
+            "conditions": [{"type": "Ready", "status": "True" if ready else "False"}],
+            "initContainerStatuses" if init else "containerStatuses": [status],
+        },
+    }
+
+
+def test_ready_when_all_expected_pods_ready() -> None:
+    readiness = ReleaseReadiness(expected_pods=2)
+    readiness.reset([_pod("a", ready=True)])
+
+    assert not readiness.is_ready()
+
+    readiness.update("ADDED", _pod("b"))
+    assert not readiness.is_ready()
+
+    readiness.update("MODIFIED", _pod("b", ready=True))
+    assert readiness.is_ready()
+
+
+def test_deleted_pods_are_forgotten() -> None:
+    readiness = ReleaseReadiness(expected_pods=1)
+    readiness.reset([_pod("old"), _pod("new", ready=True)])
+
+    readiness.update("DELETED", _pod("old"))
+
+    assert readiness.is_ready()
+
+
+def test_terminating_pods_are_ignored() -> None:
+    readiness = ReleaseReadiness(expected_pods=1)
+    readiness.reset([_pod("old", deleting=True), _pod("new", ready=True)])
+
+    assert readiness.is_ready()
+
+
+@pytest.mark.parametrize("init", [False, True])
+@pytest.mark.parametrize(
+    "reason", ["ImagePullBackOff", "InvalidImageName", "CreateContainerConfigError"]
+)
+def test_failed_waiting_reason_raises(reason: str, init: bool) -> None:
+    readiness = ReleaseReadiness(expected_pods=1)
+    readiness.reset([_pod("a", waiting_reason=reason, init=init)])
+
+    with pytest.raises(PodFailedError, match=f"Pod 'a' is in state {reason}: details"):
+        readiness.is_ready()
+
+
+def test_transient_waiting_reason_does_not_raise() -> None:
+    readiness = ReleaseReadiness(expected_pods=1)
+    readiness.reset([_pod("a", waiting_reason="ContainerCreating")])
+
+    assert not readiness.is_ready()
+
+
+def test_crash_loop_raises_only_after_threshold() -> None:
+    readiness = ReleaseReadiness(expected_pods=1)
+    readiness.reset(
+        [
+            _pod(
+                "a",
+                waiting_reason="CrashLoopBackOff",
+                restart_count=CRASH_LOOP_RESTART_THRESHOLD - 1,
+            )
+        ]
+    )
+    assert not readiness.is_ready()
+
+    readiness.update(
+        "MODIFIED",
+        _pod(
+            "a",
+            waiting_reason="CrashLoopBackOff",
+            restart_count=CRASH_LOOP_RESTART_THRESHOLD,
+        ),
+    )
+    with pytest.raises(PodFailedError, match="CrashLoopBackOff"):
+        readiness.is_ready()
+
+
+def _raw(body: dict) -> MagicMock:
+    response = MagicMock()
+    response.data = json.dumps(body).encode()
+    return response
+
+
+def _stream(*events: dict) -> MagicMock:
+    response = MagicMock()
+    response.stream.return_value = [
+        "".join(json.dumps(event) + "\n" for event in events).encode()
+    ]
+    return response
+
+
+def _watcher_with_api(api: MagicMock, timeout: float = 60) -> _ReadinessWatcher:
+    apps = MagicMock()
+    apps.list_namespaced_stateful_set.return_value = _raw(
+        {"items": [{"spec": {"replicas": 1}}]}
+    )
+    apps.list_namespaced_deployment.return_value = _raw({"items": []})
+    watcher = _ReadinessWatcher(None, "ns", "abc", time.monotonic() + timeout)
+    patch("k8s_sandbox._readiness.k8s_client", return_value=api).start()
+    patch("k8s_sandbox._readiness.client.AppsV1Api", return_value=apps).start()
+    return watcher
+
+
+@pytest.fixture(autouse=True)
+def _stop_patches() -> object:
+    yield
+    patch.stopall()
+
+
+def test_watcher_returns_when_watch_reports_ready() -> None:
+    api = MagicMock()
+    listed = {"metadata": {"resourceVersion": "1"}, "items": [_pod("a")]}
+    api.list_namespaced_pod.side_effect = [
+        _raw(listed),
+        _stream(
+            {"type": "BOOKMARK", "object": {"metadata": {"resourceVersion": "2"}}},
+            {"type": "MODIFIED", "object": _pod("a", ready=True)},
+        ),
+    ]
+
+    _watcher_with_api(api).run()
+
+    watch_call = api.list_namespaced_pod.call_args_list[1]
+    assert watch_call.kwargs["watch"] is True
+    assert watch_call.kwargs["resource_version"] == "1"
+    assert watch_call.kwargs["label_selector"] == "app.kubernetes.io/instance=abc"
+
+
+def test_watcher_relists_when_watch_history_expires() -> None:
+    api = MagicMock()
+    api.list_namespaced_pod.side_effect = [
+        _raw({"metadata": {"resourceVersion": "1"}, "items": [_pod("a")]}),
+        _stream({"type": "ERROR", "object": {"code": 410, "message": "too old"}}),
+        _raw(
+            {
+                "metadata": {"resourceVersion": "5"},
+                "items": [_pod("a", ready=True)],
+            }
+        ),
+    ]
+
+    _watcher_with_api(api).run()
+
+    assert api.list_namespaced_pod.call_count == 3
+
+
+def test_watcher_raises_pod_failure_from_watch_event() -> None:
+    api = MagicMock()
+    api.list_namespaced_pod.side_effect = [
+        _raw({"metadata": {"resourceVersion": "1"}, "items": [_pod("a")]}),
+        _stream(
+            {
+                "type": "MODIFIED",
+                "object": _pod("a", waiting_reason="ErrImageNeverPull"),
+            }
+        ),
+    ]
+
+    with pytest.raises(PodFailedError, match="ErrImageNeverPull"):
+        _watcher_with_api(api).run()
+
+
+def test_watcher_times_out() -> None:
+    api = MagicMock()
+    api.list_namespaced_pod.return_value = _raw(
+        {"metadata": {"resourceVersion": "1"}, "items": [_pod("a")]}
+    )
+
+    with pytest.raises(TimeoutError, match=r"\['a'\]"):
+        _watcher_with_api(api, timeout=0).run()
+
+
+async def test_wait_for_release_ready_propagates_errors() -> None:
+    with patch.object(
+        _ReadinessWatcher, "run", side_effect=PodFailedError("ImagePullBackOff")
+    ):
+        with pytest.raises(PodFailedError):
+            await wait_for_release_ready(None, "ns", "abc", timeout=10)
+
+
+async def test_wait_for_release_ready_returns_when_ready() -> None:
+    with patch.object(_ReadinessWatcher, "run", return_value=None):
+        await wait_for_release_ready(None, "ns", "abc", timeout=10)